@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark for redmapper.utilities.cic
+
+This times the cloud-in-cell histogramming in 1, 2, and 3 dimensions with
+grid sizes typical of the background generators, and compares against a
+direct np.add.at implementation.
+"""
+
+from __future__ import division, absolute_import, print_function
+from past.builtins import xrange
+
+import argparse
+import time
+import numpy as np
+
+from redmapper.utilities import cic
+
+
+def cic_add_at(value, pos, ns, isolated=True):
+    """
+    Reference cloud-in-cell implementation using np.add.at.
+
+    Parameters
+    ----------
+    value: `np.array`
+       Array of sample weights
+    pos: `list`
+       List of arrays of sample coordinates, one per dimension (x first)
+    ns: `list`
+       List of grid sizes, one per dimension (x first)
+    isolated: `bool`, optional
+       True if data is not periodic.  Default is True.
+
+    Returns
+    -------
+    field: `np.array`
+       Flattened float array of CIC field values
+    """
+    field = np.zeros(int(np.prod(ns)))
+
+    ks = []
+    ws = []
+    for p, n in zip(pos, ns):
+        k1 = p.astype(np.int32)
+        dng = (k1 + 0.5) - p
+        k2 = np.where(dng < 0.0, k1 + 1, k1 - 1)
+        w2 = np.abs(dng)
+        if isolated:
+            w2[(k2 < 0) | (k2 >= n)] = 0.0
+        ks.append((k1, k2 % n))
+        ws.append((1.0 - np.abs(dng), w2))
+
+    strides = np.cumprod([1] + list(ns[: -1]))
+
+    for c in xrange(2**len(ns)):
+        index = np.zeros(value.size, dtype=np.int64)
+        weight = value.copy()
+        for d in xrange(len(ns)):
+            side = (c >> d) & 1
+            index += ks[d][side] * strides[d]
+            weight *= ws[d][side]
+        np.add.at(field, index, weight)
+
+    return field
+
+
+def timeit(func, nrep):
+    """
+    Return the best time of nrep calls to func.
+    """
+    best = None
+    for i in xrange(nrep):
+        starttime = time.time()
+        func()
+        elapsed = time.time() - starttime
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark redmapper.utilities.cic')
+
+    parser.add_argument('-n', '--nsample', action='store', type=int, default=1000000,
+                        help='Number of samples')
+    parser.add_argument('-r', '--nrep', action='store', type=int, default=5,
+                        help='Number of repetitions')
+
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(seed=12345)
+
+    # chisq x refmag x (color) grids as used in the background generators
+    ns = [40, 48, 20]
+    pos = [rng.uniform(0.0, n, size=args.nsample) for n in ns]
+    value = np.ones(args.nsample)
+
+    for dim in xrange(1, 4):
+        cic_args = []
+        for d in xrange(dim):
+            cic_args.extend([pos[d], ns[d]])
+
+        field = cic(value, *cic_args, isolated=True)
+        field_ref = cic_add_at(value, pos[: dim], ns[: dim], isolated=True)
+        maxdiff = np.max(np.abs(field.ravel() - field_ref))
+
+        t_cic = timeit(lambda: cic(value, *cic_args, isolated=True), args.nrep)
+        t_ref = timeit(lambda: cic_add_at(value, pos[: dim], ns[: dim], isolated=True), args.nrep)
+
+        print("%dD: cic %.4f s, np.add.at %.4f s, speedup %.1fx, max diff %.2e" %
+              (dim, t_cic, t_ref, t_ref / t_cic, maxdiff))
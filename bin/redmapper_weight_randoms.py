@@ -21,8 +21,7 @@ if __name__ == '__main__':
 
     config = redmapper.Configuration(args.configfile)
     weigher = redmapper.RandomWeigher(config, args.randfile)
-    for lambda_cut in args.lambda_cuts:
-        wt_randfile, wt_areafile = weigher.weight_randoms(lambda_cut)
-
+    outfiles = weigher.weight_randoms_multi(args.lambda_cuts)
+    for wt_randfile, wt_areafile in outfiles:
         print("Made weighted random file %s" % (wt_randfile))
         print("Made weighted area file %s" % (wt_areafile))
@@ -23,7 +23,7 @@ from .chisq_dist import compute_chisq
 from .background import Background, ZredBackground, BackgroundGenerator, ZredBackgroundGenerator
 from .cluster import Cluster, ClusterCatalog
 from .galaxy import Galaxy, GalaxyCatalog, GalaxyCatalogMaker
-from .mask import Mask, HPMask, get_mask
+from .mask import Mask, HPMask, get_mask, maskgal_filename
 from .zlambda import Zlambda, ZlambdaCorrectionPar
 from .cluster_runner import ClusterRunner
 from .run_firstpass import RunFirstPass
@@ -290,12 +290,22 @@ class BackgroundGenerator(object):
         self.config = config.copy()
         self.config.cosmo = None
 
-    def run(self, clobber=False, natatime=100000, deepmode=False):
+    def run(self, clobber=False, natatime=100000, deepmode=False,
+            prev_bkgfile=None, prev_parfile=None, partfiles=None):
         """
         Generate the galaxy background using multiprocessing.  The number of
         cores used is specified in self.config.calib_nproc, and the output
         filename is specified in self.config.bkgfile.
 
+        If prev_bkgfile and prev_parfile are given, the redshift bins where
+        the red-sequence model in self.config.parfile is unchanged from
+        prev_parfile (to within self.config.calib_warmstart_tol) are copied
+        from prev_bkgfile rather than recomputed.
+
+        If partfiles is given, the partial histograms written by
+        run_partial() (e.g. on many nodes) are summed instead of reading
+        the galaxies.
+
         Parameters
         ----------
         clobber: `bool`, optional
@@ -305,6 +315,15 @@ class BackgroundGenerator(object):
         deepmode: `bool`, optional
            Run background to full depth of survey (rather than Lstar richness limit).
            Default is False.
+        prev_bkgfile: `str`, optional
+           Previous background file to reuse unchanged redshift bins.
+           Default is None.
+        prev_parfile: `str`, optional
+           Red-sequence parameter file used for prev_bkgfile.
+           Default is None.
+        partfiles: `list`, optional
+           Partial histogram files from run_partial() for all the jobs.
+           Default is None.
         """
 
         self.natatime = natatime
@@ -317,6 +336,227 @@ class BackgroundGenerator(object):
                         self.config.logger.info("CHISQBKG already in %s and clobber is False" % (self.config.bkgfile))
                         return
 
+        self._setup_bins()
+
+        # this is the background hist
+        sigma_g = np.zeros((self.nrefmagbins, self.nchisqbins, self.nzbins))
+        sigma_lng = np.zeros((self.nrefmagbins, self.nlnchisqbins, self.nzbins))
+
+        # Copy over the redshift bins that have not changed
+        if prev_bkgfile is not None and prev_parfile is not None:
+            prev_bkg = self._get_prev_bkg(prev_bkgfile, prev_parfile)
+            if prev_bkg is not None:
+                sigma_g[:, :, ~self.zbincompute] = prev_bkg.sigma_g[:, :, ~self.zbincompute]
+                sigma_lng[:, :, ~self.zbincompute] = prev_bkg.sigma_lng[:, :, ~self.zbincompute]
+
+                self.config.logger.info("Reusing %d of %d redshift bins from %s" %
+                                        (np.sum(~self.zbincompute), self.zbins.size, prev_bkgfile))
+
+
+        if not np.any(self.zbincompute):
+            self.config.logger.info("All redshift bins reused from %s" % (prev_bkgfile))
+        elif partfiles is not None:
+            field_g, field_lng = self._sum_partfiles(partfiles)
+
+            sigma_g[:, :, self.zbincompute] = self._normalize_field(field_g, self.config.bkg_chisqbinsize)
+            sigma_lng[:, :, self.zbincompute] = self._normalize_field(field_lng, self.lnchisqbinsize)
+        elif self.config.bkg_pixel_parallel and self.config.galfile_pixelized:
+            # Split the galfile pixels among the workers, and sum the partial
+            # histograms in job order (so the output does not depend on
+            # which worker finishes first).  Each galaxy is read only once.
+            worker_list = [inds for inds in self._pixel_jobs(4 * self.config.calib_nproc)
+                           if inds.size > 0]
+
+            field_g = np.zeros_like(sigma_g[:, :, self.zbincompute])
+            field_lng = np.zeros_like(sigma_lng[:, :, self.zbincompute])
+
+            pool = Pool(processes=self.config.calib_nproc)
+            for field_g_sub, field_lng_sub in pool.imap(self._pixel_worker, worker_list, chunksize=1):
+                field_g += field_g_sub
+                field_lng += field_lng_sub
+            pool.close()
+            pool.join()
+
+            sigma_g[:, :, self.zbincompute] = self._normalize_field(field_g, self.config.bkg_chisqbinsize)
+            sigma_lng[:, :, self.zbincompute] = self._normalize_field(field_lng, self.lnchisqbinsize)
+        else:
+            # Split into bins for parallel running
+            logrange = np.log(np.array([self.config.zrange[0] - 0.001,
+                                        self.config.zrange[1] + 0.001]))
+            logbinsize = (logrange[1] - logrange[0]) / self.config.calib_nproc
+            zedges = (np.exp(logrange[0]) + np.exp(logrange[1])) - np.exp(logrange[0] + np.arange(self.config.calib_nproc + 1) * logbinsize)
+
+            worker_list = []
+            for i in xrange(self.config.calib_nproc):
+                ubins, = np.where((self.zbins < zedges[i]) & (self.zbins > zedges[i + 1]) &
+                                  self.zbincompute)
+                gd, = np.where(ubins < self.zbins.size)
+
+                # If we have more processes than bins, some of these will be empty
+                # and this prevents us from adding them to the list
+                if gd.size == 0:
+                    continue
+
+                ubins = ubins[gd]
+
+                zbinmark = np.zeros(self.zbins.size, dtype=np.bool)
+                zbinmark[ubins] = True
+
+                worker_list.append(zbinmark)
+
+            pool = Pool(processes=self.config.calib_nproc)
+            retvals = pool.map(self._worker, worker_list, chunksize=1)
+            pool.close()
+            pool.join()
+
+            # And store the results
+            for zbinmark, sigma_g_sub, sigma_lng_sub in retvals:
+                sigma_g[:, :, zbinmark] = sigma_g_sub
+                sigma_lng[:, :, zbinmark] = sigma_lng_sub
+
+        self._write_bkg(sigma_g, sigma_lng, clobber)
+
+    def run_partial(self, job, njob, partfile, clobber=False, natatime=100000, deepmode=False,
+                    prev_bkgfile=None, prev_parfile=None):
+        """
+        Compute the partial background histograms of one job, for summing
+        with run(partfiles=...).
+
+        The galfile pixels of the sub-region are split into njob jobs with
+        roughly equal numbers of galaxies, and this computes the histograms
+        of galaxy counts for the pixels of job number job.  Each job can
+        run on a different node.  The galfile must be pixelized.
+
+        Parameters
+        ----------
+        job: `int`
+           Job number, 0 <= job < njob
+        njob: `int`
+           Total number of jobs
+        partfile: `str`
+           Output partial histogram file
+        clobber: `bool`, optional
+           Overwrite an existing partfile.  Default is False.
+        natatime: `int`, optional
+           Number of galaxies to read at a time.  Default is 100000.
+        deepmode: `bool`, optional
+           Run background to full depth of survey (rather than Lstar richness limit).
+           Default is False.
+        prev_bkgfile: `str`, optional
+           Previous background file; only the redshift bins that cannot be
+           reused from it are computed.  Default is None.
+        prev_parfile: `str`, optional
+           Red-sequence parameter file used for prev_bkgfile.
+           Default is None.
+        """
+        if not self.config.galfile_pixelized:
+            raise RuntimeError("Partial background jobs require a pixelized galfile.")
+        if job < 0 or job >= njob:
+            raise ValueError("job must be between 0 and njob - 1")
+
+        self.natatime = natatime
+        self.deepmode = deepmode
+
+        self._setup_bins()
+
+        if prev_bkgfile is not None and prev_parfile is not None:
+            self._get_prev_bkg(prev_bkgfile, prev_parfile)
+
+        field_g = np.zeros((self.nrefmagbins, self.nchisqbins, self.nzbins))
+        field_lng = np.zeros((self.nrefmagbins, self.nlnchisqbins, self.nzbins))
+
+        inds = self._pixel_jobs(njob)[job]
+        if inds.size > 0 and np.any(self.zbincompute):
+            field_g[:, :, self.zbincompute], field_lng[:, :, self.zbincompute] = self._pixel_worker(inds)
+
+        dtype = [('job', 'i4'),
+                 ('njob', 'i4'),
+                 ('deepmode', 'i2'),
+                 ('zbincompute', 'i2', self.zbins.size),
+                 ('field_g', 'f8', field_g.shape),
+                 ('field_lng', 'f8', field_lng.shape)]
+
+        part = Entry(np.zeros(1, dtype=dtype))
+        part.job = job
+        part.njob = njob
+        part.deepmode = deepmode
+        part.zbincompute[:] = self.zbincompute
+        part.field_g[:, :] = field_g
+        part.field_lng[:, :] = field_lng
+
+        part.to_fits_file(partfile, extname='BKGPART', clobber=clobber)
+
+    def _sum_partfiles(self, partfiles):
+        """
+        Sum the partial histograms from run_partial(), in job order.
+
+        Parameters
+        ----------
+        partfiles: `list`
+           Partial histogram files for all the jobs
+
+        Returns
+        -------
+        field_g: `np.array`
+           Histogram (nrefmagbins, nchisqbins, nzbins_compute) of galaxy counts
+        field_lng: `np.array`
+           Histogram (nrefmagbins, nlnchisqbins, nzbins_compute) of galaxy counts
+        """
+        parts = [Entry.from_fits_file(partfile, ext='BKGPART') for partfile in partfiles]
+        parts.sort(key=lambda part: part.job)
+
+        njob = parts[0].njob
+        if sorted(part.job for part in parts) != list(range(njob)) or \
+                any(part.njob != njob for part in parts):
+            raise RuntimeError("Partial background files must cover jobs 0 to %d once each" % (njob - 1))
+
+        field_g = np.zeros((self.nrefmagbins, self.nchisqbins, self.nzbins))
+        field_lng = np.zeros((self.nrefmagbins, self.nlnchisqbins, self.nzbins))
+        for part in parts:
+            if (bool(part.deepmode) != bool(self.deepmode) or
+                    not np.array_equal(part.zbincompute.astype(bool), self.zbincompute) or
+                    part.field_g.shape != field_g.shape or
+                    part.field_lng.shape != field_lng.shape):
+                raise RuntimeError("Partial background file for job %d does not match this run" % (part.job))
+            field_g += part.field_g
+            field_lng += part.field_lng
+
+        return field_g[:, :, self.zbincompute], field_lng[:, :, self.zbincompute]
+
+    def _pixel_jobs(self, njob):
+        """
+        Split the galfile pixels of the sub-region into jobs.
+
+        The pixels are assigned, largest first, to the job with the fewest
+        galaxies so far.  The split only depends on the galfile and njob.
+
+        Parameters
+        ----------
+        njob: `int`
+           Number of jobs
+
+        Returns
+        -------
+        jobinds: `list`
+           List of njob integer arrays of indices into the galfile master
+           table.  Some may be empty.
+        """
+        master, subreg_indices = self._get_subreg_indices()
+
+        st = np.argsort(master.ngals[subreg_indices], kind='mergesort')[::-1]
+        jobngals = np.zeros(njob, dtype=np.int64)
+        jobinds = [[] for i in xrange(njob)]
+        for ind in subreg_indices[st]:
+            j = np.argmin(jobngals)
+            jobinds[j].append(ind)
+            jobngals[j] += master.ngals[ind]
+
+        return [np.array(inds, dtype=np.int64) for inds in jobinds]
+
+    def _setup_bins(self):
+        """
+        Set up the background histogram binning and the areas.
+        """
         # get the ranges
         self.refmagrange = np.array([12.0, self.config.limmag_catalog])
         self.nrefmagbins = np.ceil((self.refmagrange[1] - self.refmagrange[0]) / self.config.bkg_refmagbinsize).astype(np.int32)
@@ -334,10 +574,6 @@ class BackgroundGenerator(object):
         self.nzbins = np.ceil((self.config.zrange[1] - self.config.zrange[0]) / self.config.bkg_zbinsize).astype(np.int32)
         self.zbins = np.arange(self.nzbins) * self.config.bkg_zbinsize + self.config.zrange[0]
 
-        # this is the background hist
-        sigma_g = np.zeros((self.nrefmagbins, self.nchisqbins, self.nzbins))
-        sigma_lng = np.zeros((self.nrefmagbins, self.nlnchisqbins, self.nzbins))
-
         # We need the areas from the depth map
         if self.config.depthfile is not None:
             depthstr = DepthMap(self.config)
@@ -345,40 +581,21 @@ class BackgroundGenerator(object):
         else:
             self.areas = np.zeros(self.refmagbins.size) + self.config.area
 
+        self.zbincompute = np.ones(self.zbins.size, dtype=bool)
 
-        # Split into bins for parallel running
-        logrange = np.log(np.array([self.config.zrange[0] - 0.001,
-                                    self.config.zrange[1] + 0.001]))
-        logbinsize = (logrange[1] - logrange[0]) / self.config.calib_nproc
-        zedges = (np.exp(logrange[0]) + np.exp(logrange[1])) - np.exp(logrange[0] + np.arange(self.config.calib_nproc + 1) * logbinsize)
-
-        worker_list = []
-        for i in xrange(self.config.calib_nproc):
-            ubins, = np.where((self.zbins < zedges[i]) & (self.zbins > zedges[i + 1]))
-            gd, = np.where(ubins < self.zbins.size)
-
-            # If we have more processes than bins, some of these will be empty
-            # and this prevents us from adding them to the list
-            if gd.size == 0:
-                continue
-
-            ubins = ubins[gd]
-
-            zbinmark = np.zeros(self.zbins.size, dtype=np.bool)
-            zbinmark[ubins] = True
-
-            worker_list.append(zbinmark)
-
-        pool = Pool(processes=self.config.calib_nproc)
-        retvals = pool.map(self._worker, worker_list, chunksize=1)
-        pool.close()
-        pool.join()
-
-        # And store the results
-        for zbinmark, sigma_g_sub, sigma_lng_sub in retvals:
-            sigma_g[:, :, zbinmark] = sigma_g_sub
-            sigma_lng[:, :, zbinmark] = sigma_lng_sub
+    def _write_bkg(self, sigma_g, sigma_lng, clobber):
+        """
+        Write the chisq background to self.config.bkgfile.
 
+        Parameters
+        ----------
+        sigma_g: `np.array`
+           Background density (nrefmagbins, nchisqbins, nzbins)
+        sigma_lng: `np.array`
+           Background density (nrefmagbins, nlnchisqbins, nzbins)
+        clobber: `bool`
+           Overwrite an existing file?
+        """
         # And save them
         dtype = [('zbins', 'f4', self.zbins.size),
                  ('zrange', 'f4', 2),
@@ -443,42 +660,76 @@ class BackgroundGenerator(object):
         starttime = time.time()
 
         zbins_use = self.zbins[zbinmark]
-        zrange_use = np.array([zbins_use[0], zbins_use[-1] + self.config.bkg_zbinsize])
 
-        # We need to load in the red sequence structure -- just in the specific redshift range
-        zredstr = RedSequenceColorPar(self.config.parfile, zrange=zrange_use)
+        field_g, field_lng = self._compute_fields(zbinmark)
 
-        zredstrbinsize = zredstr.z[1] - zredstr.z[0]
-        zpos = np.searchsorted(zredstr.z, zbins_use)
+        sigma_g_sub = self._normalize_field(field_g, self.config.bkg_chisqbinsize)
+        sigma_lng_sub = self._normalize_field(field_lng, self.lnchisqbinsize)
 
-        # How many galaxies total?
-        if self.config.galfile_pixelized:
-            master = Entry.from_fits_file(self.config.galfile)
+        self.config.logger.info("Finished %.4f < z < %.4f in %.1f seconds" % (zbins_use[0], zbins_use[-1],
+                                                                              time.time() - starttime))
 
-            if len(self.config.d.hpix) > 0:
-                # We need to take a sub-region
-                theta, phi = hp.pix2ang(master.nside, master.hpix)
-                ipring_big = hp.ang2pix(self.config.d.nside, theta, phi)
+        return (zbinmark, sigma_g_sub, sigma_lng_sub)
 
-                _, subreg_indices = esutil.numpy_util.match(self.config.d.hpix, ipring_big)
-                subreg_indices = np.unique(subreg_indices)
-            else:
-                subreg_indices = np.arange(master.hpix.size)
+    def _pixel_worker(self, subreg_indices):
+        """
+        Internal worker method for multiprocessing over galfile pixels.
 
-            ngal = np.sum(master.ngals[subreg_indices])
-            npix = subreg_indices.size
-        else:
-            hdr = fitsio.read_header(self.config.galfile, ext=1)
+        Parameters
+        ----------
+        subreg_indices: `np.array`
+           Indices into the galfile master table of the pixels to run in
+           this job
 
-            ngal = hdr['NAXIS2']
-            npix = 0
+        Returns
+        -------
+        retvals: `tuple`
+           field_g: `np.array`
+              Partial chisq histogram of galaxy counts for the redshift bins
+              in self.zbincompute
+           field_lng: `np.array`
+              Partial lnchisq histogram of galaxy counts for the redshift bins
+              in self.zbincompute
+        """
+
+        starttime = time.time()
+
+        field_g, field_lng = self._compute_fields(self.zbincompute, subreg_indices=subreg_indices)
+
+        self.config.logger.info("Finished %d galfile pixels in %.1f seconds" % (len(subreg_indices),
+                                                                                time.time() - starttime))
+
+        return (field_g, field_lng)
+
+    def _compute_fields(self, zbinmark, subreg_indices=None):
+        """
+        Compute the chisq and lnchisq histograms of galaxy counts.
 
-        nmag = self.config.nmag
-        ncol = nmag - 1
+        The histograms are accumulated as each chunk of galaxies is read, so
+        the memory use does not depend on the number of galaxies in the
+        catalog.
 
-        # default values are all guaranteed to be out of range
-        chisqs = np.zeros((ngal, zbins_use.size), dtype=np.float32) + np.exp(np.max(self.lnchisqbins)) + 100.0
-        refmags = np.zeros(ngal, dtype=np.float32)
+        Parameters
+        ----------
+        zbinmark: `np.array`
+           Boolean array marking the redshift bins to compute
+        subreg_indices: `np.array`, optional
+           Indices into the galfile master table of the pixels to read.
+           Default is None, which reads the full (sub-region of the) catalog.
+
+        Returns
+        -------
+        field_g: `np.array`
+           Histogram (nrefmagbins, nchisqbins, nzbins_use) of galaxy counts
+        field_lng: `np.array`
+           Histogram (nrefmagbins, nlnchisqbins, nzbins_use) of galaxy counts
+        """
+
+        zbins_use = self.zbins[zbinmark]
+        zrange_use = np.array([zbins_use[0], zbins_use[-1] + self.config.bkg_zbinsize])
+
+        # We need to load in the red sequence structure -- just in the specific redshift range
+        zredstr = RedSequenceColorPar(self.config.parfile, zrange=zrange_use)
 
         if (self.deepmode):
             zlimmag = np.atleast_1d(zredstr.mstar(zbins_use + self.config.bkg_zbinsize) - 2.5 * np.log10(0.01))
@@ -490,86 +741,204 @@ class BackgroundGenerator(object):
         zlimmagpos = np.clip(((zlimmag - self.refmagrange[0]) * self.nrefmagbins / (self.refmagrange[1] - self.refmagrange[0])).astype(np.int32), 0, self.nrefmagbins - 1)
         zlimmag = self.refmagbins[zlimmagpos] + self.config.bkg_refmagbinsize
 
-        zbinmid = np.median(np.arange(zredstr.z.size - 1))
+        # These are the raw (cic) galaxy counts, accumulated per chunk
+        field_g = np.zeros((self.nrefmagbins, self.nchisqbins, zbins_use.size))
+        field_lng = np.zeros((self.nrefmagbins, self.nlnchisqbins, zbins_use.size))
 
         # And the main loop
-        ctr = 0
-        p = 0
-        # This covers both loops
-        while ((ctr < ngal) and (p < npix)):
-            # Read in a section of the galaxies, or the pixel
-            if not self.config.galfile_pixelized:
-                lo = ctr
-                hi = np.clip(ctr + self.natatime, None, ngal)
-
-                gals = GalaxyCatalog.from_fits_file(self.config.galfile, rows=np.arange(lo, hi))
-                ctr = hi + 1
-            else:
-                if master.ngals[subreg_indices[p]] == 0:
-                    p += 1
-                    continue
+        for gals in self._galaxy_chunks(subreg_indices=subreg_indices):
+            for i, zbin in enumerate(zbins_use):
+                use, = np.where((gals.refmag > self.refmagrange[0]) &
+                                (gals.refmag < zlimmag[i]))
 
-                gals = GalaxyCatalog.from_galfile(self.config.galfile, nside=master.nside,
-                                                  hpix=master.hpix[subreg_indices[p]], border=0.0)
+                if (use.size > 0):
+                    # Compute chisq at the redshift zbin
+                    chisqs = zredstr.calculate_chisq(gals[use], zbin).astype(np.float32)
 
-                lo = ctr
-                hi = ctr + gals.size
+                    self._accumulate_fields(chisqs, gals.refmag[use].astype(np.float32),
+                                            field_g[:, :, i], field_lng[:, :, i])
 
-                ctr += master.ngals[subreg_indices[p]]
-                p += 1
+        return (field_g, field_lng)
 
-            inds = np.arange(lo, hi)
+    def _get_prev_bkg(self, prev_bkgfile, prev_parfile):
+        """
+        Read a previous chisq background, and mark the redshift bins where
+        the red-sequence model has changed in self.zbincompute.
 
-            refmags[inds] = gals.refmag
+        The chisq background in a redshift bin only depends on the
+        red-sequence model at that redshift, so the unchanged bins can be
+        reused as-is.
 
-            for i, zbin in enumerate(zbins_use):
-                use, = np.where((gals.refmag > self.refmagrange[0]) &
-                                (gals.refmag < zlimmag[i]))
+        Parameters
+        ----------
+        prev_bkgfile: `str`
+           Previous background file
+        prev_parfile: `str`
+           Red-sequence parameter file used for prev_bkgfile
 
-                if (use.size > 0):
-                    # Compute chisq at the redshift zbin
-                    chisqs[inds[use], i] = zredstr.calculate_chisq(gals[use], zbin)
+        Returns
+        -------
+        prev_bkg: `redmapper.Entry`
+           Previous chisq background.  None if it cannot be reused.
+        """
+        if not os.path.isfile(prev_bkgfile) or not os.path.isfile(prev_parfile):
+            return None
+
+        with fitsio.FITS(prev_bkgfile) as fits:
+            if 'CHISQBKG' not in [ext.get_extname() for ext in fits[1: ]]:
+                return None
+
+        prev_bkg = Entry.from_fits_file(prev_bkgfile, ext='CHISQBKG')
+
+        # The binning must match
+        if (prev_bkg.zbins.size != self.zbins.size or
+                prev_bkg.chisqbins.size != self.chisqbins.size or
+                prev_bkg.lnchisqbins.size != self.lnchisqbins.size or
+                prev_bkg.refmagbins.size != self.refmagbins.size or
+                not np.allclose(prev_bkg.zbins, self.zbins) or
+                not np.allclose(prev_bkg.refmagbins, self.refmagbins) or
+                not np.allclose(prev_bkg.areas, self.areas)):
+            self.config.logger.info("Binning of %s does not match; not reusing" % (prev_bkgfile))
+            return None
 
-        binsizes = self.config.bkg_refmagbinsize  * self.config.bkg_chisqbinsize
-        lnbinsizes = self.config.bkg_refmagbinsize * self.lnchisqbinsize
+        zredstr = RedSequenceColorPar(self.config.parfile, fine=True, zrange=self.config.zrange)
+        prev_zredstr = RedSequenceColorPar(prev_parfile, fine=True, zrange=self.config.zrange)
 
-        sigma_g_sub = np.zeros((self.nrefmagbins, self.nchisqbins, zbins_use.size))
-        sigma_lng_sub = np.zeros((self.nrefmagbins, self.nlnchisqbins, zbins_use.size))
+        changed = zredstr.changed_redshifts(prev_zredstr, self.config.calib_warmstart_tol)
 
-        for i, zbin in enumerate(zbins_use):
-            use, = np.where((chisqs[:, i] >= self.chisqrange[0]) &
-                            (chisqs[:, i] < self.chisqrange[1]) &
-                            (refmags >= self.refmagrange[0]) &
-                            (refmags < self.refmagrange[1]))
-            chisqpos = (chisqs[use, i] - self.chisqrange[0]) * self.nchisqbins / (self.chisqrange[1] - self.chisqrange[0])
-            refmagpos = (refmags[use] - self.refmagrange[0]) * self.nrefmagbins / (self.refmagrange[1] - self.refmagrange[0])
+        # Each bin is computed with the model at (or interpolated near) zbin,
+        # so we allow one bin of slop on each side.
+        for i, zbin in enumerate(self.zbins):
+            near, = np.where((zredstr.z >= zbin - self.config.bkg_zbinsize) &
+                             (zredstr.z <= zbin + 2.0 * self.config.bkg_zbinsize))
+            self.zbincompute[i] = (near.size == 0) or np.any(changed[near])
 
-            value = np.ones(use.size)
+        return prev_bkg
 
-            field = cic(value, chisqpos, self.nchisqbins, refmagpos, self.nrefmagbins, isolated=True)
-            for j in xrange(self.nchisqbins):
-                sigma_g_sub[:, j, i] = field[:, j] / (self.areas * binsizes)
+    def _normalize_field(self, field, chisqbinsize):
+        """
+        Normalize a histogram of galaxy counts to a background density.
 
-            lnchisqs = np.log(chisqs[:, i])
+        Parameters
+        ----------
+        field: `np.array`
+           Histogram (nrefmagbins, nchisqbins, nzbins) of galaxy counts
+        chisqbinsize: `float`
+           Bin size of the chisq (or lnchisq) axis
 
-            use, = np.where((lnchisqs >= self.lnchisqrange[0]) &
-                            (lnchisqs < self.lnchisqrange[1]) &
-                            (refmags >= self.refmagrange[0]) &
-                            (refmags < self.refmagrange[1]))
-            lnchisqpos = (lnchisqs[use] - self.lnchisqrange[0]) * self.nlnchisqbins / (self.lnchisqrange[1] - self.lnchisqrange[0])
+        Returns
+        -------
+        sigma: `np.array`
+           Background density, per unit area and bin size
+        """
+        binsizes = self.config.bkg_refmagbinsize * chisqbinsize
+
+        return field / (self.areas[:, np.newaxis, np.newaxis] * binsizes)
+
+    def _get_subreg_indices(self):
+        """
+        Get the galfile pixels in the configured sub-region.
+
+        Returns
+        -------
+        master: `redmapper.Entry`
+           Galfile master table
+        subreg_indices: `np.array`
+           Indices into the master table of the pixels in the sub-region
+        """
+        master = Entry.from_fits_file(self.config.galfile)
+
+        if len(self.config.d.hpix) > 0:
+            # We need to take a sub-region
+            theta, phi = hp.pix2ang(master.nside, master.hpix)
+            ipring_big = hp.ang2pix(self.config.d.nside, theta, phi)
+
+            _, subreg_indices = esutil.numpy_util.match(self.config.d.hpix, ipring_big)
+            subreg_indices = np.unique(subreg_indices)
+        else:
+            subreg_indices = np.arange(master.hpix.size)
+
+        return master, subreg_indices
+
+    def _galaxy_chunks(self, subreg_indices=None):
+        """
+        Generator over the galaxies in the (sub-region of the) galaxy catalog,
+        one galfile pixel (or self.natatime rows) at a time.
+
+        Parameters
+        ----------
+        subreg_indices: `np.array`, optional
+           Indices into the galfile master table of the pixels to read.
+           Default is None, which reads all pixels in the sub-region.
+
+        Yields
+        ------
+        gals: `redmapper.GalaxyCatalog`
+           Galaxy catalog for the chunk
+        """
+        if self.config.galfile_pixelized:
+            if subreg_indices is None:
+                master, subreg_indices = self._get_subreg_indices()
+            else:
+                master = Entry.from_fits_file(self.config.galfile)
+
+            for p in subreg_indices:
+                if master.ngals[p] == 0:
+                    continue
+
+                yield GalaxyCatalog.from_galfile(self.config.galfile, nside=master.nside,
+                                                 hpix=master.hpix[p], border=0.0)
+        else:
+            hdr = fitsio.read_header(self.config.galfile, ext=1)
+            ngal = hdr['NAXIS2']
+
+            for lo in xrange(0, ngal, self.natatime):
+                hi = min(lo + self.natatime, ngal)
+
+                yield GalaxyCatalog.from_fits_file(self.config.galfile, rows=np.arange(lo, hi))
+
+    def _accumulate_fields(self, chisqs, refmags, field_g, field_lng):
+        """
+        Add the cic counts of a set of galaxies to the chisq and lnchisq
+        histograms for a single redshift bin.
+
+        Parameters
+        ----------
+        chisqs: `np.array`
+           Float array of chi-squared values
+        refmags: `np.array`
+           Float array of reference magnitudes
+        field_g: `np.array`
+           Histogram (nrefmagbins, nchisqbins) of counts, modified in place
+        field_lng: `np.array`
+           Histogram (nrefmagbins, nlnchisqbins) of counts, modified in place
+        """
+        use, = np.where((chisqs >= self.chisqrange[0]) &
+                        (chisqs < self.chisqrange[1]) &
+                        (refmags >= self.refmagrange[0]) &
+                        (refmags < self.refmagrange[1]))
+        if use.size > 0:
+            chisqpos = (chisqs[use] - self.chisqrange[0]) * self.nchisqbins / (self.chisqrange[1] - self.chisqrange[0])
             refmagpos = (refmags[use] - self.refmagrange[0]) * self.nrefmagbins / (self.refmagrange[1] - self.refmagrange[0])
 
             value = np.ones(use.size)
 
-            field2 = cic(value, lnchisqpos, self.nlnchisqbins, refmagpos, self.nrefmagbins, isolated=True)
+            field_g += cic(value, chisqpos, self.nchisqbins, refmagpos, self.nrefmagbins, isolated=True)
 
-            for j in xrange(self.nlnchisqbins):
-                sigma_lng_sub[:, j, i] = field2[:, j] / (self.areas * lnbinsizes)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lnchisqs = np.log(chisqs)
 
-        self.config.logger.info("Finished %.4f < z < %.4f in %.1f seconds" % (zbins_use[0], zbins_use[-1],
-                                                                              time.time() - starttime))
+        use, = np.where((lnchisqs >= self.lnchisqrange[0]) &
+                        (lnchisqs < self.lnchisqrange[1]) &
+                        (refmags >= self.refmagrange[0]) &
+                        (refmags < self.refmagrange[1]))
+        if use.size > 0:
+            lnchisqpos = (lnchisqs[use] - self.lnchisqrange[0]) * self.nlnchisqbins / (self.lnchisqrange[1] - self.lnchisqrange[0])
+            refmagpos = (refmags[use] - self.refmagrange[0]) * self.nrefmagbins / (self.refmagrange[1] - self.refmagrange[0])
 
-        return (zbinmark, sigma_g_sub, sigma_lng_sub)
+            value = np.ones(use.size)
+
+            field_lng += cic(value, lnchisqpos, self.nlnchisqbins, refmagpos, self.nrefmagbins, isolated=True)
 
 class ZredBackgroundGenerator(object):
     """
@@ -655,62 +1024,40 @@ class ZredBackgroundGenerator(object):
         else:
             subreg_indices = np.arange(master.hpix.size)
 
-        ngal = np.sum(master.ngals[subreg_indices])
-        npix = subreg_indices.size
-
         starttime = time.time()
 
-        nmag = self.config.nmag
-        ncol = nmag - 1
-
-        zreds = np.zeros(ngal, dtype=np.float32) - 1.0
-        refmags = np.zeros(ngal, dtype=np.float32)
+        binsizes = self.config.bkg_refmagbinsize * self.config.bkg_zredbinsize
 
-        zbinmid = np.median(np.arange(zredstr.z.size, dtype=np.int32))
+        # Accumulate the cic counts pixel by pixel
+        field = np.zeros((nrefmagbins, nzredbins))
 
-        # Loop
-        ctr = 0
-        p = 0
-        while ((ctr < ngal) and (p < npix)):
-            if master.ngals[subreg_indices[p]] == 0:
-                p += 1
+        for p in subreg_indices:
+            if master.ngals[p] == 0:
                 continue
 
             gals = GalaxyCatalog.from_galfile(self.config.galfile, nside=master.nside,
-                                              hpix=master.hpix[subreg_indices[p]],
+                                              hpix=master.hpix[p],
                                               border=0.0,
                                               zredfile=self.config.zredfile)
 
-            use, = np.where(gals.chisq < maxchisq)
-
-            if use.size > 0:
-                lo = ctr
-                hi = ctr + use.size
-
-                inds = np.arange(lo, hi, dtype=np.int64)
-
-                refmags[inds] = gals.refmag[use]
-                zreds[inds] = gals.zred[use]
-
-            ctr += master.ngals[subreg_indices[p]]
-            p += 1
+            zreds = gals.zred.astype(np.float32)
+            refmags = gals.refmag.astype(np.float32)
 
-        # Compute cic
-        sigma_g = np.zeros((nrefmagbins, nzredbins))
-
-        binsizes = self.config.bkg_refmagbinsize * self.config.bkg_zredbinsize
+            use, = np.where((gals.chisq < maxchisq) &
+                            (zreds >= zredrange[0]) & (zreds < zredrange[1]) &
+                            (refmags > refmagrange[0]) & (refmags < refmagrange[1]))
 
-        use, = np.where((zreds >= zredrange[0]) & (zreds < zredrange[1]) &
-                        (refmags > refmagrange[0]) & (refmags < refmagrange[1]))
+            if use.size == 0:
+                continue
 
-        zredpos = (zreds[use] - zredrange[0]) * nzredbins / (zredrange[1] - zredrange[0])
-        refmagpos = (refmags[use] - refmagrange[0]) * nrefmagbins / (refmagrange[1] - refmagrange[0])
+            zredpos = (zreds[use] - zredrange[0]) * nzredbins / (zredrange[1] - zredrange[0])
+            refmagpos = (refmags[use] - refmagrange[0]) * nrefmagbins / (refmagrange[1] - refmagrange[0])
 
-        value = np.ones(use.size)
+            value = np.ones(use.size)
 
-        field = cic(value, zredpos, nzredbins, refmagpos, nrefmagbins, isolated=True)
+            field += cic(value, zredpos, nzredbins, refmagpos, nrefmagbins, isolated=True)
 
-        sigma_g[:, :] = field
+        sigma_g = np.zeros((nrefmagbins, nzredbins))
 
         for j in range(nzredbins):
             sigma_g[:, j] = np.clip(field[:, j], 0.1, None) / (areas * binsizes)
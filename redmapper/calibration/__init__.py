@@ -7,3 +7,4 @@ from .zlambdacal import ZLambdaCalibrator
 from .selectspecseeds import SelectSpecSeeds
 from .calibrate import RedmapperCalibrator
 from .prepmembers import PrepMembers
+from .taskgraph import CalibrationTask, CalibrationTaskGraph
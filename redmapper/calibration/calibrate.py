@@ -21,16 +21,122 @@ from .redsequencecal import RedSequenceCalibrator
 from .centeringcal import WcenCalibrator
 from .zlambdacal import ZLambdaCalibrator
 from .prepmembers import PrepMembers
+from .taskgraph import CalibrationTask, CalibrationTaskGraph
 from ..zred_runner import ZredRunCatalog, ZredRunPixels
 from ..background import BackgroundGenerator, ZredBackgroundGenerator
 from ..redmapper_run import RedmapperRun
 from ..zlambda import ZlambdaCorrectionPar
 from ..plotting import SpecPlot
-from ..mask import get_mask
+from ..mask import get_mask, maskgal_filename
 from ..run_colormem import RunColormem
 from ..utilities import getMemoryString
 from .._version import __version__
 
+def _fits_extnames(filename):
+    """
+    Get the extension names in a fits file.
+
+    Parameters
+    ----------
+    filename: `str`
+       Name of fits file
+
+    Returns
+    -------
+    extnames: `list`
+       List of extension names (empty if the file is not there)
+    """
+    if not os.path.isfile(filename):
+        return []
+
+    with fitsio.FITS(filename) as fits:
+        return [ext.get_extname() for ext in fits[1: ]]
+
+def _computes_zreds(config):
+    """
+    Check if the zred task computes the zreds in this process.
+
+    With a pixelized galfile and a sub-region, the zreds are run separately
+    (with a batch system) and the task makes no output.
+
+    Parameters
+    ----------
+    config: `redmapper.Configuration`
+       Configuration object
+
+    Returns
+    -------
+    computes: `bool`
+       True if the zreds are computed.
+    """
+    if not config.galfile_pixelized:
+        return True
+
+    hpix = config.hpix
+    if not isinstance(hpix, Iterable):
+        hpix = [hpix]
+
+    return len(hpix) == 0 or config.nside == 0
+
+def _select_spec_seeds(config, usetrain):
+    """
+    Calibration task to select the spectroscopic seeds.
+
+    Parameters
+    ----------
+    config: `redmapper.Configuration`
+       Configuration object, with the output in config.seedfile
+    usetrain: `bool`
+       Use spectra from config.specfile_train rather than config.specfile
+    """
+    if usetrain:
+        config.logger.info("Generating spectroscopic seeds (training spec)...")
+    else:
+        config.logger.info("Generating spectroscopic seeds (full spec)...")
+    sss = SelectSpecSeeds(config)
+    sss.run(usetrain=usetrain)
+
+def _seed_zreds(config, iter_seedfile, prev_catfile=None):
+    """
+    Calibration task to compute zreds for the spectroscopic seeds.
+
+    Parameters
+    ----------
+    config: `redmapper.Configuration`
+       Configuration object, with the seeds in config.seedfile
+    iter_seedfile: `str`
+       Output seed file with zreds
+    prev_catfile: `str`, optional
+       Cluster catalog from the previous iteration.  If set, the seeds
+       get the z_lambda of the matched clusters, to start z_lambda from.
+       Default is None.
+    """
+    config.logger.info("Generating iteration seedfile...")
+    seedzredfile = config.redmapper_filename('specseeds_zreds')
+    zredRuncat = ZredRunCatalog(config)
+    zredRuncat.run(config.seedfile, seedzredfile)
+
+    # Now combine seeds with zreds
+    seeds = Catalog.from_fits_file(config.seedfile, ext=1)
+    zreds = Catalog.from_fits_file(seedzredfile, ext=1)
+
+    seeds.zred = zreds.zred
+    seeds.zred_e = zreds.zred_e
+    seeds.zred_chisq = zreds.chisq
+
+    if prev_catfile is not None and os.path.isfile(prev_catfile):
+        config.logger.info("Starting z_lambda from %s" % (prev_catfile))
+        seeds = GalaxyCatalog(seeds._ndarray)
+        seeds.add_fields([('z_lambda', 'f4')])
+
+        cat = Catalog.from_fits_file(prev_catfile)
+        use, = np.where(cat.z_lambda > 0.0)
+
+        i0, i1, dd = seeds.match_many(cat.ra[use], cat.dec[use], 0.5/3600., maxmatch=1)
+        seeds.z_lambda[i1] = cat.z_lambda[use[i0]]
+
+    seeds.to_fits_file(iter_seedfile)
+
 class RedmapperCalibrator(object):
     """
     Class to perform red-sequence calibration
@@ -55,95 +161,126 @@ class RedmapperCalibrator(object):
     def run(self):
         """
         Run the red-sequence calibration.
+
+        Each stage of the calibration is run as a graph of tasks (see
+        `redmapper.calibration.CalibrationTaskGraph`), so that steps whose
+        inputs have not changed are skipped and independent steps can run
+        concurrently on config.calib_task_ncores cores.
         """
 
+        graph = CalibrationTaskGraph(self.config)
+
         # Select the red galaxies to start
         self.config.redgalfile = self.config.redmapper_filename('zspec_redgals')
         self.config.redgalmodelfile = self.config.redmapper_filename('zspec_redgals_model')
 
-        if os.path.isfile(self.config.redgalfile):
-            self.config.logger.info("%s already there.  Skipping..." % (self.config.redgalfile))
-        else:
-            self.config.logger.info("Selecting red galaxies from spectra...")
-            selred = SelectSpecRedGalaxies(self.config)
+        def _select_red_galaxies(config):
+            config.logger.info("Selecting red galaxies from spectra...")
+            selred = SelectSpecRedGalaxies(config)
             selred.run()
 
+        graph.add(CalibrationTask('redgals', _select_red_galaxies, self.config,
+                                  inputs=[self.config.specfile, self.config.galfile],
+                                  outputs=[self.config.redgalfile, self.config.redgalmodelfile]))
+
         # Make a color background
         self.config.bkgfile_color = self.config.redmapper_filename('bkg_color')
 
-        if os.path.isfile(self.config.bkgfile_color):
-            self.config.logger.info("%s already there.  Skipping..." % (self.config.bkgfile_color))
-        else:
-            self.config.logger.info("Constructing color background...")
-            cbg = ColorBackgroundGenerator(self.config)
+        def _color_background(config):
+            config.logger.info("Constructing color background...")
+            cbg = ColorBackgroundGenerator(config)
             cbg.run()
 
+        graph.add(CalibrationTask('bkg_color', _color_background, self.config,
+                                  inputs=[self.config.galfile],
+                                  outputs=[self.config.bkgfile_color]))
+
         # Generate maskgals
         self.config.maskgalfile = self.config.redmapper_filename('maskgals')
 
-        if os.path.isfile(self.config.maskgalfile):
-            self.config.logger.info("%s already there.  Skipping..." % (self.config.maskgalfile))
-        else:
-            self.config.logger.info("Constructing maskgals...")
+        def _maskgals(config):
+            config.logger.info("Constructing maskgals...")
             # This will generate the maskgalfile if it isn't found
-            mask = get_mask(self.config)
+            mask = get_mask(config)
+
+        graph.add(CalibrationTask('maskgals', _maskgals, self.config,
+                                  inputs=[self.config.maskfile, self.config.depthfile],
+                                  outputs=[maskgal_filename(self.config)],
+                                  nproc=self.config.calib_nproc))
 
         # Do the color-lambda training.
         self.config.zmemfile = self.config.redmapper_filename('iter0_colormem_pgt%4.2f_lamgt%02d' % (self.config.calib_pcut, self.config.calib_colormem_minlambda))
 
-        if os.path.isfile(self.config.zmemfile):
-            self.config.logger.info("%s already there.  Skipping..." % (self.config.zmemfile))
-        else:
-            self.config.logger.info("Doing color-lambda training...")
-            rcm = RunColormem(self.config)
+        def _colormem(config):
+            config.logger.info("Doing color-lambda training...")
+            rcm = RunColormem(config)
             rcm.run()
             rcm.output_training()
 
+        graph.add(CalibrationTask('colormem', _colormem, self.config,
+                                  inputs=[self.config.redgalfile, self.config.redgalmodelfile,
+                                          self.config.bkgfile_color, maskgal_filename(self.config)],
+                                  outputs=[self.config.zmemfile]))
+
         # Generate the spec seed file
         self.config.seedfile = self.config.redmapper_filename('specseeds_train')
 
-        if os.path.isfile(self.config.seedfile):
-            self.config.logger.info("%s already there.  Skipping..." % (self.config.seedfile))
-        else:
-            self.config.logger.info("Generating spectroscopic seeds (training spec)...")
-            sss = SelectSpecSeeds(self.config)
-            sss.run(usetrain=True)
+        graph.add(CalibrationTask('specseeds_train', _select_spec_seeds, self.config,
+                                  args=(True, ),
+                                  inputs=[self.config.specfile, self.config.specfile_train,
+                                          self.config.galfile],
+                                  outputs=[self.config.seedfile]))
+
+        graph.run()
+
         calib_iteration = RedmapperCalibrationIteration(self.config)
 
         for iteration in range(1, self.config.calib_niter + 1):
             # Run the calibration iteration
             calib_iteration.run(iteration)
 
+            graph = CalibrationTaskGraph(self.config)
+
             # Clean out the members
             # Note that the outbase is still the modified version
             redmapper_name = 'zmem_pgt%4.2f_lamgt%02d' % (self.config.calib_pcut, int(self.config.calib_minlambda))
             self.config.zmemfile = self.config.redmapper_filename(redmapper_name)
-            if os.path.isfile(self.config.zmemfile):
-                self.config.logger.info("%s already there.  Skipping..." % (self.config.zmemfile))
-            else:
-                self.config.logger.info("Preparing members for next calibration...")
+
+            def _prep_members(config):
+                config.logger.info("Preparing members for next calibration...")
                 ## FIXME
-                prep_members = PrepMembers(self.config)
+                prep_members = PrepMembers(config)
                 prep_members.run('z_init')
 
+            graph.add(CalibrationTask('prepmembers', _prep_members, self.config,
+                                      inputs=[self.config.catfile],
+                                      outputs=[self.config.zmemfile]))
+
             # Reset outbase here
             self.config.d.outbase = self.config.outbase
 
             if iteration == 1:
                 # If this is the first iteration, generate a new seedfile
                 new_seedfile = self.config.redmapper_filename('cut_specseeds')
-                if os.path.isfile(new_seedfile):
-                    self.config.logger.info("%s already there.  Skipping..." % (new_seedfile))
-                else:
-                    self.config.logger.info("Generating cut specseeds...")
-                    seeds = GalaxyCatalog.from_fits_file(self.config.seedfile)
-                    cat = GalaxyCatalog.from_fits_file(self.config.catfile)
 
-                    use, = np.where(cat.Lambda > self.config.percolation_minlambda)
+                def _cut_specseeds(config, new_seedfile):
+                    config.logger.info("Generating cut specseeds...")
+                    seeds = GalaxyCatalog.from_fits_file(config.seedfile)
+                    cat = GalaxyCatalog.from_fits_file(config.catfile)
+
+                    use, = np.where(cat.Lambda > config.percolation_minlambda)
 
                     i0, i1, dd = seeds.match_many(cat.ra[use], cat.dec[use], 0.5/3600., maxmatch=1)
                     seeds.to_fits_file(new_seedfile, indices=i1)
 
+                graph.add(CalibrationTask('cut_specseeds', _cut_specseeds, self.config,
+                                          args=(new_seedfile, ),
+                                          inputs=[self.config.seedfile, self.config.catfile],
+                                          outputs=[new_seedfile]))
+
+            graph.run()
+
+            if iteration == 1:
                 self.config.seedfile = new_seedfile
 
         # Prep for final iteration
@@ -151,12 +288,13 @@ class RedmapperCalibrator(object):
         # Generate full specseeds...
         self.config.seedfile = self.config.redmapper_filename('specseeds')
 
-        if os.path.isfile(self.config.seedfile):
-            self.config.logger.info("%s already there.  Skipping..." % (self.config.seedfile))
-        else:
-            self.config.logger.info("Generating spectroscopic seeds (full spec)...")
-            sss = SelectSpecSeeds(self.config)
-            sss.run(usetrain=False)
+        graph = CalibrationTaskGraph(self.config)
+        graph.add(CalibrationTask('specseeds', _select_spec_seeds, self.config,
+                                  args=(False, ),
+                                  inputs=[self.config.specfile, self.config.galfile,
+                                          self.config.zredfile],
+                                  outputs=[self.config.seedfile]))
+        graph.run()
 
         calib_iteration_final = RedmapperCalibrationIterationFinal(self.config)
         calib_iteration_final.run(self.config.calib_niter)
@@ -312,19 +450,41 @@ class RedmapperCalibrationIteration(object):
            Iteration number.
         """
 
+        graph = CalibrationTaskGraph(self.config)
+
+        # When warm-starting, we reuse what we can from the previous iteration
+        if self.config.calib_warmstart and iteration > 1:
+            prev_outbase = '%s_iter%d' % (self.config.outbase, iteration - 1)
+            prev_parfile = self.config.redmapper_filename('pars', outbase=prev_outbase)
+            if self.config.galfile_pixelized:
+                prev_zredfile = self.config.redmapper_filename('zreds_master_table', paths=(prev_outbase, ),
+                                                               outbase=prev_outbase)
+            else:
+                prev_zredfile = self.config.redmapper_filename('zreds', outbase=prev_outbase)
+            prev_bkgfile = self.config.redmapper_filename('bkg', outbase=prev_outbase)
+            prev_finalfile = self.config.redmapper_filename('final', outbase=prev_outbase)
+        else:
+            prev_parfile = None
+            prev_zredfile = None
+            prev_bkgfile = None
+            prev_finalfile = None
+
         # Generate the name of the parfile
         self.config.d.outbase = '%s_iter%d' % (self.config.outbase, iteration)
 
         self.config.parfile = self.config.redmapper_filename('pars')
 
         # Run the red sequence calibration
-        if os.path.isfile(self.config.parfile):
-            self.config.logger.info("%s already there.  Skipping..." % (self.config.parfile))
-        else:
-            self.config.logger.info("Running red sequence calibration...")
-            redsequencecal = RedSequenceCalibrator(self.config, self.config.zmemfile)
+        def _redsequencecal(config):
+            config.logger.info("Running red sequence calibration...")
+            redsequencecal = RedSequenceCalibrator(config, config.zmemfile)
             redsequencecal.run()
 
+        graph.add(CalibrationTask('pars', _redsequencecal, self.config,
+                                  inputs=[self.config.zmemfile, self.config.bkgfile_color],
+                                  outputs=[self.config.parfile],
+                                  nproc=self.config.calib_nproc))
+
         # Make the "sz" file (I think maybe I can skip this)
 
         # Compute zreds based on the type of galaxy file
@@ -333,64 +493,62 @@ class RedmapperCalibrationIteration(object):
         else:
             self.config.zredfile = self.config.redmapper_filename('zreds')
 
-        if os.path.isfile(self.config.zredfile):
-            self.config.logger.info("%s already there.  Skipping..." % (self.config.zredfile))
-        else:
-            self.config.logger.info("Computing zreds for all galaxies in the training region...")
-            self.config.d.hpix = self.config.hpix
-            self.config.d.nside = self.config.nside
+        def _zreds(config, prev_zredfile, prev_parfile):
+            config.logger.info("Computing zreds for all galaxies in the training region...")
+            config.d.hpix = config.hpix
+            config.d.nside = config.nside
 
-            if self.config.galfile_pixelized:
+            if config.galfile_pixelized:
 
                 #@jacobic: Run check to see if we can use sbatch system to speed things up!
-                hpix = self.config.hpix
-
-                if not isinstance(hpix, Iterable):
-                    _hpix = [hpix]
-                else:
-                    _hpix = hpix
-
-                if len(_hpix) == 0 or self.config.nside == 0:
+                if _computes_zreds(config):
                     yml = f'run_zred_iter{iteration}.yml'
-                    self.config.output_yaml(yml)
-                    self.config.logger.info(f"Please run zreds using {yml} with a batch system to continue.")
-                    self.config.logger.info("ZredRunPixels")
-                    zredRunpix = ZredRunPixels(self.config)
-                    zredRunpix.run()
+                    config.output_yaml(yml)
+                    config.logger.info(f"Please run zreds using {yml} with a batch system to continue.")
+                    config.logger.info("ZredRunPixels")
+                    zredRunpix = ZredRunPixels(config)
+                    zredRunpix.run(prev_zredfile=prev_zredfile, prev_parfile=prev_parfile)
             else:
-                zredRuncat = ZredRunCatalog(self.config)
-                self.config.logger.info("ZredRunCatalog")
-                zredRuncat.run(self.config.galfile, self.config.zredfile)
+                zredRuncat = ZredRunCatalog(config)
+                config.logger.info("ZredRunCatalog")
+                zredRuncat.run(config.galfile, config.zredfile,
+                               prev_zredfile=prev_zredfile, prev_parfile=prev_parfile)
+
+        graph.add(CalibrationTask('zreds', _zreds, self.config,
+                                  args=(prev_zredfile, prev_parfile),
+                                  inputs=[self.config.parfile, prev_parfile, prev_zredfile],
+                                  outputs=[self.config.zredfile] if _computes_zreds(self.config) else [],
+                                  nproc=self.config.calib_nproc))
 
         # Compute the chisq background
         self.config.bkgfile = self.config.redmapper_filename('bkg')
 
         # There are two extensions here, so we need to be careful
-        calc_bkg = False
-        calc_zred_bkg = False
-        if not os.path.isfile(self.config.bkgfile):
-            calc_bkg = True
-            calc_zred_bkg = True
-        else:
-            with fitsio.FITS(self.config.bkgfile) as fits:
-                if 'CHISQBKG' not in [ext.get_extname() for ext in fits[1: ]]:
-                    calc_bkg = True
-                else:
-                    self.config.logger.info("Found CHISQBKG in %s.  Skipping..." % (self.config.bkgfile))
-                if 'ZREDBKG' not in [ext.get_extname() for ext in fits[1: ]]:
-                    calc_zred_bkg = True
-                else:
-                    self.config.logger.info("Found ZREDBKG in %s.  Skipping..." % (self.config.bkgfile))
-
-        if calc_bkg:
-            self.config.logger.info("Generating chisq background...")
-            bkg_gen = BackgroundGenerator(self.config)
-            bkg_gen.run()
+        def _background(config, prev_bkgfile, prev_parfile):
+            extnames = _fits_extnames(config.bkgfile)
 
-        if calc_zred_bkg:
-            self.config.logger.info("Generating zred background...")
-            zbkg_gen = ZredBackgroundGenerator(self.config)
-            zbkg_gen.run()
+            if 'CHISQBKG' in extnames:
+                config.logger.info("Found CHISQBKG in %s.  Skipping..." % (config.bkgfile))
+            else:
+                config.logger.info("Generating chisq background...")
+                bkg_gen = BackgroundGenerator(config)
+                bkg_gen.run(prev_bkgfile=prev_bkgfile, prev_parfile=prev_parfile)
+
+            if 'ZREDBKG' in extnames:
+                config.logger.info("Found ZREDBKG in %s.  Skipping..." % (config.bkgfile))
+            else:
+                config.logger.info("Generating zred background...")
+                zbkg_gen = ZredBackgroundGenerator(config)
+                zbkg_gen.run()
+
+        bkgfile = self.config.bkgfile
+        graph.add(CalibrationTask('bkg', _background, self.config,
+                                  args=(prev_bkgfile, prev_parfile),
+                                  inputs=[self.config.parfile, self.config.zredfile,
+                                          prev_parfile, prev_bkgfile],
+                                  outputs=[self.config.bkgfile],
+                                  nproc=self.config.calib_nproc,
+                                  complete=lambda: {'CHISQBKG', 'ZREDBKG'} <= set(_fits_extnames(bkgfile))))
 
         # Set the centering function
         centerclass = copy.deepcopy(self.config.centerclass)
@@ -404,53 +562,44 @@ class RedmapperCalibrationIteration(object):
         # This is the iteration seedfile
         iter_seedfile = self.config.redmapper_filename('specseeds')
 
-        if os.path.isfile(iter_seedfile):
-            self.config.logger.info('%s already there.  Skipping...' % (iter_seedfile))
-        else:
-            self.config.logger.info("Generating iteration seedfile...")
-            seedzredfile = self.config.redmapper_filename('specseeds_zreds')
-            zredRuncat = ZredRunCatalog(self.config)
-            zredRuncat.run(self.config.seedfile, seedzredfile)
-
-            # Now combine seeds with zreds
-            seeds = Catalog.from_fits_file(self.config.seedfile, ext=1)
-            zreds = Catalog.from_fits_file(seedzredfile, ext=1)
-
-            seeds.zred = zreds.zred
-            seeds.zred_e = zreds.zred_e
-            seeds.zred_chisq = zreds.chisq
-
-            seeds.to_fits_file(iter_seedfile)
-
+        graph.add(CalibrationTask('specseeds', _seed_zreds, self.config,
+                                  args=(iter_seedfile, prev_finalfile),
+                                  inputs=[self.config.parfile, self.config.seedfile, prev_finalfile],
+                                  outputs=[iter_seedfile],
+                                  nproc=self.config.calib_nproc))
 
         # Run the cluster finder in specmode (And consolidate likelihoods)
         finalfile = self.config.redmapper_filename('final')
+        likefile = self.config.redmapper_filename('like')
+        self.config.zlambdafile = None
 
-        if os.path.isfile(finalfile):
-            self.config.logger.info('%s already there.  Skipping...' % (finalfile))
-        else:
-            self.config.logger.info("Running redmapper in specmode with seeds...")
-            self.config.zlambdafile = None
+        def _specmode_run(config, iter_seedfile, finalfile):
+            config.logger.info("Running redmapper in specmode with seeds...")
 
-            redmapper_run = RedmapperRun(self.config)
+            redmapper_run = RedmapperRun(config)
             catfile, likefile = redmapper_run.run(specmode=True, keepz=True, consolidate_like=True, seedfile=iter_seedfile, cleaninput=True)
             # check that catfile is the same as finalfile?
             if catfile != finalfile:
                 raise RuntimeError("The output catfile %s should be the same as finalfile %s" % (catfile, finalfile))
 
+        graph.add(CalibrationTask('final', _specmode_run, self.config,
+                                  args=(iter_seedfile, finalfile),
+                                  inputs=[self.config.parfile, self.config.zredfile,
+                                          self.config.bkgfile, iter_seedfile],
+                                  outputs=[finalfile],
+                                  nproc=self.config.calib_run_nproc))
+
         # If it's the first iteration, calibrate random and satellite w functions
         if iteration == 1:
             sublikefile = self.config.redmapper_filename('sub_like')
 
-            if os.path.isfile(sublikefile):
-                self.config.logger.info('%s already there.  Skipping...' % (sublikefile))
-            else:
+            def _sub_like(config, likefile, finalfile, sublikefile):
                 # Generate a subset of the likelihood file...
                 # Read these as GalaxyCatalogs to do matching
-                lcat = GalaxyCatalog.from_fits_file(self.config.redmapper_filename('like'))
+                lcat = GalaxyCatalog.from_fits_file(likefile)
                 pcat = GalaxyCatalog.from_fits_file(finalfile)
 
-                use, = np.where(pcat.Lambda > self.config.percolation_minlambda)
+                use, = np.where(pcat.Lambda > config.percolation_minlambda)
 
                 # matching...
                 i0, i1, dd = lcat.match_many(pcat.ra[use], pcat.dec[use], 0.5/3600., maxmatch=1)
@@ -459,31 +608,39 @@ class RedmapperCalibrationIteration(object):
 
                 sublcat.to_fits_file(sublikefile)
 
+            graph.add(CalibrationTask('sub_like', _sub_like, self.config,
+                                      args=(likefile, finalfile, sublikefile),
+                                      inputs=[likefile, finalfile],
+                                      outputs=[sublikefile]))
+
+            def _percolation(config, message):
+                config.logger.info(message)
+                redmapper_run = RedmapperRun(config)
+                redmapper_run.run(check=True, percolation_only=True, keepz=True, cleaninput=True)
+
             outbase = self.config.d.outbase
 
             self.config.d.outbase = '%s_rand' % (outbase)
             catfile_for_rand_calib = self.config.redmapper_filename('final')
-            if os.path.isfile(catfile_for_rand_calib):
-                self.config.logger.info('%s already there.  Skipping...' % (catfile_for_rand_calib))
-            else:
-                self.config.logger.info("Running percolation for random centers...")
-                self.config.catfile = sublikefile
-                self.config.centerclass = 'CenteringRandom'
+            self.config.catfile = sublikefile
+            self.config.centerclass = 'CenteringRandom'
 
-                redmapper_run = RedmapperRun(self.config)
-                redmapper_run.run(check=True, percolation_only=True, keepz=True, cleaninput=True)
+            graph.add(CalibrationTask('rand', _percolation, self.config,
+                                      args=("Running percolation for random centers...", ),
+                                      inputs=[sublikefile],
+                                      outputs=[catfile_for_rand_calib],
+                                      nproc=self.config.calib_run_nproc))
 
             self.config.d.outbase = '%s_randsat' % (outbase)
             catfile_for_randsat_calib = self.config.redmapper_filename('final')
-            if os.path.isfile(catfile_for_randsat_calib):
-                self.config.logger.info('%s already there.  Skipping...' % (catfile_for_randsat_calib))
-            else:
-                self.config.logger.info("Running percolation for random satellite centers...")
-                self.config.catfile = sublikefile
-                self.config.centerclass = 'CenteringRandomSatellite'
+            self.config.catfile = sublikefile
+            self.config.centerclass = 'CenteringRandomSatellite'
 
-                redmapper_run = RedmapperRun(self.config)
-                redmapper_run.run(check=True, percolation_only=True, keepz=True, cleaninput=True)
+            graph.add(CalibrationTask('randsat', _percolation, self.config,
+                                      args=("Running percolation for random satellite centers...", ),
+                                      inputs=[sublikefile],
+                                      outputs=[catfile_for_randsat_calib],
+                                      nproc=self.config.calib_run_nproc))
 
             # Reset outbase
             self.config.d.outbase = outbase
@@ -496,46 +653,46 @@ class RedmapperCalibrationIteration(object):
         self.config.catfile = finalfile
         self.config.wcenfile = self.config.redmapper_filename('wcen')
 
-        if os.path.isfile(self.config.wcenfile):
-            self.config.logger.info('%s already there.  Skipping...' % (self.config.wcenfile))
-        else:
-            self.config.logger.info("Calibrating Wcen")
-            wc = WcenCalibrator(self.config, iteration,
+        def _wcen(config):
+            config.logger.info("Calibrating Wcen")
+            wc = WcenCalibrator(config, iteration,
                                 randcatfile=catfile_for_rand_calib,
                                 randsatcatfile=catfile_for_randsat_calib)
             wc.run()
 
-        self.config.set_wcen_vals()
+        graph.add(CalibrationTask('wcen', _wcen, self.config,
+                                  inputs=[self.config.parfile, self.config.bkgfile, finalfile,
+                                          catfile_for_rand_calib, catfile_for_randsat_calib],
+                                  outputs=[self.config.wcenfile]))
 
         # Calibrate zlambda correction
         self.config.zlambdafile = self.config.redmapper_filename('zlambda')
 
-        if os.path.isfile(self.config.zlambdafile):
-            self.config.logger.info('%s already there.  Skipping...' % (self.config.zlambdafile))
-        else:
-            self.config.logger.info("Calibrating zlambda corrections...")
-            zlambdacal = ZLambdaCalibrator(self.config, corrslope=False)
+        def _zlambdacal(config):
+            config.logger.info("Calibrating zlambda corrections...")
+            zlambdacal = ZLambdaCalibrator(config, corrslope=False)
             zlambdacal.run()
 
+        graph.add(CalibrationTask('zlambda', _zlambdacal, self.config,
+                                  inputs=[finalfile],
+                                  outputs=[self.config.zlambdafile]))
+
         # Make pretty plots showing performance
-        spec_plot = SpecPlot(self.config)
-        if os.path.isfile(spec_plot.filename):
-            self.config.logger.info("%s already there.  Skipping..." % (spec_plot.filename))
-        else:
-            self.config.logger.info("Correcting redshifts and making spec plot...")
+        def _spec_plot(config):
+            config.logger.info("Correcting redshifts and making spec plot...")
             # We need to do a final run to apply the corrections, but this
             # seems inefficient...
 
             # Load in the catalog, apply the corrections, and make the plot.
-            self.config.logger.info(self.config.catfile)
-            cat = Catalog.from_fits_file(self.config.catfile)
+            config.logger.info(config.catfile)
+            cat = Catalog.from_fits_file(config.catfile)
 
             # Compute offsets for all marginal clusters to check for errors
-            use, = np.where(cat.Lambda > self.config.calib_minlambda)
+            use, = np.where(cat.Lambda > config.calib_minlambda)
             cat = cat[use]
 
-            zlambda_corr = ZlambdaCorrectionPar(parfile=self.config.zlambdafile,
-                                                zlambda_pivot=self.config.zlambda_pivot)
+            zlambda_corr = ZlambdaCorrectionPar(parfile=config.zlambdafile,
+                                                zlambda_pivot=config.zlambda_pivot)
             zlold = cat.z_lambda
             zleold = cat.z_lambda_e
 
@@ -552,9 +709,18 @@ class RedmapperCalibrationIteration(object):
                                    "config.calib_zlambda_nodesize.")
 
             # Only plot those above the specified threshold
-            use, = np.where(cat.Lambda > self.config.calib_zlambda_minlambda)
+            use, = np.where(cat.Lambda > config.calib_zlambda_minlambda)
+
+            spec_plot = SpecPlot(config)
+            spec_plot.plot_values(cat.z_spec_init[use], cat.z_lambda[use], cat.z_lambda_e[use], title=config.d.outbase)
 
-            spec_plot.plot_values(cat.z_spec_init[use], cat.z_lambda[use], cat.z_lambda_e[use], title=self.config.d.outbase)
+        graph.add(CalibrationTask('spec_plot', _spec_plot, self.config,
+                                  inputs=[finalfile, self.config.zlambdafile],
+                                  outputs=[SpecPlot(self.config).filename]))
+
+        graph.run()
+
+        self.config.set_wcen_vals()
 
 
 class RedmapperCalibrationIterationFinal(object):
@@ -588,58 +754,57 @@ class RedmapperCalibrationIterationFinal(object):
            Iteration number.  Used for naming files.
         """
 
+        graph = CalibrationTaskGraph(self.config)
+
         # Generate the names
         self.config.d.outbase = '%s_iter%db' % (self.config.outbase, iteration)
 
         # Generate zreds for the specseeds
         iter_seedfile = self.config.redmapper_filename('specseeds')
 
-        if os.path.isfile(iter_seedfile):
-            self.config.logger.info('%s already there.  Skipping...'  % (iter_seedfile))
-        else:
-            self.config.logger.info("Creating final iteration seeds...")
-            seedzredfile = self.config.redmapper_filename('specseeds_zreds')
-            zredRuncat = ZredRunCatalog(self.config)
-            zredRuncat.run(self.config.seedfile, seedzredfile)
-
-            # Now combine seeds with zreds
-            seeds = Catalog.from_fits_file(self.config.seedfile, ext=1)
-            zreds = Catalog.from_fits_file(seedzredfile, ext=1)
-
-            seeds.zred = zreds.zred
-            seeds.zred_e = zreds.zred_e
-            seeds.zred_chisq = zreds.chisq
-
-            seeds.to_fits_file(iter_seedfile)
+        graph.add(CalibrationTask('specseeds', _seed_zreds, self.config,
+                                  args=(iter_seedfile, ),
+                                  inputs=[self.config.parfile, self.config.seedfile],
+                                  outputs=[iter_seedfile],
+                                  nproc=self.config.calib_nproc))
 
         # Do the full run with these seeds
         # and the previously calibrated zlambda correction (which is what's used)
 
         finalfile = self.config.redmapper_filename('final')
 
-        if os.path.isfile(finalfile):
-            self.config.logger.info('%s already there.  Skipping...' % (finalfile))
-        else:
-            self.config.logger.info("Doing final iteration run")
-            redmapper_run = RedmapperRun(self.config)
+        def _final_run(config, iter_seedfile, finalfile):
+            config.logger.info("Doing final iteration run")
+            redmapper_run = RedmapperRun(config)
             catfile = redmapper_run.run(seedfile=iter_seedfile, cleaninput=True)
             # check that catfile is the same as finalfile?
             if catfile != finalfile:
                 raise RuntimeError("The output catfile %s should be the same as finalfile %s" % (catfile, finalfile))
 
+        graph.add(CalibrationTask('final', _final_run, self.config,
+                                  args=(iter_seedfile, finalfile),
+                                  inputs=[self.config.parfile, self.config.zredfile,
+                                          self.config.bkgfile, self.config.wcenfile,
+                                          self.config.zlambdafile, iter_seedfile],
+                                  outputs=[finalfile],
+                                  nproc=self.config.calib_run_nproc))
+
         self.config.catfile = finalfile
 
         # And pretty plots
-        spec_plot = SpecPlot(self.config)
-        if os.path.isfile(spec_plot.filename):
-            self.config.logger.info("%s already there.  Skipping..." % (spec_plot.filename))
-        else:
-            self.config.logger.info("Making final iteration spec plot...")
+        def _spec_plot(config):
+            config.logger.info("Making final iteration spec plot...")
             # We do not need to do the corrections for the final run (which has them, I hope)
 
-            cat = Catalog.from_fits_file(self.config.catfile)
-            use, = np.where(cat.Lambda > self.config.calib_zlambda_minlambda)
+            cat = Catalog.from_fits_file(config.catfile)
+            use, = np.where(cat.Lambda > config.calib_zlambda_minlambda)
             cat = cat[use]
 
-            spec_plot.plot_values(cat.z_spec_init, cat.z_lambda, cat.z_lambda_e, title=self.config.d.outbase)
+            spec_plot = SpecPlot(config)
+            spec_plot.plot_values(cat.z_spec_init, cat.z_lambda, cat.z_lambda_e, title=config.d.outbase)
+
+        graph.add(CalibrationTask('spec_plot', _spec_plot, self.config,
+                                  inputs=[finalfile],
+                                  outputs=[SpecPlot(self.config).filename]))
 
+        graph.run()
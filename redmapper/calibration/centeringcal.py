@@ -11,13 +11,14 @@ import time
 import scipy.optimize
 
 from ..configuration import Configuration
-from ..utilities import sample_from_pdf, histoGauss, chisq_pdf
+from ..utilities import sample_from_pdf, histoGauss, chisq_pdf, make_rng
 from ..redsequence import RedSequenceColorPar
 from ..background import Background
 from ..cluster import ClusterCatalog
 from ..galaxy import GalaxyCatalog
+from ..fitters import Fitter
 
-class WcenFgFitter(object):
+class WcenFgFitter(Fitter):
     """
     Class to fit the wcen foreground or satellite model.
     """
@@ -52,6 +53,8 @@ class WcenFgFitter(object):
            Best-fit parameters
         """
 
+        # The simplex fit uses no gradient: the cost has a step penalty
+        # for a negative width, which a gradient cannot see.
         pars = scipy.optimize.fmin(self, p0, disp=False, xtol=1e-5, ftol=1e-5)
 
         return pars
@@ -81,7 +84,7 @@ class WcenFgFitter(object):
 
         return t
 
-class WcenCFitter(object):
+class WcenCFitter(Fitter):
     """
     Class to fit the mean magnitude model of the central galaxies.
     """
@@ -137,6 +140,8 @@ class WcenCFitter(object):
            Best fit parameters
         """
 
+        # The simplex fit uses no gradient: the cost has a step penalty
+        # for a negative width, which a gradient cannot see.
         pars = scipy.optimize.fmin(self, p0, disp=False, xtol=1e-5, ftol=1e-5)
 
         return pars
@@ -174,7 +179,7 @@ class WcenCFitter(object):
 
         return t
 
-class WcenCwFitter(object):
+class WcenCwFitter(Fitter):
     """
     Class to fit f(w) model for central galaxies
     """
@@ -220,6 +225,8 @@ class WcenCwFitter(object):
            Best fit parameters
         """
 
+        # The simplex fit uses no gradient: the cost has a step penalty
+        # for a negative width, which a gradient cannot see.
         pars = scipy.optimize.fmin(self, p0, disp=False, xtol=1e-5, ftol=1e-5)
 
         return pars
@@ -474,7 +481,7 @@ class WcenCalibrator(object):
             ntrial = 5000
             nlambdas = 9
 
-        mag = np.zeros(nmag)
+        rng = make_rng(self.config.rng_seed)
 
         mstar = 0.0
         mrange = -2.5 * np.log10(np.array([10.0, 0.2]))
@@ -483,28 +490,49 @@ class WcenCalibrator(object):
         def schechter(x, alpha=-1.0, mstar=0.0):
             return 10.**(0.4*(alpha + 1.0)*(mstar - x)) * np.exp(-10.**(0.4*(mstar - x)))
 
-        mag = sample_from_pdf(schechter, mrange, step, nmag, alpha=self.config.calib_lumfunc_alpha, mstar=mstar)
+        mag = sample_from_pdf(schechter, mrange, step, nmag, rng=rng,
+                              alpha=self.config.calib_lumfunc_alpha, mstar=mstar)
 
         # We want to sample lambda galaxies from a schechter function...
         # And figure out the 3 brightest galaxies (m1, m2, m3)
 
         lambdas = np.linspace(20, 100, num=nlambdas, dtype=np.int32)
+        nsubs = lambdas - 1
+
+        # Each trial takes a random permutation of the sampled magnitudes
+        # (argsort of nmag uniform deviates), and each richness uses the
+        # leading nsubs[j] galaxies of the permutation.  Only the leading
+        # nsubs.max() elements of each permutation are needed, which we get
+        # with argpartition for a block of trials at a time.  The deviates
+        # are drawn in the same order as one rand(nmag) call per trial.
+        # The brightest galaxies of a subset are then those with the
+        # smallest magnitude ranks.
+        order = np.argsort(mag, kind='mergesort')
+        mag_sorted = mag[order]
+        rank = np.zeros(nmag, dtype=np.int64)
+        rank[order] = np.arange(nmag)
+
+        nsub_max = nsubs.max()
+        nblock = max(1, 10000000 // nmag)
 
         m1 = np.zeros((nlambdas, ntrial))
         m2 = np.zeros_like(m1)
         m3 = np.zeros_like(m1)
 
-        for i in xrange(ntrial):
-            r = np.random.rand(nmag)
-            st = np.argsort(r)
+        for i0 in xrange(0, ntrial, nblock):
+            i1 = min(i0 + nblock, ntrial)
+
+            r = rng.random(size=(i1 - i0, nmag))
+            lead = np.argpartition(r, nsub_max - 1, axis=1)[:, :nsub_max]
+            st = np.argsort(np.take_along_axis(r, lead, axis=1), axis=1)
+            ranks = rank[np.take_along_axis(lead, st, axis=1)]
 
             for j in xrange(nlambdas):
-                u = st[0:lambdas[j] - 1]
-                st2 = np.argsort(mag[u])
+                brightest = np.sort(np.partition(ranks[:, :nsubs[j]], 2, axis=1)[:, :3], axis=1)
 
-                m1[j, i] = mag[u[st2[0]]]
-                m2[j, i] = mag[u[st2[1]]]
-                m3[j, i] = mag[u[st2[2]]]
+                m1[j, i0: i1] = mag_sorted[brightest[:, 0]]
+                m2[j, i0: i1] = mag_sorted[brightest[:, 1]]
+                m3[j, i0: i1] = mag_sorted[brightest[:, 2]]
 
         mmstar1_mean = np.zeros(nlambdas)
         mmstar1_sigma = np.zeros(nlambdas)
@@ -8,6 +8,8 @@ import os
 import numpy as np
 import fitsio
 import time
+import copy
+from multiprocessing import Pool
 from scipy.optimize import least_squares
 
 from ..configuration import Configuration
@@ -17,7 +19,109 @@ from ..color_background import ColorBackground
 from ..galaxy import GalaxyCatalog
 from ..catalog import Catalog, Entry
 from ..zred_color import ZredColor
-from ..utilities import make_nodes, CubicSpline, interpol, RedGalInitialColors
+from ..utilities import make_nodes, CubicSpline, CubicSplineEvaluator, interpol, RedGalInitialColors, mag_to_lup
+
+class DiagonalLupcorrCalculator(object):
+    """
+    Class to compute luptitude color corrections for the training galaxies
+    while the diagonal red-sequence model is being fit one color at a time.
+
+    The model magnitudes and luptitudes of every band are cached between
+    calls, so each update only converts the one band that depends on the
+    color being fit.  The spline evaluations (at the fixed galaxy
+    redshifts) are only redone for the parameters (cvals or svals) that
+    changed since the last call, and an unchanged color returns its cached
+    correction.
+    """
+    def __init__(self, config, gals, dmags):
+        """
+        Instantiate a DiagonalLupcorrCalculator.
+
+        Parameters
+        ----------
+        config: `redmapper.Configuration`
+           Configuration object, with b values and ref_ind
+        gals: `redmapper.GalaxyCatalog`
+           Galaxy catalog being fit
+        dmags: `np.array`
+           Float array of refmag - pivotmag
+        """
+        self.b = config.b
+        self.z = gals.z
+        self.dmags = dmags
+
+        self.mags = np.zeros((gals.size, config.nmag))
+        self.lups = np.zeros_like(self.mags)
+
+        self.mags[:, config.ref_ind] = gals.mag[:, config.ref_ind]
+        self.lups[:, config.ref_ind] = mag_to_lup(self.mags[:, config.ref_ind], self.b[config.ref_ind])
+
+        # Incremented each time a band's magnitudes change
+        self._band_version = np.zeros(config.nmag, dtype=np.int64)
+        self._cache = {}
+
+    def compute(self, j, mind, sign, cnodes, cvals, snodes, svals):
+        """
+        Compute the luptitude correction for a single color.
+
+        Parameters
+        ----------
+        j: `int`
+           Color index
+        mind: `int`
+           Magnitude index to update from color j
+        sign: `int`, -1 or 1
+           Sign of color; -1 if band is redder than ref_ind,
+           +1 if band is bluer than ref_ind
+        cnodes: `np.array`
+           Float array of color nodes
+        cvals: `np.array`
+           Float array of spline values for color at pivotmag
+        snodes: `np.array`
+           Float array of slope nodes
+        svals: `np.array`
+           Float array of slope values
+
+        Returns
+        -------
+        lupcorr: `np.array`
+           Float array of luptitude color corrections
+        """
+        cache = self._cache.setdefault(j, {})
+
+        inputs_same = (cache.get('cvals') is not None and
+                       np.array_equal(cache['cvals'], cvals) and
+                       np.array_equal(cache['svals'], svals) and
+                       cache['versions'] == (self._band_version[mind + sign],
+                                             self._band_version[j],
+                                             self._band_version[j + 1]))
+        if inputs_same:
+            return cache['lupcorr']
+
+        if 'cspl' not in cache:
+            cache['cspl'] = CubicSplineEvaluator(cnodes, self.z)
+            cache['sspl'] = CubicSplineEvaluator(snodes, self.z)
+
+        if cache.get('cvals') is None or not np.array_equal(cache['cvals'], cvals):
+            cache['cv'] = cache['cspl'](cvals)
+            cache['cvals'] = np.array(cvals, copy=True)
+        if cache.get('svals') is None or not np.array_equal(cache['svals'], svals):
+            cache['svdmags'] = cache['sspl'](svals) * self.dmags
+            cache['svals'] = np.array(svals, copy=True)
+
+        self.mags[:, mind] = self.mags[:, mind + sign] + sign * (cache['cv'] + cache['svdmags'])
+        self.lups[:, mind] = mag_to_lup(self.mags[:, mind], self.b[mind])
+        self._band_version[mind] += 1
+
+        magcol = self.mags[:, j] - self.mags[:, j + 1]
+        lupcol = self.lups[:, j] - self.lups[:, j + 1]
+
+        cache['lupcorr'] = lupcol - magcol
+        cache['versions'] = (self._band_version[mind + sign],
+                             self._band_version[j],
+                             self._band_version[j + 1])
+
+        return cache['lupcorr']
 
 class RedSequenceCalibrator(object):
     """
@@ -311,54 +415,6 @@ class RedSequenceCalibrator(object):
         else:
             return cvals, svals, evals
 
-    def _compute_single_lupcorr(self, j, cvals, svals, gals, dmags, mags, lups, mind, sign):
-        """
-        Compute the luptitude correction for a single color
-
-        Parameters
-        ----------
-        j: `int`
-           Color index
-        cvals: `np.array`
-           Float array of spline values for color at pivotmag
-        svals: `np.array`
-           Float array of slope values
-        gals: `redmapper.GalaxyCatalog`
-           Galaxy catalog being fit
-        dmags: `np.array`
-           Float array of refmag - pivotmag
-        mags: `np.array`
-           2d Float array of true (model)  magnitudes
-        lups: `np.array`
-           2d Float array of true (model) luptitudes
-        mind: `int`
-           magnitude index, currently being worked on.
-        sign: `int`, -1 or 1
-           Sign of color; -1 if band is redder than ref_ind,
-           +1 if band is bluer than ref_ind
-
-        Returns
-        -------
-        lupcorr: `np.array`
-           Float array of luptitude color corrections
-        """
-        spl = CubicSpline(self.pars._ndarray[self.ztag[j]], cvals)
-        cv = spl(gals.z)
-        spl = CubicSpline(self.pars._ndarray[self.zstag[j]], svals)
-        sv = spl(gals.z)
-
-        mags[:, mind] = mags[:, mind + sign] + sign * (cv + sv * dmags)
-
-        flux = 10.**((mags[:, mind] - self.lupzp) / (-2.5))
-        lups[:, mind] = 2.5 * np.log10(1.0 / self.config.b[mind]) - np.arcsinh(0.5 * flux / self.bnmgy[mind]) / (0.4 * np.log(10.0))
-
-        magcol = mags[:, j] - mags[:, j + 1]
-        lupcol = lups[:, j] - lups[:, j + 1]
-
-        lupcorr = lupcol - magcol
-
-        return lupcorr
-
     def _calc_pivotmags(self, gals):
         """
         Calculate the pivot magnitude parameters.
@@ -446,9 +502,6 @@ class RedSequenceCalibrator(object):
 
         ncol = self.config.nmag - 1
 
-        galcolor = gals.galcol
-        galcolor_err = gals.galcol_err
-
         # compute the pivot mags
         spl = CubicSpline(self.pars.pivotmag_z, self.pars.pivotmag)
         pivotmags = spl(gals.z)
@@ -459,9 +512,9 @@ class RedSequenceCalibrator(object):
         else:
             probs = gals.p
 
-        # Figure out the order of the colors for luptitude corrections
-        mags = np.zeros((gals.size, self.config.nmag))
+        dmags = gals.refmag - pivotmags
 
+        # Figure out the order of the colors for luptitude corrections
         if self.do_lupcorr:
             col_indices = np.zeros(ncol, dtype=np.int32)
             sign_indices = np.zeros(ncol, dtype=np.int32)
@@ -479,25 +532,89 @@ class RedSequenceCalibrator(object):
                 mind_indices[c] = j
                 c += 1
 
-            lups = np.zeros_like(mags)
-
-            mags[:, self.config.ref_ind] = gals.mag[:, self.config.ref_ind]
-            flux = 10.**((mags[:, self.config.ref_ind] - self.lupzp) / (-2.5))
-            lups[:, self.config.ref_ind] = 2.5 * np.log10(1.0 / self.config.b[self.config.ref_ind]) - np.arcsinh(0.5 * flux / self.bnmgy[self.config.ref_ind]) / (0.4 * np.log(10.0))
+            lupcalc = DiagonalLupcorrCalculator(self.config, gals, dmags)
         else:
             col_indices = np.arange(ncol)
             sign_indices = np.ones(ncol, dtype=np.int32)
             mind_indices = col_indices
 
-        # One color at a time along the diagonal
-        for c in xrange(ncol):
-            starttime = time.time()
+            lupcalc = None
+
+        # The colors are fit one at a time along the diagonal.  With luptitude
+        # corrections each color depends on the previous one in the same
+        # direction from the reference band, so the redward and blueward
+        # chains are independent.  Otherwise every color is independent.
+        if self.do_lupcorr:
+            chains = [[c for c in xrange(ncol) if sign_indices[c] == -1],
+                      [c for c in xrange(ncol) if sign_indices[c] == 1]]
+        else:
+            chains = [[c] for c in xrange(ncol)]
+
+        worker_list = []
+        for chain in chains:
+            if len(chain) == 0:
+                continue
+            worker_list.append((gals, probs, dmags, lupcalc,
+                                [(col_indices[c], sign_indices[c], mind_indices[c]) for c in chain],
+                                doRaise))
+
+        nproc = min(self.config.calib_nproc, len(worker_list))
+        if nproc > 1:
+            # We need to delete "cosmo" from the config for pickling/multiprocessing
+            worker_self = copy.copy(self)
+            worker_self.config = self.config.copy()
+            worker_self.config.cosmo = None
+
+            pool = Pool(processes=nproc)
+            retvals = pool.map(worker_self._fit_diagonal_chain, worker_list, chunksize=1)
+            pool.close()
+            pool.join()
+        else:
+            retvals = [self._fit_diagonal_chain(worker) for worker in worker_list]
 
-            # The order is given by col_indices, which ensures that we work from the
-            # reference mag outward
-            j = col_indices[c]
-            sign = sign_indices[c]
-            mind = mind_indices[c]
+        # And record in the parameters
+        for chain_pars in retvals:
+            for j, cvals, svals, scvals in chain_pars:
+                self.pars._ndarray[self.ctag[j]] = cvals
+                self.pars._ndarray[self.stag[j]] = svals
+                self.pars.sigma[j, j, :] = scvals
+                self.pars.covmat_amp[j, j, :] = scvals ** 2.
+
+    def _fit_diagonal_chain(self, worker):
+        """
+        Fit a chain of colors along the diagonal, in order.
+
+        Parameters
+        ----------
+        worker: `tuple`
+           gals: `redmapper.GalaxyCatalog`
+              Galaxy catalog with fields required for fit.
+           probs: `np.array`
+              Float array of membership probabilities
+           dmags: `np.array`
+              Float array of refmag - pivotmag
+           lupcalc: `DiagonalLupcorrCalculator`
+              Luptitude correction calculator (None if no luptitude
+              corrections)
+           chain: `list`
+              List of (color index, sign, magnitude index) to fit in order
+           doRaise: `bool`
+              Raise if there's a problem with the background?
+
+        Returns
+        -------
+        chain_pars: `list`
+           List of (color index, cvals, svals, scvals) for the chain
+        """
+        gals, probs, dmags, lupcalc, chain, doRaise = worker
+
+        galcolor = gals.galcol
+        galcolor_err = gals.galcol_err
+
+        chain_pars = []
+
+        for j, sign, mind in chain:
+            starttime = time.time()
 
             self.config.logger.info("Working on diagonal for color %d" % (j))
 
@@ -528,8 +645,6 @@ class RedSequenceCalibrator(object):
                           (galcolor[:, j] < (med + self.config.calib_color_nsig * sc)))
             trunc = self.config.calib_color_nsig * sc[u]
 
-            dmags = gals.refmag - pivotmags
-
             # And the starting values...
             # Note that this returns the slope values (svals) at the nodes from the cvals
             # but these might not be the same nodes, so we have to approximate
@@ -545,7 +660,9 @@ class RedSequenceCalibrator(object):
 
             # And do the luptitude correction if necessary.
             if self.do_lupcorr:
-                lupcorr = self._compute_single_lupcorr(j, cvals, svals, gals, dmags, mags, lups, mind, sign)
+                lupcorr = lupcalc.compute(j, mind, sign,
+                                          self.pars._ndarray[self.ztag[j]], cvals,
+                                          self.pars._ndarray[self.zstag[j]], svals)
             else:
                 lupcorr = np.zeros(gals.size)
 
@@ -566,7 +683,9 @@ class RedSequenceCalibrator(object):
             cvals, = rsfitter.fit(cvals, svals, scvals, fit_mean=True)
             # Update the lupcorr...
             if self.do_lupcorr:
-                rsfitter._lupcorrs[:] = self._compute_single_lupcorr(j, cvals, svals, gals, dmags, mags, lups, mind, sign)[u]
+                rsfitter._lupcorrs[:] = lupcalc.compute(j, mind, sign,
+                                                        self.pars._ndarray[self.ztag[j]], cvals,
+                                                        self.pars._ndarray[self.zstag[j]], svals)[u]
             # fit the slope
             svals, = rsfitter.fit(cvals, svals, scvals, fit_slope=True)
             # fit the scatter
@@ -575,15 +694,13 @@ class RedSequenceCalibrator(object):
             cvals, svals, scvals = rsfitter.fit(cvals, svals, scvals,
                                                 fit_mean=True, fit_slope=True, fit_scatter=True)
 
-            # And record in the parameters
-            self.pars._ndarray[self.ctag[j]] = cvals
-            self.pars._ndarray[self.stag[j]] = svals
-            self.pars.sigma[j, j, :] = scvals
-            self.pars.covmat_amp[j, j, :] = scvals ** 2.
+            chain_pars.append((j, cvals, svals, scvals))
 
             # And print the time taken
             self.config.logger.info('Done in %.2f seconds.' % (time.time() - starttime))
 
+        return chain_pars
+
     def _calc_offdiagonal_pars(self, gals, doRaise=True):
         """
         Set the off-diagonal elements of the covariance matrix.
@@ -0,0 +1,557 @@
+"""Classes to run the calibration as a graph of file-based tasks
+"""
+
+from __future__ import division, absolute_import, print_function
+
+import os
+import copy
+import json
+import hashlib
+import fitsio
+import numpy as np
+import multiprocessing
+from multiprocessing.connection import wait
+from collections import OrderedDict
+
+
+def _same_value(value1, value2):
+    """
+    Check if two config field values are the same.
+
+    Parameters
+    ----------
+    value1: `object`
+       First value
+    value2: `object`
+       Second value
+
+    Returns
+    -------
+    same: `bool`
+       True if the values are the same.
+    """
+    if isinstance(value1, np.ndarray) or isinstance(value2, np.ndarray):
+        return np.array_equal(value1, value2)
+
+    try:
+        return bool(value1 == value2)
+    except ValueError:
+        return np.array_equal(value1, value2)
+
+
+class CalibrationTask(object):
+    """
+    Class to describe a single step of the calibration.
+
+    A task runs a function on its own copy of the configuration (taken when
+    the task is made), reads a set of input files, and makes a set of output
+    files.
+
+    The config fields that were set for the task (those that differ from
+    the values when the graph was made) are overridden while the task runs,
+    and restored afterwards.  Other config fields set by a task are kept,
+    so later tasks run in the same process can use them.
+    """
+    def __init__(self, name, func, config, args=(), inputs=None, outputs=None,
+                 requires=None, nproc=1, complete=None):
+        """
+        Instantiate a CalibrationTask.
+
+        Parameters
+        ----------
+        name: `str`
+           Name of the task, unique within a graph
+        func: `function`
+           Function to run, called as func(config, *args)
+        config: `redmapper.Configuration`
+           Configuration object.  The task keeps a copy of its current state.
+        args: `tuple`, optional
+           Extra arguments to func.  Default is ().
+        inputs: `list`, optional
+           List of input filenames.  None values are ignored.  Default is None.
+        outputs: `list`, optional
+           List of output filenames.  Default is None.
+        requires: `list`, optional
+           List of names of tasks that must be run first, in addition to
+           those making any of the inputs.  Default is None.
+        nproc: `int`, optional
+           Number of cores used by the task.  Default is 1.
+        complete: `function`, optional
+           Function returning True if the outputs are complete.  Default is
+           None, which checks that all the output files exist.
+        """
+        self.name = name
+        self.func = func
+        self.args = args
+
+        # The config field values are shared by all copies of the
+        # configuration, so we record them here and set them when run.
+        self.config = config.copy()
+        self.config.d = copy.copy(config.d)
+        self._field_values = config._get_field_values()
+        self._overrides = self._field_values
+
+        self.inputs = [f for f in (inputs or []) if f is not None]
+        self.outputs = list(outputs or [])
+        self.requires = list(requires or [])
+        self.nproc = nproc
+        self._complete = complete
+
+    def complete(self):
+        """
+        Check if the outputs of the task are complete.
+
+        Returns
+        -------
+        complete: `bool`
+           True if the outputs are complete.
+        """
+        if self._complete is not None:
+            return self._complete()
+
+        return all([os.path.isfile(f) for f in self.outputs])
+
+    def clean(self):
+        """
+        Remove the (stale) outputs of the task.
+        """
+        for f in self.outputs:
+            if os.path.isfile(f):
+                os.remove(f)
+
+    def set_base_values(self, base_values):
+        """
+        Set the config field values that the task does not need to override.
+
+        Parameters
+        ----------
+        base_values: `dict`
+           Dictionary of field name to value, from config._get_field_values()
+        """
+        self._overrides = {var: value for var, value in self._field_values.items()
+                           if var not in base_values or not _same_value(value, base_values[var])}
+
+    def run(self):
+        """
+        Run the task.  The overridden config field values are restored
+        afterwards.
+        """
+        saved_values = self.config._get_field_values()
+        saved_values = {var: saved_values[var] for var in self._overrides}
+        self.config._set_field_values(self._overrides)
+
+        try:
+            self.func(self.config, *self.args)
+        finally:
+            self.config._set_field_values(saved_values)
+
+
+class CalibrationTaskGraph(object):
+    """
+    Class to run a set of calibration tasks in dependency order.
+
+    A task depends on the tasks listed in its requires, and on any task that
+    makes one of its inputs.  A task is up to date if its outputs are
+    complete and the contents of its inputs (including the pixel files
+    listed in pixelized master tables) have not changed since it was last
+    run.  The content hashes are recorded in a json stamp file.
+    Outputs that were made before they were recorded are taken to be up to
+    date.
+
+    Independent tasks may be run concurrently (in forked processes), as long
+    as the total nproc of the running tasks fits in the core budget.
+    """
+    def __init__(self, config, stampfile=None):
+        """
+        Instantiate a CalibrationTaskGraph.
+
+        Parameters
+        ----------
+        config: `redmapper.Configuration`
+           Configuration object
+        stampfile: `str`, optional
+           Name of the json file to record content hashes.  Default is None,
+           which uses the calib_tasks file for config.outbase.
+        """
+        self.config = config
+
+        if stampfile is None:
+            stampfile = self.config.redmapper_filename('calib_tasks', filetype='json',
+                                                       outbase=self.config.outbase)
+        self.stampfile = stampfile
+
+        self.tasks = OrderedDict()
+
+        # The config fields set after this are overridden by the tasks
+        self._base_values = self.config._get_field_values()
+
+    def add(self, task):
+        """
+        Add a task to the graph.
+
+        Parameters
+        ----------
+        task: `redmapper.calibration.CalibrationTask`
+           Task to add
+
+        Returns
+        -------
+        task: `redmapper.calibration.CalibrationTask`
+           The task that was added
+        """
+        if task.name in self.tasks:
+            raise ValueError("Duplicate calibration task %s" % (task.name))
+
+        task.set_base_values(self._base_values)
+        self.tasks[task.name] = task
+
+        return task
+
+    def dependencies(self):
+        """
+        Compute the dependencies of each task.
+
+        Returns
+        -------
+        deps: `dict`
+           Dictionary of the set of task names that each task depends on.
+
+        Raises
+        ------
+        ValueError:
+           If a task requires an unknown task, or there is a cycle.
+        """
+        producers = {}
+        for name, task in self.tasks.items():
+            for f in task.outputs:
+                producers[f] = name
+
+        deps = {}
+        for name, task in self.tasks.items():
+            deps[name] = set()
+            for req in task.requires:
+                if req not in self.tasks:
+                    raise ValueError("Task %s requires unknown task %s" % (name, req))
+                deps[name].add(req)
+            for f in task.inputs:
+                if f in producers and producers[f] != name:
+                    deps[name].add(producers[f])
+
+        # Check for cycles
+        ordered = set()
+        remaining = list(self.tasks.keys())
+        while len(remaining) > 0:
+            ready = [name for name in remaining if deps[name] <= ordered]
+            if len(ready) == 0:
+                raise ValueError("Calibration tasks have a dependency cycle: %s" % (', '.join(remaining)))
+            ordered.update(ready)
+            remaining = [name for name in remaining if name not in ordered]
+
+        return deps
+
+    def run(self, ncores=None):
+        """
+        Run all the tasks that are not up to date.
+
+        Parameters
+        ----------
+        ncores: `int`, optional
+           Core budget for concurrent tasks.  Default is None, which uses
+           config.calib_task_ncores.  If 1, tasks are run one at a time in
+           this process.
+
+        Raises
+        ------
+        RuntimeError:
+           If a task fails, or does not make its outputs.  Any tasks still
+           running are terminated.
+        """
+        if ncores is None:
+            ncores = self.config.calib_task_ncores
+
+        deps = self.dependencies()
+        stamps = self._read_stamps()
+
+        running = {}
+
+        try:
+            self._run(ncores, deps, stamps, running)
+        finally:
+            for proc, task, hashes in running.values():
+                self.config.logger.info("Terminating calibration task %s" % (task.name))
+                proc.terminate()
+                proc.join()
+
+    def _run(self, ncores, deps, stamps, running):
+        """
+        Run all the tasks that are not up to date.
+
+        Parameters
+        ----------
+        ncores: `int`
+           Core budget for concurrent tasks
+        deps: `dict`
+           Dictionary of the set of task names that each task depends on
+        stamps: `dict`
+           Stamp dictionary
+        running: `dict`
+           Dictionary of the running processes, updated in place
+        """
+        pending = list(self.tasks.keys())
+        done = set()
+        failed = []
+        used = 0
+
+        while len(pending) > 0 or len(running) > 0:
+            for name in list(pending):
+                if len(failed) > 0:
+                    break
+                if not deps[name] <= done:
+                    continue
+
+                task = self.tasks[name]
+                if self._up_to_date(task, stamps):
+                    if len(task.outputs) > 0:
+                        self.config.logger.info("%s already there.  Skipping..." % (', '.join(task.outputs)))
+                    else:
+                        self.config.logger.info("Task %s has no outputs.  Skipping..." % (task.name))
+                    pending.remove(name)
+                    done.add(name)
+                    continue
+
+                if len(running) > 0 and used + task.nproc > ncores:
+                    continue
+
+                if task.complete():
+                    self.config.logger.info("Inputs of %s changed.  Rerunning..." % (', '.join(task.outputs)))
+                    task.clean()
+
+                hashes = self._input_hashes(task, stamps)
+                pending.remove(name)
+
+                if ncores <= 1:
+                    task.run()
+                    self._finish(task, hashes, stamps)
+                    done.add(name)
+                else:
+                    proc = multiprocessing.get_context('fork').Process(target=task.run, name=name)
+                    proc.start()
+                    running[proc.sentinel] = (proc, task, hashes)
+                    used += task.nproc
+
+            if len(running) == 0:
+                if len(failed) > 0:
+                    break
+                continue
+
+            for sentinel in wait(list(running.keys())):
+                proc, task, hashes = running[sentinel]
+                proc.join()
+                running.pop(sentinel)
+                used -= task.nproc
+                if proc.exitcode != 0:
+                    failed.append(task.name)
+                else:
+                    self._finish(task, hashes, stamps)
+                    done.add(task.name)
+
+        if len(failed) > 0:
+            raise RuntimeError("Calibration task(s) failed: %s" % (', '.join(failed)))
+
+    def _finish(self, task, hashes, stamps):
+        """
+        Check that a task made its outputs, and record its input hashes.
+
+        Parameters
+        ----------
+        task: `redmapper.calibration.CalibrationTask`
+           Task that was run
+        hashes: `dict`
+           Dictionary of input content hashes when the task was started
+        stamps: `dict`
+           Stamp dictionary to update
+        """
+        if not task.complete():
+            raise RuntimeError("Calibration task %s did not make %s" % (task.name, ', '.join(task.outputs)))
+
+        stamps['tasks'][self._key(task)] = hashes
+        self._write_stamps(stamps)
+
+    def _up_to_date(self, task, stamps):
+        """
+        Check if a task is up to date.
+
+        Parameters
+        ----------
+        task: `redmapper.calibration.CalibrationTask`
+           Task to check
+        stamps: `dict`
+           Stamp dictionary
+
+        Returns
+        -------
+        up_to_date: `bool`
+           True if the task does not need to be run.
+        """
+        if not task.complete():
+            return False
+
+        hashes = self._input_hashes(task, stamps)
+
+        key = self._key(task)
+        if key not in stamps['tasks']:
+            # Made before it was recorded; record the current inputs
+            stamps['tasks'][key] = hashes
+            self._write_stamps(stamps)
+            return True
+
+        return stamps['tasks'][key] == hashes
+
+    def _input_hashes(self, task, stamps):
+        """
+        Compute the content hashes of the inputs to a task.
+
+        Parameters
+        ----------
+        task: `redmapper.calibration.CalibrationTask`
+           Task to hash inputs
+        stamps: `dict`
+           Stamp dictionary, with cached file hashes
+
+        Returns
+        -------
+        hashes: `dict`
+           Dictionary of input filename to sha256 (None if missing)
+        """
+        hashes = {}
+        for f in task.inputs:
+            hashes[f] = self._hash(f, stamps)
+            if hashes[f] is None:
+                continue
+
+            # Pixelized master tables also depend on the pixel files.  These
+            # can be large and many, so we use the size and modification time.
+            pixfiles = stamps['files'][f][3]
+            if len(pixfiles) > 0:
+                sha = hashlib.sha256(hashes[f].encode())
+                for pixfile in pixfiles:
+                    if os.path.isfile(pixfile):
+                        stat = os.stat(pixfile)
+                        sha.update(('%s %d %d\n' % (pixfile, stat.st_size, stat.st_mtime_ns)).encode())
+                    else:
+                        sha.update(('%s missing\n' % (pixfile)).encode())
+                hashes[f] = sha.hexdigest()
+
+        return hashes
+
+    def _hash(self, filename, stamps):
+        """
+        Compute the sha256 of a file.  The hash is cached by file size and
+        modification time, so unchanged (large) files are not reread.  The
+        pixel files listed in a pixelized master table are cached with it.
+
+        Parameters
+        ----------
+        filename: `str`
+           Name of file to hash
+        stamps: `dict`
+           Stamp dictionary, with cached file hashes
+
+        Returns
+        -------
+        sha: `str`
+           Hex digest of the file contents.  None if the file is not there.
+        """
+        if not os.path.isfile(filename):
+            return None
+
+        stat = os.stat(filename)
+        cached = stamps['files'].get(filename)
+        if (cached is not None and len(cached) == 4 and
+                cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns):
+            return cached[2]
+
+        sha = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1024*1024), b''):
+                sha.update(block)
+
+        stamps['files'][filename] = [stat.st_size, stat.st_mtime_ns, sha.hexdigest(),
+                                     self._pixel_files(filename)]
+
+        return sha.hexdigest()
+
+    def _pixel_files(self, filename):
+        """
+        Get the pixel files listed in a pixelized master table.
+
+        Parameters
+        ----------
+        filename: `str`
+           Name of file to check
+
+        Returns
+        -------
+        pixfiles: `list`
+           List of pixel filenames.  Empty if the file is not a master table.
+        """
+        try:
+            with fitsio.FITS(filename) as fits:
+                if len(fits) < 2 or fits[1].get_exttype() != 'BINARY_TBL':
+                    return []
+                colnames = [name for name in fits[1].get_colnames() if name.lower() == 'filenames']
+                if len(colnames) == 0:
+                    return []
+                filenames = fits[1].read_column(colnames[0], rows=[0])[0]
+        except (IOError, OSError, ValueError):
+            return []
+
+        path = os.path.dirname(os.path.abspath(filename))
+        pixfiles = []
+        for f in np.atleast_1d(filenames):
+            try:
+                f = f.decode()
+            except AttributeError:
+                pass
+            pixfiles.append(os.path.join(path, f.strip()))
+
+        return pixfiles
+
+    def _key(self, task):
+        """
+        Stamp key for a task, from its outputs (unique across graphs), or
+        its name if it has no outputs.
+        """
+        if len(task.outputs) == 0:
+            return task.name
+        return ','.join(task.outputs)
+
+    def _read_stamps(self):
+        """
+        Read the stamp file.
+
+        Returns
+        -------
+        stamps: `dict`
+           Stamp dictionary with 'tasks' and 'files' entries.
+        """
+        stamps = {'tasks': {}, 'files': {}}
+        if os.path.isfile(self.stampfile):
+            with open(self.stampfile) as f:
+                stamps.update(json.load(f))
+
+        return stamps
+
+    def _write_stamps(self, stamps):
+        """
+        Write the stamp file.
+
+        Parameters
+        ----------
+        stamps: `dict`
+           Stamp dictionary to write
+        """
+        tempfile = self.stampfile + '.tmp'
+        with open(tempfile, 'w') as f:
+            json.dump(stamps, f, indent=1, sort_keys=True)
+        os.replace(tempfile, self.stampfile)
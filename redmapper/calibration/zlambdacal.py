@@ -16,10 +16,10 @@ from ..galaxy import GalaxyCatalog
 from ..cluster import ClusterCatalog
 from ..zlambda import ZlambdaCorrectionPar
 from ..utilities import make_nodes, CubicSpline, interpol
-from ..fitters import MedZFitter
+from ..fitters import MedZFitter, Fitter
 from ..catalog import Entry
 
-class ZLambdaFitter(object):
+class ZLambdaFitter(Fitter):
     """
     Class to fit the z_lambda afterburner spline function.
     """
@@ -128,6 +128,8 @@ class ZLambdaFitter(object):
             self._gscatter = np.clip(spl(self._redshifts), self._min_scatter, None)
 
         # FIXME
+        # The simplex fit uses no gradient: the cost has a step penalty
+        # for a scatter below min_scatter, which a gradient cannot see.
         pars = scipy.optimize.fmin(self, p0, disp=False)
 
         retval = []
@@ -155,20 +157,20 @@ class ZLambdaFitter(object):
            Total cost function of negative log-likelihood to minimize.
         """
         if self._fit_delta:
-            spl = CubicSpline(self._nodes, pars[self._delta_index: self._delta_index + self._n_nodes])
-            gdelta = spl(self._redshifts)
+            spl = self._spline_evaluator(self._nodes, self._redshifts)
+            gdelta = spl(pars[self._delta_index: self._delta_index + self._n_nodes])
         else:
             gdelta = self._gdelta
 
         if self._fit_slope:
-            spl = CubicSpline(self._slope_nodes, pars[self._slope_index: self._slope_index + self._n_slope_nodes])
-            gslope = spl(self._redshifts)
+            spl = self._spline_evaluator(self._slope_nodes, self._redshifts)
+            gslope = spl(pars[self._slope_index: self._slope_index + self._n_slope_nodes])
         else:
             gslope = self._gslope
 
         if self._fit_scatter:
-            spl = CubicSpline(self._slope_nodes, pars[self._scatter_index: self._scatter_index + self._n_slope_nodes])
-            gscatter = np.clip(spl(self._redshifts), self._min_scatter, None)
+            spl = self._spline_evaluator(self._slope_nodes, self._redshifts)
+            gscatter = np.clip(spl(pars[self._scatter_index: self._scatter_index + self._n_slope_nodes]), self._min_scatter, None)
         else:
             gscatter = self._gscatter
 
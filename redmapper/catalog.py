@@ -13,6 +13,44 @@ from redmapper.utilities import astro_to_sphere
 import healpy as hp
 
 
+# Maps of attribute name to field name (or None for other attributes),
+# shared by all objects with the same dtype.
+_field_maps = {}
+_unknown = object()
+
+# Dtypes that are known to have lower-case names
+_lower_dtypes = set()
+
+
+def _get_field_map(dtype):
+    """
+    Get the (cached) map of attribute names to field names for a dtype.
+
+    Parameters
+    ----------
+    dtype: `np.dtype`
+       Data type of the wrapped array
+
+    Returns
+    -------
+    field_map: `dict`
+       Map of attribute name to lower-case field name.
+    """
+    try:
+        return _field_maps[dtype]
+    except KeyError:
+        pass
+
+    if dtype.names is None:
+        field_map = {}
+    else:
+        field_map = {name.lower(): name for name in dtype.names}
+        field_map.update({name: name for name in dtype.names})
+    _field_maps[dtype] = field_map
+
+    return field_map
+
+
 class DataObject(object):
     """
     Generic DataObject class.
@@ -84,19 +122,56 @@ class DataObject(object):
         return cls(np.zeros(size, dtype=dtype))
 
     def __getattr__(self, attr):
-        try:
-            return self._ndarray[attr.lower()]
-        except:
-            return object.__getattribute__(self, attr)
+        # This is only called when regular attribute lookup fails, so
+        # it is the path for all the column reads.
+        field = self._lookup_field(attr)
+        if field is not None:
+            return self.__dict__['_ndarray'][field]
+        return object.__getattribute__(self, attr)
 
     def __setattr__(self, attr, val):
         if attr == '_ndarray':
             object.__setattr__(self, attr, val)
-        elif attr.lower() in self._ndarray.dtype.names:
-            self._ndarray[attr.lower()] = val
+            object.__setattr__(self, '_field_map', _get_field_map(val.dtype))
+            return
+
+        field = self._lookup_field(attr)
+        if field is not None:
+            self._ndarray[field] = val
         else:
             object.__setattr__(self, attr, val)
 
+    def _lookup_field(self, attr):
+        """
+        Internal method to look up the field name associated with an attribute.
+
+        Parameters
+        ----------
+        attr: `str`
+           Attribute name (any case)
+
+        Returns
+        -------
+        field: `str`
+           Field name, or None if attr is not a field.
+        """
+        field_map = self.__dict__.get('_field_map')
+        if field_map is None:
+            return None
+        field = field_map.get(attr, _unknown)
+        if field is _unknown:
+            # Remember mixed-case aliases and non-field attributes for
+            # next time.
+            field = field_map.get(attr.lower())
+            field_map[attr] = field
+        return field
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Cached column views are not valid on a copy
+        state.pop('_columns', None)
+        return state
+
     @property
     def dtype(self):
         """
@@ -229,8 +304,12 @@ class DataObject(object):
         ----------
         array: `np.array`
         """
+        if array.dtype in _lower_dtypes:
+            # Rows of a catalog share its (already lowered) dtype
+            return
         names = list(array.dtype.names)
         array.dtype.names = [n.lower() for n in names]
+        _lower_dtypes.add(array.dtype)
 
     def __repr__(self):
         # return the representation of the underlying array
@@ -286,22 +365,48 @@ class Entry(DataObject):
         self._lower_array(array)
         self._ndarray = self._merge_arrays([self._ndarray, array])[0]
 
-    def __getattr__(self, attr):
-        try:
-            return self._ndarray[attr.lower()]
-        except:
-            return object.__getattribute__(self, attr)
-
 
 class Catalog(DataObject):
     """
     A Catalog is an extension of a DataObject.  It can be decomposed into
     individual Entry objects.  This class is used to describe catalogs of all
     sorts, including galaxy catalogs, cluster catalogs, and other ndarrays.
+
+    Rows added with append() or extend() go into an over-allocated backing
+    buffer, so that repeated appends in a loop are amortized.  Call freeze()
+    to release the unused capacity when done appending.
     """
 
     entry_class = Entry
 
+    # Over-allocated backing buffer for append/extend; self._ndarray is a
+    # view of the first self.size rows.
+    _buffer = None
+    _growth_factor = 2.0
+
+    @classmethod
+    def concatenate(cls, catalogs, **kwargs):
+        """
+        Construct a Catalog from a list of Catalogs (or ndarrays), allocating
+        the output only once.
+
+        Parameters
+        ----------
+        catalogs: `list` of `redmapper.Catalog` or `np.ndarray`
+           Catalogs to concatenate, all with the same dtype.
+        **kwargs: Additional keywords passed to the constructor.
+
+        Returns
+        -------
+        catalog: `redmapper.Catalog`
+           Concatenated catalog, of the type of the calling class.
+        """
+        arrays = [cat._ndarray if isinstance(cat, DataObject) else cat for cat in catalogs]
+        if len(arrays) == 0:
+            raise ValueError("Must have at least one catalog to concatenate")
+
+        return cls(np.concatenate(arrays), **kwargs)
+
     @property
     def size(self):
         """
@@ -309,6 +414,47 @@ class Catalog(DataObject):
         """
         return self._ndarray.size
 
+    @property
+    def capacity(self):
+        """
+        Return the number of rows that can be held without reallocating.
+        """
+        if self._has_buffer():
+            return self._buffer.size
+        return self._ndarray.size
+
+    def _has_buffer(self):
+        """
+        Internal method to check that the backing buffer is still in use.
+
+        The buffer is dropped if self._ndarray was replaced (e.g., by
+        add_fields).
+        """
+        return self._buffer is not None and self._ndarray.base is self._buffer
+
+    def _reserve(self, size):
+        """
+        Internal method to make sure the backing buffer can hold size rows.
+
+        Parameters
+        ----------
+        size: `int`
+           Number of rows that are required.
+        """
+        if self._has_buffer():
+            if size <= self._buffer.size:
+                return
+            capacity = max(size, int(self._growth_factor * self._buffer.size))
+        else:
+            # The first append allocates what is needed; growth starts after.
+            capacity = size
+
+        n = self._ndarray.size
+        buffer = np.zeros(capacity, dtype=self._ndarray.dtype)
+        buffer[: n] = self._ndarray
+        self._buffer = buffer
+        self._ndarray = self._buffer[: n]
+
     def append(self, append_cat):
         """
         Append a number of rows to the catalog, in-place.
@@ -319,9 +465,20 @@ class Catalog(DataObject):
            Catalog to append
         """
         if isinstance(append_cat, Catalog):
-            self._ndarray = np.append(self._ndarray, append_cat._ndarray)
+            new_rows = append_cat._ndarray
         else:
-            self._ndarray = np.append(self._ndarray, append_cat)
+            new_rows = np.atleast_1d(append_cat)
+
+        if new_rows.dtype != self._ndarray.dtype:
+            # Leave any dtype conversion (or error) to numpy
+            self._ndarray = np.append(self._ndarray, new_rows)
+            self._buffer = None
+            return
+
+        n = self._ndarray.size
+        self._reserve(n + new_rows.size)
+        self._buffer[n: n + new_rows.size] = new_rows
+        self._ndarray = self._buffer[: n + new_rows.size]
 
     def extend(self, n_new):
         """
@@ -332,8 +489,44 @@ class Catalog(DataObject):
         n_new: `int`
            Number of new rows to append
         """
-        temp = np.zeros(n_new, dtype=self._ndarray.dtype)
-        self._ndarray = np.append(self._ndarray, temp)
+        n = self._ndarray.size
+        self._reserve(n + n_new)
+        self._buffer[n: n + n_new] = np.zeros(n_new, dtype=self._ndarray.dtype)
+        self._ndarray = self._buffer[: n + n_new]
+
+    def freeze(self):
+        """
+        Compact the catalog to its logical size, releasing any extra capacity
+        from append() or extend().
+        """
+        if self._has_buffer():
+            self._ndarray = self._ndarray.copy()
+        self._buffer = None
+
+    def __getattr__(self, attr):
+        # Column views are cached until self._ndarray is replaced.
+        columns = self.__dict__.get('_columns')
+        if columns is not None:
+            try:
+                return columns[attr]
+            except KeyError:
+                pass
+
+        field = self._lookup_field(attr)
+        if field is None:
+            return object.__getattribute__(self, attr)
+
+        column = self.__dict__['_ndarray'][field]
+        if columns is None:
+            columns = {}
+            object.__setattr__(self, '_columns', columns)
+        columns[attr] = column
+        return column
+
+    def __setattr__(self, attr, val):
+        if attr == '_ndarray':
+            object.__setattr__(self, '_columns', None)
+        super(Catalog, self).__setattr__(attr, val)
 
     def __len__(self): return self.size
 
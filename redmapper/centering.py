@@ -378,8 +378,10 @@ class CenteringRandom(Centering):
         success: `bool`
            True when a center is successfully found. (Always True).
         """
-        r = self.cluster.r_lambda * np.sqrt(np.random.random(size=1))
-        phi = 2. * np.pi * np.random.random(size=1)
+        rng = np.random if self.cluster.rng is None else self.cluster.rng
+
+        r = self.cluster.r_lambda * np.sqrt(rng.random(size=1))
+        phi = 2. * np.pi * rng.random(size=1)
 
         x = r * np.cos(phi) / (self.cluster.mpc_scale)
         y = r * np.sin(phi) / (self.cluster.mpc_scale)
@@ -436,7 +438,9 @@ class CenteringRandomSatellite(Centering):
         cdf = np.cumsum(pdf.tolist())
         cdfi = (cdf * st.size).astype(np.int32)
 
-        rand = (np.random.uniform(size=1) * st.size).astype(np.int32)
+        rng = np.random if self.cluster.rng is None else self.cluster.rng
+
+        rand = (rng.uniform(size=1) * st.size).astype(np.int32)
         ind = np.where(cdfi >= rand[0])[0][0]
         maxind = st[ind]
 
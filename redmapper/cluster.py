@@ -157,6 +157,9 @@ class Cluster(Entry):
         self.zredbkg = zredbkg
         self.set_neighbors(neighbors)
 
+        # Per-cluster random number generator; None uses the global state
+        self.rng = None
+
         self._mstar = None
         self._mpc_scale = None
 
@@ -242,12 +245,9 @@ class Cluster(Entry):
         else:
             radius_degrees = radius
 
-        indices, dists = galcat.match_one(self.ra, self.dec, radius_degrees)
-
-        if maxmag is not None:
-            use, = np.where(galcat.refmag[indices] <= maxmag)
-            indices = indices[use]
-            dists = dists[use]
+        # The maxmag cut is done in the magnitude-sorted neighbor index
+        indices, dists = galcat.match_one(self.ra, self.dec, radius_degrees,
+                                          maxmag=maxmag)
 
         self.set_neighbors(galcat[indices])
         self.neighbors.dist = dists
@@ -495,7 +495,7 @@ class Cluster(Entry):
         theta_i = calc_theta_i(self.neighbors.refmag[idx], self.neighbors.refmag_err[idx],
                                maxmag, self.zredstr.limmag)
 
-        cpars = mask.calc_maskcorr(self.mstar, maxmag, self.zredstr.limmag)
+        cpars = mask.calc_maskcorr(self.mstar, maxmag, self.zredstr.limmag, rng=self.rng)
 
         try:
             w = theta_i * self.neighbors.pfree[idx]
@@ -722,7 +722,7 @@ class Cluster(Entry):
 
         bcounts = self.calc_cbkg_density(self.neighbors.r, col_index, col, self.neighbors.refmag)
 
-        cpars = mask.calc_maskcorr(self.mstar, maxmag, self.config.limmag_catalog)
+        cpars = mask.calc_maskcorr(self.mstar, maxmag, self.config.limmag_catalog, rng=self.rng)
 
         try:
             w = theta_i * self.neighbors.pfree
@@ -1005,15 +1005,8 @@ class ClusterCatalog(Catalog):
     def grid(self):
         #TODO: add docstring
         zgrid = np.arange(*self.config.zrange, self.config.scanmode_step)
-        for i, _ in enumerate(self):
-            for j, z in enumerate(zgrid):
-                # slice so that we get a ClusterCatalog rather than a Cluster
-                # cluster = copy.deepcopy(self[slice(i, i + 1)])
-                cluster = self[slice(i, i + 1)]
-                if j == 0:
-                    cat = cluster
-                else:
-                    cat.append(cluster)
-                cat[j].redshift = z
-                cat[j].z = z
+        for i in xrange(self.size):
+            # One copy of the cluster per grid redshift, allocated at once
+            cat = self[np.full(zgrid.size, i)]
+            cat.z = zgrid
             yield cat
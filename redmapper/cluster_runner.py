@@ -12,9 +12,12 @@ from past.builtins import xrange
 
 import fitsio
 import numpy as np
+import healpy as hp
 import esutil
 import os
 import gc
+import hashlib
+import tempfile
 from esutil.cosmology import Cosmo
 
 from .configuration import Configuration
@@ -32,7 +35,7 @@ from .zlambda import Zlambda
 from .zlambda import ZlambdaCorrectionPar
 from .redsequence import RedSequenceColorPar
 from .depth_fitting import DepthLim
-from .utilities import getMemoryString
+from .utilities import getMemoryString, make_rng
 
 
 ###################################################
@@ -79,6 +82,9 @@ class ClusterRunner(object):
         self.use_parfile = True
         self._filename = None
 
+        # Number of clusters to compute radial masks and depths for at once
+        self.maskgal_batch_size = 200
+
         # Will want to add stuff to check that everything needed is present?
 
         self._additional_initialization(**kwargs)
@@ -239,7 +245,8 @@ class ClusterRunner(object):
         # If we don't have a depth map, get ready to compute local depth
         if self.depthstr is None:
             try:
-                self.depthlim = DepthLim(self.gals.refmag, self.gals.refmag_err)
+                self.depthlim = DepthLim(self.gals.refmag, self.gals.refmag_err,
+                                         rng=make_rng(self.config.rng_seed))
             except RuntimeError:
                 self.config.logger.info(
                     "Failed to obtain depth info in %s for pixel %s with %d "
@@ -247,6 +254,11 @@ class ClusterRunner(object):
                     self.runmode, self.hpix_logstr, len(self.gals)))
                 return False
 
+            # Fit the depth once per cell, and use that as a depth map
+            # instead of fitting every cluster.
+            if self.config.depthlim_map_nside > 0:
+                self.depthstr = self._get_depthlim_map()
+
         # default limiting luminosity
         self.limlum = np.clip(self.config.lval_reference - 0.1, 0.01, None)
 
@@ -276,6 +288,72 @@ class ClusterRunner(object):
 
         return True
 
+    def _get_depthlim_map(self):
+        """
+        Internal method to get the local depth-fit map for this region.
+
+        The map is made from the galaxies with self.depthlim.make_depthmap()
+        if it is not already cached in the output path.
+
+        Returns
+        -------
+        depthstr: `redmapper.DepthMap`
+           Depth map of the local depth fits
+        """
+        name = 'depthlim%d_map_%s' % (self.config.depthlim_map_nside,
+                                      self._depthlim_map_hash())
+        if len(self.config.d.hpix) > 0:
+            name += '_%d_%s' % (self.config.d.nside,
+                                '_'.join(['%d' % (hpix) for hpix in self.config.d.hpix]))
+        depthfile = self.config.redmapper_filename(name)
+
+        if not os.path.isfile(depthfile):
+            self.config.logger.info("Fitting local depth map for pixel %s" % (self.hpix_logstr))
+
+            # Write to a temporary file and rename, so that no other job can
+            # read a partial map
+            tf = tempfile.mkstemp(prefix=os.path.basename(depthfile) + '.', suffix='.tmp',
+                                  dir=os.path.dirname(os.path.abspath(depthfile)))
+            os.close(tf[0])
+            try:
+                self.depthlim.make_depthmap(self.gals.ra, self.gals.dec,
+                                            self.gals.refmag, self.gals.refmag_err,
+                                            tf[1], nside=self.config.depthlim_map_nside,
+                                            clobber=True)
+                os.replace(tf[1], depthfile)
+            finally:
+                if os.path.isfile(tf[1]):
+                    os.remove(tf[1])
+
+        return DepthMap(self.config, depthfile=depthfile)
+
+    def _depthlim_map_hash(self):
+        """
+        Internal method to get a hash of the inputs to the local depth-fit map.
+
+        The hash covers the galaxy file, the reference band, the settings
+        that select the galaxies of this region, and the magnitudes of the
+        selected galaxies themselves, so that a cached map is never reused
+        for a different input.
+
+        Returns
+        -------
+        hashstr: `str`
+           Hex digest of the depth-map inputs
+        """
+        pars = (os.path.abspath(self.config.galfile),
+                self.config.refmag,
+                self.config.depthlim_map_nside,
+                self.config.border,
+                self.config.d.nside,
+                tuple(int(hpix) for hpix in self.config.d.hpix))
+
+        md5 = hashlib.md5(repr(pars).encode('utf-8'))
+        md5.update(np.ascontiguousarray(self.gals.refmag, dtype=np.float64).tobytes())
+        md5.update(np.ascontiguousarray(self.gals.refmag_err, dtype=np.float64).tobytes())
+
+        return md5.hexdigest()[: 16]
+
     def _generate_mem_match_ids(self):
         """
         Internal method to compute unique cluster mem_match_ids
@@ -303,6 +381,88 @@ class ClusterRunner(object):
         cluster.z_lambda = -1.0
         cluster.z_lambda_e = -1.0
 
+    def _compute_mask_batch(self, cat, start):
+        """
+        Select maskgal samples, and compute the radial mask and depth values
+        of the maskgals, for a batch of clusters.
+
+        Parameters
+        ----------
+        cat: `redmapper.ClusterCatalog`
+           Cluster catalog being run
+        start: `int`
+           Index of the first cluster in the batch
+
+        Returns
+        -------
+        maskgal_index: `np.array`
+           Integer array of maskgal sample index for each cluster
+        mark: `np.array`
+           Bool array (nclusters, maskgal_ngals) of maskgal mask values
+        limmag: `np.array`
+           Float array (nclusters, maskgal_ngals) of limiting magnitudes,
+           or None if there is no depth map.
+        exptime: `np.array`
+           Float array (nclusters, maskgal_ngals) of effective exposure times,
+           or None if there is no depth map.
+        m50: `np.array`
+           Float array (nclusters, maskgal_ngals) of 50% completeness depths,
+           or None if there is no depth map.
+        rngs: `list`
+           Random number generator for each cluster, or None if
+           config.rng_seed is not set.
+        """
+        end = min(start + self.maskgal_batch_size, cat.size)
+
+        if self.config.rng_seed is None:
+            rngs = None
+            maskgal_index = np.random.choice(self.config.maskgal_nsamples,
+                                             size=end - start)
+        else:
+            rngs = self._make_cluster_rngs(cat, start, end)
+            maskgal_index = np.array([rng.choice(self.config.maskgal_nsamples)
+                                      for rng in rngs])
+
+        # This matches the clipping in cluster.redshift
+        mpc_scale = np.radians(1.) * self.config.cosmo.Da(
+            0, np.clip(cat.z[start: end], 0.01, None))
+
+        mark, limmag, exptime, m50 = self.mask.calc_radmask_batch(
+            cat.ra[start: end], cat.dec[start: end], mpc_scale,
+            maskgal_index, depthstr=self.depthstr, rngs=rngs)
+
+        return maskgal_index, mark, limmag, exptime, m50, rngs
+
+    def _make_cluster_rngs(self, cat, start, end):
+        """
+        Make the random number generators for a batch of clusters.
+
+        Each cluster gets its own stream, keyed on (config.rng_seed, pixel,
+        mem_match_id), where the pixel is the fine (nside 2**20, nest) pixel
+        of the cluster position.  This distinguishes clusters before the
+        mem_match_ids are assigned.  The results for a cluster therefore do
+        not depend on the order of processing or on how the run is split.
+
+        Parameters
+        ----------
+        cat: `redmapper.ClusterCatalog`
+           Cluster catalog being run
+        start: `int`
+           Index of the first cluster in the batch
+        end: `int`
+           Index after the last cluster in the batch
+
+        Returns
+        -------
+        rngs: `list` of `np.random.Generator`
+           Random number generator for each cluster
+        """
+        pixels = hp.ang2pix(2**20, cat.ra[start: end], cat.dec[start: end],
+                            lonlat=True, nest=True)
+
+        return [make_rng(self.config.rng_seed, pixel, mem_match_id)
+                for pixel, mem_match_id in zip(pixels, cat.mem_match_id[start: end])]
+
     def _process_cluster(self, cluster):
         """
         Process a single cluster.
@@ -397,8 +557,16 @@ class ClusterRunner(object):
                 self.grid = [self.cat]
 
             for idx, cat in enumerate(self.grid):
-                for cluster in cat:
-                    cluster.maskgal_index = self.mask.select_maskgals_sample()
+                for i, cluster in enumerate(cat):
+                    # The radial mask (and depth) values are computed for a
+                    # batch of clusters at a time
+                    j = i % self.maskgal_batch_size
+                    if j == 0:
+                        mask_batch = self._compute_mask_batch(cat, i)
+                    cluster.maskgal_index = self.mask.select_maskgals_sample(
+                        maskgal_index=mask_batch[0][j])
+                    if mask_batch[5] is not None:
+                        cluster.rng = mask_batch[5][j]
 
                     if ((cctr % 1000) == 0):
                         self.config.logger.info(
@@ -434,16 +602,17 @@ class ClusterRunner(object):
                                                      cluster.neighbors.refmag_err)
                     else:
                         # get from the depth structure
-                        self.depthstr.calc_maskdepth(self.mask.maskgals,
-                                                     cluster.ra, cluster.dec,
-                                                     cluster.mpc_scale)
+                        self.depthstr.set_maskdepth(self.mask.maskgals,
+                                                    mask_batch[2][j, :],
+                                                    mask_batch[3][j, :],
+                                                    mask_batch[4][j, :])
 
                     cluster.lim_exptime = np.median(self.mask.maskgals.exptime)
                     cluster.lim_limmag = np.median(self.mask.maskgals.limmag)
                     cluster.lim_limmag_hard = self.config.limmag_catalog
 
                     # And survey masking (this may be a dummy)
-                    self.mask.set_radmask(cluster)
+                    self.mask.maskgals.mark = mask_batch[1][j, :]
 
                     # And compute maskfrac here...approximate first computation
                     inside, = np.where(self.mask.maskgals.r < 1.0)
@@ -635,7 +804,7 @@ class ClusterRunner(object):
                         mem_temp.mag_err[:, :] = cluster.neighbors.mag_err[
                                                  memuse, :]
 
-                        # Worried this is going to be slow...
+                        # Appends are amortized by the Catalog buffer
                         if self.members is None:
                             self.members = mem_temp
                         else:
@@ -647,8 +816,12 @@ class ClusterRunner(object):
                     cat.z_lambda_e = self.config.scanmode_step
                     scan.append(cat)
 
+        if self.members is not None:
+            # Release the extra capacity from appending members
+            self.members.freeze()
+
         if self.config.scanmode:
-            self.cat = ClusterCatalog(np.concatenate([_._ndarray for _ in scan]))
+            self.cat = ClusterCatalog.concatenate(scan)
 
         else:
             self._postprocess()
@@ -14,7 +14,7 @@ import os
 from .catalog import Entry
 from .utilities import interpol
 from .depthmap import DepthMap
-from .utilities import cic
+from .utilities import cic, make_rng
 from .galaxy import GalaxyCatalog
 
 class ColorBackground(object):
@@ -342,7 +342,8 @@ class ColorBackgroundGenerator(object):
             nside = self.config.d.nside
         else:
             nchoice = int(self.config.hpix_bkg_frac * npix)
-            hpix = master.hpix[np.random.choice(npix, nchoice, replace=False)]
+            rng = make_rng(self.config.rng_seed)
+            hpix = master.hpix[rng.choice(npix, nchoice, replace=False)]
             self.config.logger.info(f'Background sampling {len(hpix)}/{npix} pixels.')
             nside = master.nside
 
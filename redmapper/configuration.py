@@ -210,9 +210,14 @@ class Configuration(object):
     calib_nproc = ConfigField(default=1, required=True)
     calib_run_nproc = ConfigField(default=1, required=True)
     calib_run_min_nside = ConfigField(default=1, required=True)
+    calib_task_ncores = ConfigField(default=1, required=False)
 
     runcat_percolation_masking = ConfigField(default=True, required=False)
 
+    dense_map_lookup = ConfigField(default=False, required=False)
+    rng_seed = ConfigField(default=None, required=False)
+    depthlim_map_nside = ConfigField(default=0, required=False)
+
     outpath = ConfigField(default='./', required=True)
     plotpath = ConfigField(default='', required=True)
 
@@ -264,6 +269,8 @@ class Configuration(object):
     mstar_band = ConfigField(default='i03')
 
     calib_niter = ConfigField(default=3)
+    calib_warmstart = ConfigField(default=False)
+    calib_warmstart_tol = ConfigField(default=0.001)
     calib_zrange_cushion = ConfigField(default=0.05)
 
     calib_use_pcol = ConfigField(default=True)
@@ -316,6 +323,7 @@ class Configuration(object):
     bkg_zbinsize = ConfigField(default=0.02)
     bkg_zredbinsize = ConfigField(default=0.01)
     bkg_deepmode = ConfigField(default=False)
+    bkg_pixel_parallel = ConfigField(default=False)
     calib_make_full_bkg = ConfigField(default=True)
     bkg_local_annuli = ConfigField(isArray=True, array_length=2,
                                    default=np.array([2.0, 3.0]))
@@ -600,6 +608,38 @@ class Configuration(object):
             except TypeError:
                 raise TypeError("Error with type of variable %s" % (key))
 
+    def _get_field_values(self):
+        """
+        Internal method to get the values of all the config fields.
+
+        Note that config field values are stored on the class, so they are
+        shared by copies of the configuration.
+
+        Returns
+        -------
+        values: `dict`
+           Dictionary of field name to (copied) value
+        """
+        values = {}
+        for var in type(self).__dict__:
+            if isinstance(type(self).__dict__[var], ConfigField):
+                values[var] = copy.copy(getattr(self, var))
+
+        return values
+
+    def _set_field_values(self, values):
+        """
+        Internal method to restore config field values from
+        _get_field_values(), without conversion or validation.
+
+        Parameters
+        ----------
+        values: `dict`
+           Dictionary of field name to value
+        """
+        for var in values:
+            type(self).__dict__[var]._value = values[var]
+
     def _set_lengths(self, l, length):
         """
         Internal method to set the validation length for a list of field names
@@ -6,9 +6,12 @@ from __future__ import division, absolute_import, print_function
 from past.builtins import xrange
 
 import fitsio
+import warnings
 import numpy as np
 import esutil
 import scipy.optimize
+import healpy as hp
+import healsparse
 
 
 class DepthFunction(object):
@@ -330,7 +333,7 @@ class DepthLim(object):
 
     This class is used to compute depth in realtime from data.
     """
-    def __init__(self, mag, mag_err, max_gals=100000):
+    def __init__(self, mag, mag_err, max_gals=100000, rng=None):
         """
         Instantiate DepthLim object.
 
@@ -345,6 +348,9 @@ class DepthLim(object):
            Float array of magnitude errors from a large region of sky
         max_gals: `int`
            Maximum number of galaxies to sample to get global default fit.
+        rng: `np.random.Generator`, optional
+           Random number generator for the sampling.  Default is None
+           (global numpy state).
 
         Raises
         ------
@@ -357,7 +363,9 @@ class DepthLim(object):
         if mag.size < max_gals:
             use = np.arange(mag.size)
         else:
-            use = np.random.choice(np.arange(mag.size), size=max_gals, replace=False)
+            if rng is None:
+                rng = np.random
+            use = rng.choice(np.arange(mag.size), size=max_gals, replace=False)
 
         self.initpars, fail = calcErrorModel(mag[use], mag_err[use], calcErr=False)
 
@@ -397,3 +405,91 @@ class DepthLim(object):
 
         return
 
+
+    def make_depthmap(self, ra, dec, mag, mag_err, depthfile, nside=256,
+                      min_gals=100, clobber=False):
+        """
+        Fit the depth in fine healpix cells, and save as a depth map.
+
+        The error model is fit once per cell with at least min_gals galaxies.
+        The fits are then smoothed over each cell and its neighbors, and
+        cells with no usable fits (in or next to the cell) get the global
+        fit.  The output is in the same healsparse format as a survey depth
+        map, and can be read with redmapper.DepthMap.  This replaces a full
+        fit per cluster with a lookup.
+
+        Parameters
+        ----------
+        ra: `np.array`
+           Float array of galaxy right ascensions
+        dec: `np.array`
+           Float array of galaxy declinations
+        mag: `np.array`
+           Float array of galaxy magnitudes
+        mag_err: `np.array`
+           Float array of galaxy magnitude errors
+        depthfile: `str`
+           Output healsparse depth file name
+        nside: `int`, optional
+           Nside (nest) of the cells to fit.  Default is 256.
+        min_gals: `int`, optional
+           Minimum number of galaxies in a cell to fit.  Default is 100.
+        clobber: `bool`, optional
+           Overwrite any existing depthfile?  Default is False.
+        """
+        ipnest = hp.ang2pix(nside, ra, dec, lonlat=True, nest=True)
+
+        st = np.argsort(ipnest)
+        cells, first, counts = np.unique(ipnest[st], return_index=True, return_counts=True)
+
+        limmag = np.zeros(cells.size) + np.nan
+        exptime = np.zeros(cells.size) + np.nan
+
+        for i in np.where(counts >= min_gals)[0]:
+            use = st[first[i]: first[i] + counts[i]]
+            limpars, fail = calcErrorModel(mag[use], mag_err[use], calcErr=False)
+            if not fail:
+                limmag[i] = limpars['LIMMAG'][0]
+                exptime[i] = limpars['EXPTIME'][0]
+
+        # Smooth each cell with its neighbors (where fit)
+        neighbors = np.vstack((cells, hp.get_all_neighbours(nside, cells, nest=True)))
+        index = np.clip(np.searchsorted(cells, neighbors), 0, cells.size - 1)
+        found = (neighbors >= 0) & (cells[index] == neighbors)
+
+        limmag_nb = np.where(found, limmag[index], np.nan)
+        exptime_nb = np.where(found, exptime[index], np.nan)
+        nfit = np.sum(np.isfinite(limmag_nb), axis=0)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            limmag_smooth = np.nanmean(limmag_nb, axis=0)
+            exptime_smooth = np.nanmean(exptime_nb, axis=0)
+
+        nofit, = np.where(nfit == 0)
+        limmag_smooth[nofit] = self.initpars['LIMMAG'][0]
+        exptime_smooth[nofit] = self.initpars['EXPTIME'][0]
+
+        # m50 is left at zero, as with the per-cluster fits, so that the
+        # mask corrections use the limiting magnitude directly.
+        dtype = [('exptime', 'f4'),
+                 ('limmag', 'f4'),
+                 ('m50', 'f4'),
+                 ('fracgood', 'f4')]
+        values = np.zeros(cells.size, dtype=dtype)
+        values['exptime'] = exptime_smooth
+        values['limmag'] = limmag_smooth
+        values['fracgood'] = 1.0
+
+        hdr = {'NSIG': float(self.initpars['NSIG'][0]),
+               'ZP': float(self.initpars['ZP'][0]),
+               'NBAND': 1,
+               'W': 0.0,
+               'EFF': 1.0}
+
+        sparse_depthmap = healsparse.HealSparseMap.make_empty(min(32, nside), nside,
+                                                              dtype, primary='fracgood',
+                                                              metadata=hdr)
+        sparse_depthmap.update_values_pix(cells, values)
+
+        sparse_depthmap.write(depthfile, clobber=clobber)
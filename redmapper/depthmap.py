@@ -12,8 +12,10 @@ from healpy import pixelfunc
 import esutil
 import scipy.optimize
 import healsparse
+import warnings
 
-from .utilities import astro_to_sphere, get_healsparse_subpix_indices
+from .utilities import astro_to_sphere, get_healsparse_subpix_indices, project_maskgals
+from .utilities import DenseHealsparseMap
 from .catalog import Catalog, Entry
 
 class DepthMap(object):
@@ -67,6 +69,12 @@ class DepthMap(object):
 
         self.sparse_depthmap = healsparse.HealSparseMap.read(self.depthfile, pixels=covpixels)
 
+        # Expand a subregion into a dense raster for fast position lookups
+        if config.dense_map_lookup and covpixels is not None:
+            self._lookup_map = DenseHealsparseMap(self.sparse_depthmap)
+        else:
+            self._lookup_map = self.sparse_depthmap
+
         self.galfile_nside = config.galfile_nside
         self.config_logger = config.logger
         self.nside = self.sparse_depthmap.nside_sparse
@@ -101,7 +109,7 @@ class DepthMap(object):
         if ras.size != decs.size:
             raise ValueError("ra, dec must be the same length")
 
-        values = self.sparse_depthmap.get_values_pos(ras, np.clip(decs, -90.0, 90.0), lonlat=True)
+        values = self._lookup_map.get_values_pos(ras, np.clip(decs, -90.0, 90.0), lonlat=True)
 
         bad, = np.where(np.abs(decs) > 90.0)
         values['limmag'][bad] = hp.UNSEEN
@@ -132,7 +140,7 @@ class DepthMap(object):
         if (ras.size != decs.size):
             raise ValueError("ra, dec must be the same length")
 
-        values = self.sparse_depthmap.get_values_pos(ras, np.clip(decs, -90.0, 90.0), lonlat=True)
+        values = self._lookup_map.get_values_pos(ras, np.clip(decs, -90.0, 90.0), lonlat=True)
 
         bad, = np.where(np.abs(decs) > 90.0)
         values['fracgood'][bad] = 0.0
@@ -157,47 +165,106 @@ class DepthMap(object):
         mpc_scale: `float`
            Scaling in Mpc / degree at cluster redshift
         """
-        unseen = hp.pixelfunc.UNSEEN
-
         # compute ra and dec based on maskgals
-        ras = ra + (maskgals.x/mpc_scale)/np.cos(dec*np.pi/180.)
-        decs = dec + maskgals.y/mpc_scale
+        ras, decs = project_maskgals(ra, dec, mpc_scale, maskgals.x, maskgals.y)
+
+        limmag, exptime, m50 = self.calc_maskdepth_batch(ras[np.newaxis, :],
+                                                         decs[np.newaxis, :])
+
+        self.set_maskdepth(maskgals, limmag[0, :], exptime[0, :], m50[0, :])
+
+    def set_maskdepth(self, maskgals, limmag, exptime, m50):
+        """
+        Set the depth for a maskgals structure from precomputed values.
+
+        This will modify maskgals.limmag, maskgals.exptime, maskgals.m50,
+        maskgals.zp, maskgals.nsig.
 
+        Parameters
+        ----------
+        maskgals: `redmapper.Catalog`
+           maskgals catalog
+        limmag: `np.array`
+           Float array of limiting magnitudes for the maskgals
+        exptime: `np.array`
+           Float array of effective exposure times for the maskgals
+        m50: `np.array`
+           Float array of 50% completeness depths for the maskgals
+        """
         maskgals.w[:] = self.w
         maskgals.eff = None
-        maskgals.limmag[:] = unseen
+        maskgals.limmag[:] = limmag
+        maskgals.exptime[:] = exptime
+        maskgals.m50[:] = m50
         maskgals.zp[0] = self.zp
         maskgals.nsig[0] = self.nsig
 
+    def calc_maskdepth_batch(self, ras, decs):
+        """
+        Calculate depth for the maskgals of a set of clusters.
+
+        Maskgals that are outside the depth map are filled with the median
+        (or mean, if there are fewer than 3 good values) of the other maskgals
+        of the same cluster.
+
+        Parameters
+        ----------
+        ras: `np.array`
+           Float array (nclusters, ngals) of maskgal right ascensions
+        decs: `np.array`
+           Float array (nclusters, ngals) of maskgal declinations
+
+        Returns
+        -------
+        limmag: `np.array`
+           Float array (nclusters, ngals) of limiting magnitudes
+        exptime: `np.array`
+           Float array (nclusters, ngals) of effective exposure times
+        m50: `np.array`
+           Float array (nclusters, ngals) of 50% completeness depths
+        """
+        unseen = hp.pixelfunc.UNSEEN
+
+        limmag = np.zeros(ras.shape, dtype=np.float32) + unseen
+        exptime = np.zeros(ras.shape, dtype=np.float32) + unseen
+        m50 = np.zeros(ras.shape, dtype=np.float32) + unseen
+
         # Make sure the dec is within range, if we're going toward the pole (in sims)
-        gd, = np.where(np.abs(decs) < 90.0)
-
-        maskgals.limmag[gd], maskgals.exptime[gd], maskgals.m50[gd] = self.get_depth_values(ras[gd], decs[gd])
-
-        bd = (maskgals.limmag < 0.0)
-        ok = ~bd
-        nok = ok.sum()
-
-        if (bd.sum() > 0):
-            if (nok >= 3):
-                # fill them in
-                maskgals.limmag[bd] = np.median(maskgals.limmag[ok])
-                maskgals.exptime[bd] = np.median(maskgals.exptime[ok])
-                maskgals.m50[bd] = np.median(maskgals.m50[ok])
-            elif (nok > 0):
-                # fill with mean
-                maskgals.limmag[bd] = np.mean(maskgals.limmag[ok])
-                maskgals.exptime[bd] = np.mean(maskgals.exptime[ok])
-                maskgals.m50[bd] = np.mean(maskgals.m50[ok])
-            else:
-                # very bad (nok == 0)
-                # Set this to 1.0 so it'll get used but will give giant errors.
-                # And the cluster should be filtered
-                maskgals.limmag[:] = 1.0
-                maskgals.exptime[:] = 1000.0
-                maskgals.m50[:] = 0.0
+        gd = (np.abs(decs) < 90.0)
+
+        limmag[gd], exptime[gd], m50[gd] = self.get_depth_values(ras[gd], decs[gd])
+
+        bd = (limmag < 0.0)
+        nok = (~bd).sum(axis=1)
+
+        fill, = np.where(bd.any(axis=1))
+        if fill.size == 0:
+            return limmag, exptime, m50
+
+        for vals in (limmag, exptime, m50):
+            okvals = np.where(bd[fill, :], np.nan, vals[fill, :])
+
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                # fill them in with the median, or mean if there are too few
+                fillvals = np.where(nok[fill] >= 3,
+                                    np.nanmedian(okvals, axis=1),
+                                    np.nanmean(okvals, axis=1))
+
+            vals[fill, :] = np.where(bd[fill, :], fillvals[:, np.newaxis], vals[fill, :])
+
+        verybad, = np.where(nok == 0)
+        if verybad.size > 0:
+            # very bad (nok == 0)
+            # Set this to 1.0 so it'll get used but will give giant errors.
+            # And the cluster should be filtered
+            limmag[verybad, :] = 1.0
+            exptime[verybad, :] = 1000.0
+            m50[verybad, :] = 0.0
+            for i in xrange(verybad.size):
                 self.config_logger.info("Warning: Bad cluster in bad region...")
 
+        return limmag, exptime, m50
 
     def calc_areas(self, mags):
         """
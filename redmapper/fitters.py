@@ -13,9 +13,133 @@ from scipy import special
 import scipy.optimize
 import warnings
 
-from .utilities import CubicSpline, interpol
+from .utilities import CubicSpline, CubicSplineEvaluator, interpol
 
-class MedZFitter(object):
+class Fitter(object):
+    """
+    Base class for the likelihood fitters.
+
+    Subclasses implement __call__(pars), which returns the cost function to
+    minimize, and may override value_and_grad(pars) to supply an analytic
+    gradient.  The default gradient uses finite differences.
+    """
+    # Step size for finite-difference gradients
+    _grad_eps = 1e-7
+
+    def value_and_grad(self, pars):
+        """
+        Compute the cost function and its gradient.
+
+        This default uses forward finite differences.
+
+        Parameters
+        ----------
+        pars: `np.array`
+           Float array of fit parameters
+
+        Returns
+        -------
+        t: `float`
+           Cost function at pars
+        grad: `np.array`
+           Float array of the gradient of t with respect to pars
+        """
+        pars = np.atleast_1d(pars).astype(np.float64)
+
+        t = self(pars)
+
+        grad = np.zeros(pars.size)
+        for i in xrange(pars.size):
+            dpars = pars.copy()
+            dpars[i] += self._grad_eps
+            grad[i] = (self(dpars) - t) / self._grad_eps
+
+        return t, grad
+
+    def check_grad(self, pars, eps=1e-6):
+        """
+        Compare the gradient from value_and_grad() to central finite
+        differences of the cost function.
+
+        Parameters
+        ----------
+        pars: `np.array`
+           Float array of fit parameters
+        eps: `float`, optional
+           Finite-difference step size.  Default is 1e-6.
+
+        Returns
+        -------
+        grad: `np.array`
+           Float array of the gradient from value_and_grad()
+        grad_num: `np.array`
+           Float array of the central finite-difference gradient
+        """
+        pars = np.atleast_1d(pars).astype(np.float64)
+
+        _, grad = self.value_and_grad(pars)
+
+        grad_num = np.zeros(pars.size)
+        for i in xrange(pars.size):
+            dpars = np.zeros(pars.size)
+            dpars[i] = eps
+            grad_num[i] = (self(pars + dpars) - self(pars - dpars)) / (2. * eps)
+
+        return grad, grad_num
+
+    def _spline_evaluator(self, nodes, x):
+        """
+        Get the (cached) natural cubic spline evaluator for fixed positions.
+
+        Parameters
+        ----------
+        nodes: `np.array`
+           Float array of spline node positions
+        x: `np.array`
+           Float array of positions to evaluate the spline.  The cache is
+           keyed on the contents of nodes and x.
+
+        Returns
+        -------
+        spl: `redmapper.utilities.CubicSplineEvaluator`
+           Spline evaluator, called with the node values
+        """
+        if not hasattr(self, '_spline_evaluator_cache'):
+            self._spline_evaluator_cache = {}
+
+        key = (nodes.tobytes(), x.tobytes())
+        if key not in self._spline_evaluator_cache:
+            self._spline_evaluator_cache[key] = CubicSplineEvaluator(nodes, x)
+
+        return self._spline_evaluator_cache[key]
+
+    def _spline_basis(self, nodes, x):
+        """
+        Get the (cached) natural cubic spline basis matrix for fixed positions.
+
+        Parameters
+        ----------
+        nodes: `np.array`
+           Float array of spline node positions
+        x: `np.array`
+           Float array of positions to evaluate the spline.  The cache is
+           keyed on the contents of nodes and x.
+
+        Returns
+        -------
+        basis: `np.array`
+           Float array (x.size, nodes.size) of spline basis functions at x
+        """
+        if not hasattr(self, '_spline_basis_cache'):
+            self._spline_basis_cache = {}
+
+        key = (nodes.tobytes(), x.tobytes())
+        if key not in self._spline_basis_cache:
+            self._spline_basis_cache[key] = self._spline_evaluator(nodes, x).basis()
+
+        return self._spline_basis_cache[key]
+
+class MedZFitter(Fitter):
     """
     Class to fit a spline to the median value as a function of redshift.
 
@@ -57,6 +181,10 @@ class MedZFitter(object):
         for i in range(len(p0)):
             bounds.append([min_val, max_val])
 
+        # The absolute-deviation cost is not differentiable where the
+        # spline crosses a data point, and its exact (sub)gradient is a
+        # step function that stalls L-BFGS-B.  The finite-difference
+        # gradient with eps=1e-5 smooths over the steps.
         res = scipy.optimize.minimize(self,
                                       p0,
                                       method='L-BFGS-B',
@@ -86,15 +214,15 @@ class MedZFitter(object):
         t: `float`
            Median cost
         """
-        spl = CubicSpline(self._z_nodes, pars)
-        m = spl(self._redshifts)
+        spl = self._spline_evaluator(self._z_nodes, self._redshifts)
+        m = spl(pars)
 
         absdev = np.abs(self._values - m)
         t = np.sum(absdev.astype(np.float64))
 
         return t
 
-class RedSequenceFitter(object):
+class RedSequenceFitter(Fitter):
     """
     Class to fit a spline to the red sequence as a function of redshift.
 
@@ -314,11 +442,19 @@ class RedSequenceFitter(object):
         if not self._fit_scatter and self._trunc is not None:
             self._phi_bma = special.erf((self._trunc / self._gsig) / np.sqrt(2.))
 
-        res = scipy.optimize.minimize(self,
+        # The splines of the fit parameters are linear in the node values
+        if self._fit_mean:
+            self._mean_basis = self._spline_basis(self._mean_nodes, self._redshifts)
+        if self._fit_slope:
+            self._slope_basis = self._spline_basis(self._slope_nodes, self._redshifts)
+        if self._fit_scatter:
+            self._scatter_basis = self._spline_basis(self._scatter_nodes, self._redshifts)
+
+        res = scipy.optimize.minimize(self.value_and_grad,
                                       p0,
                                       method='L-BFGS-B',
                                       bounds=bounds,
-                                      jac=False,
+                                      jac=True,
                                       options={'maxfun': 2000,
                                                'maxiter': 2000,
                                                'maxcor': 20,
@@ -351,24 +487,48 @@ class RedSequenceFitter(object):
         t: `float`
            Total negative log-likelihood.
         """
+        t, _ = self.value_and_grad(pars, compute_grad=False)
+
+        return t
+
+    def value_and_grad(self, pars, compute_grad=True):
+        """
+        Compute the red sequence log-likelihood (negative for minimization)
+        and its gradient with respect to the fit parameters.
+
+        This must be called after the spline bases are set up in fit().
+
+        Parameters
+        ----------
+        pars: `np.array`
+           Concatenated array of all the fit parameters
+        compute_grad: `bool`, optional
+           Compute the gradient?  Default is True.
+
+        Returns
+        -------
+        t: `float`
+           Total negative log-likelihood.
+        grad: `np.array`
+           Gradient of t with respect to pars (None if compute_grad is False)
+        """
         if self._fit_mean:
             # We are fitting the mean
-            spl = CubicSpline(self._mean_nodes, pars[self._mean_index: self._mean_index + self._n_mean_nodes])
-            gmean = spl(self._redshifts)
+            gmean = np.dot(self._mean_basis, pars[self._mean_index: self._mean_index + self._n_mean_nodes])
         else:
             gmean = self._gmean
 
         if self._fit_slope:
             # We are fitting the slope
-            spl = CubicSpline(self._slope_nodes, pars[self._slope_index: self._slope_index + self._n_slope_nodes])
-            gslope = spl(self._redshifts)
+            gslope = np.dot(self._slope_basis, pars[self._slope_index: self._slope_index + self._n_slope_nodes])
         else:
             gslope = self._gslope
 
         if self._fit_scatter:
             # We are fitting the scatter
-            spl = CubicSpline(self._scatter_nodes, pars[self._scatter_index: self._scatter_index + self._n_scatter_nodes])
-            self._gsig = np.sqrt(np.clip(spl(self._redshifts), self._min_scatter, None)**2. + self._err2s)
+            gscat = np.dot(self._scatter_basis, pars[self._scatter_index: self._scatter_index + self._n_scatter_nodes])
+            gscat_clipped = np.clip(gscat, self._min_scatter, None)
+            self._gsig = np.sqrt(gscat_clipped**2. + self._err2s)
 
         if self._fit_scatter and self._trunc is not None:
             phi_bma = special.erf((self._trunc / self._gsig) / np.sqrt(2.))
@@ -386,25 +546,26 @@ class RedSequenceFitter(object):
 
         phi = (1. / self._gsig) * (1. / np.sqrt(2. * np.pi)) * np.exp(-0.5 * xi**2.)
 
-        with np.warnings.catch_warnings():
-            np.warnings.simplefilter("ignore")
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
             # This might have a divide-by-zero, that's okay, we check later.
             gci = phi / phi_bma
 
         if self._has_probs:
             # Use probabilities and bkgs
-            with np.warnings.catch_warnings():
-                np.warnings.simplefilter("ignore")
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
 
-                vals = np.log(self._probs * gci + (1.0 - self._probs) * self._bkgs)
+                lik = self._probs * gci + (1.0 - self._probs) * self._bkgs
+                vals = np.log(lik)
         else:
             # No probabilities or bkgs
-            with np.warnings.catch_warnings():
-                np.warnings.simplefilter("ignore")
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
 
                 vals = np.log(gci)
 
-        bad, = np.where(~np.isfinite(vals))
+        bad = ~np.isfinite(vals)
         vals[bad] = -100.0
 
         if self._fit_scatter and self._use_scatter_prior:
@@ -412,9 +573,53 @@ class RedSequenceFitter(object):
         else:
             t = -np.sum(vals)
 
-        return t
+        if not compute_grad:
+            return t, None
+
+        # dvals/dlog(gci); the clipped (bad) values do not vary
+        if self._has_probs:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                dvals = self._probs * gci / lik
+        else:
+            dvals = np.ones(vals.size)
+        dvals[bad] = 0.0
+
+        grad = np.zeros(pars.size)
+
+        if self._fit_mean or self._fit_slope:
+            # dlog(gci)/dmodel_color = xi / gsig
+            dt_dmodel = -dvals * xi / self._gsig
+
+            if self._fit_mean:
+                grad[self._mean_index: self._mean_index + self._n_mean_nodes] = np.dot(dt_dmodel, self._mean_basis)
+            if self._fit_slope:
+                grad[self._slope_index: self._slope_index + self._n_slope_nodes] = np.dot(dt_dmodel * self._dmags, self._slope_basis)
 
-class RedSequenceOffDiagonalFitter(object):
+        if self._fit_scatter:
+            # dlog(gci)/dgsig, including the truncation normalization
+            dlngci_dgsig = (xi**2. - 1.) / self._gsig
+            if self._trunc is not None:
+                u = (self._trunc / self._gsig) / np.sqrt(2.)
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    dlnphi_bma_dgsig = -(2. / np.sqrt(np.pi)) * np.exp(-u**2.) * (u / self._gsig) / phi_bma
+                dlnphi_bma_dgsig[~np.isfinite(dlnphi_bma_dgsig)] = 0.0
+                dlngci_dgsig -= dlnphi_bma_dgsig
+
+            # dgsig/dscatter is zero where the scatter is clipped
+            dgsig_dscat = np.where(gscat > self._min_scatter, gscat_clipped / self._gsig, 0.0)
+
+            dt_dscat = -dvals * dlngci_dgsig * dgsig_dscat
+            grad[self._scatter_index: self._scatter_index + self._n_scatter_nodes] = np.dot(dt_dscat, self._scatter_basis)
+
+            if self._use_scatter_prior:
+                scatpars = pars[self._scatter_index: self._scatter_index + self._n_scatter_nodes]
+                grad[self._scatter_index: self._scatter_index + self._n_scatter_nodes] += np.where(scatpars > self._min_scatter, 1. / scatpars, 0.0)
+
+        return t, grad
+
+class RedSequenceOffDiagonalFitter(Fitter):
     """
     Class to fit a spline to a pair of off-diagonal elements of the
     red-sequence covariance matrix.
@@ -529,15 +734,17 @@ class RedSequenceOffDiagonalFitter(object):
         for i in range(self._nodes.size):
             bounds.append((-0.9, 0.9))
 
-        res = scipy.optimize.minimize(self,
+        # The spline of the correlation is linear in the node values
+        self._basis = self._spline_basis(self._nodes, self._redshifts)
+
+        res = scipy.optimize.minimize(self.value_and_grad,
                                       p0,
                                       method='L-BFGS-B',
                                       bounds=bounds,
-                                      jac=False,
+                                      jac=True,
                                       options={'maxfun': 2000,
                                                'maxiter': 2000,
                                                'maxcor': 20,
-                                               'eps': 1e-3,
                                                'gtol': 1e-8},
                                       callback=None)
         pars = res.x
@@ -558,9 +765,35 @@ class RedSequenceOffDiagonalFitter(object):
         t: `float`
            Total negative log-likelihood
         """
+        t, _ = self.value_and_grad(pars, compute_grad=False)
+
+        return t
+
+    def value_and_grad(self, pars, compute_grad=True):
+        """
+        Compute the off-diagonal log-likelihood (negative for minimization)
+        and its gradient with respect to the fit parameters.
 
-        spl = CubicSpline(self._nodes, pars)
-        r = np.clip(spl(self._redshifts), -0.9, 0.9)
+        This must be called after the spline basis is set up in fit().  The
+        eigenvalue wall is a constant penalty, and does not contribute to
+        the gradient.
+
+        Parameters
+        ----------
+        pars: `np.array`
+           Float array of the correlation (r) values
+        compute_grad: `bool`, optional
+           Compute the gradient?  Default is True.
+
+        Returns
+        -------
+        t: `float`
+           Total negative log-likelihood
+        grad: `np.array`
+           Gradient of t with respect to pars (None if compute_grad is False)
+        """
+        r_raw = np.dot(self._basis, pars)
+        r = np.clip(r_raw, -0.9, 0.9)
 
         metrics = np.zeros((2, 2, self._redshifts.size))
         self._c_int[0, 1, :] = r * self._s1 * self._s2
@@ -585,15 +818,19 @@ class RedSequenceOffDiagonalFitter(object):
 
         gci = (dets**(-0.5) / (2. * np.pi)) * np.exp(exponents)
 
-        vals = np.log(self._probs * gci + (1. - self._probs ) * self._bkgs)
+        like = self._probs * gci + (1. - self._probs ) * self._bkgs
+        vals = np.log(like)
 
-        bad, = np.where(~np.isfinite(vals))
+        bad = ~np.isfinite(vals)
         vals[bad] = -100
 
         t=-(np.sum(vals) - np.sum(0.5 * (pars / self._covmat_prior)**2.))
 
         if ~np.isfinite(t):
             t = 1e11
+            if compute_grad:
+                return t, np.zeros(pars.size)
+            return t, None
         else:
             wall = False
 
@@ -607,9 +844,25 @@ class RedSequenceOffDiagonalFitter(object):
             if wall:
                 t += 100000
 
-        return t
+        if not compute_grad:
+            return t, None
+
+        # d(log gci)/d(c_01), with the exponent -0.5 * q / dets
+        c01 = covmats[0, 1, :]
+        q = -2. * exponents * dets
+        dlngci_dc01 = (c01 + self._d1 * self._d2) / dets - q * c01 / dets**2.
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            dt_dr = -self._probs * gci * dlngci_dc01 * self._s1 * self._s2 / like
+        # The correlation does not vary where it is clipped
+        dt_dr[bad | (r_raw != r) | (~np.isfinite(dt_dr))] = 0.0
 
-class CorrectionFitter(object):
+        grad = np.dot(dt_dr, self._basis) + pars / self._covmat_prior**2.
+
+        return t, grad
+
+class CorrectionFitter(Fitter):
     """
     Class for fit a spline to the zred corrections as a function of redshift.
 
@@ -791,15 +1044,29 @@ class CorrectionFitter(object):
             self._gbkg = np.clip(spl(self._redshifts), 1e-10, None)
             self._gci1 = (1. / np.sqrt(2. * np.pi * self._gbkg)) * np.exp(-self._dzs**2. / (2. * self._gbkg))
 
-        res = scipy.optimize.minimize(self,
+        # The splines of the fit parameters are linear in the node values
+        if self._fit_mean:
+            self._mean_basis = self._spline_basis(self._mean_nodes, self._redshifts)
+        if self._fit_slope:
+            self._slope_basis = self._spline_basis(self._slope_nodes, self._redshifts)
+        if self._fit_r:
+            self._r_basis = self._spline_basis(self._r_nodes, self._redshifts)
+        if self._fit_bkg:
+            self._bkg_basis = self._spline_basis(self._bkg_nodes, self._redshifts)
+
+        # The background width is clipped at 1e-10, which makes the
+        # likelihood very stiff near the lower bound.  With the exact
+        # gradient the default ftol stops the minimizer early there, so
+        # ftol is tightened.
+        res = scipy.optimize.minimize(self.value_and_grad,
                                       p0,
                                       method='L-BFGS-B',
                                       bounds=bounds,
-                                      jac=False,
+                                      jac=True,
                                       options={'maxfun': 5000,
                                                'maxiter': 5000,
                                                'maxcor': 20,
-                                               'eps': 1e-5,
+                                               'ftol': 1e-12,
                                                'gtol': 1e-10},
                                       callback=None)
         pars = res.x
@@ -832,28 +1099,28 @@ class CorrectionFitter(object):
         """
 
         if self._fit_mean:
-            spl = CubicSpline(self._mean_nodes, pars[self._mean_index: self._mean_index + self._n_mean_nodes])
-            gmean = spl(self._redshifts)
+            spl = self._spline_evaluator(self._mean_nodes, self._redshifts)
+            gmean = spl(pars[self._mean_index: self._mean_index + self._n_mean_nodes])
         else:
             gmean = self._gmean
 
         if self._fit_slope:
-            spl = CubicSpline(self._slope_nodes, pars[self._slope_index: self._slope_index + self._n_slope_nodes])
-            gslope = spl(self._redshifts)
+            spl = self._spline_evaluator(self._slope_nodes, self._redshifts)
+            gslope = spl(pars[self._slope_index: self._slope_index + self._n_slope_nodes])
         else:
             gslope = self._gslope
 
         if self._fit_r:
-            spl = CubicSpline(self._r_nodes, pars[self._r_index: self._r_index + self._n_r_nodes])
-            gr = spl(self._redshifts)
+            spl = self._spline_evaluator(self._r_nodes, self._redshifts)
+            gr = spl(pars[self._r_index: self._r_index + self._n_r_nodes])
         else:
             gr = self._gr
 
         if self._fit_bkg:
             #if pars[self._bkg_index: self._bkg_index + self._n_bkg_nodes].min() < 0.0:
             #    return 1e11
-            spl = CubicSpline(self._bkg_nodes, pars[self._bkg_index: self._bkg_index + self._n_bkg_nodes])
-            gbkg = np.clip(spl(self._redshifts), 1e-10, None)
+            spl = self._spline_evaluator(self._bkg_nodes, self._redshifts)
+            gbkg = np.clip(spl(pars[self._bkg_index: self._bkg_index + self._n_bkg_nodes]), 1e-10, None)
             gci1 = (1. / np.sqrt(2. * np.pi * gbkg)) * np.exp(-self._dzs**2. / (2. * gbkg))
         else:
             gbkg = self._gbkg
@@ -873,8 +1140,105 @@ class CorrectionFitter(object):
 
         return t
 
+    def value_and_grad(self, pars):
+        """
+        Compute the correction log-likelihood (negative for minimization) and
+        its gradient with respect to the fit parameters.
+
+        This must be called after the spline bases are set up in fit().
+
+        Parameters
+        ----------
+        pars: `np.array`
+           Float array of the consolidate parameters
+
+        Returns
+        -------
+        t: `float`
+           Total negative log-likelihood
+        grad: `np.array`
+           Gradient of t with respect to pars
+        """
+        if self._fit_mean:
+            gmean = np.dot(self._mean_basis, pars[self._mean_index: self._mean_index + self._n_mean_nodes])
+        else:
+            gmean = self._gmean
+
+        if self._fit_slope:
+            gslope = np.dot(self._slope_basis, pars[self._slope_index: self._slope_index + self._n_slope_nodes])
+        else:
+            gslope = self._gslope
+
+        if self._fit_r:
+            gr = np.dot(self._r_basis, pars[self._r_index: self._r_index + self._n_r_nodes])
+        else:
+            gr = self._gr
+
+        if self._fit_bkg:
+            gbkg_raw = np.dot(self._bkg_basis, pars[self._bkg_index: self._bkg_index + self._n_bkg_nodes])
+            gbkg = np.clip(gbkg_raw, 1e-10, None)
+            gci1 = (1. / np.sqrt(2. * np.pi * gbkg)) * np.exp(-self._dzs**2. / (2. * gbkg))
+        else:
+            gbkg = self._gbkg
+            gci1 = self._gci1
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+
+            var0 = (gr * self._dz_errs)**2.
+            resid = self._dzs - (gmean + gslope * self._dmags)
+            gci0 = (1. / np.sqrt(2. * np.pi * var0)) * np.exp(-resid**2. / (2. * var0))
+
+            vals = self._ws * (self._probs * gci0 + (1. - self._probs) * gci1)
+
+        bad = (~np.isfinite(vals)) | (vals <= 0.0)
+        vals[bad] = 4e-44
+
+        t = -np.sum(np.log(vals))
+
+        # dt/dgci0 and dt/dgci1; the clipped (bad) values do not vary
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+
+            dt_dgci0 = -self._ws * self._probs / vals
+            dt_dgci1 = -self._ws * (1. - self._probs) / vals
+        dt_dgci0[bad] = 0.0
+        dt_dgci1[bad] = 0.0
+
+        grad = np.zeros(pars.size)
+
+        if self._fit_mean or self._fit_slope:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                dt_dmodel = dt_dgci0 * gci0 * resid / var0
+            dt_dmodel[~np.isfinite(dt_dmodel)] = 0.0
+
+            if self._fit_mean:
+                grad[self._mean_index: self._mean_index + self._n_mean_nodes] = np.dot(dt_dmodel, self._mean_basis)
+            if self._fit_slope:
+                grad[self._slope_index: self._slope_index + self._n_slope_nodes] = np.dot(dt_dmodel * self._dmags, self._slope_basis)
+
+        if self._fit_r:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                dt_dr = dt_dgci0 * gci0 * (resid**2. / var0 - 1.) / gr
+            dt_dr[~np.isfinite(dt_dr)] = 0.0
+
+            grad[self._r_index: self._r_index + self._n_r_nodes] = np.dot(dt_dr, self._r_basis)
+
+        if self._fit_bkg:
+            # dgbkg/dbkg is zero where the background is clipped
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                dt_dbkg = dt_dgci1 * gci1 * (self._dzs**2. / (2. * gbkg**2.) - 1. / (2. * gbkg))
+            dt_dbkg[(gbkg_raw <= 1e-10) | (~np.isfinite(dt_dbkg))] = 0.0
+
+            grad[self._bkg_index: self._bkg_index + self._n_bkg_nodes] = np.dot(dt_dbkg, self._bkg_basis)
+
+        return t, grad
 
-class EcgmmFitter(object):
+
+class EcgmmFitter(Fitter):
     """
     Class to fit the error-corrected Gaussian Mixture Model (ECGMM), see Hao et
     al. (2009) (ApJ).
@@ -944,11 +1308,11 @@ class EcgmmFitter(object):
         else:
             _bounds = bounds
 
-        res = scipy.optimize.minimize(self,
+        res = scipy.optimize.minimize(self.value_and_grad,
                                       p0,
                                       method='L-BFGS-B',
                                       bounds=_bounds,
-                                      jac=False,
+                                      jac=True,
                                       options={'maxfun': 2000,
                                                'maxiter': 2000,
                                                'maxcor': 20,
@@ -1004,3 +1368,46 @@ class EcgmmFitter(object):
         t = np.sum(np.log(g))
 
         return -t
+
+    def value_and_grad(self, pars):
+        """
+        Compute the ECGMM log-likelihood (negative for minimization) and its
+        gradient.
+
+        Parameters
+        ----------
+        pars: `np.array`
+           Float array of the combined parameters
+           pars: [wt0, mu0, mu1, sigma0, sigma1]
+
+        Returns
+        -------
+        t: `float`
+           Total negative log-likelihood
+        grad: `np.array`
+           Gradient of t with respect to pars
+        """
+        wt = np.array([pars[0], 1.0 - pars[0]])
+        mu = pars[1: 3]
+        sigma = pars[3: 5]
+
+        grad = np.zeros(5)
+
+        comps = []
+        for i in xrange(2):
+            var = sigma[i]**2. + self._y_err2
+            resid = self._y - mu[i]
+            comps.append((var, resid, (1. / np.sqrt(2. * np.pi * var)) * np.exp(-resid**2. / (2. * var))))
+
+        g = wt[0] * comps[0][2] + wt[1] * comps[1][2]
+
+        t = -np.sum(np.log(g))
+
+        grad[0] = -np.sum((comps[0][2] - comps[1][2]) / g)
+        for i in xrange(2):
+            var, resid, gauss = comps[i]
+            wgauss = wt[i] * gauss / g
+            grad[1 + i] = -np.sum(wgauss * resid / var)
+            grad[3 + i] = -np.sum(wgauss * (resid**2. / var**2. - 1. / var) * sigma[i])
+
+        return t, grad
@@ -15,11 +15,13 @@ import healpy as hp
 import os
 import glob
 import re
+import uuid
+import socket
 from collections.abc import Iterable
 
 from .catalog import Catalog, Entry
 from .mask import get_mask
-from .utilities import make_lockfile
+from .utilities import make_lockfile, lockfile_is_stale
 
 
 def zred_extra_dtype(nsamp):
@@ -82,10 +84,14 @@ class GalaxyCatalog(Catalog):
            information)
         depth: `int`, optional
            HTM matcher depth, default is 10.
+        nside_index: `int`, optional
+           Healpix nside of the magnitude-sorted neighbor index, default is 256.
         """
         super(GalaxyCatalog, self).__init__(*arrays)
         self._htm_matcher = None
         self.depth = 10 if 'depth' not in kwargs else kwargs['depth']
+        self._mag_index = None
+        self.nside_index = 256 if 'nside_index' not in kwargs else kwargs['nside_index']
 
     @classmethod
     def from_galfile(cls, filename, zredfile=None, nside=0, hpix=[], border=0.0, truth=False):
@@ -332,13 +338,17 @@ class GalaxyCatalog(Catalog):
         if len(dtype_augment) > 0:
             self.add_fields(dtype_augment)
 
-    def match_one(self, ra, dec, radius):
+    def match_one(self, ra, dec, radius, maxmag=None):
         """
         Match one ra/dec position to the galaxy catalog.
 
         This is typically used when finding all the neighbors around a cluster
         over a relatively large area.
 
+        If maxmag is set, the match is done with a healpix index where each
+        cell is sorted by refmag, so only galaxies brighter than maxmag are
+        gathered from each cell.
+
         Parameters
         ----------
         ra: `float`
@@ -347,6 +357,8 @@ class GalaxyCatalog(Catalog):
            Declination to match to.
         radius: `float`
            Match radius (degrees)
+        maxmag: `float`, optional
+           Maximum refmag of matched galaxies.  Default is None (no cut).
 
         Returns
         -------
@@ -355,6 +367,9 @@ class GalaxyCatalog(Catalog):
         dists: `np.array`
            Float array of distance (degrees) from each galaxy in indices
         """
+        if maxmag is not None:
+            return self._match_one_maglim(ra, dec, radius, maxmag)
+
         if self._htm_matcher is None:
             self._htm_matcher = Matcher(self.depth, self.ra, self.dec)
 
@@ -362,6 +377,84 @@ class GalaxyCatalog(Catalog):
 
         return indices, dists
 
+    def _build_mag_index(self):
+        """
+        Internal method to build the magnitude-sorted healpix neighbor index.
+
+        Galaxies are sorted by (nest pixel, refmag), and the offset of the
+        first galaxy in each occupied pixel is recorded.
+        """
+        ipnest = hp.ang2pix(self.nside_index, np.radians(90.0 - self.dec),
+                            np.radians(self.ra), nest=True)
+
+        st = np.lexsort((self.refmag, ipnest))
+
+        cells, starts = np.unique(ipnest[st], return_index=True)
+
+        self._mag_index = {'sort': st,
+                           'refmag': self.refmag[st],
+                           'cells': cells,
+                           'starts': np.append(starts, st.size)}
+
+    def _match_one_maglim(self, ra, dec, radius, maxmag):
+        """
+        Internal method to match one ra/dec position to the galaxy catalog,
+        keeping only galaxies with refmag <= maxmag.
+
+        Parameters
+        ----------
+        ra: `float`
+           Right ascension to match to.
+        dec: `float`
+           Declination to match to.
+        radius: `float`
+           Match radius (degrees)
+        maxmag: `float`
+           Maximum refmag of matched galaxies.
+
+        Returns
+        -------
+        indices: `np.array`
+           Integer array of GalaxyCatalog indices that match to input ra/dec,
+           sorted by increasing distance
+        dists: `np.array`
+           Float array of distance (degrees) from each galaxy in indices
+        """
+        if self._mag_index is None:
+            self._build_mag_index()
+
+        vec = hp.ang2vec(np.radians(90.0 - dec), np.radians(ra))
+        qpix = hp.query_disc(self.nside_index, vec, np.radians(radius),
+                             inclusive=True, nest=True)
+
+        # Only the occupied cells are in the index
+        cells = self._mag_index['cells']
+        pos = np.clip(np.searchsorted(cells, qpix), 0, cells.size - 1)
+        pos = pos[cells[pos] == qpix]
+
+        starts = self._mag_index['starts'][pos]
+        ends = self._mag_index['starts'][pos + 1]
+
+        # Each cell is sorted by refmag, so stop at the magnitude limit
+        refmag = self._mag_index['refmag']
+        ends = np.array([start + np.searchsorted(refmag[start: end], maxmag, side='right')
+                         for start, end in zip(starts, ends)], dtype=np.int64)
+
+        nper = ends - starts
+        if nper.sum() == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+        offsets = np.repeat(starts - np.cumsum(nper) + nper, nper)
+        cand = self._mag_index['sort'][offsets + np.arange(nper.sum())]
+
+        dists = esutil.coords.sphdist(ra, dec, self.ra[cand], self.dec[cand])
+        use, = np.where(dists <= radius)
+
+        # Return in order of increasing distance, as the htm matcher does
+        st = np.argsort(dists[use], kind='mergesort')
+
+        return cand[use[st]], dists[use[st]]
+
     def match_many(self, ras, decs, radius, maxmatch=0):
         """
         Match many ra/dec positions to the galaxy catalog.
@@ -510,10 +603,21 @@ class GalaxyCatalogMaker(object):
         # insert code to translate to file format
         maker.append_galaxies(galaxies)
     maker.finalize_catalog()
+
+    Galaxies are buffered in memory per pixel, and the pixel files are only
+    written when the buffer exceeds buffer_mb, on flush(), or on
+    finalize_catalog().  In parallel mode, each maker writes its own
+    per-pixel part files (no locking is needed), and the last maker to
+    finalize merges the part files into the pixel files.  If nwriters is
+    set, the merge waits for that many makers to finalize, so the makers
+    may be created at any time (e.g. staggered array jobs).  Otherwise
+    it waits for all the makers that have been created; a maker on this
+    host whose process has died is skipped with a message.
     """
 
     def __init__(self, outbase, info_dict, nside=32, maskfile=None, mask_mode=0,
-                 parallel=False, generate_unique_ids=False):
+                 parallel=False, generate_unique_ids=False, buffer_mb=500.0,
+                 nwriters=None):
         """
         Instantiate a GalaxyCatalogMaker
 
@@ -546,10 +650,18 @@ class GalaxyCatalogMaker(object):
            This is part of a parallel job of writing files.
         generate_unique_ids: `bool`, optional
            Make new unique galaxy ids
+        buffer_mb: `float`, optional
+           Maximum size of the in-memory galaxy buffer (MB) before the pixel
+           files are written.  Default is 500.
+        nwriters: `int`, optional
+           Total number of parallel makers.  Default is None (wait for the
+           makers that have been created).
         """
 
         self.parallel = parallel
+        self.nwriters = nwriters
         self.generate_unique_ids = generate_unique_ids
+        self.buffer_mb = buffer_mb
 
         # Record values
         self.outbase = outbase
@@ -634,6 +746,20 @@ class GalaxyCatalogMaker(object):
         # create a table
         self.ngals = np.zeros(hp.nside2npix(self.nside), dtype=np.int32)
 
+        # Buffered galaxies, a list of arrays for each pixel
+        self._buffer = {}
+        self._buffer_nbytes = 0
+
+        # Unique tag for part files from this maker in parallel mode
+        self._part_tag = '%d%s' % (os.getpid(), uuid.uuid4().hex[: 8])
+
+        # Register this maker as an active writer in parallel mode, so that
+        # the part files are only merged when all writers have finished.
+        # The marker records the owner, as for a lockfile.
+        if self.parallel:
+            with open(self._writer_filename('active'), 'w') as f:
+                f.write('%s %d\n' % (socket.gethostname(), os.getpid()))
+
         # And read in mask if necessary
         self.mask = None
         if maskfile is not None:
@@ -664,6 +790,9 @@ class GalaxyCatalogMaker(object):
         """
         Append a set of galaxies to a galaxy catalog.
 
+        The galaxies are buffered, and written out by flush() when the buffer
+        is full.
+
         Parameters
         ----------
         gals: `np.ndarray`
@@ -691,40 +820,141 @@ class GalaxyCatalogMaker(object):
         for pix in gdpix:
             i1a = rev[rev[pix]: rev[pix + 1]]
 
+            self._buffer.setdefault(pix, []).append(gals[i1a])
+            self._buffer_nbytes += i1a.size * gals.dtype.itemsize
+
+        if self._buffer_nbytes > self.buffer_mb * 1024 * 1024:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all the buffered galaxies to the pixel files.
+
+        In parallel mode, the galaxies are written to part files that are
+        unique to this maker, and merged in finalize_catalog().
+        """
+        for pix in sorted(self._buffer.keys()):
+            if len(self._buffer[pix]) == 1:
+                gals = self._buffer[pix][0]
+            else:
+                gals = np.concatenate(self._buffer[pix])
+
             fname = os.path.join(self.outpath, '%s_%07d.fit' % (self.outbase_nopath, pix))
 
             if self.parallel:
-                # Parallel writing mode
-                lockfile = fname + '.lock'
-                locktest = make_lockfile(lockfile, block=True, maxtry=300, waittime=2)
-                if not locktest:
-                    raise RuntimeError("Could not get a lock to write galaxies!")
-
-                if not os.path.isfile(fname):
-                    # Create a new file
-                    fitsio.write(fname, gals[i1a])
-                else:
-                    fits = fitsio.FITS(fname, mode='rw')
-                    fits[1].append(gals[i1a])
-                    fits.close()
-
-                # Clear the lockfile
-                os.remove(lockfile)
+                # Parallel writing mode, only this maker writes the part file
+                partname = os.path.join(self.outpath, '%s_%07d_part%s.fit' %
+                                        (self.outbase_nopath, pix, self._part_tag))
+                self._write_or_append(partname, gals, os.path.isfile(partname))
             else:
                 # Regular serial writing
 
                 if (self.ngals[pix] == 0) and (os.path.isfile(fname)):
                     raise RuntimeError("We think there are 0 galaxies in pixel %d, but the file exists." % (pix))
 
-                if self.ngals[pix] == 0:
-                    # Create a new file
-                    fitsio.write(fname, gals[i1a])
-                else:
-                    fits = fitsio.FITS(fname, mode='rw')
-                    fits[1].append(gals[i1a])
-                    fits.close()
+                self._write_or_append(fname, gals, self.ngals[pix] > 0)
+
+            self.ngals[pix] += gals.size
+
+        self._buffer = {}
+        self._buffer_nbytes = 0
+
+    def _write_or_append(self, fname, gals, append):
+        """
+        Write galaxies to a new file, or append to an existing file.
+
+        Parameters
+        ----------
+        fname: `str`
+           Filename to write.
+        gals: `np.ndarray`
+           Galaxy catalog structure.
+        append: `bool`
+           Append to an existing file?
+        """
+        if append:
+            with fitsio.FITS(fname, mode='rw') as fits:
+                fits[1].append(gals)
+        else:
+            fitsio.write(fname, gals)
+
+    def _writer_filename(self, state):
+        """
+        Get the name of the marker file for this (parallel) maker.
+
+        Parameters
+        ----------
+        state: `str`
+           Writer state, 'active' or 'done'
 
-            self.ngals[pix] += i1a.size
+        Returns
+        -------
+        filename: `str`
+           Marker filename
+        """
+        return os.path.join(self.outpath, '%s_writer%s.%s' % (self.outbase_nopath,
+                                                              self._part_tag, state))
+
+    def _all_writers_done(self):
+        """
+        Check if all the parallel makers have finalized.
+
+        Markers of active makers on this host whose process is gone are
+        removed, with a message.
+
+        Returns
+        -------
+        done: `bool`
+           True if the part files can be merged.
+        """
+        if self.nwriters is not None:
+            ndone = len(glob.glob('%s/%s_writer*.done' % (self.outpath, self.outbase_nopath)))
+            if ndone < self.nwriters:
+                print("Deferring master table %s: %d of %d writers have finished." %
+                      (self.filename, ndone, self.nwriters))
+                return False
+            return True
+
+        active = []
+        for f in sorted(glob.glob('%s/%s_writer*.active' % (self.outpath, self.outbase_nopath))):
+            if lockfile_is_stale(f):
+                print("Warning: writer marker %s was left by a process that is gone; "
+                      "its galaxies may be incomplete." % (f))
+                try:
+                    os.remove(f)
+                except OSError:
+                    pass
+            elif os.path.isfile(f):
+                active.append(f)
+
+        if len(active) > 0:
+            print("Deferring master table %s: %d writers are still active (%s)." %
+                  (self.filename, len(active), ', '.join(os.path.basename(f) for f in active)))
+            return False
+
+        return True
+
+    def _merge_part_files(self):
+        """
+        Merge the part files from all the parallel makers into the pixel files.
+        """
+        partfiles = sorted(glob.glob('%s/%s_???????_part*.fit' % (self.outpath, self.outbase_nopath)))
+
+        parts_by_pix = {}
+        for f in partfiles:
+            m = re.search(r'_(\d{7})_part[^_]*\.fit$', f)
+            if m is None:
+                raise RuntimeError("Malformed filename for pixel part file: %s" % (f))
+            parts_by_pix.setdefault(int(m.groups()[0]), []).append(f)
+
+        for pix in sorted(parts_by_pix.keys()):
+            gals = np.concatenate([fitsio.read(f, ext=1) for f in parts_by_pix[pix]])
+
+            fname = os.path.join(self.outpath, '%s_%07d.fit' % (self.outbase_nopath, pix))
+            self._write_or_append(fname, gals, os.path.isfile(fname))
+
+            for f in parts_by_pix[pix]:
+                os.remove(f)
 
     def finalize_catalog(self):
         """
@@ -733,13 +963,25 @@ class GalaxyCatalogMaker(object):
         This should be the last step.
         """
 
+        self.flush()
+
         if self.parallel:
             # Only one can write the final catalog
 
+            # Mark this maker as done
+            if os.path.isfile(self._writer_filename('active')):
+                os.replace(self._writer_filename('active'), self._writer_filename('done'))
+            self.is_finalized = True
+
             # If the final file is there, we're already done.
             if os.path.isfile(self.filename):
                 return
 
+            # If other makers are still writing, the last one to finish is
+            # responsible for the final output.
+            if not self._all_writers_done():
+                return
+
             # Try to get a lock
             lockfile = self.filename + '.lock'
             locktest = make_lockfile(lockfile, block=False)
@@ -750,13 +992,17 @@ class GalaxyCatalogMaker(object):
 
             # We have a lock and the file isn't written, so we need to do the
             # consolidation
+            self._merge_part_files()
+
+            for f in glob.glob('%s/%s_writer*.done' % (self.outpath, self.outbase_nopath)):
+                os.remove(f)
 
             self.ngals[:] = 0
 
             # Figure out which hpixels are there
             files = sorted(glob.glob('%s/%s_???????.fit' % (self.outpath, self.outbase_nopath)))
             for f in files:
-                m = re.search('_(\d{7})', f)
+                m = re.search(r'_(\d{7})', f)
                 if m is None:
                     raise RuntimeError("Malformed filename for pixel file: %s" % (f))
 
@@ -11,16 +11,23 @@ import fitsio
 import healpy as hp
 import numpy as np
 import os
+import time
+import tempfile
+import hashlib
+from multiprocessing import Pool
 from scipy.special import erf
 import scipy.integrate
 import healsparse
 
 from .catalog import Catalog,Entry
 from .utilities import TOTAL_SQDEG, SEC_PER_DEG, astro_to_sphere, calc_theta_i, apply_errormodels
-from .utilities import make_lockfile, sample_from_pdf, chisq_pdf, schechter_pdf, nfw_pdf
-from .utilities import get_healsparse_subpix_indices
+from .utilities import make_lockfile, lockfile_is_stale, sample_from_pdf, chisq_pdf, schechter_pdf, nfw_pdf, make_rng
+from .utilities import get_healsparse_subpix_indices, project_maskgals, DenseHealsparseMap
 
-CURRENT_MASKGAL_VERSION = 7
+CURRENT_MASKGAL_VERSION = 8
+
+# Maximum age (seconds) of a maskgal lock held from another host
+MASKGAL_LOCK_MAXAGE = 3600.0
 
 class Mask(object):
     """
@@ -49,7 +56,7 @@ class Mask(object):
         if include_maskgals:
             self.read_maskgals(config.maskgalfile)
 
-    def compute_radmask(self, ra, dec):
+    def compute_radmask(self, ra, dec, rands=None):
         """
         Compute the geometric mask value at a list of positions.
 
@@ -59,6 +66,9 @@ class Mask(object):
            Float array of right ascensions
         dec: `np.array`
            Float array of declinations
+        rands: `np.array`, optional
+           Uniform random numbers, one per position.  Unused for the bare
+           mask.
 
         Returns
         -------
@@ -78,43 +88,83 @@ class Mask(object):
         """
         Read the "maskgal" file for monte carlo estimation of coverage.
 
-        Note that this reads the file into the object.
+        Note that this reads the file into the object.  The maskgals are
+        cached in a file named from maskgalfile and a hash of the generating
+        config parameters (see maskgal_filename()), so that only runs with
+        compatible parameters share a file.  If the file does not exist, it
+        is generated.  Only one job generates the file at a time; other jobs
+        wait for it to appear.
 
         Parameters
         ----------
         maskgalfile: `str`
-           Filename of maskgal file with monte carlo galaxies
+           Base filename of maskgal file with monte carlo galaxies
         """
 
-        make_maskgals = False
+        cfghash = _maskgal_config_hash(self.config)
+        maskgalfile = maskgal_filename(self.config, maskgalfile)
+
         lockfile = maskgalfile + '.lock'
-        # locktest = make_lockfile(lockfile, block=True, maxtry=300, waittime=2)
-        # locktest = make_lockfile(lockfile, block=True, maxtry=500,
-        #                          waittime=10*(1+np.random.ranf()))
-        locktest = True
-        if not locktest:
-            raise RuntimeError("Could not get a lock to read/write maskgals!")
+        waiting = False
+        while not self._check_maskgals(maskgalfile, cfghash):
+            if make_lockfile(lockfile, block=False):
+                try:
+                    # Another job may have finished it while we checked
+                    if not self._check_maskgals(maskgalfile, cfghash):
+                        self._gen_maskgals(maskgalfile)
+                finally:
+                    os.remove(lockfile)
+            elif lockfile_is_stale(lockfile, maxage=MASKGAL_LOCK_MAXAGE):
+                # The job holding the lock is gone.  Remove the lock and try
+                # again.  If two jobs do this at once they may both generate
+                # the file, which is safe because it is written atomically.
+                self.config.logger.info("Removing stale maskgal lock %s" % (lockfile))
+                try:
+                    os.remove(lockfile)
+                except OSError:
+                    pass
+            else:
+                if not waiting:
+                    self.config.logger.info("Waiting for maskgals in %s" % (maskgalfile))
+                    waiting = True
+                time.sleep(2)
+
+        # Read the maskgals
+        # These are going to be *all* the maskgals, but we only operate on a subset
+        # at a time.  Any file renamed into place here since the check was
+        # generated with the same parameters.
+        self.maskgals_all = Catalog.from_fits_file(maskgalfile)
 
+    def _check_maskgals(self, maskgalfile, cfghash):
+        """
+        Check if a maskgal file exists and is up to date.
+
+        Parameters
+        ----------
+        maskgalfile: `str`
+           Filename of maskgal file
+        cfghash: `str`
+           Expected hash of the maskgal generation parameters
+
+        Returns
+        -------
+        ok: `bool`
+           True if the file can be used.
+        """
         if not os.path.isfile(maskgalfile):
-            # We don't have the maskgals...generate them
-            self._gen_maskgals(maskgalfile)
+            return False
 
-        # Check version
         hdr = fitsio.read_header(maskgalfile, ext=1)
         if (hdr['version'] != CURRENT_MASKGAL_VERSION):
-            # Generate new maskgals
             self.config.logger.info("Found old maskgals file (version %d).  Generating version %d" % (hdr['version'], CURRENT_MASKGAL_VERSION))
-            self._gen_maskgals(maskgalfile)
-
-        # Read the maskgals
-        # These are going to be *all* the maskgals, but we only operate on a subset
-        # at a time
-        self.maskgals_all = Catalog.from_fits_file(maskgalfile)
+            return False
+        if ('cfghash' not in hdr) or (hdr['cfghash'] != cfghash):
+            self.config.logger.info("Found maskgals file %s with different config parameters.  Regenerating." % (maskgalfile))
+            return False
 
-        # Clear lockfile
-        # os.remove(lockfile)
+        return True
 
-    def select_maskgals_sample(self, maskgal_index=None):
+    def select_maskgals_sample(self, maskgal_index=None, rng=None):
         """
         Select a subset of maskgals by sampling.
 
@@ -125,10 +175,14 @@ class Mask(object):
         maskgal_index: `int`, optional
            Pre-selected index to sample from (for reproducibility).
            Default is None (select randomly).
+        rng: `np.random.Generator`, optional
+           Random number generator.  Default is None (global numpy state).
         """
 
         if maskgal_index is None:
-            maskgal_index = np.random.choice(self.config.maskgal_nsamples)
+            if rng is None:
+                rng = np.random
+            maskgal_index = rng.choice(self.config.maskgal_nsamples)
 
         self.maskgals = self.maskgals_all[maskgal_index * self.config.maskgal_ngals:
                                               (maskgal_index + 1) * self.config.maskgal_ngals]
@@ -139,6 +193,13 @@ class Mask(object):
         """
         Internal method to generate the maskgal monte carlo galaxies.
 
+        Each of the config.maskgal_nsamples samples is generated
+        independently, in parallel with config.calib_nproc processes.  If
+        config.rng_seed is set, each sample has its own seeded stream, so
+        the output does not depend on the number of processes.  Otherwise a
+        serial run draws from the global numpy random state.  The file is
+        written to a temporary file and renamed into place.
+
         Parameters
         ----------
         maskgalfile: `str`
@@ -151,119 +212,39 @@ class Mask(object):
         nradbins = np.ceil((maxrad - minrad) / self.config.maskgal_rad_stepsize).astype(np.int32) + 1
         radbins = np.arange(nradbins, dtype=np.float32) * self.config.maskgal_rad_stepsize + minrad
 
-        nmag = self.config.nmag
-        ncol = nmag - 1
-
-        ngals = self.config.maskgal_ngals * self.config.maskgal_nsamples
-
-        maskgals = Catalog.zeros(ngals, dtype=[('r', 'f4'),
-                                               ('phi', 'f4'),
-                                               ('x', 'f4'),
-                                               ('y', 'f4'),
-                                               ('r_uniform', 'f4'),
-                                               ('x_uniform', 'f4'),
-                                               ('y_uniform', 'f4'),
-                                               ('m', 'f4'),
-                                               ('refmag', 'f4'),
-                                               ('refmag_obs', 'f4'),
-                                               ('refmag_obs_err', 'f4'),
-                                               ('chisq', 'f4'),
-                                               ('cwt', 'f4'),
-                                               ('chisq_pdf', 'f4'),
-                                               ('nfw', 'f4'),
-                                               ('dzred', 'f4'),
-                                               ('zwt', 'f4'),
-                                               ('lumwt', 'f4'),
-                                               ('lum_pdf', 'f4'),
-                                               ('limmag', 'f4'),
-                                               ('limmag_dered', 'f4'),
-                                               ('exptime', 'f4'),
-                                               ('m50', 'f4'),
-                                               ('eff', 'f4'),
-                                               ('w', 'f4'),
-                                               ('theta_r', 'f4', nradbins),
-                                               ('mark', np.bool),
-                                               ('radbins', 'f4', nradbins),
-                                               ('nin', 'f4', nradbins),
-                                               ('nin_orig', 'f4', nradbins),
-                                               ('zp', 'f4'),
-                                               ('ebv', 'f4'),
-                                               ('extinction', 'f4'),
-                                               ('nsig', 'f4')])
-
-        maskgals['radbins'] = np.tile(radbins, maskgals.size).reshape(maskgals.size, nradbins)
-
-        # Generate chisq
-        maskgals.chisq = sample_from_pdf(chisq_pdf, [0.0, self.config.chisq_max],
-                                         self.config.chisq_max / 10000.,
-                                         maskgals.size, k=ncol)
-        # Generate mstar
-        maskgals.m = sample_from_pdf(schechter_pdf,
-                                     [-2.5*np.log10(10.0),
-                                       -2.5*np.log10(self.config.lval_reference) + self.config.maskgal_dmag_extra],
-                                     0.002, maskgals.size,
-                                     alpha=self.config.calib_lumfunc_alpha, mstar=0.0)
-        # Generate nfw(r)
-        maskgals.r = sample_from_pdf(nfw_pdf,
-                                     [0.001, maxrad],
-                                     0.001, maskgals.size, radfactor=True)
-
-        # Generate phi
-        maskgals.phi = 2. * np.pi * np.random.random(size=maskgals.size)
-
-        # Precompute x/y
-        maskgals.x = maskgals.r * np.cos(maskgals.phi)
-        maskgals.y = maskgals.r * np.sin(maskgals.phi)
-
-        # And uniform x/y
-        maskgals.r_uniform = self.config.bkg_local_annuli[1] * np.sqrt(np.random.uniform(size=maskgals.size))
-        theta_new = np.random.uniform(size=maskgals.size)*2*np.pi
-        maskgals.x_uniform = maskgals.r_uniform*np.cos(theta_new)
-        maskgals.y_uniform = maskgals.r_uniform*np.sin(theta_new)
-
-        # Compute weights to go with these values
-
-        # Chisq weight
-        maskgals.cwt = chisq_pdf(maskgals.chisq, ncol)
-        maskgals.chisq_pdf = maskgals.cwt
-
-        # Nfw weight
-        maskgals.nfw = nfw_pdf(maskgals.r, radfactor=True)
-
-        # luminosity weight
-
-        # We just choose a reference mstar for the normalization code
-        mstar = 19.0
-        normmag = mstar - 2.5 * np.log10(self.config.lval_reference)
-        steps = np.arange(10.0, normmag, 0.01)
-        f = schechter_pdf(steps, alpha=self.config.calib_lumfunc_alpha, mstar=mstar)
-        n = scipy.integrate.simps(f, steps)
-        maskgals.lum_pdf = schechter_pdf(maskgals.m + mstar, mstar=mstar, alpha=self.config.calib_lumfunc_alpha)
-        maskgals.lumwt = maskgals.lum_pdf / n
-
-        # zred weight
-        maskgals.dzred = np.random.normal(loc=0.0, scale=self.config.maskgal_zred_err, size=maskgals.size)
-        maskgals.zwt = (1. / (np.sqrt(2.*np.pi) * self.config.maskgal_zred_err)) * np.exp(-(maskgals.dzred**2.) / (2.*self.config.maskgal_zred_err**2.))
-
-        # And we need the radial function for each set of samples
-        for j in xrange(self.config.maskgal_nsamples):
-            indices = np.arange(j * self.config.maskgal_ngals,
-                                (j + 1) * self.config.maskgal_ngals)
-
-            # Radial function
-            for i, rad in enumerate(radbins):
-                inside, = np.where((maskgals.r[indices] <= rad) &
-                                   (maskgals.m[indices] < -2.5*np.log10(self.config.lval_reference)))
-                maskgals.nin_orig[indices, i] = inside.size
-
-                if self.config.rsig <= 0.0:
-                    theta_r = np.ones(self.config.maskgal_ngals)
-                else:
-                    theta_r = 0.5 + 0.5*erf((rad - maskgals.r[indices]) / (np.sqrt(2.)*self.config.rsig))
-                maskgals.theta_r[indices, i] = theta_r
-
-                inside2, = np.where(maskgals.m[indices] < -2.5*np.log10(self.config.lval_reference))
-                maskgals.nin[indices, i] = np.sum(theta_r[inside2])
+        pars = {'radbins': radbins,
+                'maxrad': maxrad,
+                'ngals': self.config.maskgal_ngals,
+                'ncol': self.config.nmag - 1,
+                'chisq_max': self.config.chisq_max,
+                'lval_reference': self.config.lval_reference,
+                'maskgal_dmag_extra': self.config.maskgal_dmag_extra,
+                'alpha': self.config.calib_lumfunc_alpha,
+                'rmax_uniform': self.config.bkg_local_annuli[1],
+                'zred_err': self.config.maskgal_zred_err,
+                'rsig': self.config.rsig}
+
+        nsamples = self.config.maskgal_nsamples
+        nproc = min(self.config.calib_nproc, nsamples)
+
+        if self.config.rng_seed is None and nproc == 1:
+            samples = [_gen_maskgal_sample(pars, np.random) for j in xrange(nsamples)]
+        else:
+            if self.config.rng_seed is None:
+                seed = np.random.randint(0, 2**31)
+            else:
+                seed = self.config.rng_seed
+            worker_list = [(pars, seed, j) for j in xrange(nsamples)]
+
+            if nproc > 1:
+                pool = Pool(processes=nproc)
+                samples = pool.map(_gen_maskgal_sample_worker, worker_list, chunksize=1)
+                pool.close()
+                pool.join()
+            else:
+                samples = [_gen_maskgal_sample_worker(worker) for worker in worker_list]
+
+        maskgals = Catalog(np.concatenate(samples))
 
         # And save it
 
@@ -280,9 +261,20 @@ class Mask(object):
         hdr['alpha'] = self.config.calib_lumfunc_alpha
         hdr['rsig'] = self.config.rsig
         hdr['zrederr'] = self.config.maskgal_zred_err
-
-        maskgals.to_fits_file(maskgalfile, clobber=True, header=hdr)
-
+        hdr['nsamples'] = nsamples
+        hdr['cfghash'] = _maskgal_config_hash(self.config)
+
+        # Write to a temporary file and rename, so that no other job can see
+        # a partial file
+        tf = tempfile.mkstemp(prefix=os.path.basename(maskgalfile) + '.', suffix='.tmp',
+                              dir=os.path.dirname(os.path.abspath(maskgalfile)))
+        os.close(tf[0])
+        try:
+            maskgals.to_fits_file(tf[1], clobber=True, header=hdr)
+            os.rename(tf[1], maskgalfile)
+        finally:
+            if os.path.isfile(tf[1]):
+                os.remove(tf[1])
 
     def set_radmask(self, cluster):
         """
@@ -294,11 +286,70 @@ class Mask(object):
            Cluster to get position/redshift/scaling
         """
         # note this probably can be in the superclass, no?
-        ras = cluster.ra + self.maskgals.x/(cluster.mpc_scale)/np.cos(np.radians(cluster.dec))
-        decs = cluster.dec + self.maskgals.y/(cluster.mpc_scale)
-        self.maskgals.mark = self.compute_radmask(ras,decs)
+        ras, decs = project_maskgals(cluster.ra, cluster.dec, cluster.mpc_scale,
+                                     self.maskgals.x, self.maskgals.y)
+        if cluster.rng is None:
+            rands = None
+        else:
+            rands = cluster.rng.random(size=ras.size)
+        self.maskgals.mark = self.compute_radmask(ras, decs, rands=rands)
+
+    def calc_radmask_batch(self, ra, dec, mpc_scale, maskgal_index, depthstr=None, rngs=None):
+        """
+        Compute mask (0: out; 1: in) values, and optionally depth values, for
+        the maskgals of a set of clusters at once.
+
+        Parameters
+        ----------
+        ra: `np.array`
+           Float array of cluster right ascensions
+        dec: `np.array`
+           Float array of cluster declinations
+        mpc_scale: `np.array`
+           Float array of scaling in Mpc / degree at cluster redshifts
+        maskgal_index: `np.array`
+           Integer array of maskgal sample index for each cluster
+        depthstr: `redmapper.DepthMap`, optional
+           Depth map to compute depth values.  Default is None.
+        rngs: `list` of `np.random.Generator`, optional
+           Random number generator for each cluster.  Default is None
+           (global numpy state).
 
-    def calc_maskcorr(self, mstar, maxmag, limmag):
+        Returns
+        -------
+        mark: `np.array`
+           Bool array (nclusters, maskgal_ngals) of maskgal mask values
+        limmag: `np.array`
+           Float array (nclusters, maskgal_ngals) of limiting magnitudes,
+           or None if depthstr is None.
+        exptime: `np.array`
+           Float array (nclusters, maskgal_ngals) of effective exposure times,
+           or None if depthstr is None.
+        m50: `np.array`
+           Float array (nclusters, maskgal_ngals) of 50% completeness depths,
+           or None if depthstr is None.
+        """
+        ngals = self.config.maskgal_ngals
+        x = self.maskgals_all.x.reshape(-1, ngals)[maskgal_index, :]
+        y = self.maskgals_all.y.reshape(-1, ngals)[maskgal_index, :]
+
+        ras, decs = project_maskgals(ra, dec, mpc_scale, x, y)
+
+        if rngs is None:
+            rands = None
+        else:
+            rands = np.concatenate([rng.random(size=ngals) for rng in rngs])
+
+        mark = self.compute_radmask(ras.ravel(), decs.ravel(), rands=rands).reshape(ras.shape)
+
+        if depthstr is None:
+            return mark, None, None, None
+
+        limmag, exptime, m50 = depthstr.calc_maskdepth_batch(ras, decs)
+
+        return mark, limmag, exptime, m50
+
+    def calc_maskcorr(self, mstar, maxmag, limmag, rng=None):
         """
         Calculate mask correction cpars, a third-order polynomial which describes the
         mask fraction of a cluster as a function of radius.
@@ -311,6 +362,9 @@ class Mask(object):
            maximum magnitude for use in luminosity function filter
         limmag: `float`
            Survey or local limiting magnitude
+        rng: `np.random.Generator`, optional
+           Random number generator for the error model noise.  Default is
+           None (global numpy state).
 
         Returns
         -------
@@ -321,7 +375,7 @@ class Mask(object):
         self.maskgals.refmag = mag_in
 
         if self.maskgals.limmag[0] > 0.0:
-            mag, mag_err = apply_errormodels(self.maskgals, mag_in)
+            mag, mag_err = apply_errormodels(self.maskgals, mag_in, rng=rng)
 
             self.maskgals.refmag_obs = mag
             self.maskgals.refmag_obs_err = mag_err
@@ -388,11 +442,17 @@ class HPMask(Mask):
 
         self.sparse_fracgood = healsparse.HealSparseMap.read(self.maskfile, pixels=covpixels)
 
+        # Expand a subregion into a dense raster for fast position lookups
+        if config.dense_map_lookup and covpixels is not None:
+            self._lookup_map = DenseHealsparseMap(self.sparse_fracgood)
+        else:
+            self._lookup_map = self.sparse_fracgood
+
         self.nside = self.sparse_fracgood.nside_sparse
 
         super(HPMask, self).__init__(config, **kwargs)
 
-    def compute_radmask(self, ras, decs):
+    def compute_radmask(self, ras, decs, rands=None):
         """
         Compute the geometric mask value at a list of positions.
 
@@ -404,6 +464,9 @@ class HPMask(Mask):
            Float array of right ascensions
         decs: `np.array`
            Float array of declinations
+        rands: `np.array`, optional
+           Uniform random numbers, one per position, to sample the fracgood.
+           Default is None (draw from the global numpy state).
 
         Returns
         -------
@@ -418,13 +481,220 @@ class HPMask(Mask):
         gd, = np.where(np.abs(decs) < 90.0)
 
         fracgood = np.zeros(ras.size)
-        fracgood[gd] = self.sparse_fracgood.get_values_pos(ras[gd], decs[gd], lonlat=True)
+        fracgood[gd] = self._lookup_map.get_values_pos(ras[gd], decs[gd], lonlat=True)
 
         radmask = np.zeros(ras.size, dtype=np.bool)
-        radmask[np.where(fracgood > np.random.rand(ras.size))] = True
+        if rands is None:
+            rands = np.random.rand(ras.size)
+        radmask[np.where(fracgood > rands)] = True
         return radmask
 
 
+def _gen_maskgal_sample(pars, rng):
+    """
+    Generate a single sample of maskgal monte carlo galaxies.
+
+    Parameters
+    ----------
+    pars: `dict`
+       Generation parameters, as set up in Mask._gen_maskgals()
+    rng: `np.random.Generator` or `np.random`
+       Random number generator
+
+    Returns
+    -------
+    maskgals: `np.ndarray`
+       Structured array of pars['ngals'] maskgals
+    """
+    radbins = pars['radbins']
+    nradbins = radbins.size
+    ngals = pars['ngals']
+    ncol = pars['ncol']
+
+    maskgals = Catalog.zeros(ngals, dtype=[('r', 'f4'),
+                                           ('phi', 'f4'),
+                                           ('x', 'f4'),
+                                           ('y', 'f4'),
+                                           ('r_uniform', 'f4'),
+                                           ('x_uniform', 'f4'),
+                                           ('y_uniform', 'f4'),
+                                           ('m', 'f4'),
+                                           ('refmag', 'f4'),
+                                           ('refmag_obs', 'f4'),
+                                           ('refmag_obs_err', 'f4'),
+                                           ('chisq', 'f4'),
+                                           ('cwt', 'f4'),
+                                           ('chisq_pdf', 'f4'),
+                                           ('nfw', 'f4'),
+                                           ('dzred', 'f4'),
+                                           ('zwt', 'f4'),
+                                           ('lumwt', 'f4'),
+                                           ('lum_pdf', 'f4'),
+                                           ('limmag', 'f4'),
+                                           ('limmag_dered', 'f4'),
+                                           ('exptime', 'f4'),
+                                           ('m50', 'f4'),
+                                           ('eff', 'f4'),
+                                           ('w', 'f4'),
+                                           ('theta_r', 'f4', nradbins),
+                                           ('mark', np.bool),
+                                           ('radbins', 'f4', nradbins),
+                                           ('nin', 'f4', nradbins),
+                                           ('nin_orig', 'f4', nradbins),
+                                           ('zp', 'f4'),
+                                           ('ebv', 'f4'),
+                                           ('extinction', 'f4'),
+                                           ('nsig', 'f4')])
+
+    maskgals['radbins'] = np.tile(radbins, maskgals.size).reshape(maskgals.size, nradbins)
+
+    # Generate chisq
+    maskgals.chisq = sample_from_pdf(chisq_pdf, [0.0, pars['chisq_max']],
+                                     pars['chisq_max'] / 10000.,
+                                     maskgals.size, rng=rng, k=ncol)
+    # Generate mstar
+    maskgals.m = sample_from_pdf(schechter_pdf,
+                                 [-2.5*np.log10(10.0),
+                                   -2.5*np.log10(pars['lval_reference']) + pars['maskgal_dmag_extra']],
+                                 0.002, maskgals.size, rng=rng,
+                                 alpha=pars['alpha'], mstar=0.0)
+    # Generate nfw(r)
+    maskgals.r = sample_from_pdf(nfw_pdf,
+                                 [0.001, pars['maxrad']],
+                                 0.001, maskgals.size, rng=rng, radfactor=True)
+
+    # Generate phi
+    maskgals.phi = 2. * np.pi * rng.random(size=maskgals.size)
+
+    # Precompute x/y
+    maskgals.x = maskgals.r * np.cos(maskgals.phi)
+    maskgals.y = maskgals.r * np.sin(maskgals.phi)
+
+    # And uniform x/y
+    maskgals.r_uniform = pars['rmax_uniform'] * np.sqrt(rng.uniform(size=maskgals.size))
+    theta_new = rng.uniform(size=maskgals.size)*2*np.pi
+    maskgals.x_uniform = maskgals.r_uniform*np.cos(theta_new)
+    maskgals.y_uniform = maskgals.r_uniform*np.sin(theta_new)
+
+    # Compute weights to go with these values
+
+    # Chisq weight
+    maskgals.cwt = chisq_pdf(maskgals.chisq, ncol)
+    maskgals.chisq_pdf = maskgals.cwt
+
+    # Nfw weight
+    maskgals.nfw = nfw_pdf(maskgals.r, radfactor=True)
+
+    # luminosity weight
+
+    # We just choose a reference mstar for the normalization code
+    mstar = 19.0
+    normmag = mstar - 2.5 * np.log10(pars['lval_reference'])
+    steps = np.arange(10.0, normmag, 0.01)
+    f = schechter_pdf(steps, alpha=pars['alpha'], mstar=mstar)
+    n = scipy.integrate.simps(f, steps)
+    maskgals.lum_pdf = schechter_pdf(maskgals.m + mstar, mstar=mstar, alpha=pars['alpha'])
+    maskgals.lumwt = maskgals.lum_pdf / n
+
+    # zred weight
+    zred_err = pars['zred_err']
+    maskgals.dzred = rng.normal(loc=0.0, scale=zred_err, size=maskgals.size)
+    maskgals.zwt = (1. / (np.sqrt(2.*np.pi) * zred_err)) * np.exp(-(maskgals.dzred**2.) / (2.*zred_err**2.))
+
+    # And we need the radial function for the sample
+    bright = (maskgals.m < -2.5*np.log10(pars['lval_reference']))
+    for i, rad in enumerate(radbins):
+        inside, = np.where((maskgals.r <= rad) & bright)
+        maskgals.nin_orig[:, i] = inside.size
+
+        if pars['rsig'] <= 0.0:
+            theta_r = np.ones(ngals)
+        else:
+            theta_r = 0.5 + 0.5*erf((rad - maskgals.r) / (np.sqrt(2.)*pars['rsig']))
+        maskgals.theta_r[:, i] = theta_r
+
+        maskgals.nin[:, i] = np.sum(theta_r[bright])
+
+    return maskgals._ndarray
+
+def _gen_maskgal_sample_worker(worker):
+    """
+    Generate a sample of maskgals from its own seeded stream.
+
+    This is used for multiprocessing.
+
+    Parameters
+    ----------
+    worker: `tuple`
+       (pars, seed, index) with the generation parameters, run seed, and
+       the sample index
+
+    Returns
+    -------
+    maskgals: `np.ndarray`
+       Structured array of maskgals
+    """
+    pars, seed, index = worker
+
+    return _gen_maskgal_sample(pars, make_rng(seed, index))
+
+def _maskgal_config_hash(config):
+    """
+    Compute a hash of the config parameters used to generate maskgals.
+
+    Parameters
+    ----------
+    config: `redmapper.Configuration`
+       Configuration object
+
+    Returns
+    -------
+    cfghash: `str`
+       Hex digest of the maskgal generation parameters
+    """
+    pars = (CURRENT_MASKGAL_VERSION,
+            config.percolation_r0,
+            config.percolation_beta,
+            config.maskgal_rad_stepsize,
+            config.nmag,
+            config.maskgal_ngals,
+            config.maskgal_nsamples,
+            config.chisq_max,
+            config.lval_reference,
+            config.maskgal_dmag_extra,
+            config.calib_lumfunc_alpha,
+            config.rsig,
+            config.maskgal_zred_err,
+            config.bkg_local_annuli[1])
+
+    return hashlib.md5(repr(tuple(float(par) for par in pars)).encode('utf-8')).hexdigest()[: 16]
+
+def maskgal_filename(config, maskgalfile=None):
+    """
+    Get the name of the maskgal cache file for a configuration.
+
+    The name is <base>_<hash><ext>, where hash is the first 8 hex digits of
+    the hash of the maskgal generation parameters.
+
+    Parameters
+    ----------
+    config: `redmapper.Configuration`
+       Configuration object
+    maskgalfile: `str`, optional
+       Base filename.  Default is None (use config.maskgalfile).
+
+    Returns
+    -------
+    filename: `str`
+       Name of the maskgal file
+    """
+    if maskgalfile is None:
+        maskgalfile = config.maskgalfile
+
+    base, ext = os.path.splitext(maskgalfile)
+
+    return '%s_%s%s' % (base, _maskgal_config_hash(config)[: 8], ext)
+
 def get_mask(config, include_maskgals=True):
     """
     Convenience function to look at a config file and load the appropriate type of mask.
@@ -6,6 +6,7 @@ import os
 import esutil
 import re
 import copy
+import warnings
 import numpy as np
 import healsparse
 
@@ -81,6 +82,11 @@ class GenerateRandoms(object):
         n_left = copy.copy(nrandoms)
         ctr = 0
 
+        # Positions generated and redshifts placed so far, to size the
+        # batches from the observed acceptance rate
+        n_tried = 0
+        n_placed = 0
+
         dtype = [('id', 'i4'),
                  ('ra', 'f8'),
                  ('dec', 'f8'),
@@ -113,7 +119,14 @@ class GenerateRandoms(object):
         self.config.logger.info("Generating %d randoms to %s" % (n_left, outbase))
 
         while (n_left > 0):
-            n_gen = np.clip(n_left * 3, min_gen, max_gen)
+            if n_tried == 0:
+                n_gen = np.clip(n_left * 3, min_gen, max_gen)
+            elif n_placed == 0:
+                n_gen = max_gen
+            else:
+                # Aim for 10% more positions than needed at the acceptance
+                # rate so far
+                n_gen = np.clip(int(np.ceil(1.1 * n_left * n_tried / n_placed)), min_gen, max_gen)
             ra_rand, dec_rand = healsparse.make_uniform_randoms(self.vlim_mask.sparse_vlimmap,
                                                                 n_gen, rng=rng)
 
@@ -122,45 +135,36 @@ class GenerateRandoms(object):
             r = rng.uniform(size=n_gen)
             gd, = np.where(r < fracgood)
 
+            n_tried += n_gen
+
             if gd.size == 0:
                 continue
 
-            tempcat = Catalog(np.zeros(gd.size, dtype=dtype))
-            tempcat.ra = ra_rand[gd]
-            tempcat.dec = dec_rand[gd]
-            tempcat.z = -1.0
-
             r = rng.choice(np.arange(self.redmapper_cat.size), size=gd.size, replace=True)
             zz = self.redmapper_cat.z_lambda[r]
-            ll = self.redmapper_cat.Lambda[r]
-            ii = self.redmapper_cat.mem_match_id[r]
-
-            # zctr counts the number of successfully placed randoms
-            # while i counts index through tempcat, many of which will be rejected.
-            zctr = 0
-            for i in range(tempcat.size):
-                if (zz[zctr] < zmax[i]):
-                    # This is in a location that is within the volume limit.
-                    tempcat.z[i] = zz[zctr]
-                    tempcat.Lambda[i] = ll[zctr]
-                    tempcat.id_input[i] = ii[zctr]
-                    zctr += 1
-
-            # Which of the tempcat were actually placed?
-            gd, = np.where(tempcat.z > 0.0)
-            n_good = gd.size
+
+            # Which of the positions were actually used, in order of the
+            # drawn redshifts?
+            use = self._place_redshifts(zz, zmax[gd])
+            n_good = use.size
+            n_placed += n_good
 
             if n_good == 0:
                 continue
 
             if n_good > n_left:
                 n_good = n_left
-                gd = gd[0: n_good]
+                use = use[0: n_good]
 
-            tempcat = tempcat[gd]
+            tempcat = Catalog(np.zeros(n_good, dtype=dtype))
             tempcat.id = np.arange(ctr + 1, ctr + n_good + 1)
+            tempcat.ra = ra_rand[gd[use]]
+            tempcat.dec = dec_rand[gd[use]]
+            tempcat.z = zz[: n_good]
+            tempcat.Lambda = self.redmapper_cat.Lambda[r[: n_good]]
+            tempcat.id_input = self.redmapper_cat.mem_match_id[r[: n_good]]
 
-            maker.append_randoms(tempcat._ndarray[: n_good])
+            maker.append_randoms(tempcat._ndarray)
 
             ctr += n_good
             n_left -= n_good
@@ -168,6 +172,51 @@ class GenerateRandoms(object):
 
         maker.finalize_catalog()
 
+    @staticmethod
+    def _place_redshifts(zz, zmax):
+        """
+        Place a list of redshifts, in order, on a list of random positions.
+
+        The positions are scanned in order, and each is given to the next
+        redshift in the list if it is within the volume limit (zmax > z).  A
+        redshift that does not fit waits for the next position where it
+        does, so each is placed uniformly over the region where it could
+        have been observed.
+
+        The scan is sequential, and is done on plain lists to keep the
+        per-position cost low.  It is not vectorized: an exact vectorized
+        scan over runs of accepted positions is only faster when nearly all
+        positions are accepted, and placing the redshifts in a different
+        way would change the randoms of a seeded run.
+
+        Parameters
+        ----------
+        zz : `np.ndarray`
+           Redshifts to place, in order.
+        zmax : `np.ndarray`
+           Maximum redshift at each random position.
+
+        Returns
+        -------
+        use : `np.ndarray`
+           Integer array of the position index of each placed redshift.
+           Redshift i (for i < use.size) is placed at position use[i].
+        """
+        zz_list = zz.tolist()
+        nz = len(zz_list)
+
+        use = []
+        zctr = 0
+        for i, zm in enumerate(zmax.tolist()):
+            if zctr == nz:
+                break
+            if zz_list[zctr] < zm:
+                # This is in a location that is within the volume limit.
+                use.append(i)
+                zctr += 1
+
+        return np.array(use, dtype=np.int64)
+
 
 class RandomCatalog(GalaxyCatalog):
     """
@@ -201,7 +250,7 @@ class RandomCatalogMaker(GalaxyCatalogMaker):
     """
     """
 
-    def __init__(self, outbase, info_dict, nside=32, maskfile=None, mask_mode=0, parallel=False):
+    def __init__(self, outbase, info_dict, nside=32, maskfile=None, mask_mode=0, parallel=False, buffer_mb=500.0):
         """
         """
 
@@ -218,7 +267,7 @@ class RandomCatalogMaker(GalaxyCatalogMaker):
         if 'ZP' not in info_dict:
             info_dict['ZP'] = 0.0
 
-        super(RandomCatalogMaker, self).__init__(outbase, info_dict, nside=nside, maskfile=maskfile, mask_mode=mask_mode, parallel=parallel)
+        super(RandomCatalogMaker, self).__init__(outbase, info_dict, nside=nside, maskfile=maskfile, mask_mode=mask_mode, parallel=parallel, buffer_mb=buffer_mb)
 
     def split_randoms(self, rands):
         """
@@ -282,6 +331,54 @@ class RandomWeigher(object):
         else:
             self.redmapper_cat = redmapper_cat
 
+        self._groups = None
+
+    def _group_randoms(self):
+        """
+        Match each random to the cluster it was drawn from, and group the
+        randoms by input id.
+
+        The grouping is done once, and shared by all the weightings.
+
+        Returns
+        -------
+        groups : `dict`
+           Dictionary with the index of the input cluster of each random
+           ('cat_index', -1 if not matched), the group index of each random
+           ('group'), the number of groups ('ngroup'), the redshift sort
+           order ('z_order'), and the richness of the input cluster and of
+           each random ('lambda_cat', 'lambda_rand') and the same values
+           used for the minlambda cut ('lambda_cat_cut', 'lambda_rand_cut').
+        """
+        if self._groups is not None:
+            return self._groups
+
+        a, b = esutil.numpy_util.match(self.redmapper_cat.mem_match_id, self.randcat.id_input)
+        cat_index = np.zeros(self.randcat.size, dtype=np.int64) - 1
+        cat_index[b] = a
+
+        _, group = np.unique(self.randcat.id_input, return_inverse=True)
+
+        lambda_cat = self.redmapper_cat.Lambda[cat_index]
+        lambda_rand = self.randcat.lambda_in
+        if self.config.select_scaleval:
+            lambda_cat_cut = lambda_cat / self.redmapper_cat.scaleval[cat_index]
+            lambda_rand_cut = lambda_rand / self.randcat.scaleval
+        else:
+            lambda_cat_cut = lambda_cat
+            lambda_rand_cut = lambda_rand
+
+        self._groups = {'cat_index': cat_index,
+                        'group': group,
+                        'ngroup': group.max() + 1 if group.size > 0 else 0,
+                        'z_order': np.argsort(self.randcat.z),
+                        'lambda_cat': lambda_cat,
+                        'lambda_rand': lambda_rand,
+                        'lambda_cat_cut': lambda_cat_cut,
+                        'lambda_rand_cut': lambda_rand_cut}
+
+        return self._groups
+
     def weight_randoms(self, minlambda, zrange=None, lambdabin=None):
         """
         Compute random weights.
@@ -294,6 +391,75 @@ class RandomWeigher(object):
            2-element list of redshift range.  Default is full range.
         lambdabin : `np.ndarray`, optional
            2-element list of lambda range.  Default is full range.
+
+        Returns
+        -------
+        randfile_out : `str`
+           Name of weighted random file
+        areafile_out : `str`
+           Name of area file
+        """
+        return self.weight_randoms_multi([minlambda], zranges=[zrange], lambdabins=[lambdabin])[0]
+
+    def weight_randoms_multi(self, minlambdas, zranges=None, lambdabins=None):
+        """
+        Compute random weights for a set of richness cuts, redshift ranges,
+        and richness bins.
+
+        Parameters
+        ----------
+        minlambdas : `list`
+           Minimum lambda for each weighting
+        zranges : `list`, optional
+           2-element redshift range (or None) for each weighting.
+           Default is full range for all.
+        lambdabins : `list`, optional
+           2-element lambda range (or None) for each weighting.
+           Default is full range for all.
+
+        Returns
+        -------
+        outfiles : `list`
+           List of (randfile_out, areafile_out) tuples, one for each weighting.
+        """
+        if zranges is None:
+            zranges = [None] * len(minlambdas)
+        if lambdabins is None:
+            lambdabins = [None] * len(minlambdas)
+
+        if len(zranges) != len(minlambdas) or len(lambdabins) != len(minlambdas):
+            raise ValueError("minlambdas, zranges, and lambdabins must be the same length.")
+
+        # Group the randoms once for all the selections
+        groups = self._group_randoms()
+
+        outfiles = []
+        for minlambda, zrange, lambdabin in zip(minlambdas, zranges, lambdabins):
+            outfiles.append(self._weight_selection(groups, minlambda, zrange, lambdabin))
+
+        return outfiles
+
+    def _weight_selection(self, groups, minlambda, zrange, lambdabin):
+        """
+        Compute random weights and area for one selection.
+
+        Parameters
+        ----------
+        groups : `dict`
+           Grouping of the randoms from self._group_randoms()
+        minlambda : `float`
+           Minimum lambda to use in computations
+        zrange : `np.ndarray`
+           2-element list of redshift range, or None for full range.
+        lambdabin : `np.ndarray`
+           2-element list of lambda range, or None for full range.
+
+        Returns
+        -------
+        randfile_out : `str`
+           Name of weighted random file
+        areafile_out : `str`
+           Name of area file
         """
         if zrange is None:
             zrange = np.array([self.config.zrange[0], self.config.zrange[1]])
@@ -307,77 +473,61 @@ class RandomWeigher(object):
         else:
             lamname = 'lgt%03d_l%03d-%03d' % (int(minlambda), int(lambdabin[0]), int(lambdabin[1]))
 
-        zuse, = np.where((self.randcat.z > zrange[0]) &
-                         (self.randcat.z < zrange[1]))
+        zsel = ((self.randcat.z > zrange[0]) &
+                (self.randcat.z < zrange[1]))
 
-        if zuse.size == 0:
+        if not np.any(zsel):
             raise RuntimeError("No random points in specified redshift range %.2f < z < %.2f" %
                                (zrange[0], zrange[1]))
 
-        st = np.argsort(self.randcat.id_input[zuse])
-        uid = np.unique(self.randcat.id_input[zuse[st]])
-
-        a, b = esutil.numpy_util.match(self.redmapper_cat.mem_match_id, uid)
-
-        if b.size < uid.size:
+        if np.any(groups['cat_index'][zsel] < 0):
             raise RuntimeError("IDs in randcat do not match those of corresponding redmapper catalog.")
 
-        a, b = esutil.numpy_util.match(self.redmapper_cat.mem_match_id, self.randcat.id_input[zuse])
+        # Randoms drawn from clusters in the richness selection
+        sel = (zsel &
+               (groups['lambda_cat_cut'] > minlambda) &
+               (groups['lambda_cat'] > lambdabin[0]) &
+               (groups['lambda_cat'] <= lambdabin[1]))
 
-        if self.config.select_scaleval:
-            luse, = np.where((self.redmapper_cat.Lambda[a]/self.redmapper_cat.scaleval[a] > minlambda) &
-                             (self.redmapper_cat.Lambda[a] > lambdabin[0]) &
-                             (self.redmapper_cat.Lambda[a] <= lambdabin[1]))
-        else:
-            luse, = np.where((self.redmapper_cat.Lambda[a] > minlambda) &
-                             (self.redmapper_cat.Lambda[a] > lambdabin[0]) &
-                             (self.redmapper_cat.Lambda[a] <= lambdabin[1]))
-
-        if luse.size == 0:
+        if not np.any(sel):
             raise RuntimeError("No random points in specified richness range %0.2f < lambda < %0.2f and lambda > %.2f" %
                                (lambdabin[0], lambdabin[1], minlambda))
 
-        alluse = zuse[b[luse]]
-
-        randpoints = Catalog.zeros(luse.size, dtype=[('ra', 'f8'),
-                                                     ('dec', 'f8'),
-                                                     ('ztrue', 'f4'),
-                                                     ('lambda_in', 'f4'),
-                                                     ('avg_lambdaout', 'f4'),
-                                                     ('weight', 'f4')])
-        randpoints.ra = self.randcat.ra[alluse]
-        randpoints.dec = self.randcat.dec[alluse]
-        randpoints.ztrue = self.randcat.z[alluse]
-        randpoints.lambda_in = self.randcat.lambda_in[alluse]
-        randpoints.avg_lambdaout = self.randcat.lambda_in[alluse]
-
-        h, rev = esutil.stat.histogram(self.randcat.id_input[alluse], rev=True)
-        ok, = np.where(h > 0)
-
-        for i in ok:
-            i1a = rev[rev[i]: rev[i + 1]]
-
-            if self.config.select_scaleval:
-                gd, = np.where((self.randcat.lambda_in[alluse[i1a]]/self.randcat.scaleval[alluse[i1a]] > minlambda) &
-                               (self.randcat.maskfrac[alluse[i1a]] < self.config.max_maskfrac) &
-                               (self.randcat.lambda_in[alluse[i1a]] > lambdabin[0]) &
-                               (self.randcat.lambda_in[alluse[i1a]] <= lambdabin[1]))
-            else:
-                gd, = np.where((self.randcat.lambda_in[alluse[i1a]] > minlambda) &
-                               (self.randcat.maskfrac[alluse[i1a]] < self.config.max_maskfrac) &
-                               (self.randcat.lambda_in[alluse[i1a]] > lambdabin[0]) &
-                               (self.randcat.lambda_in[alluse[i1a]] <= lambdabin[1]))
+        # And randoms that pass the selection themselves
+        good_base = (sel &
+                     (groups['lambda_rand_cut'] > minlambda) &
+                     (self.randcat.maskfrac < self.config.max_maskfrac) &
+                     (groups['lambda_rand'] > lambdabin[0]))
+        good = good_base & (groups['lambda_rand'] <= lambdabin[1])
 
-            if gd.size > 0:
-                randpoints.weight[i1a[gd]] = float(i1a.size)/float(gd.size)
+        # The weight of each good random is the number of randoms drawn from
+        # the same cluster over the number of those that are good.
+        nall = np.bincount(groups['group'][sel], minlength=groups['ngroup'])
+        ngood = np.bincount(groups['group'][good], minlength=groups['ngroup'])
+
+        weight = np.zeros(self.randcat.size)
+        weight[good] = nall[groups['group'][good]].astype(np.float64) / ngood[groups['group'][good]]
 
         # And only save the randpoints with weight > 0.0
-        use, = np.where(randpoints.weight > 0.0)
+        use, = np.where(weight > 0.0)
+
+        randpoints = Catalog.zeros(use.size, dtype=[('ra', 'f8'),
+                                                    ('dec', 'f8'),
+                                                    ('ztrue', 'f4'),
+                                                    ('lambda_in', 'f4'),
+                                                    ('avg_lambdaout', 'f4'),
+                                                    ('weight', 'f4')])
+        randpoints.ra = self.randcat.ra[use]
+        randpoints.dec = self.randcat.dec[use]
+        randpoints.ztrue = self.randcat.z[use]
+        randpoints.lambda_in = self.randcat.lambda_in[use]
+        randpoints.avg_lambdaout = self.randcat.lambda_in[use]
+        randpoints.weight = weight[use]
 
         fname_base = 'weighted_randoms_%s_%s_%s' % (zname, lamname, vlimname)
         randfile_out = self.config.redmapper_filename(fname_base, withversion=True)
 
-        randpoints.to_fits_file(randfile_out, indices=use)
+        randpoints.to_fits_file(randfile_out)
 
         # And now we need to compute the associated area.
 
@@ -395,23 +545,14 @@ class RandomWeigher(object):
         zbinsize = self.config.area_coarsebin
         zbins = np.arange(self.config.zrange[0], self.config.zrange[1], zbinsize)
 
-        st = np.argsort(self.randcat.z[alluse])
-        ind1 = np.searchsorted(self.randcat.z[alluse[st]], zbins)
-        if self.config.select_scaleval:
-            gd, = np.where((self.randcat.lambda_in[alluse[st]]/self.randcat.scaleval[alluse[st]] > minlambda) &
-                           (self.randcat.maskfrac[alluse[st]] < self.config.max_maskfrac) &
-                           (self.randcat.lambda_in[alluse[st]] > lambdabin[0]) &
-                           (self.randcat.lambda_in[alluse[st]] < lambdabin[1]))
-        else:
-            gd, = np.where((self.randcat.lambda_in[alluse[st]] > minlambda) &
-                           (self.randcat.maskfrac[alluse[st]] < self.config.max_maskfrac) &
-                           (self.randcat.lambda_in[alluse[st]] > lambdabin[0]) &
-                           (self.randcat.lambda_in[alluse[st]] < lambdabin[1]))
-        ind2 = np.searchsorted(self.randcat.z[alluse[st[gd]]], zbins)
+        zsorted = self.randcat.z[groups['z_order']]
+        ind1 = np.searchsorted(zsorted[sel[groups['z_order']]], zbins)
+        gd = good_base & (groups['lambda_rand'] < lambdabin[1])
+        ind2 = np.searchsorted(zsorted[gd[groups['z_order']]], zbins)
 
         xvals = (zbins[0: -2] + zbins[1: -1])/2.
-        with np.warnings.catch_warnings():
-            np.warnings.simplefilter("ignore")
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
             yvals = np.nan_to_num(ind2[1: -1].astype(np.float64) / ind1[1: -1].astype(np.float64))
 
         fitter = MedZFitter(nodes, xvals, yvals)
@@ -12,19 +12,40 @@ import scipy.optimize
 import esutil
 import healpy as hp
 import copy
+import multiprocessing
 
 from ..configuration import Configuration
-from ..fitters import MedZFitter
+from ..fitters import MedZFitter, Fitter
 from ..redsequence import RedSequenceColorPar
 from ..galaxy import GalaxyCatalog
 from ..catalog import Catalog, Entry
-from ..utilities import make_nodes, CubicSpline, interpol, read_members
+from ..utilities import make_nodes, CubicSpline, interpol, read_members, make_rng
 from ..plotting import SpecPlot, NzPlot
 from ..volumelimit import VolumeLimitMask, VolumeLimitMaskFixed
 from .redmagic_selector import RedmagicSelector
 from .redmagictask import RunRedmagicTask
 
-class RedmagicParameterFitter(object):
+# State shared with forked calibration workers; see RedmagicCalibrator.run
+_calib_state = None
+
+def _calibrate_mode_worker(i):
+    """
+    Fit the redMaGiC parameters for mode i, using the shared _calib_state.
+
+    Parameters
+    ----------
+    i: `int`
+       Index of the mode
+
+    Returns
+    -------
+    retvals: `tuple`
+       Output of RedmagicCalibrator._calibrate_mode
+    """
+    calibrator, rngs = _calib_state[0], _calib_state[1]
+    return calibrator._calibrate_mode(i, *_calib_state[2:], rng=rngs[i])
+
+class RedmagicParameterFitter(Fitter):
     """
     Class for fitting redMaGiC parameters.
     """
@@ -157,13 +178,13 @@ class RedmagicParameterFitter(object):
                 raise RuntimeError("Must set biaspars, eratiopars if using the afterburner")
 
             # Set _zredmagic based on the afterburner values
-            spl = CubicSpline(self._corrnodes, biaspars)
-            self._zredmagic = self._z - spl(self._z)
+            spl = self._spline_evaluator(self._corrnodes, self._z)
+            offset = spl(biaspars)
+            self._zredmagic = self._z - offset
 
-            self._zredmagic_samp = self._zsamp - spl(self._z)
+            self._zredmagic_samp = self._zsamp - offset
 
-            spl = CubicSpline(self._corrnodes, eratiopars)
-            self._zredmagic_e = self._z_err * spl(self._z)
+            self._zredmagic_e = self._z_err * spl(eratiopars)
         else:
             self._zredmagic[:] = self._z
             self._zredmagic_e[:] = self._z_err
@@ -173,6 +194,8 @@ class RedmagicParameterFitter(object):
         self._mstar = self._zredstr.mstar(self._zredmagic)
 
         # For whatever reason, the nelder-meade minimizer works better here.
+        # The cost counts galaxies passing a chi2 cut, so it is piecewise
+        # constant in the parameters and has no useful gradient.
         pars = scipy.optimize.fmin(self, p0_cval, disp=False, xtol=1e-8, ftol=1e-8)
 
         return pars
@@ -198,8 +221,8 @@ class RedmagicParameterFitter(object):
            Float array of best-fit eratio parameters
         """
 
-        spl = CubicSpline(self._nodes, cval)
-        chi2max = np.clip(spl(self._z), 0.1, self._maxchi)
+        spl = self._spline_evaluator(self._nodes, self._z)
+        chi2max = np.clip(spl(cval), 0.1, self._maxchi)
 
         ab_mask = ((self._chisq[self._ab_use] < chi2max[self._ab_use]) &
                    (self._refmag[self._ab_use] < (self._mstar[self._ab_use] - 2.5 * np.log10(self._etamin))))
@@ -245,8 +268,8 @@ class RedmagicParameterFitter(object):
         """
 
         # chi2max is computed at the raw redshift
-        spl = CubicSpline(self._nodes, pars)
-        chi2max = np.clip(spl(self._z), 0.1, self._maxchi)
+        spl = self._spline_evaluator(self._nodes, self._z)
+        chi2max = np.clip(spl(pars), 0.1, self._maxchi)
 
         # zsamp = self._randomn * self._zredmagic_e + self._zredmagic
 
@@ -449,187 +472,38 @@ class RedmagicCalibrator(object):
 
         self.config.redmagicfile = self.config.redmapper_filename('redmagic_calib')
 
-        # loop over cuts...
-
-        for i in range(nruns):
-            self.config.logger.info("Working on %s: etamin = %.3f, n0 = %.3f" % (self.config.redmagic_names[i], self.config.redmagic_etas[i], self.config.redmagic_n0s[i]))
-
-            # This is the full redshift range for redshift selection and plots
-            redmagic_zrange = [self.config.redmagic_zrange[0],
-                               self.config.redmagic_zmaxes[i]]
-
-            # This is the redshift range where the cost function is computed
-            cost_zrange = [redmagic_zrange[0] + self.config.redmagic_calib_redshift_buffer,
-                           redmagic_zrange[1] - self.config.redmagic_calib_redshift_buffer]
-            # And make sure that we have even sized bins
-            nbin = np.ceil((cost_zrange[1] - cost_zrange[0]) / self.config.redmagic_calib_zbinsize).astype(np.int32)
-            cost_zrange[1] = nbin * self.config.redmagic_calib_zbinsize + cost_zrange[0]
-
-            # Plot over the full range
-            plot_zrange = [redmagic_zrange[0], redmagic_zrange[1]]
-            nbin_plot = np.ceil((plot_zrange[1] - plot_zrange[0]) / self.config.redmagic_calib_zbinsize).astype(np.int32)
-            plot_zrange[1] = nbin_plot * self.config.redmagic_calib_zbinsize + plot_zrange[0]
-
-            # The nodes only cover the range of the cost function
-            nodes = make_nodes(cost_zrange, self.config.redmagic_calib_nodesize)
-            corrnodes = make_nodes(cost_zrange, self.config.redmagic_calib_corr_nodesize)
-
-            # Prepare calibration structure
-            vmaskfile = ''
-            if isinstance(vlim_masks[self.config.redmagic_names[i]], VolumeLimitMask):
-                vmaskfile = vlim_masks[self.config.redmagic_names[i]].vlimfile
-
-            calstr = Entry(np.zeros(1, dtype=[('zrange', 'f4', 2),
-                                              ('cost_zrange', 'f4', 2),
-                                              ('lstar_cushion', 'f4'),
-                                              ('z_cushion', 'f4'),
-                                              ('name', 'a%d' % (len(self.config.redmagic_names[i]) + 1)),
-                                              ('maxchi', 'f4'),
-                                              ('nodes', 'f8', nodes.size),
-                                              ('etamin', 'f8'),
-                                              ('n0', 'f8'),
-                                              ('cmax', 'f8', nodes.size),
-                                              ('corrnodes', 'f8', corrnodes.size),
-                                              ('run_afterburner', 'i2'),
-                                              ('apply_afterburner', 'i2'),
-                                              ('buffer', 'f4'),
-                                              ('bias', 'f8', corrnodes.size),
-                                              ('eratio', 'f8', corrnodes.size),
-                                              ('vmaskfile', 'a%d' % (len(vmaskfile) + 1))]))
-
-            calstr.zrange[:] = redmagic_zrange
-            calstr.cost_zrange[:] = cost_zrange
-            calstr.lstar_cushion = lstar_cushion
-            calstr.z_cushion = z_cushion
-            calstr.name = self.config.redmagic_names[i]
-            calstr.maxchi = self.config.redmagic_calib_chisqcut
-            calstr.nodes[:] = nodes
-            calstr.corrnodes[:] = corrnodes
-            calstr.etamin = self.config.redmagic_etas[i]
-            calstr.n0 = self.config.redmagic_n0s[i]
-            calstr.vmaskfile = vmaskfile
-            calstr.run_afterburner = self.config.redmagic_run_afterburner
-            calstr.apply_afterburner = self.config.redmagic_apply_afterburner_zsamp
-            calstr.buffer = self.config.redmagic_calib_redshift_buffer
-
-            # Take the first sample of each galaxy
-            zsamp = gals.zred_samp[:, 0].copy()
-
-            # Initial histogram, using sampled redshifts
-            # This histogram isn't actually used for anything except to confirm the size
-            h = esutil.stat.histogram(zsamp,
-                                      min=cost_zrange[0], max=cost_zrange[1] - 0.0001,
-                                      binsize=self.config.redmagic_calib_zbinsize)
-            zbins = np.arange(h.size, dtype=np.float64) * self.config.redmagic_calib_zbinsize + cost_zrange[0] + self.config.redmagic_calib_zbinsize / 2.
-
-            etamin_ref = np.clip(self.config.redmagic_etas[i] - lstar_cushion, 0.1, None)
-
-            # These are possible redmagic galaxies for this selection
-            red_poss, = np.where(gals.refmag < (mstar_init - 2.5*np.log10(etamin_ref)))
-
-            # Determine which of the galaxies to use in the afterburner
-            gd, = np.where(gals.zcal[red_poss] > 0.0)
-            ntrain = int(self.config.redmagic_calib_fractrain * gd.size)
-            r = np.random.random(gd.size)
-            st = np.argsort(r)
-            afterburner_use = gd[st[0: ntrain]]
-
-            # Compute the volume
-            vmask = vlim_masks[self.config.redmagic_names[i]]
-            astr = vlim_areas[self.config.redmagic_names[i]]
-
-            aind = np.searchsorted(astr.z, zbins)
-            z_areas = astr.area[aind]
-
-            volume = np.zeros(zbins.size)
-            for j in xrange(zbins.size):
-                volume[j] = (self.config.cosmo.V(zbins[j] - self.config.redmagic_calib_zbinsize/2.,
-                                                 zbins[j] + self.config.redmagic_calib_zbinsize/2.) *
-                                  (z_areas[j] / 41252.961))
-
-            zmax = vmask.calc_zmax(gals.ra[red_poss], gals.dec[red_poss])
-
-            # Compute the density based on the histogram above and the volume
-            dens = h.astype(np.float64) / volume
-
-            bad, = np.where(dens < self.config.redmagic_n0s[i] * 1e-4)
-            if bad.size > 0:
-                self.config.logger.info("Warning: not enough galaxies at z=%s" % (zbins[bad].__str__()))
-
-            # get starting values
-            cmaxvals = np.zeros(nodes.size)
-
-            aind = np.searchsorted(astr.z, nodes)
-            test_areas = astr.area[aind]
-
-            test_vol = np.zeros(nodes.size)
-            for j in xrange(nodes.size):
-                test_vol[j] = (self.config.cosmo.V(nodes[j] - self.config.redmagic_calib_zbinsize/2.,
-                                                   nodes[j] + self.config.redmagic_calib_zbinsize/2.) *
-                               (test_areas[j] / 41252.961))
-
-            for j in xrange(nodes.size):
-                zrange = [nodes[j] - self.config.redmagic_calib_zbinsize/2.,
-                          nodes[j] + self.config.redmagic_calib_zbinsize/2.]
-                if j == 0:
-                    zrange = [nodes[j],
-                              nodes[j] + self.config.redmagic_calib_zbinsize]
-                elif j == nodes.size - 1:
-                    zrange = [nodes[j] - self.config.redmagic_calib_zbinsize,
-                              nodes[j]]
-
-                u, = np.where((gals.zuse[red_poss] > zrange[0]) &
-                              (gals.zuse[red_poss] < zrange[1]))
-
-                st = np.argsort(gals.chisq[red_poss[u]])
-                test_den = np.arange(u.size) / test_vol[j]
-                ind = np.clip(np.searchsorted(test_den, self.config.redmagic_n0s[i] * 1e-4), 0, test_den.size - 1)
-                cmaxvals[j] = gals.chisq[red_poss[u[st[ind]]]]
-
-            # minimize chisquared parameters
-            rmfitter = RedmagicParameterFitter(nodes, corrnodes,
-                                               gals.zuse[red_poss], gals.zuse_e[red_poss],
-                                               gals.chisq[red_poss], mstar_init[red_poss],
-                                               gals.zcal[red_poss], gals.zcal_e[red_poss],
-                                               gals.refmag[red_poss], zsamp[red_poss],
-                                               zmax,
-                                               self.config.redmagic_etas[i],
-                                               self.config.redmagic_n0s[i],
-                                               volume, cost_zrange,
-                                               self.config.redmagic_calib_zbinsize,
-                                               zredstr,
-                                               maxchi=self.config.redmagic_calib_chisqcut,
-                                               ab_use=afterburner_use,
-                                               ab_apply=self.config.redmagic_apply_afterburner_zsamp)
-
-            self.config.logger.info("Fitting first pass...")
-            cmaxvals = rmfitter.fit(cmaxvals, afterburner=False)
-
-            # default is no bias or eratio
-            biasvals = np.zeros(corrnodes.size)
-            eratiovals = np.ones(corrnodes.size)
-
-            # run with afterburner
-            if self.config.redmagic_run_afterburner:
-                self.config.logger.info("Fitting with afterburner...")
-
-                # Let's look at 5 iterations here...
-                for k in xrange(5):
-                    self.config.logger.info("Afterburner iteration %d" % (k))
-                    # Fit the bias and eratio...
-                    biasvals, eratiovals = rmfitter.fit_bias_eratio(cmaxvals, biasvals, eratiovals)
-                    cmaxvals = rmfitter.fit(cmaxvals, biaspars=biasvals, eratiopars=eratiovals, afterburner=True)
-
-                # And a last fit of bias/eratio
-                biasvals, eratiovals = rmfitter.fit_bias_eratio(cmaxvals, biasvals, eratiovals)
-
-            rmfitter = None
-
-            # Record the calibrations
-            calstr.cmax[:] = cmaxvals
-            calstr.bias[:] = biasvals
-            calstr.eratio[:] = eratiovals
-
+        # Fit the modes, in parallel if configured.  The modes only share the
+        # input galaxies, which forked workers see through copy-on-write.
+        nproc = min(self.config.calib_nproc, nruns)
+
+        # Each mode has its own random stream.  Without a run seed, a serial
+        # run draws from the global state in turn, as before.  Forked
+        # workers would all inherit the same global state, so in that case
+        # a seed for each mode is drawn here in the parent before forking.
+        if self.config.rng_seed is not None:
+            rngs = [make_rng(self.config.rng_seed, i) for i in range(nruns)]
+        elif nproc > 1:
+            mode_seeds = np.random.randint(0, 2**31 - 1, size=nruns)
+            rngs = [make_rng(mode_seed) for mode_seed in mode_seeds]
+        else:
+            rngs = [make_rng(None)] * nruns
+
+        global _calib_state
+        _calib_state = (self, rngs, gals, mstar_init, zredstr, vlim_masks, vlim_areas,
+                        lstar_cushion, z_cushion)
+
+        try:
+            if nproc > 1:
+                # The pool is terminated on exit, also if a mode fails
+                with multiprocessing.get_context('fork').Pool(processes=nproc) as pool:
+                    retvals = pool.map(_calibrate_mode_worker, range(nruns), chunksize=1)
+            else:
+                retvals = [_calibrate_mode_worker(i) for i in range(nruns)]
+        finally:
+            _calib_state = None
+
+        # And record, select, and plot each mode in order
+        for i, (calstr, cost_zrange, plot_zrange) in enumerate(retvals):
             calstr.to_fits_file(self.config.redmagicfile, clobber=False, extname=self.config.redmagic_names[i])
 
             # Do the redmagic selection on our calibration galaxies
@@ -706,3 +580,218 @@ class RedmagicCalibrator(object):
             # Call the redmagic runner here.
             run_redmagic = RunRedmagicTask(runfile)
             run_redmagic.run()
+
+    def _calibrate_mode(self, i, gals, mstar_init, zredstr, vlim_masks, vlim_areas,
+                        lstar_cushion, z_cushion, rng):
+        """
+        Fit the redMaGiC parameters for a single mode.
+
+        Parameters
+        ----------
+        i: `int`
+           Index of the mode in self.config.redmagic_names
+        gals: `redmapper.GalaxyCatalog`
+           Possible redMaGiC galaxies, with calibration fields
+        mstar_init: `np.array`
+           Float array of mstar at the raw galaxy redshifts
+        zredstr: `redmapper.RedSequenceColorPar`
+           Red-sequence structure
+        vlim_masks: `OrderedDict`
+           Volume-limit masks, keyed by mode name
+        vlim_areas: `OrderedDict`
+           Volume-limit areas, keyed by mode name
+        lstar_cushion: `float`
+           Cushion on the luminosity cut for possible galaxies
+        z_cushion: `float`
+           Cushion on the redshift range for possible galaxies
+        rng: `np.random.Generator`
+           Random number generator for the mode
+
+        Returns
+        -------
+        calstr: `redmapper.Entry`
+           Calibration structure for the mode
+        cost_zrange: `list`
+           Redshift range of the cost function
+        plot_zrange: `list`
+           Redshift range for plots
+        """
+        self.config.logger.info("Working on %s: etamin = %.3f, n0 = %.3f" % (self.config.redmagic_names[i], self.config.redmagic_etas[i], self.config.redmagic_n0s[i]))
+
+        # This is the full redshift range for redshift selection and plots
+        redmagic_zrange = [self.config.redmagic_zrange[0],
+                           self.config.redmagic_zmaxes[i]]
+
+        # This is the redshift range where the cost function is computed
+        cost_zrange = [redmagic_zrange[0] + self.config.redmagic_calib_redshift_buffer,
+                       redmagic_zrange[1] - self.config.redmagic_calib_redshift_buffer]
+        # And make sure that we have even sized bins
+        nbin = np.ceil((cost_zrange[1] - cost_zrange[0]) / self.config.redmagic_calib_zbinsize).astype(np.int32)
+        cost_zrange[1] = nbin * self.config.redmagic_calib_zbinsize + cost_zrange[0]
+
+        # Plot over the full range
+        plot_zrange = [redmagic_zrange[0], redmagic_zrange[1]]
+        nbin_plot = np.ceil((plot_zrange[1] - plot_zrange[0]) / self.config.redmagic_calib_zbinsize).astype(np.int32)
+        plot_zrange[1] = nbin_plot * self.config.redmagic_calib_zbinsize + plot_zrange[0]
+
+        # The nodes only cover the range of the cost function
+        nodes = make_nodes(cost_zrange, self.config.redmagic_calib_nodesize)
+        corrnodes = make_nodes(cost_zrange, self.config.redmagic_calib_corr_nodesize)
+
+        # Prepare calibration structure
+        vmaskfile = ''
+        if isinstance(vlim_masks[self.config.redmagic_names[i]], VolumeLimitMask):
+            vmaskfile = vlim_masks[self.config.redmagic_names[i]].vlimfile
+
+        calstr = Entry(np.zeros(1, dtype=[('zrange', 'f4', 2),
+                                          ('cost_zrange', 'f4', 2),
+                                          ('lstar_cushion', 'f4'),
+                                          ('z_cushion', 'f4'),
+                                          ('name', 'a%d' % (len(self.config.redmagic_names[i]) + 1)),
+                                          ('maxchi', 'f4'),
+                                          ('nodes', 'f8', nodes.size),
+                                          ('etamin', 'f8'),
+                                          ('n0', 'f8'),
+                                          ('cmax', 'f8', nodes.size),
+                                          ('corrnodes', 'f8', corrnodes.size),
+                                          ('run_afterburner', 'i2'),
+                                          ('apply_afterburner', 'i2'),
+                                          ('buffer', 'f4'),
+                                          ('bias', 'f8', corrnodes.size),
+                                          ('eratio', 'f8', corrnodes.size),
+                                          ('vmaskfile', 'a%d' % (len(vmaskfile) + 1))]))
+
+        calstr.zrange[:] = redmagic_zrange
+        calstr.cost_zrange[:] = cost_zrange
+        calstr.lstar_cushion = lstar_cushion
+        calstr.z_cushion = z_cushion
+        calstr.name = self.config.redmagic_names[i]
+        calstr.maxchi = self.config.redmagic_calib_chisqcut
+        calstr.nodes[:] = nodes
+        calstr.corrnodes[:] = corrnodes
+        calstr.etamin = self.config.redmagic_etas[i]
+        calstr.n0 = self.config.redmagic_n0s[i]
+        calstr.vmaskfile = vmaskfile
+        calstr.run_afterburner = self.config.redmagic_run_afterburner
+        calstr.apply_afterburner = self.config.redmagic_apply_afterburner_zsamp
+        calstr.buffer = self.config.redmagic_calib_redshift_buffer
+
+        # Take the first sample of each galaxy
+        zsamp = gals.zred_samp[:, 0].copy()
+
+        # Initial histogram, using sampled redshifts
+        # This histogram isn't actually used for anything except to confirm the size
+        h = esutil.stat.histogram(zsamp,
+                                  min=cost_zrange[0], max=cost_zrange[1] - 0.0001,
+                                  binsize=self.config.redmagic_calib_zbinsize)
+        zbins = np.arange(h.size, dtype=np.float64) * self.config.redmagic_calib_zbinsize + cost_zrange[0] + self.config.redmagic_calib_zbinsize / 2.
+
+        etamin_ref = np.clip(self.config.redmagic_etas[i] - lstar_cushion, 0.1, None)
+
+        # These are possible redmagic galaxies for this selection
+        red_poss, = np.where(gals.refmag < (mstar_init - 2.5*np.log10(etamin_ref)))
+
+        # Determine which of the galaxies to use in the afterburner
+        gd, = np.where(gals.zcal[red_poss] > 0.0)
+        ntrain = int(self.config.redmagic_calib_fractrain * gd.size)
+        r = rng.random(gd.size)
+        st = np.argsort(r)
+        afterburner_use = gd[st[0: ntrain]]
+
+        # Compute the volume
+        vmask = vlim_masks[self.config.redmagic_names[i]]
+        astr = vlim_areas[self.config.redmagic_names[i]]
+
+        aind = np.searchsorted(astr.z, zbins)
+        z_areas = astr.area[aind]
+
+        volume = np.zeros(zbins.size)
+        for j in xrange(zbins.size):
+            volume[j] = (self.config.cosmo.V(zbins[j] - self.config.redmagic_calib_zbinsize/2.,
+                                             zbins[j] + self.config.redmagic_calib_zbinsize/2.) *
+                              (z_areas[j] / 41252.961))
+
+        zmax = vmask.calc_zmax(gals.ra[red_poss], gals.dec[red_poss])
+
+        # Compute the density based on the histogram above and the volume
+        dens = h.astype(np.float64) / volume
+
+        bad, = np.where(dens < self.config.redmagic_n0s[i] * 1e-4)
+        if bad.size > 0:
+            self.config.logger.info("Warning: not enough galaxies at z=%s" % (zbins[bad].__str__()))
+
+        # get starting values
+        cmaxvals = np.zeros(nodes.size)
+
+        aind = np.searchsorted(astr.z, nodes)
+        test_areas = astr.area[aind]
+
+        test_vol = np.zeros(nodes.size)
+        for j in xrange(nodes.size):
+            test_vol[j] = (self.config.cosmo.V(nodes[j] - self.config.redmagic_calib_zbinsize/2.,
+                                               nodes[j] + self.config.redmagic_calib_zbinsize/2.) *
+                           (test_areas[j] / 41252.961))
+
+        for j in xrange(nodes.size):
+            zrange = [nodes[j] - self.config.redmagic_calib_zbinsize/2.,
+                      nodes[j] + self.config.redmagic_calib_zbinsize/2.]
+            if j == 0:
+                zrange = [nodes[j],
+                          nodes[j] + self.config.redmagic_calib_zbinsize]
+            elif j == nodes.size - 1:
+                zrange = [nodes[j] - self.config.redmagic_calib_zbinsize,
+                          nodes[j]]
+
+            u, = np.where((gals.zuse[red_poss] > zrange[0]) &
+                          (gals.zuse[red_poss] < zrange[1]))
+
+            st = np.argsort(gals.chisq[red_poss[u]])
+            test_den = np.arange(u.size) / test_vol[j]
+            ind = np.clip(np.searchsorted(test_den, self.config.redmagic_n0s[i] * 1e-4), 0, test_den.size - 1)
+            cmaxvals[j] = gals.chisq[red_poss[u[st[ind]]]]
+
+        # minimize chisquared parameters
+        rmfitter = RedmagicParameterFitter(nodes, corrnodes,
+                                           gals.zuse[red_poss], gals.zuse_e[red_poss],
+                                           gals.chisq[red_poss], mstar_init[red_poss],
+                                           gals.zcal[red_poss], gals.zcal_e[red_poss],
+                                           gals.refmag[red_poss], zsamp[red_poss],
+                                           zmax,
+                                           self.config.redmagic_etas[i],
+                                           self.config.redmagic_n0s[i],
+                                           volume, cost_zrange,
+                                           self.config.redmagic_calib_zbinsize,
+                                           zredstr,
+                                           maxchi=self.config.redmagic_calib_chisqcut,
+                                           ab_use=afterburner_use,
+                                           ab_apply=self.config.redmagic_apply_afterburner_zsamp)
+
+        self.config.logger.info("Fitting first pass...")
+        cmaxvals = rmfitter.fit(cmaxvals, afterburner=False)
+
+        # default is no bias or eratio
+        biasvals = np.zeros(corrnodes.size)
+        eratiovals = np.ones(corrnodes.size)
+
+        # run with afterburner
+        if self.config.redmagic_run_afterburner:
+            self.config.logger.info("Fitting with afterburner...")
+
+            # Let's look at 5 iterations here...
+            for k in xrange(5):
+                self.config.logger.info("Afterburner iteration %d" % (k))
+                # Fit the bias and eratio...
+                biasvals, eratiovals = rmfitter.fit_bias_eratio(cmaxvals, biasvals, eratiovals)
+                cmaxvals = rmfitter.fit(cmaxvals, biaspars=biasvals, eratiopars=eratiovals, afterburner=True)
+
+            # And a last fit of bias/eratio
+            biasvals, eratiovals = rmfitter.fit_bias_eratio(cmaxvals, biasvals, eratiovals)
+
+        rmfitter = None
+
+        # Record the calibrations
+        calstr.cmax[:] = cmaxvals
+        calstr.bias[:] = biasvals
+        calstr.eratio[:] = eratiovals
+
+        return calstr, cost_zrange, plot_zrange
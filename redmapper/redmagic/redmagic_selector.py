@@ -18,7 +18,7 @@ from ..galaxy import GalaxyCatalog
 from ..configuration import Configuration
 from ..volumelimit import VolumeLimitMask, VolumeLimitMaskFixed
 from ..redsequence import RedSequenceColorPar
-from ..utilities import CubicSpline
+from ..utilities import CubicSpline, CubicSplineEvaluator
 
 class RedmagicSelector(object):
     """
@@ -95,7 +95,7 @@ class RedmagicSelector(object):
 
         self.spec = None
 
-    def select_redmagic_galaxies(self, gals, mode, return_indices=False):
+    def select_redmagic_galaxies(self, gals, mode, return_indices=False, rng=None):
         """
         Select redMaGiC galaxies from a galaxy catalog, according to the mode.
 
@@ -107,6 +107,10 @@ class RedmagicSelector(object):
            redMaGiC mode to select
         return_indices: `bool`, optional
            Return the indices of the galaxies selected.  Default is False.
+        rng: `np.random.Generator`, optional
+           Random number generator for sampling zredmagic when the
+           catalog has no zred samples.  Default is None, which uses the
+           global numpy random state.
 
         Returns
         -------
@@ -139,50 +143,56 @@ class RedmagicSelector(object):
                       calstr.cost_zrange[1] + z_cushion + z_buffer]
         minlstar = np.clip(np.min(calstr.etamin) - lstar_cushion, 0.1, None)
 
-        red_poss_mask = ((gals.zred_uncorr > cut_zrange[0]) &
-                         (gals.zred_uncorr < cut_zrange[1]) &
-                         (gals.chisq < calstr.maxchi) &
-                         (gals.refmag < (mstar_init - 2.5*np.log10(minlstar))))
+        red_poss, = np.where((gals.zred_uncorr > cut_zrange[0]) &
+                             (gals.zred_uncorr < cut_zrange[1]) &
+                             (gals.chisq < calstr.maxchi) &
+                             (gals.refmag < (mstar_init - 2.5*np.log10(minlstar))))
 
-        # Creates a new catalog...
-        zredmagic = np.copy(gals.zred_uncorr)
-        zredmagic_e = np.copy(gals.zred_uncorr_e)
+        # Everything below only touches the possibly red galaxies, so we
+        # never copy the full zred_samp matrix.
+        zred_uncorr = gals.zred_uncorr[red_poss]
+        zredmagic = gals.zred_uncorr[red_poss]
+        zredmagic_e = gals.zred_uncorr_e[red_poss]
         try:
-            zredmagic_samp = np.copy(gals.zred_samp)
+            zredmagic_samp = gals.zred_samp[red_poss]
         except (ValueError, AttributeError) as e:
             # Sample from zred + zred_e (not optimal, for old catalogs)
+            if rng is None:
+                rng = np.random
             zredmagic_samp = np.zeros((zredmagic.size, 1))
-            zredmagic_samp[:, 0] = np.random.normal(loc=zredmagic,
-                                                    scale=zredmagic_e,
-                                                    size=zredmagic.size)
+            zredmagic_samp[:, 0] = rng.normal(loc=zredmagic,
+                                              scale=zredmagic_e,
+                                              size=zredmagic.size)
 
         spl = CubicSpline(calstr.nodes, calstr.cmax, fixextrap=True)
-        chi2max = np.clip(spl(gals.zred_uncorr), 0.1, calstr.maxchi)
+        chi2max = np.clip(spl(zred_uncorr), 0.1, calstr.maxchi)
 
         if calstr.run_afterburner:
-            spl = CubicSpline(calstr.corrnodes, calstr.bias, fixextrap=True)
-            offset = spl(gals.zred_uncorr)
+            # The bias and eratio share nodes and evaluation points
+            spl = CubicSplineEvaluator(calstr.corrnodes, zred_uncorr, fixextrap=True)
+            offset = spl(calstr.bias)
             zredmagic -= offset
 
             if calstr.apply_afterburner:
-                for i in range(zredmagic_samp.shape[1]):
-                    zredmagic_samp[:, i] -= offset
+                zredmagic_samp -= offset[:, np.newaxis]
 
-            spl = CubicSpline(calstr.corrnodes, calstr.eratio, fixextrap=True)
-            zredmagic_e *= spl(gals.zred_uncorr)
+            zredmagic_e *= spl(calstr.eratio)
 
         # Compute mstar
         mstar = self.zredstr.mstar(zredmagic)
 
         # Compute the maximum redshift
         vmask = self.vlim_masks[_mode]
-        zmax = vmask.calc_zmax(gals.ra, gals.dec)
+        if red_poss.size > 0:
+            zmax = vmask.calc_zmax(gals.ra[red_poss], gals.dec[red_poss])
+        else:
+            zmax = np.zeros(0)
 
         # Do the redmagic selection
-        gd, = np.where((gals.chisq < chi2max) &
-                       (gals.refmag < (mstar - 2.5 * np.log10(calstr.etamin))) &
-                       (zredmagic < zmax) &
-                       (red_poss_mask))
+        sel, = np.where((gals.chisq[red_poss] < chi2max) &
+                        (gals.refmag[red_poss] < (mstar - 2.5 * np.log10(calstr.etamin))) &
+                        (zredmagic < zmax))
+        gd = red_poss[sel]
 
         redmagic_catalog = GalaxyCatalog(np.zeros(gd.size, dtype=[('id', 'i8'),
                                                                   ('ra', 'f8'),
@@ -211,13 +221,13 @@ class RedmagicSelector(object):
         redmagic_catalog.refmag_err = gals.refmag_err[gd]
         redmagic_catalog.mag[:, :] = gals.mag[gd, :]
         redmagic_catalog.mag_err[:, :] = gals.mag_err[gd, :]
-        redmagic_catalog.zredmagic = zredmagic[gd]
-        redmagic_catalog.zredmagic_e = zredmagic_e[gd]
-        redmagic_catalog.zredmagic_samp = zredmagic_samp[gd, :]
+        redmagic_catalog.zredmagic = zredmagic[sel]
+        redmagic_catalog.zredmagic_e = zredmagic_e[sel]
+        redmagic_catalog.zredmagic_samp = zredmagic_samp[sel, :]
         redmagic_catalog.chisq = gals.chisq[gd]
 
         # Compute the luminosity
-        redmagic_catalog.lum = 10.**((mstar[gd] - redmagic_catalog.refmag) / 2.5)
+        redmagic_catalog.lum = 10.**((mstar[sel] - redmagic_catalog.refmag) / 2.5)
 
         # In the future, add absolute magnitude calculations, but that will
         # require some k-corrections.
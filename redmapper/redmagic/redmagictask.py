@@ -6,6 +6,7 @@ import os
 import numpy as np
 import glob
 import fitsio
+import multiprocessing
 
 from ..configuration import Configuration
 from .redmagic_selector import RedmagicSelector
@@ -14,6 +15,40 @@ from ..galaxy import GalaxyCatalog
 from ..plotting import SpecPlot, NzPlot
 from .redmagic_randoms import RedmagicGenerateRandoms
 from ..volumelimit import VolumeLimitMaskFixed
+from ..utilities import make_rng
+
+# State shared with forked selection workers; see RunRedmagicTask.run
+_select_state = None
+
+def _select_pixel_worker(index_pix):
+    """
+    Select redMaGiC galaxies in one galfile pixel, for all the modes in the
+    shared _select_state.
+
+    Parameters
+    ----------
+    index_pix: `tuple`
+       Index of the pixel in the galfile table, and galfile healpix pixel
+
+    Returns
+    -------
+    red_gals_list: `list`
+       List of redMaGiC galaxy arrays, one per mode
+    """
+    config, selector, modes, nside, seed = _select_state
+    index, pix = index_pix
+
+    # Each pixel has its own stream (spawned from the seed by index)
+    rng = make_rng(seed, index)
+
+    gals = GalaxyCatalog.from_galfile(config.galfile,
+                                      zredfile=config.zredfile,
+                                      nside=nside,
+                                      hpix=pix,
+                                      border=0.0,
+                                      truth=config.has_truth)
+
+    return [selector.select_redmagic_galaxies(gals, mode, rng=rng)._ndarray for mode in modes]
 
 class RunRedmagicTask(object):
     """
@@ -39,13 +74,19 @@ l           Output path.  Default is None, use same absolute
 
         self.config = Configuration(configfile, outpath=path)
 
-    def run(self, modes=None, clobber=False, do_plots=True, n_randoms=None, rng=None):
+    def run(self, modes=None, clobber=False, do_plots=True, n_randoms=None, rng=None,
+            nproc=None, nwrite=100000):
         """
         Run redMaGiC selection over a full catalog.
 
         The modes are optional, if not specified all the modes
         will be run.
 
+        The galfile pixels are read and selected one at a time (in parallel
+        if nproc > 1), and the selected galaxies are written out in chunks,
+        so memory is bounded by the largest pixel rather than the full
+        catalog.
+
         Parameters
         ----------
         modes: `list`, optional
@@ -60,6 +101,12 @@ l           Output path.  Default is None, use same absolute
            If >0, then that many randoms are generated.
         rng : `np.random.RandomState`, optional
            Pre-set random number generator.  Default is None.
+        nproc: `int`, optional
+           Number of processes for the pixel selection.  Default is None,
+           which uses self.config.calib_run_nproc.
+        nwrite: `int`, optional
+           Number of selected galaxies to buffer (per mode) before writing.
+           Default is 100000.
         """
         if rng is None:
             rng = np.random.RandomState()
@@ -86,34 +133,79 @@ l           Output path.  Default is None, use same absolute
         # Loop over all pixels in the galaxy table
         tab = Entry.from_fits_file(self.config.galfile)
 
+        if nproc is None:
+            nproc = self.config.calib_run_nproc
+
         started = [False] * n_modes
+        buffers = [[] for j in range(n_modes)]
+        nbuffered = np.zeros(n_modes, dtype=np.int64)
 
         self.config.logger.info("Making redMaGiC selection for %d modes and %d pixels" % (n_modes, tab.hpix.size))
         if self.config.has_truth:
             self.config.logger.info("Using truth information for zspec")
 
-        for i, pix in enumerate(tab.hpix):
-            gals = GalaxyCatalog.from_galfile(self.config.galfile,
-                                              zredfile=self.config.zredfile,
-                                              nside=tab.nside,
-                                              hpix=pix,
-                                              border=0.0,
-                                              truth=self.config.has_truth)
+        def _flush(j):
+            if len(buffers[j]) == 0:
+                return
 
-            # Loop over all modes
-            for j, mode in enumerate(modes):
-                # Select the red galaxies
-                red_gals = selector.select_redmagic_galaxies(gals, mode)
-
-                # Spool out redMaGiC galaxies
-                if not started[j]:
-                    # write a new file (and overwrite if necessary, since we
-                    # already did the clobber check)
-                    red_gals.to_fits_file(filenames[j], clobber=True)
-                    started[j] = True
-                else:
-                    with fitsio.FITS(filenames[j], mode='rw') as fits:
-                        fits[1].append(red_gals._ndarray)
+            red_gals = np.concatenate(buffers[j])
+
+            # Spool out redMaGiC galaxies
+            if not started[j]:
+                # write a new file (and overwrite if necessary, since we
+                # already did the clobber check)
+                fitsio.write(filenames[j], red_gals, clobber=True)
+                started[j] = True
+            else:
+                with fitsio.FITS(filenames[j], mode='rw') as fits:
+                    fits[1].append(red_gals)
+
+            buffers[j] = []
+            nbuffered[j] = 0
+
+        # Random draws (only for catalogs without zred samples) use a
+        # stream for each pixel.  Without a run seed, a serial run draws
+        # from the global state as before.  Forked workers would all
+        # inherit the same global state, so in that case a seed is drawn
+        # here in the parent before forking.
+        if self.config.rng_seed is not None:
+            seed = self.config.rng_seed
+        elif nproc > 1:
+            seed = np.random.randint(0, 2**31 - 1)
+        else:
+            seed = None
+
+        # The workers see the selector (with its masks) through fork
+        global _select_state
+        _select_state = (self.config, selector, modes, tab.nside, seed)
+
+        pool = None
+        try:
+            if nproc > 1:
+                pool = multiprocessing.get_context('fork').Pool(processes=nproc)
+                # imap keeps the pixel order, so the output is deterministic
+                results = pool.imap(_select_pixel_worker, enumerate(tab.hpix), chunksize=1)
+            else:
+                results = (_select_pixel_worker(index_pix) for index_pix in enumerate(tab.hpix))
+
+            for red_gals_list in results:
+                for j in range(n_modes):
+                    buffers[j].append(red_gals_list[j])
+                    nbuffered[j] += red_gals_list[j].size
+                    if nbuffered[j] >= nwrite:
+                        _flush(j)
+
+            if pool is not None:
+                pool.close()
+                pool.join()
+        finally:
+            # Do not leave workers behind if anything failed
+            if pool is not None:
+                pool.terminate()
+            _select_state = None
+
+        for j in range(n_modes):
+            _flush(j)
 
         # Load in catalogs and make plots!
         if do_plots:
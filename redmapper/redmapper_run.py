@@ -296,7 +296,7 @@ class RedmapperRun(object):
         ubercat = Catalog(np.zeros(ncluster, dtype=dtype))
         ctr = 0
 
-        ubermem = None
+        ubermems = []
 
         for hpix, f in zip(hpixels, filenames):
             cat = Catalog.from_fits_file(f, ext=1)
@@ -341,13 +341,16 @@ class RedmapperRun(object):
                 ubercat._ndarray[n][ctr: ctr + cat.size] = cat._ndarray[n]
 
             if members:
-                if ubermem is None:
-                    ubermem = mem
-                else:
-                    ubermem.append(mem)
+                ubermems.append(mem)
 
             ctr += cat.size
 
+        # Allocate the member catalog once
+        if len(ubermems) > 0:
+            ubermem = Catalog.concatenate(ubermems)
+        else:
+            ubermem = None
+
         # Crop the catalog to the range that we had clusters
         ubercat = ubercat[0:ctr]
 
@@ -15,8 +15,8 @@ from scipy import interpolate
 
 from .chisq_dist import compute_chisq
 from .catalog import Catalog
-from .utilities import CubicSpline, MStar
-from .utilities import schechter_pdf, RedGalInitialColors
+from .utilities import CubicSplineEvaluator, MStar
+from .utilities import schechter_pdf, RedGalInitialColors, model_lupcorrs
 
 class RedSequenceColorPar(object):
     """
@@ -208,26 +208,30 @@ class RedSequenceColorPar(object):
             # not set then index errors can occur in the zred calculation.
             self.extrapolated[-1] = True
 
+            # Many of the parameters share nodes, and all are evaluated at
+            # self.z, so we cache the spline evaluators by node set.
+            evaluators = {}
+            def splines(nodes, vals):
+                key = nodes.tobytes()
+                if key not in evaluators:
+                    evaluators[key] = CubicSplineEvaluator(nodes, self.z)
+                return evaluators[key](vals)
+
             # set the pivotmag
             self.pivotmag = np.zeros(self.z.size, dtype=np.float64)
-            spl=CubicSpline(pars[0][pivotmag_name+'_Z'],pars[0][pivotmag_name])
-            self.pivotmag[:] = spl(self.z)
+            self.pivotmag[:] = splines(pars[0][pivotmag_name+'_Z'], pars[0][pivotmag_name])
 
             # and the max/min refmag
-            spl=CubicSpline(pars[0][pivotmag_name+'_Z'], pars[0]['MAX'+refmag_name])
-            self.maxrefmag = spl(self.z)
-            spl=CubicSpline(pars[0][pivotmag_name+'_Z'], pars[0]['MIN'+refmag_name])
-            self.minrefmag = spl(self.z)
+            self.maxrefmag = splines(pars[0][pivotmag_name+'_Z'], pars[0]['MAX'+refmag_name])
+            self.minrefmag = splines(pars[0][pivotmag_name+'_Z'], pars[0]['MIN'+refmag_name])
 
             # c/slope
             self.c = np.zeros((nz,ncol),dtype=np.float64)
             self.slope = np.zeros((nz,ncol),dtype=np.float64)
             for j in xrange(ncol):
                 jstring='%02d' % (j)
-                spl=CubicSpline(pars[0]['Z'+jstring],pars[0]['C'+jstring])
-                self.c[:,j] = spl(self.z)
-                spl=CubicSpline(pars[0]['ZS'+jstring],pars[0]['SLOPE'+jstring])
-                self.slope[:,j] = spl(self.z)
+                self.c[:,j] = splines(pars[0]['Z'+jstring], pars[0]['C'+jstring])
+                self.slope[:,j] = splines(pars[0]['ZS'+jstring], pars[0]['SLOPE'+jstring])
 
             # sigma/covmat
             self.sigma = np.zeros((ncol,ncol,nz),dtype=np.float64)
@@ -235,16 +239,14 @@ class RedSequenceColorPar(object):
 
             # diagonals
             for j in xrange(ncol):
-                spl=CubicSpline(pars[0]['COVMAT_Z'],pars[0]['SIGMA'][j,j,:])
-                self.sigma[j,j,:] = np.clip(spl(self.z), minsig, None)
+                self.sigma[j,j,:] = np.clip(splines(pars[0]['COVMAT_Z'], pars[0]['SIGMA'][j,j,:]), minsig, None)
 
                 self.covmat[j,j,:] = self.sigma[j,j,:]*self.sigma[j,j,:]
 
             # off-diagonals
             for j in xrange(ncol):
                 for k in xrange(j+1,ncol):
-                    spl=CubicSpline(pars[0]['COVMAT_Z'],pars[0]['SIGMA'][j,k,:])
-                    self.sigma[j,k,:] = spl(self.z)
+                    self.sigma[j,k,:] = splines(pars[0]['COVMAT_Z'], pars[0]['SIGMA'][j,k,:])
 
                     too_high,=np.where(self.sigma[j,k,:] > 0.99)
                     if (too_high.size > 0):
@@ -259,27 +261,21 @@ class RedSequenceColorPar(object):
                     self.covmat[k,j,:] = self.covmat[j,k,:]
 
             # volume factor
-            spl=CubicSpline(pars[0]['VOLUME_FACTOR_Z'],pars[0]['VOLUME_FACTOR'])
-            self.volume_factor = spl(self.z)
+            self.volume_factor = splines(pars[0]['VOLUME_FACTOR_Z'], pars[0]['VOLUME_FACTOR'])
 
             # corrections
-            spl=CubicSpline(pars[0]['CORR_Z'],pars[0]['CORR'])
-            self.corr = spl(self.z)
-            spl=CubicSpline(pars[0]['CORR_SLOPE_Z'],pars[0]['CORR_SLOPE'])
-            self.corr_slope = spl(self.z)
+            self.corr = splines(pars[0]['CORR_Z'], pars[0]['CORR'])
+            self.corr_slope = splines(pars[0]['CORR_SLOPE_Z'], pars[0]['CORR_SLOPE'])
 
-            spl=CubicSpline(pars[0]['CORR_Z'],pars[0]['CORR2'])
-            self.corr2 = spl(self.z)
-            spl=CubicSpline(pars[0]['CORR_SLOPE_Z'],pars[0]['CORR2_SLOPE'])
-            self.corr2_slope = spl(self.z)
+            self.corr2 = splines(pars[0]['CORR_Z'], pars[0]['CORR2'])
+            self.corr2_slope = splines(pars[0]['CORR_SLOPE_Z'], pars[0]['CORR2_SLOPE'])
 
             if 'CORR_R' in pars.dtype.names:
                 # protect against stupidity
                 if (pars[0]['CORR_R'][0] <= 0.0) :
                     self.corr_r = np.ones(nz)
                 else:
-                    spl=CubicSpline(pars[0]['CORR_SLOPE_Z'],pars[0]['CORR_R'])
-                    self.corr_r = spl(self.z)
+                    self.corr_r = splines(pars[0]['CORR_SLOPE_Z'], pars[0]['CORR_R'])
 
                 test,=np.where(self.corr_r < 0.5)
                 if (test.size > 0) : self.corr_r[test] = 0.5
@@ -287,8 +283,7 @@ class RedSequenceColorPar(object):
                 if (pars[0]['CORR2_R'][0] <= 0.0):
                     self.corr2_r = np.ones(nz)
                 else:
-                    spl=CubicSpline(pars[0]['CORR_SLOPE_Z'],pars[0]['CORR2_R'])
-                    self.corr2_r = spl(self.z)
+                    self.corr2_r = splines(pars[0]['CORR_SLOPE_Z'], pars[0]['CORR2_R'])
 
                 test,=np.where(self.corr2_r < 0.5)
                 if (test.size > 0) : self.corr2_r[test] = 0.5
@@ -346,30 +341,12 @@ class RedSequenceColorPar(object):
             # lupcorr (annoying!)
             self.lupcorr = np.zeros((self.refmagbins.size,nz,ncol),dtype='f8')
             if (do_lupcorr):
-                bnmgy = bvalues*1e9
-
-                for i in xrange(nz):
-                    mags = np.zeros((self.refmagbins.size,nmag))
-                    lups = np.zeros((self.refmagbins.size,nmag))
-
-                    mags[:,ref_ind] = self.refmagbins
-
-                    # go redward
-                    for j in xrange(ref_ind+1,nmag):
-                        mags[:,j] = mags[:,j-1] - (self.c[i,j-1]+self.slope[i,j-1]*(mags[:,ref_ind]-self.pivotmag[i]))
-                    # blueward
-                    for j in xrange(ref_ind-1,-1,-1):
-                        mags[:,j] = mags[:,j+1] + (self.c[i,j]+self.slope[i,j]*(mags[:,ref_ind]-self.pivotmag[i]))
-
-                    # and the luptitude conversion
-                    for j in xrange(nmag):
-                        flux = 10.**((mags[:,j]-22.5)/(-2.5))
-                        lups[:,j] = 2.5*np.log10(1.0/bvalues[j]) - np.arcsinh(0.5*flux/bnmgy[j])/(0.4*np.log(10.0))
+                # All redshifts and colors at once, as (nrefmag, nz, ncol)
+                dmags = self.refmagbins[:,np.newaxis] - self.pivotmag[np.newaxis,:]
+                colors = self.c[np.newaxis,:,:] + self.slope[np.newaxis,:,:]*dmags[:,:,np.newaxis]
+                refmags = np.broadcast_to(self.refmagbins[:,np.newaxis], dmags.shape)
 
-                    magcol = mags[:,0:ncol] - mags[:,1:ncol+1]
-                    lupcol = lups[:,0:ncol] - lups[:,1:ncol+1]
-
-                    self.lupcorr[:,i,:] = lupcol - magcol
+                self.lupcorr[:,:,:] = model_lupcorrs(refmags, colors, ref_ind, bvalues)
 
         # set top overflow bins to very large number
         self.z[self.z.size-1] = 1000.0
@@ -554,6 +531,44 @@ class RedSequenceColorPar(object):
                              lupcorr=self.lupcorr[magind,zind,:],
                              calc_chisq=calc_chisq, calc_lkhd=calc_lkhd)
 
+    def changed_redshifts(self, other, tol):
+        """
+        Find the redshifts where this red-sequence model differs from another.
+
+        The models are compared at each redshift in self.z, using the
+        colors, slopes, (pivot-scaled) pivot magnitudes, scatter, zred
+        corrections, reference magnitude ranges, and volume factor.  Both models must have been read with
+        the same redshift binning; if not, all redshifts are marked as
+        changed.
+
+        Parameters
+        ----------
+        other: `redmapper.RedSequenceColorPar`
+           Red-sequence model to compare to
+        tol: `float`
+           Tolerance on the absolute change of any parameter
+
+        Returns
+        -------
+        changed: `np.array`
+           Boolean array, True where the models differ by more than tol.
+        """
+        if (self.z.size != other.z.size or self.ncol != other.ncol or
+                not np.allclose(self.z, other.z)):
+            return np.ones(self.z.size, dtype=bool)
+
+        delta = np.zeros(self.z.size)
+
+        delta = np.maximum(delta, np.max(np.abs(self.c - other.c), axis=1))
+        delta = np.maximum(delta, np.max(np.abs(self.slope - other.slope), axis=1))
+        delta = np.maximum(delta, np.max(np.abs(self.slope * (self.pivotmag - other.pivotmag)[:, np.newaxis]), axis=1))
+        delta = np.maximum(delta, np.max(np.abs(self.sigma - other.sigma), axis=(0, 1)))
+
+        for name in ['corr', 'corr_slope', 'corr_r', 'corr2', 'corr2_slope', 'corr2_r',
+                     'maxrefmag', 'minrefmag', 'volume_factor']:
+            delta = np.maximum(delta, np.abs(getattr(self, name) - getattr(other, name)))
+
+        return ~(delta <= tol)
 
     def plot_redsequence_diag(self, fig, ind, bands):
         """
@@ -22,7 +22,7 @@ from .cluster import Cluster
 from .cluster import ClusterCatalog
 from .depthmap import DepthMap
 from .cluster_runner import ClusterRunner
-from .utilities import CubicSpline
+from .utilities import CubicSpline, make_rng
 
 ###################################################
 # Order of operations:
@@ -175,7 +175,8 @@ class RunColormem(ClusterRunner):
         self.members = Catalog(self.members._ndarray[b])
 
         if self.config.calib_colormem_smooth > 0.0:
-            self.members.z += np.random.normal(scale=self.config.calib_colormem_smooth, size=self.members.size)
+            rng = make_rng(self.config.rng_seed)
+            self.members.z += rng.normal(scale=self.config.calib_colormem_smooth, size=self.members.size)
 
     def output_training(self):
         """
@@ -154,6 +154,11 @@ class RunFirstPass(ClusterRunner):
             if self.specmode:
                 self.cat.z_init = incat.zspec
                 self.cat.z = incat.zspec
+
+                # With calib_warmstart, seeds may carry z_lambda from a
+                # previous run to start from
+                if self.config.calib_warmstart and 'z_lambda' in incat.dtype.names:
+                    self.cat.z_lambda = incat.z_lambda
             else:
                 self.cat.z_init = incat.zred
                 self.cat.z = incat.zred
@@ -262,6 +267,11 @@ class RunFirstPass(ClusterRunner):
 
         zuse = cluster.z_init.copy()
 
+        if self.specmode and self.config.calib_warmstart and cluster.z_lambda > 0.0:
+            z_lambda_init = cluster.z_lambda
+        else:
+            z_lambda_init = None
+
         for i in xrange(self.maxiter):
             if bad:
                 done = True
@@ -280,7 +290,8 @@ class RunFirstPass(ClusterRunner):
                 # Really, this should be on at most n-1th iteration
                 zlam = Zlambda(cluster)
                 z_lambda, z_lambda_e = zlam.calc_zlambda(cluster.redshift, self.mask,
-                                                         calc_err=True, calcpz=False)
+                                                         calc_err=True, calcpz=False,
+                                                         z_lambda_init=z_lambda_init)
 
                 if z_lambda < self.config.zrange[0] or z_lambda > self.config.zrange[1]:
                     bad = True
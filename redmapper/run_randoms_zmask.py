@@ -141,7 +141,8 @@ class RunRandomsZmask(ClusterRunner):
         cluster.r_mask = cluster.r_lambda
 
         maxmag = cluster.mstar - 2.5*np.log10(self.config.lval_reference)
-        cpars = self.mask.calc_maskcorr(cluster.mstar, maxmag, cluster.zredstr.limmag)
+        cpars = self.mask.calc_maskcorr(cluster.mstar, maxmag, cluster.zredstr.limmag,
+                                        rng=cluster.rng)
         cval = np.sum(cpars*cluster.r_lambda**(np.arange(cpars.size)[::-1]))
         cluster.scaleval = 1./(1. - cval)
 
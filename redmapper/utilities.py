@@ -45,7 +45,6 @@ from pkg_resources import resource_filename
 import scipy.interpolate as interpolate
 import fitsio
 from scipy.special import erf
-from numpy import random
 import healpy as hp
 import esutil
 import sys
@@ -78,6 +77,54 @@ def astro_to_sphere(ra, dec):
     """
     return np.radians(90.0-dec), np.radians(ra)
 
+def project_maskgals(ra, dec, mpc_scale, x, y):
+    """
+    Project maskgal offsets around one or more cluster centers to ra/dec.
+
+    Parameters
+    ----------
+    ra: `float` or `np.array`
+       Right ascension of cluster center(s)
+    dec: `float` or `np.array`
+       Declination of cluster center(s)
+    mpc_scale: `float` or `np.array`
+       Scaling in Mpc / degree at cluster redshift(s)
+    x: `np.array`
+       Float array of maskgal x offsets (Mpc).  May be (ngals) or
+       (nclusters, ngals).
+    y: `np.array`
+       Float array of maskgal y offsets (Mpc).  Same shape as x.
+
+    Returns
+    -------
+    ras: `np.array`
+       Float array of right ascensions, (ngals) for a single cluster or
+       (nclusters, ngals) for arrays of clusters.
+    decs: `np.array`
+       Float array of declinations, same shape as ras.
+    """
+    # Always project in double precision: float32 offsets would otherwise
+    # pull the (float64) cluster centers down to float32 and lose ra/dec
+    # precision.
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    if np.ndim(ra) > 0:
+        ra = np.asarray(ra, dtype=np.float64)[:, np.newaxis]
+        dec = np.asarray(dec, dtype=np.float64)[:, np.newaxis]
+        mpc_scale = np.asarray(mpc_scale, dtype=np.float64)[:, np.newaxis]
+    else:
+        ra = np.float64(ra)
+        dec = np.float64(dec)
+        mpc_scale = np.float64(mpc_scale)
+
+    cosdec = np.cos(np.radians(dec))
+
+    ras = ra + (x/mpc_scale)/cosdec
+    decs = dec + y/mpc_scale
+
+    return ras, decs
+
 #Equation 7 in Rykoff et al. 2014
 def chisq_pdf(data, k):
     """
@@ -468,6 +515,131 @@ class CubicSpline(object):
 
             return vals
 
+class CubicSplineEvaluator(object):
+    """
+    CubicSpline interpolation at fixed node positions and fixed evaluation
+    points, for repeated evaluation with new node values.
+
+    The spline is linear in the node values, so the tridiagonal solve for
+    the second derivatives and the interval indices and weights of the
+    evaluation points are computed once.  Each evaluation is then a small
+    matrix-vector product and a weighted sum over the two bracketing nodes.
+    """
+    def __init__(self, x, xeval, yp=None, fixextrap=False):
+        """
+        Instantiate a CubicSplineEvaluator object.
+
+        Parameters
+        ----------
+        x: `np.array`
+           Float array of node positions
+        xeval: `np.array`
+           Float array of x values to compute interpolation
+        yp: `str`
+           Type of spline.  Default is None, which is "natural".
+           Also supports '3d=0'.  (Fixed end derivatives are not linear
+           in the node values and are not supported.)
+        fixextrap: `bool`, optional
+           Fix the extrapolation at the end of the node positions.
+           Default is False.
+        """
+        x = np.atleast_1d(x).astype(np.float64)
+        xeval = np.atleast_1d(xeval).astype(np.float64)
+
+        npts = x.size
+        mat = np.zeros((3, npts))
+        # enforce continuity of 1st derivatives
+        mat[1,1:-1] = (x[2:  ]-x[0:-2])/3.
+        mat[2,0:-2] = (x[1:-1]-x[0:-2])/6.
+        mat[0,2:  ] = (x[2:  ]-x[1:-1])/6.
+        # bb = np.dot(bbmat, y)
+        bbmat = np.zeros((npts, npts))
+        inds = np.arange(1, npts - 1)
+        bbmat[inds, inds + 1] = 1./(x[2:  ]-x[1:-1])
+        bbmat[inds, inds] = -1./(x[2:  ]-x[1:-1]) - 1./(x[1:-1]-x[0:-2])
+        bbmat[inds, inds - 1] = 1./(x[1:-1]-x[0:-2])
+        if yp is None: # natural cubic spline
+            mat[1,0] = 1.
+            mat[1,-1] = 1.
+        elif yp == '3d=0':
+            mat[1, 0] = -1./(x[1]-x[0])
+            mat[0, 1] =  1./(x[1]-x[0])
+            mat[1,-1] =  1./(x[-2]-x[-1])
+            mat[2,-2] = -1./(x[-2]-x[-1])
+        else:
+            raise ValueError("CubicSplineEvaluator only supports natural or '3d=0' splines.")
+        # y2 = np.dot(self._y2mat, y)
+        self._y2mat = solve_banded((1,1), mat, bbmat)
+
+        lo = np.clip(np.searchsorted(x, xeval)-1, 0, npts-2)
+        hi = lo + 1
+        dx = x[hi] - x[lo]
+        a = (x[hi] - xeval)/dx
+        b = (xeval - x[lo])/dx
+
+        self._lo, self._hi = (lo, hi)
+        self._wa, self._wb = (a, b)
+        self._wa2 = (a**3-a)*dx**2./6.
+        self._wb2 = (b**3-b)*dx**2./6.
+
+        self.x, self.xeval = (x, xeval)
+
+        self.fixextrap = fixextrap
+        if fixextrap:
+            self._extrap_lo, = np.where(xeval < x[0])
+            self._extrap_hi, = np.where(xeval > x[-1])
+
+    def __call__(self, y):
+        """
+        Compute spline interpolation at self.xeval.
+
+        Parameters
+        ----------
+        y: `np.array`
+           Float array of node values
+
+        Returns
+        -------
+        yeval: `np.array`
+           Spline interpolated values at self.xeval
+        """
+        y = np.asarray(y, dtype=np.float64)
+        y2 = np.dot(self._y2mat, y)
+
+        vals = (self._wa*y[self._lo] + self._wb*y[self._hi] +
+                self._wa2*y2[self._lo] + self._wb2*y2[self._hi])
+
+        if self.fixextrap:
+            vals[self._extrap_lo] = y[0]
+            vals[self._extrap_hi] = y[-1]
+
+        return vals
+
+    def basis(self):
+        """
+        Compute the spline basis matrix, such that the interpolated values
+        are np.dot(basis, y).
+
+        Returns
+        -------
+        basis: `np.array`
+           Float array (xeval.size, x.size) of spline basis functions
+        """
+        rows = np.arange(self.xeval.size)
+
+        basis = (self._wa2[:, np.newaxis]*self._y2mat[self._lo, :] +
+                 self._wb2[:, np.newaxis]*self._y2mat[self._hi, :])
+        basis[rows, self._lo] += self._wa
+        basis[rows, self._hi] += self._wb
+
+        if self.fixextrap:
+            basis[self._extrap_lo, :] = 0.0
+            basis[self._extrap_lo, 0] = 1.0
+            basis[self._extrap_hi, :] = 0.0
+            basis[self._extrap_hi, -1] = 1.0
+
+        return basis
+
 def calc_theta_i(mag, mag_err, maxmag, limmag):
     """
     Calculate the luminosity function smooth cutoff function, theta_i.
@@ -500,7 +672,7 @@ def calc_theta_i(mag, mag_err, maxmag, limmag):
     return theta_i
 
 def apply_errormodels(maskgals, mag_in, b=None, err_ratio=1.0, fluxmode=False,
-    nonoise=False, inlup=False, lnscat=None, sigma0=0.0):
+    nonoise=False, inlup=False, lnscat=None, sigma0=0.0, rng=None):
     """
     Apply error models to a set of magnitudes.
 
@@ -526,6 +698,9 @@ def apply_errormodels(maskgals, mag_in, b=None, err_ratio=1.0, fluxmode=False,
        Default is None (no ln(scatter) term).
     sigma0: `float`, optional
        Additional noise floor term to apply.  Default is 0.0 (no floor).
+    rng: `np.random.Generator`, optional
+       Random number generator for the noise.  Default is None (global
+       numpy state).
 
     Returns
     -------
@@ -549,13 +724,16 @@ def apply_errormodels(maskgals, mag_in, b=None, err_ratio=1.0, fluxmode=False,
     if sigma0 > 0.0:
         noise = np.sqrt(noise**2. + ((np.log(10.)/2.5) * sigma0 * tflux)**2.)
 
+    if rng is None:
+        rng = np.random
+
     if lnscat is not None:
-        noise = np.exp(np.log(noise) + lnscat * np.random.normal(size=noise.size))
+        noise = np.exp(np.log(noise) + lnscat * rng.normal(size=noise.size))
 
     if nonoise:
         flux = tflux
     else:
-        flux = tflux + noise*random.standard_normal(mag_in.size)
+        flux = tflux + noise*rng.standard_normal(mag_in.size)
 
     if fluxmode:
         mag = flux/maskgals.exptime
@@ -582,6 +760,73 @@ def apply_errormodels(maskgals, mag_in, b=None, err_ratio=1.0, fluxmode=False,
 
     return mag, mag_err
 
+#####################
+## Luptitude corrections
+#####################
+
+def mag_to_lup(mag, b, zp=22.5):
+    """
+    Convert magnitudes to luptitudes.
+
+    Parameters
+    ----------
+    mag: `np.array`
+       Float array of magnitudes.  The last axis runs over the bands if
+       b is an array.
+    b: `float` or `np.array`
+       Luptitude softening parameter (per band)
+    zp: `float`, optional
+       Magnitude zeropoint.  Default is 22.5.
+
+    Returns
+    -------
+    lup: `np.array`
+       Float array of luptitudes, same shape as mag
+    """
+    flux = 10.**((mag - zp) / (-2.5))
+    return 2.5 * np.log10(1.0 / b) - np.arcsinh(0.5 * flux / (b * 1e9)) / (0.4 * np.log(10.0))
+
+def model_lupcorrs(refmag, colors, ref_ind, b, zp=22.5):
+    """
+    Compute the luptitude color corrections for model red-sequence colors.
+
+    The model magnitudes are built out from the reference band using the
+    colors (redward and blueward), and all the bands are converted to
+    luptitudes in one pass.
+
+    Parameters
+    ----------
+    refmag: `np.array`
+       Float array of reference magnitudes, shape (...)
+    colors: `np.array`
+       Float array of model colors, shape (..., ncol)
+    ref_ind: `int`
+       Index of the reference band
+    b: `np.array`
+       Float array of luptitude softening parameters, size ncol + 1
+    zp: `float`, optional
+       Magnitude zeropoint.  Default is 22.5.
+
+    Returns
+    -------
+    lupcorrs: `np.array`
+       Float array of luptitude color corrections, shape (..., ncol)
+    """
+    refmag = np.asarray(refmag, dtype=np.float64)
+    colors = np.asarray(colors, dtype=np.float64)
+
+    # Redward bands subtract the colors, blueward bands add them
+    red = refmag[..., np.newaxis] - np.cumsum(colors[..., ref_ind:], axis=-1)
+    blue = refmag[..., np.newaxis] + np.cumsum(colors[..., :ref_ind][..., ::-1], axis=-1)[..., ::-1]
+
+    mags = np.concatenate((blue, refmag[..., np.newaxis], red), axis=-1)
+    lups = mag_to_lup(mags, b, zp=zp)
+
+    magcol = mags[..., :-1] - mags[..., 1:]
+    lupcol = lups[..., :-1] - lups[..., 1:]
+
+    return lupcol - magcol
+
 #####################
 ## IDL interpol
 #####################
@@ -618,12 +863,62 @@ def interpol(v, x, xout):
 ## IDL cic
 #####################
 
+def _cic_axis(pos, n, isolated):
+    """
+    Compute the cloud-in-cell indices and weights along one axis.
+
+    Parameters
+    ----------
+    pos: `np.array`
+       Array of coordinates of field samples, unit indices: [0, n)
+    n: `int`
+       Range of values
+    isolated: `bool`
+       True if data is not periodic.
+
+    Returns
+    -------
+    k1: `np.array`
+       Integer array of indices of the nearest grid points
+    k2: `np.array`
+       Integer array of indices of the other neighboring grid points
+    w1: `np.array`
+       Float array of weights of the nearest grid points
+    w2: `np.array`
+       Float array of weights of the other neighboring grid points
+    """
+    # coordinates of nearest grid point (ngp)
+    k1 = pos.astype(np.int32)
+
+    # distance from sample to ngp
+    dng = (k1 + 0.5) - pos
+
+    # weight of ngp and of the other side
+    w1 = 1.0 - np.abs(dng)
+    w2 = np.abs(dng)
+
+    # The other side is to the left if x(ngp) > pos, and to the right otherwise
+    k2 = np.where(dng < 0.0, k1 + 1, k1 - 1)
+
+    # Wrap around (periodic), or zero the weight (isolated)
+    wrap = (k2 == -1) | (k2 == n)
+    if np.any(wrap):
+        k2 = np.where(k2 == -1, n - 1, k2)
+        k2[k2 == n] = 0
+        if isolated:
+            w2[wrap] = 0.0
+
+    return k1, k2, w1, w2
+
 def cic(value, posx=None, nx=None, posy=None, ny=None, posz=None, nz=None, average=False, isolated=True):
     """
     Port of idl astronomy utils cic.pro
 
     Interpolate an irregularly sampled field using Cloud-in-Cells
 
+    The samples are assigned to the 2**dim neighboring grid points with a
+    weighted np.bincount over flattened indices, one corner at a time.
+
     Parameters
     ----------
     value: `np.array`
@@ -656,9 +951,6 @@ def cic(value, posx=None, nx=None, posy=None, ny=None, posz=None, nz=None, avera
        1d, 2d, or 3d float array of CIC field values.
     """
 
-    # need type checks
-
-    nrsamples = value.size
     dim = 0
     if (posx is not None and nx is not None):
         dim += 1
@@ -674,180 +966,46 @@ def cic(value, posx=None, nx=None, posy=None, ny=None, posz=None, nz=None, avera
 
     nxny = nx * ny
 
-    # X-direction
-
-    # coordinates of nearest grid point (ngp)
-    ngx = posx.astype(np.int32) + 0.5
-
-    # distance from sample to ngp
-    dngx = ngx - posx
-
-    # Index of ngp
-    kx1 = ngx - 0.5
-    # weight of ngp
-    wx1 = 1.0 - np.abs(dngx)
-
-    # other side
-    left, = np.where(dngx < 0.0)
-    # The following is only correct if x(ngp)>posx (ngp to the right).
-    kx2 = kx1 - 1
-    # Correct points where x(ngp)<posx (ngp to the left).
-    if left.size > 0:
-        kx2[left] += 2
-    wx2 = np.abs(dngx)
-
-    # free memory
-    left = None
-
-    bad, = np.where(kx2 == -1)
-    if bad.size > 0:
-        kx2[bad] = nx - 1
-        if isolated:
-            wx2[bad] = 0.0
-    bad, = np.where(kx2 == nx)
-    if bad.size > 0:
-        kx2[bad] = 0
-        if isolated:
-            wx2[bad] = 0.0
-    bad = None
-
-    # Y-direction
-
+    # Indices and weights of the two neighboring grid points along each axis
+    axes = [_cic_axis(posx, nx, isolated)]
     if dim >= 2:
-        ngy = posy.astype(np.int32) + 0.5
-
-        # distance from sample to ngp
-        dngy = ngy - posy
-
-        # Index of ngp
-        ky1 = ngy - 0.5
-        # weight of ngp
-        wy1 = 1.0 - np.abs(dngy)
-
-        # other side
-        left, = np.where(dngy < 0.0)
-        # The following is only correct if y(ngp)>posy (ngp to the right).
-        ky2 = ky1 - 1
-        # Correct points where x(ngp)<posx (ngp to the left).
-        if left.size > 0:
-            ky2[left] += 2
-        wy2 = np.abs(dngy)
-
-        # free memory
-        left = None
-
-        bad, = np.where(ky2 == -1)
-        if bad.size > 0:
-            ky2[bad] = ny - 1
-            if isolated:
-                wy2[bad] = 0.0
-        bad, = np.where(ky2 == ny)
-        if bad.size > 0:
-            ky2[bad] = 0
-            if isolated:
-                wy2[bad] = 0.0
-        bad = None
-    else:
-        ky1 = 0
-        ky2 = 0
-        wy1 = 1
-        wy2 = 1
-
-    # Z-direction
-
+        axes.append(_cic_axis(posy, ny, isolated))
     if dim == 3:
-        ngz = posz.astype(np.int32) + 0.5
-
-        # distance from sample to ngp
-        dngz = ngz - posz
-
-        # Index of ngp
-        kz1 = ngz - 0.5
-        # weight of ngp
-        wz1 = 1.0 - np.abs(dngz)
-
-        # other side
-        left, = np.where(dngz < 0.0)
-        # The following is only correct if z(ngp)>posz (ngp to the right).
-        kz2 = kz1 - 1
-        # Correct points where z(ngp)<posz (ngp to the left).
-        if left.size > 0:
-            kz2[left] += 2
-        wz2 = np.abs(dngz)
-
-        # free memory
-        left = None
-
-        bad, = np.where(kz2 == -1)
-        if bad.size > 0:
-            kz2[bad] = nz - 1
-            if isolated:
-                wz2[bad] = 0.0
-        bad, = np.where(kz2 == nz)
-        if bad.size > 0:
-            kz2[bad] = 0
-            if isolated:
-                wz2[bad] = 0.0
-        bad = None
-    else:
-        kz1 = 0
-        kz2 = 0
-        wz1 = 1
-        wz2 = 1
+        axes.append(_cic_axis(posz, nz, isolated))
 
-    # Interpolate samples to grid
-
-    field = np.zeros(nx * ny * nz)
-
-    if average:
-        totcicweight = np.zeros_like(field)
+    strides = [1, nx, nxny]
 
-    index = (kx1 + ky1*nx + kz1 * nxny).astype(np.int32)
-    cicweight = wx1 * wy1 * wz1
-    np.add.at(field, index, cicweight * value)
-    if average:
-        np.add.at(totcicweight, index, cicweight)
-
-    index = (kx2 + ky1 * nx + kz1 * nxny).astype(np.int32)
-    cicweight = wx2 * wy1 * wz1
-    np.add.at(field, index, cicweight * value)
+    # Accumulate the 2**dim corners one at a time (ordered with x varying
+    # fastest, then y, then z), so only one set of flattened indices and
+    # weights is in memory.  Each bincount starts with the running sum in
+    # every grid point, so the samples are added in the same order (and
+    # with the same rounding) as a single bincount over all the corners.
+    nrsamples = value.size
+    ncorner = 2**dim
+    ngrid = nx * ny * nz
+    gridindex = np.arange(ngrid)
+    field = np.zeros(ngrid)
     if average:
-        np.add.at(totcicweight, index, cicweight)
-
-    if dim >= 2:
-        index = (kx1 + ky2*nx + kz1*nxny).astype(np.int32)
-        cicweight = wx1 * wy2 * wz1
-        np.add.at(field, index, cicweight * value)
-        if average:
-            np.add.at(totcicweight, index, cicweight)
-        index = (kx2 + ky2*nx + kz1*nxny).astype(np.int32)
-        cicweight = wx2 * wy2 * wz1
-        np.add.at(field, index, cicweight * value)
+        totcicweight = np.zeros(ngrid)
+
+    for c in xrange(ncorner):
+        index = np.zeros(nrsamples, dtype=np.int64)
+        cicweight = np.ones(nrsamples)
+        for d in xrange(dim):
+            k1, k2, w1, w2 = axes[d]
+            if (c >> d) & 1:
+                index += k2 * strides[d]
+                cicweight *= w2
+            else:
+                index += k1 * strides[d]
+                cicweight *= w1
+
+        index = np.concatenate((gridindex, index))
+        field = np.bincount(index, weights=np.concatenate((field, cicweight * value)),
+                            minlength=ngrid)
         if average:
-            np.add.at(totcicweight, index, cicweight)
-        if dim == 3:
-            index = (kx1 + ky1 * nx + kz2 * nxny).astype(np.int32)
-            cicweight = wx1 * wy1 * wz2
-            np.add.at(field, index, cicweight * value)
-            if average:
-                np.add.at(totcicweight, index, cicweight)
-            index = (kx2 + ky1 * nx + kz2 * nxny).astype(np.int32)
-            cicweight = wx2 * wy1 * wz2
-            np.add.at(field, index, cicweight * value)
-            if average:
-                np.add.at(totcicweight, index, cicweight)
-            index = (kx1 + ky2 * nx + kz2 * nxny).astype(np.int32)
-            cicweight = wx1 * wy2 * wz2
-            np.add.at(field, index, cicweight * value)
-            if average:
-                np.add.at(totcicweight, index, cicweight)
-            index = (kx2 + ky2 * nx + kz2 * nxny).astype(np.int32)
-            cicweight = wx2 * wy2 * wz2
-            np.add.at(field, index, cicweight * value)
-            if average:
-                np.add.at(totcicweight, index, cicweight)
-
-    index = None
+            totcicweight = np.bincount(index, weights=np.concatenate((totcicweight, cicweight)),
+                                       minlength=ngrid)
 
     if average:
         good, = np.where(totcicweight != 0)
@@ -922,7 +1080,7 @@ def make_nodes(zrange, nodesize, maxnode=None, minnode=None):
 ## Sample from a pdf
 #######################
 
-def sample_from_pdf(f, ran, step, nsamp, **kwargs):
+def sample_from_pdf(f, ran, step, nsamp, rng=None, **kwargs):
     """
     Sample from a PDF described by a function f.
 
@@ -936,6 +1094,8 @@ def sample_from_pdf(f, ran, step, nsamp, **kwargs):
        Step size for interpolation.
     nsamp: `int`
        Number of samples from pdf
+    rng: `np.random.Generator`, optional
+       Random number generator.  Default is None (global numpy state).
     **kwargs: `dict`
        Extra arguments to call f()
 
@@ -953,15 +1113,44 @@ def sample_from_pdf(f, ran, step, nsamp, **kwargs):
     cdf = np.cumsum(pdf.tolist())
     cdfi = (cdf * x.size).astype(np.int32)
 
-    rand = (np.random.uniform(size=nsamp) * x.size).astype(np.int32)
+    if rng is None:
+        rng = np.random
 
-    samples = np.zeros(nsamp)
-    for i in xrange(nsamp):
-        test, = np.where(cdfi >= rand[i])
-        samples[i] = x[test[0]]
+    rand = (rng.uniform(size=nsamp) * x.size).astype(np.int32)
+
+    # The first point where cdfi >= rand
+    samples = x[np.searchsorted(cdfi, rand, side='left')]
 
     return samples
 
+def make_rng(seed, *keys):
+    """
+    Make a random number generator for a reproducible stream.
+
+    The stream is derived from the run seed and a set of integer keys (for
+    example a pixel and a mem_match_id), using the counter-based Philox
+    generator.  The same (seed, keys) always gives the same stream,
+    independently of the order in which streams are made or used.
+
+    Parameters
+    ----------
+    seed: `int` or None
+       Run seed.  If None, the global numpy random state is returned.
+    *keys: `int`
+       Non-negative integer keys identifying the stream.
+
+    Returns
+    -------
+    rng: `np.random.Generator` or `np.random`
+       Random number generator.  Callers should only use methods common to
+       both (random, uniform, normal, choice).
+    """
+    if seed is None:
+        return np.random
+
+    seedseq = np.random.SeedSequence(int(seed), spawn_key=tuple(int(key) for key in keys))
+    return np.random.Generator(np.random.Philox(seedseq))
+
 # for multiprocessing classes
 def _pickle_method(m):
     """
@@ -1022,8 +1211,8 @@ def histoGauss(ax, array):
         np.std(array)]
 
     try:
-        with np.warnings.catch_warnings():
-            np.warnings.simplefilter("ignore")
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
 
             # This fit might throw a warning, which we don't need now.
             # Note that in the future if we use the output from this fit in an
@@ -1068,6 +1257,9 @@ def make_lockfile(lockfile, block=False, maxtry=300, waittime=2):
     """
     Make a lockfile with atomic linking.
 
+    The lockfile records the host name and process id of the owner, which
+    is used by lockfile_is_stale().
+
     Parameters
     ----------
     lockfile: `str`
@@ -1086,11 +1278,14 @@ def make_lockfile(lockfile, block=False, maxtry=300, waittime=2):
     """
 
     import os
+    import socket
     import tempfile
     import time
 
     tf = tempfile.mkstemp(prefix='', dir=os.path.dirname(lockfile))
     tempfilename = tf[1]
+    # Record the owner so that a stale lock can be recognized
+    os.write(tf[0], ('%s %d\n' % (socket.gethostname(), os.getpid())).encode('utf-8'))
     os.close(tf[0])
 
     if not block:
@@ -1123,6 +1318,52 @@ def make_lockfile(lockfile, block=False, maxtry=300, waittime=2):
 
         return locked
 
+def lockfile_is_stale(lockfile, maxage=None):
+    """
+    Check if a lockfile has been left behind by a process that is gone.
+
+    A lock made by make_lockfile() on this host is stale if the owning
+    process is no longer running.  Any lock is stale if it is older than
+    maxage.
+
+    Parameters
+    ----------
+    lockfile: `str`
+       Name of lockfile to check
+    maxage: `float`, optional
+       Maximum age in seconds of a lock.  Default is None (no expiry).
+
+    Returns
+    -------
+    stale: `bool`
+       True if the lockfile is stale, False if it is held (or gone).
+    """
+
+    import os
+    import socket
+    import time
+
+    try:
+        with open(lockfile) as f:
+            owner = f.read().split()
+        age = time.time() - os.path.getmtime(lockfile)
+    except (IOError, OSError):
+        # The lock has been released
+        return False
+
+    if len(owner) == 2 and owner[0] == socket.gethostname():
+        try:
+            os.kill(int(owner[1]), 0)
+        except ProcessLookupError:
+            return True
+        except (PermissionError, ValueError):
+            pass
+
+    if maxage is not None and age > maxage:
+        return True
+
+    return False
+
 def read_members(catfile):
     """
     Read members associated to a catalog file.
@@ -1345,3 +1586,96 @@ def get_healsparse_subpix_indices(subpix_nside, subpix_hpix, subpix_border, cove
 
     return covpix
 
+
+class DenseHealsparseMap(object):
+    """
+    A dense, nest-ordered raster of the covered part of a healsparse map.
+
+    This is meant for maps that have been read in for a single subregion
+    (config.d.hpix plus border), where the full-resolution pixels of every
+    covered coverage pixel comfortably fit in memory.  Position lookups are
+    then a single ang2pix and an array index, avoiding the per-call overhead
+    of the sparse map.
+    """
+
+    def __init__(self, sparse_map):
+        """
+        Instantiate a DenseHealsparseMap
+
+        Parameters
+        ----------
+        sparse_map: `healsparse.HealSparseMap`
+           Sparse map to expand.  Values outside the coverage of this map
+           are returned as for the sparse map itself.
+        """
+        self.nside = sparse_map.nside_sparse
+        nside_coverage = sparse_map.nside_coverage
+
+        self._bit_shift = 2 * int(np.round(np.log2(self.nside // nside_coverage)))
+        self._nfine = 2**self._bit_shift
+
+        covered = sparse_map.coverage_mask
+        covpix, = np.where(covered)
+
+        # Block 0 is filled with the out-of-coverage value, and every
+        # uncovered coverage pixel points there.
+        self._cov_offset = np.zeros(covered.size, dtype=np.int64)
+        self._cov_offset[covpix] = (np.arange(covpix.size) + 1) * self._nfine
+
+        pixels = (np.left_shift(covpix.astype(np.int64), self._bit_shift)[:, np.newaxis] +
+                  np.arange(self._nfine)).ravel()
+
+        uncovered, = np.where(~covered)
+        if uncovered.size > 0:
+            fill = sparse_map.get_values_pix(np.atleast_1d(np.left_shift(uncovered[0], self._bit_shift)))
+        else:
+            fill = np.zeros(1, dtype=sparse_map.dtype)
+
+        values = np.concatenate((np.repeat(fill, self._nfine),
+                                 sparse_map.get_values_pix(pixels)))
+
+        # Fancy indexing of a structured array is slow, so each field is
+        # kept as its own contiguous array.
+        self.dtype = values.dtype
+        if self.dtype.names is None:
+            self._values = values
+        else:
+            self._values = {name: np.ascontiguousarray(values[name])
+                            for name in self.dtype.names}
+
+    def get_values_pos(self, ra_or_theta, dec_or_phi, lonlat=True):
+        """
+        Get the map values at a set of positions.
+
+        Parameters
+        ----------
+        ra_or_theta: `np.array`
+           Float array of right ascensions (degrees) if lonlat is True,
+           or colatitudes (radians) otherwise
+        dec_or_phi: `np.array`
+           Float array of declinations (degrees) if lonlat is True,
+           or longitudes (radians) otherwise
+        lonlat: `bool`, optional
+           Positions are ra/dec in degrees rather than theta/phi in
+           radians, as for healsparse.  Default is True.
+
+        Returns
+        -------
+        values: `np.array`
+           Array of map values, with the same dtype as the sparse map.
+        """
+        if lonlat:
+            pixels = hp.ang2pix(self.nside, ra_or_theta, dec_or_phi, lonlat=True, nest=True)
+        else:
+            pixels = hp.ang2pix(self.nside, ra_or_theta, dec_or_phi, nest=True)
+        index = (self._cov_offset[np.right_shift(pixels, self._bit_shift)] +
+                 np.bitwise_and(pixels, self._nfine - 1))
+
+        if self.dtype.names is None:
+            return self._values[index]
+
+        values = np.zeros(index.size, dtype=self.dtype)
+        for name in self.dtype.names:
+            values[name] = self._values[name][index]
+
+        return values
@@ -10,11 +10,13 @@ import numpy as np
 import esutil
 import os
 import healsparse
+from multiprocessing import Pool
 
 from .catalog import Catalog, Entry
 from .depthmap import DepthMap
 from .redsequence import RedSequenceColorPar
 from .utilities import astro_to_sphere, get_healsparse_subpix_indices
+from .utilities import DenseHealsparseMap
 
 
 class VolumeLimitMask(object):
@@ -90,15 +92,30 @@ class VolumeLimitMask(object):
 
         self.sparse_vlimmap = healsparse.HealSparseMap.read(self.vlimfile, pixels=covpixels)
 
+        # Expand a subregion into a dense raster for fast position lookups
+        if self.config.dense_map_lookup and covpixels is not None:
+            self._lookup_map = DenseHealsparseMap(self.sparse_vlimmap)
+        else:
+            self._lookup_map = self.sparse_vlimmap
+
         self.nside = self.sparse_vlimmap.nside_sparse
         self.subpix_nside = self.config.d.hpix
         self.subpix_hpix = self.config.d.nside
         self.subpix_border = self.config.border
 
-    def _build_mask(self):
+    def _build_mask(self, chunk_size=64):
         """
         Build a VolumeLimitMask from the parameters in the config file, and
         store the mask in self.vlimfile
+
+        The depth maps are processed in chunks of coverage pixels, with
+        config.calib_nproc processes, so that only one chunk of each depth
+        map is in memory per process.
+
+        Parameters
+        ----------
+        chunk_size: `int`, optional
+           Number of coverage pixels to process per chunk.  Default is 64.
         """
 
         # Make some checks to make sure we can build a volume limit mask
@@ -123,55 +140,16 @@ class VolumeLimitMask(object):
         # get the reference index
         ref_ind = self.config.bands.index(self.config.refmag)
 
-        # Read in the primary depth structure
-        sparse_depthmap = healsparse.HealSparseMap.read(self.config.depthfile)
-
-        dtype_vlimmap = [('fracgood', 'f4'),
-                         ('zmax', 'f4')]
-
-        sparse_vlimmap = healsparse.HealSparseMap.make_empty(sparse_depthmap.nside_coverage,
-                                                             sparse_depthmap.nside_sparse,
-                                                             dtype=dtype_vlimmap,
-                                                             primary='fracgood')
-
-        validPixels = sparse_depthmap.valid_pixels
-        depthValues = sparse_depthmap.get_values_pix(validPixels)
-        vlimmap = np.zeros(validPixels.size, dtype=dtype_vlimmap)
-        vlimmap['fracgood'] = depthValues['fracgood']
-
-        lo, = np.where(depthValues['m50'] <= limmags.min())
-        vlimmap['zmax'][lo] = zbins.min()
-        hi, = np.where(depthValues['m50'] >= limmags.max())
-        vlimmap['zmax'][hi] = zbins.max()
-        mid, = np.where((depthValues['m50'] > limmags.min()) & (depthValues['m50'] < limmags.max()))
-        if mid.size > 0:
-            l = np.searchsorted(limmags, depthValues['m50'][mid], side='right')
-            vlimmap['zmax'][mid] = zbins[l]
-
-        # Read in any additional depth maps
+        # The magnitude limits for any additional depth maps only depend on
+        # the red sequence, so are computed once here.
+        extra_maps = []
         for i, depthfile in enumerate(self.config.vlim_depthfiles):
-            sparse_depthmap2, hdr2 = healsparse.HealSparseMap.read(depthfile, header=True)
-
-            validPixels2 = sparse_depthmap2.valid_pixels
-            depthValues2 = sparse_depthmap2.get_values_pix(validPixels2)
-
-            nsig = hdr2['NSIG']
-            zp = hdr2['ZP']
+            hdr2 = fitsio.read_header(depthfile, ext='COV')
 
             # find mag name thing...
             # Note this is validated in the config read
             map_ind = self.config.bands.index(self.config.vlim_bands[i])
 
-            # match pixels
-            a, b = esutil.numpy_util.match(validPixels, validPixels2)
-
-            n2 = self.config.vlim_nsigs[i]**2.
-            flim_in = 10.**((depthValues2['limmag'][b] - zp) / (-2.5))
-            fn = np.clip((flim_in**2. * depthValues2['exptime'][b]) / (nsig**2.) - flim_in, 0.001, None)
-            flim_mask = (n2 + np.sqrt(n2**2. + 4.*depthValues2['exptime'][b] * n2 * fn)) / (2.*depthValues2['exptime'][b])
-            lim_mask = np.zeros(vlimmap.size)
-            lim_mask[a] = zp - 2.5*np.log10(flim_mask)
-
             zinds = np.searchsorted(zredstr.z, zbins, side='right')
 
             limmags_temp = zredstr.mstar(zbins) - 2.5*np.log10(self.vlim_lstar)
@@ -189,25 +167,52 @@ class VolumeLimitMask(object):
                     for jj in xrange(ref_ind, map_ind):
                         limmags_temp -= (zredstr.c[zinds, jj] + zredstr.slope[zinds, jj] * (refmag_lim - zredstr.pivotmag[zinds]))
 
-            # adjust zmax with zmax_temp
-            zmax_temp = np.zeros(vlimmap.size)
+            extra_maps.append({'depthfile': depthfile,
+                               'nside_coverage': hdr2['NSIDE'],
+                               'nsig': hdr2['NSIG'],
+                               'zp': hdr2['ZP'],
+                               'vlim_nsig': self.config.vlim_nsigs[i],
+                               'limmags': limmags_temp})
+
+        # Split the coverage of the primary depth map into chunks
+        cov = healsparse.HealSparseCoverage.read(self.config.depthfile)
+        covpix, = np.where(cov.coverage_mask)
+
+        pars = {'depthfile': self.config.depthfile,
+                'nside_coverage': cov.nside_coverage,
+                'zbins': zbins,
+                'limmags': limmags,
+                'extra_maps': extra_maps}
 
-            lo, = np.where(lim_mask <= limmags_temp.min())
-            zmax_temp[lo] = zbins.min()
-            hi, = np.where(lim_mask >= limmags_temp.max())
-            zmax_temp[hi] = zbins.max()
-            mid, = np.where((lim_mask > limmags_temp.min()) & (lim_mask < limmags_temp.max()))
-            if mid.size > 0:
-                l = np.clip(np.searchsorted(limmags_temp, lim_mask[mid], side='right'), 0, zbins.size - 1)
-                zmax_temp[mid] = zbins[l]
+        worker_list = [(pars, covpix[i: i + chunk_size])
+                       for i in xrange(0, covpix.size, chunk_size)]
+
+        dtype_vlimmap = [('fracgood', 'f4'),
+                         ('zmax', 'f4')]
 
-            limited, = np.where(zmax_temp < vlimmap['zmax'])
-            vlimmap['zmax'][limited] = zmax_temp[limited]
+        sparse_vlimmap = healsparse.HealSparseMap.make_empty(cov.nside_coverage,
+                                                             cov.nside_sparse,
+                                                             dtype=dtype_vlimmap,
+                                                             primary='fracgood')
 
+        # Stream the results of each chunk into the output map.  The chunks
+        # are merged in coverage pixel order, so that the pixel order of the
+        # output map does not depend on the number of processes.
+        nproc = min(self.config.calib_nproc, len(worker_list))
+        if nproc > 1:
+            pool = Pool(processes=nproc)
+            results = pool.imap(_vlim_chunk_worker, worker_list, chunksize=1)
+        else:
+            pool = None
+            results = (_vlim_chunk_worker(worker) for worker in worker_list)
 
-        gd, = np.where(vlimmap['zmax'] > zbins[0])
+        for pixels, vlimmap in results:
+            if pixels.size > 0:
+                sparse_vlimmap.update_values_pix(pixels, vlimmap)
 
-        sparse_vlimmap.update_values_pix(validPixels[gd], vlimmap[gd])
+        if pool is not None:
+            pool.close()
+            pool.join()
 
         sparse_vlimmap.write(self.vlimfile)
 
@@ -264,7 +269,7 @@ class VolumeLimitMask(object):
         if (len(ras) != len(decs)):
             raise ValueError("ras, decs must be same length")
 
-        values = self.sparse_vlimmap.get_values_pos(ras, decs, lonlat=True)
+        values = self._lookup_map.get_values_pos(ras, decs, lonlat=True)
 
         bad, = np.where(np.abs(decs) > 90.0)
         values['zmax'][bad] = hp.UNSEEN
@@ -315,6 +320,119 @@ class VolumeLimitMask(object):
         return astr
 
 
+def _vlim_chunk_worker(worker):
+    """
+    Compute the volume limit mask for a chunk of depth map coverage pixels.
+
+    This is used for multiprocessing by VolumeLimitMask._build_mask().
+
+    Parameters
+    ----------
+    worker: `tuple`
+       (pars, covpix) with the dict of build parameters and the (nest)
+       coverage pixels of the primary depth map to compute
+
+    Returns
+    -------
+    pixels: `np.array`
+       Integer array of (nest) pixels with zmax above the lowest redshift bin
+    vlimmap: `np.ndarray`
+       Structured array of fracgood and zmax values for pixels
+    """
+    pars, covpix = worker
+
+    zbins = pars['zbins']
+    limmags = pars['limmags']
+
+    sparse_depthmap = healsparse.HealSparseMap.read(pars['depthfile'], pixels=covpix)
+
+    validPixels = sparse_depthmap.valid_pixels
+    depthValues = sparse_depthmap.get_values_pix(validPixels)
+    vlimmap = np.zeros(validPixels.size, dtype=[('fracgood', 'f4'),
+                                                ('zmax', 'f4')])
+    vlimmap['fracgood'] = depthValues['fracgood']
+
+    lo, = np.where(depthValues['m50'] <= limmags.min())
+    vlimmap['zmax'][lo] = zbins.min()
+    hi, = np.where(depthValues['m50'] >= limmags.max())
+    vlimmap['zmax'][hi] = zbins.max()
+    mid, = np.where((depthValues['m50'] > limmags.min()) & (depthValues['m50'] < limmags.max()))
+    if mid.size > 0:
+        l = np.searchsorted(limmags, depthValues['m50'][mid], side='right')
+        vlimmap['zmax'][mid] = zbins[l]
+
+    # And any additional depth maps, for the same area
+    for extra_map in pars['extra_maps']:
+        covpix2 = _convert_covpix(covpix, pars['nside_coverage'], extra_map['nside_coverage'])
+        sparse_depthmap2 = healsparse.HealSparseMap.read(extra_map['depthfile'], pixels=covpix2)
+
+        validPixels2 = sparse_depthmap2.valid_pixels
+        depthValues2 = sparse_depthmap2.get_values_pix(validPixels2)
+
+        nsig = extra_map['nsig']
+        zp = extra_map['zp']
+        limmags_temp = extra_map['limmags']
+
+        # match pixels
+        a, b = esutil.numpy_util.match(validPixels, validPixels2)
+
+        n2 = extra_map['vlim_nsig']**2.
+        flim_in = 10.**((depthValues2['limmag'][b] - zp) / (-2.5))
+        fn = np.clip((flim_in**2. * depthValues2['exptime'][b]) / (nsig**2.) - flim_in, 0.001, None)
+        flim_mask = (n2 + np.sqrt(n2**2. + 4.*depthValues2['exptime'][b] * n2 * fn)) / (2.*depthValues2['exptime'][b])
+        lim_mask = np.zeros(vlimmap.size)
+        lim_mask[a] = zp - 2.5*np.log10(flim_mask)
+
+        # adjust zmax with zmax_temp
+        zmax_temp = np.zeros(vlimmap.size)
+
+        lo, = np.where(lim_mask <= limmags_temp.min())
+        zmax_temp[lo] = zbins.min()
+        hi, = np.where(lim_mask >= limmags_temp.max())
+        zmax_temp[hi] = zbins.max()
+        mid, = np.where((lim_mask > limmags_temp.min()) & (lim_mask < limmags_temp.max()))
+        if mid.size > 0:
+            l = np.clip(np.searchsorted(limmags_temp, lim_mask[mid], side='right'), 0, zbins.size - 1)
+            zmax_temp[mid] = zbins[l]
+
+        limited, = np.where(zmax_temp < vlimmap['zmax'])
+        vlimmap['zmax'][limited] = zmax_temp[limited]
+
+    gd, = np.where(vlimmap['zmax'] > zbins[0])
+
+    return validPixels[gd], vlimmap[gd]
+
+def _convert_covpix(covpix, nside_coverage, nside_coverage_new):
+    """
+    Convert (nest) coverage pixels to a different coverage nside.
+
+    Parameters
+    ----------
+    covpix: `np.array`
+       Integer array of (nest) coverage pixels
+    nside_coverage: `int`
+       Coverage nside of covpix
+    nside_coverage_new: `int`
+       Coverage nside to convert to
+
+    Returns
+    -------
+    covpix_new: `np.array`
+       Integer array of (nest) coverage pixels at nside_coverage_new that
+       overlap covpix
+    """
+    if nside_coverage_new == nside_coverage:
+        return covpix
+
+    bit_shift = 2 * int(np.round(np.log2(max(nside_coverage, nside_coverage_new) /
+                                         min(nside_coverage, nside_coverage_new))))
+    if nside_coverage_new < nside_coverage:
+        return np.unique(np.right_shift(covpix, bit_shift))
+    else:
+        return (np.left_shift(covpix, bit_shift)[:, np.newaxis] +
+                np.arange(2**bit_shift)).ravel()
+
+
 class VolumeLimitMaskFixed(object):
     """
     A class to describe a volume limit mask with a fixed redshift maximum.
@@ -47,7 +47,7 @@ class Zlambda(object):
         self.cosmo = cluster.cosmo
 
     def calc_zlambda(self, zin, mask, maxmag_in=None, calcpz=False, calc_err=True,
-                     correction=False, record_values=True):
+                     correction=False, record_values=True, z_lambda_init=None):
         """
         Calculate the z_lambda cluster photometric redshift
 
@@ -76,6 +76,10 @@ class Zlambda(object):
            Record redshift values in input cluster.  Default is True.
            Should set to False when doing ancillary calculations that
            should not be recorded.
+        z_lambda_init: `float`, optional
+           Starting point for the z_lambda iterations (e.g. z_lambda from a
+           previous run).  The neighbor magnitude cut still uses zin.
+           Default is None, which starts at zin.
 
         Returns
         -------
@@ -93,6 +97,9 @@ class Zlambda(object):
 
         maxrad = 1.2 * self.cluster.r0 * 3.**self.cluster.beta
 
+        if z_lambda_init is not None and z_lambda_init > 0.0:
+            z_lambda = copy.copy(z_lambda_init)
+
         self.niter = 0
         pzdone = False
 
@@ -309,20 +309,66 @@ class ZredColor(object):
             # we have a single bin... hack this
             chisq = self.zredstr.calculate_chisq(galaxy, np.array([zbins[0], zbins[0]]), z_is_index=True, calc_lkhd=False)[0]
 
+        lndist = self._chisq_to_lndist(chisq, galaxy.refmag, zbins)
+
+        return (lndist, chisq)
+
+    def _calculate_lndist_galaxies(self, galaxies, zbin):
+        """
+        Calculate the log-likelihood for a set of galaxies at one redshift bin.
+
+        This is the same log-likelihood as _calculate_lndist() (both use
+        _chisq_to_lndist()), evaluated for many galaxies at once.
+
+        Parameters
+        ----------
+        galaxies: `redmapper.GalaxyCatalog`
+           Galaxies to compute likelihoods
+        zbin: `int`
+           Redshift bin
+
+        Returns
+        -------
+        lndist: `np.array`
+           Log-likelihood for each galaxy
+        """
+        chisq = self.zredstr.calculate_chisq(galaxies, zbin, z_is_index=True, calc_lkhd=False)
+
+        return self._chisq_to_lndist(chisq, galaxies.refmag, zbin)
+
+    def _chisq_to_lndist(self, chisq, refmag, zbins):
+        """
+        Convert the fit chi-squared to the log-likelihood, with the
+        luminosity function and volume weighting.
+
+        Parameters
+        ----------
+        chisq: `np.array`
+           Fit chi-squared
+        refmag: `float` or `np.array`
+           Reference magnitude of the galaxy or galaxies
+        zbins: `int` or `np.array`
+           Redshift bin(s) of chisq
+
+        Returns
+        -------
+        lndist: `np.array`
+           Log-likelihood
+        """
         lndist = -0.5 * chisq
 
-        #with np.errstate(invalid='ignore'):
-        lndistcorr = np.log((10.**(0.4 * (self.zredstr.alpha + 1.0) *
-                                   (self.zredstr._mstar[zbins] - galaxy.refmag)) *
-                             np.exp(-10.**(0.4 * (self.zredstr._mstar[zbins] - galaxy.refmag)))) *
-                            self.zredstr.volume_factor[zbins])
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+            lndistcorr = np.log((10.**(0.4 * (self.zredstr.alpha + 1.0) *
+                                       (self.zredstr._mstar[zbins] - refmag)) *
+                                 np.exp(-10.**(0.4 * (self.zredstr._mstar[zbins] - refmag)))) *
+                                self.zredstr.volume_factor[zbins])
 
         lndist += lndistcorr
 
         bad, = np.where(~np.isfinite(lndist))
         lndist[bad] = -1e11
 
-        return (lndist, chisq)
+        return lndist
 
     def _reset_bad_values(self, galaxy):
         """
@@ -29,6 +29,142 @@ from .catalog import Catalog, Entry
 from .redsequence import RedSequenceColorPar
 import tqdm
 
+
+def _warm_start_zreds(zredc, prev_zredc, galaxies, prev_zreds, zchanged, nsig=3.0,
+                      lnmargin=25.0):
+    """
+    Compute zreds for a catalog of galaxies, reusing the previous zreds for
+    galaxies that only depend on unchanged redshifts of the red-sequence
+    model.
+
+    A galaxy is a candidate for reuse if zred_uncorr +/- nsig*zred_uncorr_e,
+    the range of its zred samples and its corrected zreds stay more than
+    three redshift bins away from any changed redshift, and its previous
+    zred was good.
+
+    This alone does not guarantee that the likelihood peak cannot move to a
+    changed redshift, so each candidate is then checked explicitly against
+    ZredColor.compute_zred().  Within the galaxy's fit range, at every
+    changed redshift the log-likelihood under both the previous and the
+    current model must be more than lnmargin below both the previous lkhd
+    and the peak log-likelihood (so the changed redshifts are outside the
+    p(z) support and cannot be the peak), must be good or bad under both
+    models, and must be more than five bins from the peak (the parabola fit
+    window).  The refmag range must also agree at the changed redshifts.
+    Candidates that fail any check are recomputed.  The peak is found with
+    one vectorized likelihood evaluation per redshift bin, which is much
+    cheaper than the per-galaxy fit.
+
+    Parameters
+    ----------
+    zredc: `redmapper.ZredColor`
+       Zred calculator with the current red-sequence model
+    prev_zredc: `redmapper.ZredColor`
+       Zred calculator with the red-sequence model of prev_zreds
+    galaxies: `redmapper.GalaxyCatalog`
+       Galaxies with zred fields.  Modified in place.
+    prev_zreds: `redmapper.Catalog`
+       Previous zreds for the same galaxies
+    zchanged: `np.array`
+       Boolean array, True for the changed redshifts in zredc.zredstr.z
+    nsig: `float`, optional
+       Number of sigma around zred_uncorr to check.  Default is 3.0.
+    lnmargin: `float`, optional
+       Minimum log-likelihood below the previous lkhd and the peak at the
+       changed redshifts.  Default is 25.0 (relative p(z) < 1.4e-11).
+
+    Returns
+    -------
+    reused: `np.array`
+       Boolean array, True for the galaxies whose previous zreds were kept
+    """
+    zredstr = zredc.zredstr
+    prev_zredstr = prev_zredc.zredstr
+
+    if (zredc.nz != prev_zredc.nz or
+            not np.array_equal(zredstr.extrapolated, prev_zredstr.extrapolated) or
+            not np.array_equal(zredstr._mstar, prev_zredstr._mstar) or
+            zredstr.alpha != prev_zredstr.alpha):
+        # The likelihood changes at every redshift
+        zchanged = np.ones_like(zchanged)
+
+    zsamp = prev_zreds.zred_samp.reshape(prev_zreds.size, -1)
+
+    for dt in zred_extra_dtype(zsamp.shape[1]):
+        name = dt[0].lower()
+        galaxies._ndarray[name][:] = prev_zreds._ndarray[name].reshape(galaxies._ndarray[name].shape)
+
+    zlo = np.minimum(prev_zreds.zred_uncorr - nsig * prev_zreds.zred_uncorr_e, np.min(zsamp, axis=1))
+    zlo = np.minimum(zlo, np.minimum(prev_zreds.zred, prev_zreds.zred2))
+    zhi = np.maximum(prev_zreds.zred_uncorr + nsig * prev_zreds.zred_uncorr_e, np.max(zsamp, axis=1))
+    zhi = np.maximum(zhi, np.maximum(prev_zreds.zred, prev_zreds.zred2))
+
+    z = zredstr.z
+    nchanged = np.append(0, np.cumsum(zchanged))
+    ilo = np.clip(np.searchsorted(z, zlo) - 3, 0, z.size)
+    ihi = np.clip(np.searchsorted(z, zhi) + 3, 0, z.size)
+
+    redo = ((nchanged[ihi] - nchanged[ilo]) > 0)
+    redo |= ((prev_zreds.zred_uncorr_e <= 0.0) | ~np.isfinite(zlo) | ~np.isfinite(zhi))
+
+    keep, = np.where(~redo)
+    changed_bins, = np.where(zchanged[: zredc.nz])
+    if keep.size > 0 and changed_bins.size > 0:
+        cand = galaxies[keep]
+        refmag = cand.refmag
+
+        def _inrange(zstr, zbin):
+            return ((refmag < zstr.maxrefmag[zbin]) & (refmag > zstr.minrefmag[zbin]) &
+                    (zstr.z[zbin] < 100.0))
+
+        # The fit range is the refmag-limited range plus 10 neighbors,
+        # as in ZredColor.compute_zred()
+        first = np.full(keep.size, zredc.nz, dtype=np.int64)
+        last = np.full(keep.size, -1, dtype=np.int64)
+        for zbin in xrange(zredc.nz):
+            inrange = _inrange(zredstr, zbin)
+            first[inrange & (first == zredc.nz)] = zbin
+            last[inrange] = zbin
+        fitlo = first - 10
+        fithi = last + 10
+
+        # The peak used for the parabola fit
+        notextrap = np.zeros(zredc.nz, dtype=bool)
+        notextrap[zredc.notextrap] = True
+        peak = np.full(keep.size, -1e12)
+        ind = np.zeros(keep.size, dtype=np.int64)
+        for zbin in zredc.notextrap:
+            infit = (zbin >= fitlo) & (zbin < fithi)
+            lndist = np.where(infit, zredc._calculate_lndist_galaxies(cand, zbin), -1e12)
+            if zchanged[zbin]:
+                prev_lndist = np.where(infit, prev_zredc._calculate_lndist_galaxies(cand, zbin), -1e12)
+                lndist = np.maximum(lndist, prev_lndist)
+            better = (lndist > peak)
+            peak[better] = lndist[better]
+            ind[better] = zbin
+
+        lnmax = np.minimum(prev_zreds.lkhd[keep], peak) - lnmargin
+
+        bad = np.zeros(keep.size, dtype=bool)
+        for zbin in changed_bins:
+            infit = (zbin >= fitlo) & (zbin < fithi)
+            lndist = zredc._calculate_lndist_galaxies(cand, zbin)
+            prev_lndist = prev_zredc._calculate_lndist_galaxies(cand, zbin)
+            bad |= infit & ((np.maximum(lndist, prev_lndist) > lnmax) |
+                            ((lndist > -1e10) != (prev_lndist > -1e10)) |
+                            (np.abs(zbin - ind) <= 5))
+            bad |= (_inrange(zredstr, zbin) != _inrange(prev_zredstr, zbin))
+        bad |= (first >= last)
+        redo[keep[bad]] = True
+
+    if np.any(redo):
+        sub = galaxies[redo]
+        zredc.compute_zreds(sub)
+        galaxies._ndarray[redo] = sub._ndarray
+
+    return ~redo
+
+
 class ZredRunCatalog(object):
     """
     Class to run a galaxy catalog file to compute zreds, using multiprocessing.
@@ -47,10 +183,17 @@ class ZredRunCatalog(object):
         self.config = config.copy()
         self.config.cosmo = None
 
-    def run(self, galaxyfile, outfile, clobber=False, nperproc=None, maxperproc=500000):
+    def run(self, galaxyfile, outfile, clobber=False, nperproc=None, maxperproc=500000,
+            prev_zredfile=None, prev_parfile=None):
         """
         Run a galaxy file to compute zreds and output zreds to output file.
 
+        If prev_zredfile and prev_parfile are given, the zreds of galaxies
+        that only depend on redshifts where the red-sequence model is
+        unchanged from prev_parfile (to within
+        self.config.calib_warmstart_tol) are copied from prev_zredfile.
+        The galaxies whose zreds were copied are marked in self.reused.
+
         Parameters
         ----------
         galaxyfile: `str`
@@ -66,6 +209,11 @@ class ZredRunCatalog(object):
         maxperproc: `int`, optional
            Maximum number to run per processor, when doing automatic
            division.   Default is 500000.
+        prev_zredfile: `str`, optional
+           Previous zred file for the same galaxies.  Default is None.
+        prev_parfile: `str`, optional
+           Red-sequence parameter file used for prev_zredfile.
+           Default is None.
         """
 
         self.galaxyfile = galaxyfile
@@ -77,7 +225,22 @@ class ZredRunCatalog(object):
         zredstr = RedSequenceColorPar(self.config.parfile)
         self.zredc = ZredColor(zredstr)
 
+        self.prev_zredfile = None
+        self.prev_zredc = None
+        self.zchanged = None
+        if prev_zredfile is not None and prev_parfile is not None:
+            if (os.path.isfile(prev_zredfile) and os.path.isfile(prev_parfile) and
+                    fitsio.read_header(prev_zredfile, ext=1)['NAXIS2'] == ngal):
+                self.prev_zredfile = prev_zredfile
+                prev_zredstr = RedSequenceColorPar(prev_parfile)
+                self.prev_zredc = ZredColor(prev_zredstr)
+                self.zchanged = zredstr.changed_redshifts(prev_zredstr,
+                                                          self.config.calib_warmstart_tol)
+                self.config.logger.info("Reusing zreds from %s (%d of %d redshifts changed)" %
+                                        (prev_zredfile, np.sum(self.zchanged), self.zchanged.size))
+
         zreds = Catalog(np.zeros(ngal, dtype=zred_extra_dtype(self.config.zred_nsamp)))
+        self.reused = np.zeros(ngal, dtype=bool)
 
         if nperproc is None:
             nperproc = int(float(ngal) / (self.config.calib_nproc - 0.1))
@@ -91,7 +254,7 @@ class ZredRunCatalog(object):
         pool.close()
         pool.join()
 
-        for ind_range, zred, zred_e, zred2, zred2_e, zred_uncorr, zred_uncorr_e, zred_samp, lkhd, chisq in retvals:
+        for ind_range, zred, zred_e, zred2, zred2_e, zred_uncorr, zred_uncorr_e, zred_samp, lkhd, chisq, reused in retvals:
             zreds.zred[ind_range[0]: ind_range[1]] = zred
             zreds.zred_e[ind_range[0]: ind_range[1]] = zred_e
             zreds.zred2[ind_range[0]: ind_range[1]] = zred2
@@ -101,6 +264,10 @@ class ZredRunCatalog(object):
             zreds.zred_samp[ind_range[0]: ind_range[1], :] = zred_samp
             zreds.lkhd[ind_range[0]: ind_range[1]] = lkhd
             zreds.chisq[ind_range[0]: ind_range[1]] = chisq
+            self.reused[ind_range[0]: ind_range[1]] = reused
+
+        if self.zchanged is not None:
+            self.config.logger.info("Reused %d of %d zreds" % (np.sum(self.reused), ngal))
 
         zreds.to_fits_file(outfile, clobber=clobber)
 
@@ -136,6 +303,9 @@ class ZredRunCatalog(object):
            Float array of likelihoods for the galaxies in ind_range
         chisq: `np.array`
            Float array of chi-squared for the galaxies in ind_range
+        reused: `np.array`
+           Boolean array, True for the galaxies in ind_range whose
+           previous zreds were kept
         """
 
         # Need a GalaxyCatalog from a fits...
@@ -144,14 +314,20 @@ class ZredRunCatalog(object):
         galaxies = GalaxyCatalog(in_cat)
         galaxies.add_zred_fields(self.config.zred_nsamp)
 
-        self.zredc.compute_zreds(galaxies)
+        if self.zchanged is not None:
+            prev_zreds = Catalog.from_fits_file(self.prev_zredfile, ext=1,
+                                                rows=np.arange(ind_range[0], ind_range[1]))
+            reused = _warm_start_zreds(self.zredc, self.prev_zredc, galaxies, prev_zreds, self.zchanged)
+        else:
+            self.zredc.compute_zreds(galaxies)
+            reused = np.zeros(galaxies.size, dtype=bool)
 
         return (ind_range,
                 galaxies.zred, galaxies.zred_e,
                 galaxies.zred2, galaxies.zred2_e,
                 galaxies.zred_uncorr, galaxies.zred_uncorr_e,
                 galaxies.zred_samp,
-                galaxies.lkhd, galaxies.chisq)
+                galaxies.lkhd, galaxies.chisq, reused)
 
 
 class ZredRunPixels(object):
@@ -172,11 +348,18 @@ class ZredRunPixels(object):
         self.config = config.copy()
         self.config.cosmo = None
 
-    def run(self, single_process=False, no_zred_table=False, verbose=False):
+    def run(self, single_process=False, no_zred_table=False, verbose=False,
+            prev_zredfile=None, prev_parfile=None):
         """
         Run all the galaxies in a pixelized self.config.galfile to compute
         zreds and save zreds.
 
+        If prev_zredfile and prev_parfile are given, the zreds of galaxies
+        that only depend on redshifts where the red-sequence model is
+        unchanged from prev_parfile (to within
+        self.config.calib_warmstart_tol) are copied from the pixel files of
+        prev_zredfile.
+
         Parameters
         ----------
         single_process: `bool`, optional
@@ -186,6 +369,11 @@ class ZredRunPixels(object):
            Default is False.
         verbose: `bool`, optional
            Be verbose with output.  Default is False.
+        prev_zredfile: `str`, optional
+           Previous zred master table for the same galfile.  Default is None.
+        prev_parfile: `str`, optional
+           Red-sequence parameter file used for prev_zredfile.
+           Default is None.
 
         Returns
         -------
@@ -218,6 +406,20 @@ class ZredRunPixels(object):
         self.zredc = ZredColor(zredstr)
 
         self.galtable = Entry.from_fits_file(self.config.galfile)
+
+        self.prev_ztable = None
+        self.prev_zredc = None
+        self.zchanged = None
+        if prev_zredfile is not None and prev_parfile is not None:
+            if os.path.isfile(prev_zredfile) and os.path.isfile(prev_parfile):
+                self.prev_ztable = Entry.from_fits_file(prev_zredfile)
+                self.prev_zredpath = os.path.dirname(prev_zredfile)
+                prev_zredstr = RedSequenceColorPar(prev_parfile)
+                self.prev_zredc = ZredColor(prev_zredstr)
+                self.zchanged = zredstr.changed_redshifts(prev_zredstr,
+                                                          self.config.calib_warmstart_tol)
+                self.config.logger.info("Reusing zreds from %s (%d of %d redshifts changed)" %
+                                        (prev_zredfile, np.sum(self.zchanged), self.zchanged.size))
         indices = list(get_subpixel_indices(self.galtable,
                                             hpix=self.config.d.hpix, border=self.config.border, nside=self.config.d.nside))
 
@@ -282,7 +484,12 @@ class ZredRunPixels(object):
                 ctr = 0
                 ngal = galaxies.size
 
-            self.zredc.compute_zreds(galaxies)
+            prev_zredfile = self._prev_pixel_zredfile(index)
+            if prev_zredfile is not None:
+                prev_zreds = Catalog.from_fits_file(prev_zredfile, ext=1)
+                _warm_start_zreds(self.zredc, self.prev_zredc, galaxies, prev_zreds, self.zchanged)
+            else:
+                self.zredc.compute_zreds(galaxies)
             ctr += galaxies.size
 
             if self.single_process:
@@ -299,6 +506,35 @@ class ZredRunPixels(object):
 
         return (index, outfile)
 
+    def _prev_pixel_zredfile(self, index):
+        """
+        Get the previous zred file for a pixel, if it can be reused.
+
+        Parameters
+        ----------
+        index: `int`
+           Pixel index in self.galtable from self.config.galfile
+
+        Returns
+        -------
+        prev_zredfile: `str`
+           Previous zred file for the pixel.  None if not available.
+        """
+        if self.zchanged is None or self.prev_ztable.ngals[index] != self.galtable.ngals[index]:
+            return None
+
+        try:
+            filename = self.prev_ztable.filenames[index].decode()
+        except AttributeError:
+            filename = self.prev_ztable.filenames[index]
+
+        prev_zredfile = os.path.join(self.prev_zredpath, filename)
+
+        if len(filename) == 0 or not os.path.isfile(prev_zredfile):
+            return None
+
+        return prev_zredfile
+
     def make_zred_table(self, indices_and_filenames):
         """
         Make a zred table from a list of indices and filenames
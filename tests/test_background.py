@@ -93,6 +93,7 @@ class BackgroundTestCase(unittest.TestCase):
         gen.run(clobber=True)
 
         self.assertTrue(os.path.isfile(config.bkgfile))
+        bkgfile_serial = config.bkgfile
 
         bkg = fitsio.read(config.bkgfile, ext='CHISQBKG')
 
@@ -104,6 +105,56 @@ class BackgroundTestCase(unittest.TestCase):
         testing.assert_almost_equal(bkg[0]['sigma_lng'][30, 10, 3], 3.7618985, 4)
         testing.assert_almost_equal(bkg[0]['sigma_lng'][45, 10, 3], 0.0)
 
+        # And the pixel-parallel decomposition should give the same answer
+        config.bkgfile = os.path.join(config.outpath, '%s_testbkg_pixel.fit' % (config.d.outbase))
+        config.calib_nproc = 2
+        config.bkg_pixel_parallel = True
+
+        gen = BackgroundGenerator(config)
+        gen.run(clobber=True)
+
+        bkg_pixel = fitsio.read(config.bkgfile, ext='CHISQBKG')
+
+        testing.assert_array_almost_equal(bkg_pixel[0]['sigma_g'], bkg[0]['sigma_g'])
+        testing.assert_array_almost_equal(bkg_pixel[0]['sigma_lng'], bkg[0]['sigma_lng'])
+
+        # Partial histograms from separate jobs, summed afterwards, should
+        # give exactly the same answer as the pool with the same jobs
+        njob = 4 * config.calib_nproc
+        partfiles = []
+        for job in xrange(njob):
+            partfile = os.path.join(config.outpath, '%s_testbkg_part%02d.fit' % (config.d.outbase, job))
+            gen = BackgroundGenerator(config)
+            gen.run_partial(job, njob, partfile, clobber=True)
+            partfiles.append(partfile)
+
+        config.bkgfile = os.path.join(config.outpath, '%s_testbkg_parts.fit' % (config.d.outbase))
+
+        gen = BackgroundGenerator(config)
+        gen.run(clobber=True, partfiles=partfiles[::-1])
+
+        bkg_parts = fitsio.read(config.bkgfile, ext='CHISQBKG')
+
+        testing.assert_array_equal(bkg_parts[0]['sigma_g'], bkg_pixel[0]['sigma_g'])
+        testing.assert_array_equal(bkg_parts[0]['sigma_lng'], bkg_pixel[0]['sigma_lng'])
+
+        # And all the jobs are needed
+        gen = BackgroundGenerator(config)
+        self.assertRaises(RuntimeError, gen.run, clobber=True, partfiles=partfiles[1: ])
+
+        # With unchanged red-sequence parameters all the bins are reused
+        config.bkgfile = os.path.join(config.outpath, '%s_testbkg_warm.fit' % (config.d.outbase))
+
+        gen = BackgroundGenerator(config)
+        gen.run(clobber=True, prev_bkgfile=bkgfile_serial, prev_parfile=config.parfile)
+
+        self.assertEqual(np.sum(gen.zbincompute), 0)
+
+        bkg_warm = fitsio.read(config.bkgfile, ext='CHISQBKG')
+
+        testing.assert_array_equal(bkg_warm[0]['sigma_g'], bkg[0]['sigma_g'])
+        testing.assert_array_equal(bkg_warm[0]['sigma_lng'], bkg[0]['sigma_lng'])
+
         #if os.path.exists(test_dir):
         #    shutil.rmtree(test_dir, True)
 
@@ -11,6 +11,7 @@ import os
 from numpy import random
 
 from redmapper import DepthLim
+from redmapper import DepthMap
 from redmapper import Configuration
 from redmapper import GalaxyCatalog
 from redmapper import get_mask
@@ -64,6 +65,54 @@ class DepthFitTestCase(unittest.TestCase):
         testing.assert_almost_equal(pars['LIMMAG'], mask.maskgals.limmag.min())
         testing.assert_almost_equal(pars['LIMMAG'], mask.maskgals.limmag.max())
 
+    def test_depthlim_map(self):
+        """
+        Test making a local depth-fit map with redmapper.DepthLim
+        """
+
+        file_path = "data_for_tests"
+        conf_filename = "testconfig.yaml"
+        config = Configuration(file_path + "/" + conf_filename)
+
+        self.test_dir = tempfile.mkdtemp(dir='./', prefix='TestRedmapper-')
+        depthfile = os.path.join(self.test_dir, 'test_depthlim_map.hs')
+
+        gals = GalaxyCatalog.from_galfile(config.galfile)
+
+        np.random.seed(seed=12345)
+        dlim = DepthLim(gals.refmag, gals.refmag_err)
+
+        # With no cells to fit, everything gets the global fit
+        dlim.make_depthmap(gals.ra, gals.dec, gals.refmag, gals.refmag_err,
+                           depthfile, nside=128, min_gals=gals.size + 1)
+        depthstr = DepthMap(config, depthfile=depthfile)
+        limmag, exptime, m50 = depthstr.get_depth_values(gals.ra, gals.dec)
+        testing.assert_almost_equal(limmag, dlim.initpars['LIMMAG'][0], 5)
+        testing.assert_almost_equal(exptime, dlim.initpars['EXPTIME'][0], 4)
+        testing.assert_array_equal(m50, 0.0)
+        self.assertEqual(depthstr.w, 0.0)
+        self.assertEqual(depthstr.nsig, dlim.initpars['NSIG'][0])
+
+        # And the local fits should be close to the global fit
+        dlim.make_depthmap(gals.ra, gals.dec, gals.refmag, gals.refmag_err,
+                           depthfile, nside=128, clobber=True)
+        depthstr = DepthMap(config, depthfile=depthfile)
+        limmag, exptime, m50 = depthstr.get_depth_values(gals.ra, gals.dec)
+        testing.assert_array_less(np.abs(limmag - dlim.initpars['LIMMAG'][0]), 0.5)
+        testing.assert_array_less(0.0, exptime)
+
+        # Positions off the map are not valid
+        limmag, exptime, m50 = depthstr.get_depth_values(np.array([50.0]), np.array([50.0]))
+        testing.assert_array_less(limmag, 0.0)
+
+    def setUp(self):
+        self.test_dir = None
+
+    def tearDown(self):
+        if self.test_dir is not None:
+            if os.path.exists(self.test_dir):
+                shutil.rmtree(self.test_dir, True)
+
 
 if __name__=='__main__':
     unittest.main()
@@ -9,6 +9,8 @@ import fitsio
 
 from redmapper import DepthMap
 from redmapper import Configuration
+from redmapper import Cluster
+from redmapper.mask import get_mask
 
 class DepthMapTestCase(unittest.TestCase):
     """
@@ -59,6 +61,20 @@ class DepthMapTestCase(unittest.TestCase):
         testing.assert_almost_equal(exptime2, comp_exptime, 4)
         testing.assert_almost_equal(m502, comp_m50, 4)
 
+        # The dense raster lookup must match the sparse map
+        config2.dense_map_lookup = True
+        depthstr2d = DepthMap(config2)
+        limmag2d, exptime2d, m502d = depthstr2d.get_depth_values(RAs, Decs)
+        testing.assert_array_equal(limmag2d, limmag2)
+        testing.assert_array_equal(exptime2d, exptime2)
+        testing.assert_array_equal(m502d, m502)
+
+        rng = np.random.RandomState(seed=12345)
+        ras = rng.uniform(low=141.9, high=142.2, size=1000)
+        decs = rng.uniform(low=65.0, high=65.2, size=1000)
+        testing.assert_array_equal(depthstr2d.get_depth_values(ras, decs),
+                                   depthstr2.get_depth_values(ras, decs))
+
         config3 = Configuration(file_path + "/" + conf_filename)
         config3.d.hpix = [8421]
         config3.d.nside = 128
@@ -67,5 +83,35 @@ class DepthMapTestCase(unittest.TestCase):
         areas3 = depthstr3.calc_areas(np.array([20.0, 20.5, 21.0]))
         testing.assert_almost_equal(areas3[0], 0.20457271, 6)
 
+        # Check that the batch maskgal depths match one cluster at a time,
+        # including a cluster partly off the edge of the depth map
+        mask = get_mask(config)
+        cra = np.array([142.04090, 140.00434405, 142.09242])
+        cdec = np.array([65.133844, 63.47175301, 65.084844])
+        mpc_scale = np.array([10.0, 8.0, 1.0])
+        maskgal_index = np.array([0, 1, 0])
+
+        np.random.seed(12345)
+        mark, limmag, exptime, m50 = mask.calc_radmask_batch(cra, cdec, mpc_scale,
+                                                             maskgal_index,
+                                                             depthstr=depthstr)
+        self.assertEqual(mark.shape, (cra.size, config.maskgal_ngals))
+
+        np.random.seed(12345)
+        for i in xrange(cra.size):
+            mask.select_maskgals_sample(maskgal_index=maskgal_index[i])
+            cluster = Cluster(config=config)
+            cluster.ra = cra[i]
+            cluster.dec = cdec[i]
+            cluster._mpc_scale = mpc_scale[i]
+            mask.set_radmask(cluster)
+            testing.assert_array_equal(mask.maskgals.mark, mark[i, :])
+
+            depthstr.calc_maskdepth(mask.maskgals, cra[i], cdec[i], mpc_scale[i])
+            testing.assert_array_almost_equal(mask.maskgals.limmag, limmag[i, :])
+            testing.assert_array_almost_equal(mask.maskgals.exptime, exptime[i, :])
+            testing.assert_array_almost_equal(mask.maskgals.m50, m50[i, :])
+            testing.assert_array_less(0.0, limmag[i, :])
+
 if __name__=='__main__':
     unittest.main()
@@ -11,12 +11,13 @@ from redmapper.fitters import EcgmmFitter
 from redmapper.fitters import MedZFitter
 from redmapper.fitters import RedSequenceFitter
 from redmapper.fitters import CorrectionFitter
+from redmapper.fitters import RedSequenceOffDiagonalFitter
 from redmapper.utilities import make_nodes, CubicSpline
 
 class FitterTestCase(unittest.TestCase):
     """
     Tests for various fitters in redmapper.fitters, including EcgmmFitter,
-    MedZFitter, RedSequenceFitter, and
+    MedZFitter, RedSequenceFitter, RedSequenceOffDiagonalFitter, and
     CorrectionFitter.
     """
     def test_ecgmm(self):
@@ -39,6 +40,13 @@ class FitterTestCase(unittest.TestCase):
         testing.assert_almost_equal(mu, [-0.31850688, -0.11686182], 5)
         testing.assert_almost_equal(sigma, [0.15283559, 0.04079095], 5)
 
+        # Check the analytic gradient against finite differences
+        pars = np.concatenate([[wt[0]], mu + 0.5, sigma])
+        t, grad = ecfitter.value_and_grad(pars)
+        testing.assert_almost_equal(t, ecfitter(pars))
+        grad, grad_num = ecfitter.check_grad(pars)
+        testing.assert_allclose(grad, grad_num, rtol=1e-3, atol=1e-3)
+
     def test_make_nodes(self):
         """
         Run tests of redmapper.utilities.make_nodes()
@@ -144,6 +152,13 @@ class FitterTestCase(unittest.TestCase):
         testing.assert_almost_equal(slopepars3, [-0.01054824, -0.01296713, -0.01605626], 4)
         testing.assert_almost_equal(scatpars3, [0.03453208, 0.04054536, 0.03832689], 4)
 
+        # Check the analytic gradient against finite differences
+        pars = np.concatenate([meanpars3, slopepars3, scatpars3])
+        t, grad = rsfitter.value_and_grad(pars)
+        testing.assert_almost_equal(t, rsfitter(pars))
+        grad, grad_num = rsfitter.check_grad(pars)
+        testing.assert_allclose(grad, grad_num, rtol=1e-3, atol=1e-3)
+
     def test_zred_correction_fitter(self):
         """
         Run tests of redmapper.fitters.CorrectionFitter
@@ -173,23 +188,68 @@ class FitterTestCase(unittest.TestCase):
         pars_mean, = corrfitter.fit(p0_mean, p0_slope, p0_r, p0_bkg, fit_mean=True)
 
         #testing.assert_almost_equal(pars_mean, np.array([0.00484127, 0.00159642, -0.00019032]), 4)
-        testing.assert_almost_equal(pars_mean, np.array([0.00483505, 0.00159392, -0.00018447]), 5)
+        testing.assert_almost_equal(pars_mean, np.array([0.0048383, 0.00159805, -0.00019054]), 5)
 
         p0_mean = pars_mean
         pars_r, = corrfitter.fit(p0_mean, p0_slope, p0_r, p0_bkg, fit_r=True)
 
-        testing.assert_almost_equal(pars_r, np.array([0.79166451, 0.35962414]), 5)
+        testing.assert_almost_equal(pars_r, np.array([0.79169708, 0.3595552]), 5)
 
         p0_r = pars_r
         pars_bkg, = corrfitter.fit(p0_mean, p0_slope, p0_r, p0_bkg, fit_bkg=True)
 
-        testing.assert_almost_equal(pars_bkg, np.array([0., 0.00043553]), 5)
+        testing.assert_almost_equal(pars_bkg, np.array([0., 0.00043053]), 5)
         p0_bkg = pars_bkg
         pars_mean, pars_r, pars_bkg = corrfitter.fit(p0_mean, p0_slope, p0_r, p0_bkg, fit_mean=True, fit_r=True, fit_bkg=True)
 
-        testing.assert_almost_equal(pars_mean, np.array([0.00518834, 0.00178504, 0.00117311]), 5)
-        testing.assert_almost_equal(pars_r, np.array([0.81519327, 0.33098604]), 5)
-        testing.assert_almost_equal(pars_bkg, np.array([0., 0.00043576]), 5)
+        testing.assert_almost_equal(pars_mean, np.array([0.00519579, 0.00178836, 0.00117834]), 5)
+        testing.assert_almost_equal(pars_r, np.array([0.81502393, 0.33094609]), 5)
+        testing.assert_almost_equal(pars_bkg, np.array([0., 0.00044067]), 5)
+
+        # Check the analytic gradient against finite differences, away
+        # from the clipping of the background width
+        pars = np.concatenate([pars_mean, pars_r, pars_bkg + np.array([1e-3, 0.0])])
+        t, grad = corrfitter.value_and_grad(pars)
+        testing.assert_almost_equal(t, corrfitter(pars))
+        grad, grad_num = corrfitter.check_grad(pars)
+        testing.assert_allclose(grad, grad_num, rtol=1e-3, atol=1e-3)
+
+    def test_off_diagonal_fitter(self):
+        """
+        Run tests of redmapper.fitters.RedSequenceOffDiagonalFitter
+        """
+        rs = np.random.RandomState(seed=12345)
+        ngal = 10000
+
+        nodes = np.array([0.1, 0.2, 0.3])
+        z = rs.uniform(low=0.1, high=0.3, size=ngal)
+        s1 = np.zeros(ngal) + 0.04
+        s2 = np.zeros(ngal) + 0.03
+        mag_errs = np.zeros((ngal, 5)) + 0.02
+        r_true = 0.5
+
+        covmats = np.zeros((ngal, 2, 2))
+        covmats[:, 0, 0] = s1**2. + 2. * 0.02**2.
+        covmats[:, 1, 1] = s2**2. + 2. * 0.02**2.
+        covmats[:, 0, 1] = r_true * s1 * s2 - 0.02**2.
+        covmats[:, 1, 0] = covmats[:, 0, 1]
+        d = np.einsum('nij,nj->ni', np.linalg.cholesky(covmats), rs.normal(size=(ngal, 2)))
+
+        probs = np.ones(ngal)
+        bkgs = np.zeros(ngal)
+
+        odfitter = RedSequenceOffDiagonalFitter(nodes, z, d[:, 0], d[:, 1], s1, s2,
+                                                mag_errs, 1, 2, probs, bkgs, 0.45)
+        pars = odfitter.fit(np.zeros(nodes.size))
+
+        testing.assert_allclose(pars, r_true, atol=0.1)
+
+        # Check the analytic gradient against finite differences
+        pars = np.array([0.3, 0.2, -0.1])
+        t, grad = odfitter.value_and_grad(pars)
+        testing.assert_almost_equal(t, odfitter(pars))
+        grad, grad_num = odfitter.check_grad(pars)
+        testing.assert_allclose(grad, grad_num, rtol=1e-4, atol=1e-3)
 
 
 if __name__=='__main__':
@@ -9,7 +9,12 @@ from numpy import random
 import healpy as hp
 import tempfile
 import shutil
+import copy
+import glob
 import os
+import socket
+import subprocess
+import sys
 import esutil
 
 from redmapper import Configuration
@@ -70,6 +75,17 @@ class GalaxyCatalogTestCase(unittest.TestCase):
         testing.assert_equal(indices.size, 521)
         testing.assert_array_less(dists, 0.2)
 
+        # and the magnitude-limited matching should give the same galaxies,
+        # in the same order, as a cut on the full match
+        maxmag = 19.0
+        indices_lim, dists_lim = gals_all.match_one(140.5, 65.0, 0.2, maxmag=maxmag)
+        use, = np.where(gals_all.refmag[indices] <= maxmag)
+        testing.assert_array_equal(indices_lim, indices[use])
+        testing.assert_array_almost_equal(dists_lim, dists[use])
+
+        indices_lim, dists_lim = gals_all.match_one(140.5, 65.0, 0.2, maxmag=0.0)
+        testing.assert_equal(indices_lim.size, 0)
+
         i0, i1, dists = gals_all.match_many([140.5,141.2],
                                             [65.0, 65.2], [0.2,0.1])
         testing.assert_equal(i0.size, 666)
@@ -80,6 +96,90 @@ class GalaxyCatalogTestCase(unittest.TestCase):
         testing.assert_equal(test.size, 666 - 521)
         testing.assert_array_less(dists[test], 0.1)
 
+    def test_catalog_append(self):
+        """
+        Run `redmapper.Catalog` append/extend/concatenate tests.
+        """
+        dtype = [('id', 'i8'),
+                 ('mag', 'f4', 2)]
+
+        cat = Catalog(np.zeros(1, dtype=dtype))
+        parts = [cat._ndarray.copy()]
+        for i in xrange(1, 20):
+            part = np.zeros(i, dtype=dtype)
+            part['id'] = np.arange(i) + 100*i
+            part['mag'][:, 1] = i
+            parts.append(part)
+            if i % 2 == 0:
+                cat.append(Catalog(part))
+            else:
+                cat.append(part)
+
+        expected = np.concatenate(parts)
+        testing.assert_equal(cat.size, expected.size)
+        testing.assert_array_equal(cat.id, expected['id'])
+        testing.assert_array_equal(cat.mag, expected['mag'])
+        self.assertTrue(cat.capacity >= cat.size)
+
+        # Extending adds zero-filled rows
+        cat.extend(5)
+        testing.assert_equal(cat.size, expected.size + 5)
+        testing.assert_array_equal(cat.id[-5:], 0)
+
+        # Freezing compacts the catalog
+        cat.freeze()
+        testing.assert_equal(cat.capacity, cat.size)
+        testing.assert_array_equal(cat.id[: expected.size], expected['id'])
+
+        # And adding fields drops the buffer but keeps appending working
+        cat.append(expected[0: 2])
+        cat.add_fields([('extra', 'f4')])
+        cat.append(np.zeros(3, dtype=cat.dtype))
+        testing.assert_equal(cat.size, expected.size + 10)
+        testing.assert_equal(cat.capacity, cat.size)
+
+        cat2 = Catalog.concatenate(parts)
+        testing.assert_array_equal(cat2.id, expected['id'])
+        self.assertRaises(ValueError, Catalog.concatenate, [])
+
+    def test_catalog_attributes(self):
+        """
+        Run `redmapper.Catalog` and `redmapper.Entry` attribute access tests.
+        """
+        dtype = [('ID', 'i8'),
+                 ('Ra', 'f8')]
+        cat = Catalog(np.zeros(5, dtype=dtype))
+
+        # Any case works for reading and writing
+        cat.RA = np.arange(5)
+        testing.assert_array_equal(cat.ra, np.arange(5))
+        testing.assert_array_equal(cat.rA, np.arange(5))
+
+        # Cached columns follow the catalog when it is replaced
+        cat.append(cat._ndarray[0: 2])
+        testing.assert_equal(cat.ra.size, 7)
+        cat.add_fields([('dec', 'f8')])
+        testing.assert_equal(cat.dec.size, 7)
+        testing.assert_array_equal(cat.ra, [0, 1, 2, 3, 4, 0, 1])
+
+        # Entries write through to the catalog
+        entry = cat[2]
+        entry.Dec = 10.0
+        entry.id = 3
+        testing.assert_equal(cat.dec[2], 10.0)
+        testing.assert_equal(cat.id[2], 3)
+
+        # Non-field attributes are regular attributes
+        cat.foo = 1.0
+        testing.assert_equal(cat.foo, 1.0)
+        self.assertFalse(hasattr(cat, 'bar'))
+
+        # And copies are independent
+        cat2 = copy.deepcopy(cat)
+        cat2.ra[0] = 100.0
+        testing.assert_equal(cat2._ndarray['ra'][0], 100.0)
+        testing.assert_equal(cat.ra[0], 0.0)
+
     def test_galaxycatalog_create(self):
         """
         Run `redmapper.GalaxyCatalogMaker` tests.
@@ -125,6 +225,20 @@ class GalaxyCatalogTestCase(unittest.TestCase):
                 fname = os.path.join(self.test_dir, filename)
             self.assertTrue(os.path.isfile(fname))
 
+        # Test 1b: write the catalog in chunks with a small buffer, and
+        # make sure we get the same pixel files
+        maker = GalaxyCatalogMaker(os.path.join(self.test_dir, 'test_chunked'), info_dict, nside=tab.nside, buffer_mb=0.1)
+        for i in xrange(0, gals.size, 1000):
+            maker.append_galaxies(gals._ndarray[i: i + 1000])
+        maker.finalize_catalog()
+
+        tab3 = Entry.from_fits_file(os.path.join(self.test_dir, 'test_chunked_master_table.fit'))
+        testing.assert_array_equal(tab3.hpix, tab2.hpix)
+        testing.assert_array_equal(tab3.ngals, tab2.ngals)
+        gals2 = GalaxyCatalog.from_galfile(os.path.join(self.test_dir, 'test_working_master_table.fit'))
+        gals3 = GalaxyCatalog.from_galfile(os.path.join(self.test_dir, 'test_chunked_master_table.fit'))
+        testing.assert_array_equal(gals3.id, gals2.id)
+
         # Test 2: Make a catalog that has an incomplete dtype
         dtype = [('id', 'i8'),
                  ('ra', 'f8')]
@@ -204,11 +318,14 @@ class GalaxyCatalogTestCase(unittest.TestCase):
         maker1.append_galaxies(gals._ndarray[0: gals.size//2])
         maker2.append_galaxies(gals._ndarray[gals.size//2: ])
         maker1.finalize_catalog()
+        # maker2 is still writing, so the catalog is not finalized yet
+        self.assertFalse(os.path.isfile(os.path.join(self.test_dir, 'test_working_master_table.fit')))
         maker2.finalize_catalog()
 
         tab2 = Entry.from_fits_file(os.path.join(self.test_dir, 'test_working_master_table.fit'))
         self.assertEqual(tab.nside, tab2.nside)
         self.assertEqual(tab.filenames.size, tab2.filenames.size)
+        self.assertEqual(tab2.ngals.sum(), gals.size)
 
         for filename in tab2.filenames:
             try:
@@ -217,6 +334,35 @@ class GalaxyCatalogTestCase(unittest.TestCase):
                 fname = os.path.join(self.test_dir, filename)
             self.assertTrue(os.path.isfile(fname))
 
+        # And the part files have all been merged
+        self.assertEqual(len(glob.glob(os.path.join(self.test_dir, '*_part*.fit'))), 0)
+        self.assertEqual(len(glob.glob(os.path.join(self.test_dir, '*_writer*'))), 0)
+
+        # With nwriters, the makers may be created one after the other
+        outbase = os.path.join(self.test_dir, 'test_staggered')
+        maker1 = GalaxyCatalogMaker(outbase, info_dict, nside=tab.nside, parallel=True, nwriters=2)
+        maker1.append_galaxies(gals._ndarray[0: gals.size//2])
+        maker1.finalize_catalog()
+        self.assertFalse(os.path.isfile(outbase + '_master_table.fit'))
+        maker2 = GalaxyCatalogMaker(outbase, info_dict, nside=tab.nside, parallel=True, nwriters=2)
+        maker2.append_galaxies(gals._ndarray[gals.size//2: ])
+        maker2.finalize_catalog()
+        tab3 = Entry.from_fits_file(outbase + '_master_table.fit')
+        self.assertEqual(tab3.ngals.sum(), gals.size)
+
+        # A marker left by a writer that died does not block the merge
+        outbase = os.path.join(self.test_dir, 'test_crashed')
+        proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+        proc.wait()
+        with open(outbase + '_writerdead.active', 'w') as f:
+            f.write('%s %d\n' % (socket.gethostname(), proc.pid))
+        maker = GalaxyCatalogMaker(outbase, info_dict, nside=tab.nside, parallel=True)
+        maker.append_galaxies(gals._ndarray)
+        maker.finalize_catalog()
+        tab4 = Entry.from_fits_file(outbase + '_master_table.fit')
+        self.assertEqual(tab4.ngals.sum(), gals.size)
+        self.assertFalse(os.path.isfile(outbase + '_writerdead.active'))
+
     def setUp(self):
         self.test_dir = None
 
@@ -8,9 +8,12 @@ import fitsio
 import tempfile
 import shutil
 import os
+import socket
+import subprocess
+import sys
 from numpy import random
 
-from redmapper import get_mask, Mask, HPMask
+from redmapper import get_mask, Mask, HPMask, maskgal_filename
 from redmapper import Configuration
 
 class MaskTestCase(unittest.TestCase):
@@ -71,6 +74,11 @@ class MaskTestCase(unittest.TestCase):
         comp = np.array([False, True, True, True, False])
         testing.assert_equal(mask2.compute_radmask(RAs, Decs), comp)
 
+        # And with the dense raster lookup
+        config2.dense_map_lookup = True
+        mask3 = get_mask(config2, include_maskgals=False)
+        testing.assert_equal(mask3.compute_radmask(RAs, Decs), comp)
+
     def test_maskgals(self):
         """
         Test generation of maskgals file.
@@ -94,17 +102,20 @@ class MaskTestCase(unittest.TestCase):
         self.test_dir = tempfile.mkdtemp(dir='./', prefix='TestRedmapper-')
         config.outpath = self.test_dir
 
-        maskgalfile = os.path.join(self.test_dir, 'testmaskgal.fit')
+        maskgalbase = os.path.join(self.test_dir, 'testmaskgal.fit')
+        maskgalfile = maskgal_filename(config, maskgalbase)
+        self.assertTrue(maskgalfile.startswith(os.path.join(self.test_dir, 'testmaskgal_')))
+        self.assertTrue(maskgalfile.endswith('.fit'))
 
         random.seed(seed=12345)
 
         # This will generate the file if it isn't there
-        mask.read_maskgals(maskgalfile)
+        mask.read_maskgals(maskgalbase)
 
         maskgals, hdr = fitsio.read(maskgalfile, ext=1, header=True)
 
         self.assertEqual(maskgals.size, config.maskgal_ngals * config.maskgal_nsamples)
-        self.assertEqual(hdr['VERSION'], 7)
+        self.assertEqual(hdr['VERSION'], 8)
         self.assertEqual(hdr['R0'], config.percolation_r0)
         self.assertEqual(hdr['BETA'], config.percolation_beta)
         self.assertEqual(hdr['STEPSIZE'], config.maskgal_rad_stepsize)
@@ -135,6 +146,45 @@ class MaskTestCase(unittest.TestCase):
         testing.assert_almost_equal(maskgals['nin_orig'][0, 0: 3], [2213., 2663., 3066.])
         testing.assert_almost_equal(maskgals['nin'][0, 0: 3], [2203.3347168, 2651.54467773, 3062.44628906])
 
+        # Changing the generating parameters uses a different file, and
+        # leaves the first one in place
+        config.maskgal_nsamples = 2
+        maskgalfile1 = maskgalfile
+        maskgalfile = maskgal_filename(config, maskgalbase)
+        self.assertNotEqual(maskgalfile, maskgalfile1)
+        mask.read_maskgals(maskgalbase)
+        self.assertEqual(mask.maskgals_all.size, config.maskgal_ngals * config.maskgal_nsamples)
+        self.assertTrue(os.path.isfile(maskgalfile))
+        self.assertTrue(os.path.isfile(maskgalfile1))
+
+        # The seed and the number of processes do not change the file name
+        config.rng_seed = 12345
+        config.calib_nproc = 1
+        self.assertEqual(maskgal_filename(config, maskgalbase), maskgalfile)
+
+        # With a seed, the samples do not depend on the number of processes
+        os.remove(maskgalfile)
+        mask.read_maskgals(maskgalbase)
+        maskgals_serial = fitsio.read(maskgalfile, ext=1)
+
+        config.calib_nproc = 2
+        os.remove(maskgalfile)
+        mask.read_maskgals(maskgalbase)
+        maskgals_parallel = fitsio.read(maskgalfile, ext=1)
+
+        testing.assert_array_equal(maskgals_parallel, maskgals_serial)
+        self.assertFalse(os.path.isfile(maskgalfile + '.lock'))
+
+        # A lock left behind by a dead process is removed, not waited on
+        proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+        proc.wait()
+        with open(maskgalfile + '.lock', 'w') as f:
+            f.write('%s %d\n' % (socket.gethostname(), proc.pid))
+        os.remove(maskgalfile)
+        mask.read_maskgals(maskgalbase)
+        self.assertTrue(os.path.isfile(maskgalfile))
+        self.assertFalse(os.path.isfile(maskgalfile + '.lock'))
+
     def setUp(self):
         self.test_dir = None
 
@@ -62,6 +62,18 @@ class RedmapperRandomsTestCase(unittest.TestCase):
         testing.assert_array_almost_equal(rands.z[: 3], [0.3401208, 0.27653775, 0.36452898])
         testing.assert_array_almost_equal(rands.Lambda[: 3], [38.751846, 33.458374, 36.40258])
 
+        # And that every random is within the volume limit, and has the
+        # redshift and richness of the input cluster it was drawn from
+        testing.assert_array_equal(np.sort(rands.id), np.arange(nrands) + 1)
+        zmax = vlim.calc_zmax(rands.ra, rands.dec)
+        testing.assert_array_less(rands.z, zmax)
+
+        cat = Catalog.from_fits_file(config.catfile)
+        a, b = esutil.numpy_util.match(cat.mem_match_id, rands.id_input)
+        self.assertEqual(b.size, nrands)
+        testing.assert_array_almost_equal(rands.z[b], cat.z_lambda[a])
+        testing.assert_array_almost_equal(rands.Lambda[b], cat.Lambda[a])
+
         # Run the random points through the zmask code
         rand_zmask = RunRandomsZmask(config)
         rand_zmask.run()
@@ -73,6 +85,20 @@ class RedmapperRandomsTestCase(unittest.TestCase):
         testing.assert_array_less(-0.00001, randcat.maskfrac)
         testing.assert_array_less(randcat.maskfrac, 1.00001)
 
+        # With a run seed each cluster has its own random stream, so the
+        # results do not depend on the global state or the batching
+        config.rng_seed = 12345
+        np.random.seed(seed=1)
+        rand_zmask2 = RunRandomsZmask(config)
+        rand_zmask2.run()
+        np.random.seed(seed=2)
+        rand_zmask3 = RunRandomsZmask(config)
+        rand_zmask3.maskgal_batch_size = 7
+        rand_zmask3.run()
+        testing.assert_array_equal(rand_zmask3.cat.maskfrac, rand_zmask2.cat.maskfrac)
+        testing.assert_array_equal(rand_zmask3.cat.scaleval, rand_zmask2.cat.scaleval)
+        config.rng_seed = None
+
         # Figure out final selection
         weigher = RandomWeigher(config, rand_zmask.filename)
         wt_randfile, wt_areafile = weigher.weight_randoms(20.0)
@@ -90,6 +116,16 @@ class RedmapperRandomsTestCase(unittest.TestCase):
         testing.assert_array_less(-0.0001, astr.area)
         testing.assert_array_almost_equal(astr.area[100: 103], [0.89969015, 0.9031234, 0.90639186], 3)
 
+        # And multiple weightings at once should give the same files
+        outfiles = weigher.weight_randoms_multi([20.0, 10.0],
+                                                lambdabins=[None, [10.0, 30.0]])
+        self.assertEqual(outfiles[0], (wt_randfile, wt_areafile))
+        wrandcat2 = Catalog.from_fits_file(outfiles[0][0])
+        testing.assert_array_equal(wrandcat2.weight, wrandcat.weight)
+        wrandcat3 = Catalog.from_fits_file(outfiles[1][0])
+        testing.assert_array_less(10.0, wrandcat3.lambda_in)
+        testing.assert_array_less(wrandcat3.lambda_in, 30.00001)
+
     def setUp(self):
         self.test_dir = None
 
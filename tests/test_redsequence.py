@@ -5,6 +5,9 @@ import unittest
 import numpy.testing as testing
 import numpy as np
 import fitsio
+import tempfile
+import shutil
+import os
 
 import redmapper
 
@@ -129,6 +132,57 @@ class RedSequenceColorTestCase(unittest.TestCase):
         testing.assert_almost_equal(zredstr.c[extrap_indices, 3], np.array([0.30677113, 0.49210047]))
 
 
+class RedSequenceChangedTestCase(unittest.TestCase):
+    """
+    Tests of comparing redmapper.RedSequenceColorPar models.
+    """
+
+    def test_changed_redshifts(self):
+        """
+        Test redmapper.RedSequenceColorPar.changed_redshifts.
+        """
+        file_path = 'data_for_tests'
+        parfile = os.path.join(file_path, 'test_dr8_pars.fit')
+
+        zredstr = redmapper.RedSequenceColorPar(parfile)
+
+        # Nothing changes when comparing to itself
+        changed = zredstr.changed_redshifts(zredstr, 0.001)
+        testing.assert_equal(changed.size, zredstr.z.size)
+        self.assertFalse(np.any(changed))
+
+        # Perturb the red sequence at high redshift
+        self.test_dir = tempfile.mkdtemp(dir='./', prefix='TestRedmapper-')
+        parfile_perturbed = os.path.join(self.test_dir, 'test_pars_perturbed.fit')
+
+        pars, hdr = fitsio.read(parfile, ext=1, header=True)
+        hi = pars['Z00'][0] > 0.5
+        pars['C00'][0][hi] += 0.05
+        fitsio.write(parfile_perturbed, pars, header=hdr)
+
+        zredstr_perturbed = redmapper.RedSequenceColorPar(parfile_perturbed)
+
+        changed = zredstr_perturbed.changed_redshifts(zredstr, 0.001)
+        self.assertFalse(np.any(changed[zredstr.z < 0.4]))
+        self.assertTrue(np.all(changed[(zredstr.z > 0.5) & (zredstr.z < 0.65)]))
+
+        # A looser tolerance ignores the perturbation
+        changed = zredstr_perturbed.changed_redshifts(zredstr, 0.1)
+        self.assertFalse(np.any(changed))
+
+        # Different binning means everything has changed
+        zredstr_fine = redmapper.RedSequenceColorPar(parfile, fine=True)
+        self.assertTrue(np.all(zredstr_fine.changed_redshifts(zredstr, 0.001)))
+
+    def setUp(self):
+        self.test_dir = None
+
+    def tearDown(self):
+        if self.test_dir is not None:
+            if os.path.exists(self.test_dir):
+                shutil.rmtree(self.test_dir, True)
+
+
 if __name__=='__main__':
     unittest.main()
 
@@ -0,0 +1,231 @@
+from __future__ import division, absolute_import, print_function
+
+import unittest
+import tempfile
+import shutil
+import os
+import time
+import numpy as np
+import fitsio
+
+from redmapper import Configuration
+from redmapper.calibration import CalibrationTask, CalibrationTaskGraph
+
+def _copy_task(config, infile, outfile, calls=None):
+    """
+    Task to copy a text file (and record the call).
+    """
+    if calls is not None:
+        calls.append(os.path.basename(outfile))
+    with open(infile) as f:
+        text = f.read()
+    with open(outfile, 'w') as f:
+        f.write(text)
+
+def _fail_task(config):
+    """
+    Task that fails.
+    """
+    raise RuntimeError("Failing on purpose")
+
+def _set_zredfile_task(config, zredfile, outfile, calls):
+    """
+    Task that sets a config field (and records the bkgfile it sees).
+    """
+    calls.append(config.bkgfile)
+    config.zredfile = zredfile
+    with open(outfile, 'w') as f:
+        f.write(zredfile)
+
+def _get_zredfile_task(config, outfile, calls):
+    """
+    Task that records config fields set by other tasks.
+    """
+    calls.append(config.zredfile)
+    calls.append(config.bkgfile)
+    with open(outfile, 'w') as f:
+        f.write(config.zredfile)
+
+def _sleep_task(config, pidfile):
+    """
+    Task that records its pid and sleeps.
+    """
+    with open(pidfile, 'w') as f:
+        f.write('%d' % (os.getpid()))
+    time.sleep(60.0)
+
+def _no_output_task(config):
+    """
+    Task that does not make its output.
+    """
+    time.sleep(1.0)
+
+class CalibrationTaskGraphTestCase(unittest.TestCase):
+    """
+    Tests for running calibration tasks with
+    redmapper.calibration.CalibrationTaskGraph
+    """
+    def _write(self, filename, text):
+        with open(filename, 'w') as f:
+            f.write(text)
+
+    def _make_graph(self, config, calls):
+        """
+        Make a graph of a -> b, with c independent of both.
+        """
+        infile = os.path.join(self.test_dir, 'input.txt')
+        afile = os.path.join(self.test_dir, 'a.txt')
+        bfile = os.path.join(self.test_dir, 'b.txt')
+        cfile = os.path.join(self.test_dir, 'c.txt')
+
+        graph = CalibrationTaskGraph(config)
+        # Add b first to check the dependency ordering
+        graph.add(CalibrationTask('b', _copy_task, config, args=(afile, bfile, calls),
+                                  inputs=[afile], outputs=[bfile]))
+        graph.add(CalibrationTask('a', _copy_task, config, args=(infile, afile, calls),
+                                  inputs=[infile], outputs=[afile]))
+        graph.add(CalibrationTask('c', _copy_task, config, args=(infile, cfile, calls),
+                                  inputs=[infile], outputs=[cfile]))
+
+        return graph
+
+    def test_taskgraph(self):
+        """
+        Test redmapper.calibration.CalibrationTaskGraph
+        """
+        file_path = 'data_for_tests'
+        configfile = 'testconfig.yaml'
+
+        config = Configuration(os.path.join(file_path, configfile))
+
+        self.test_dir = tempfile.mkdtemp(dir='./', prefix='TestRedmapper-')
+        config.outpath = self.test_dir
+
+        infile = os.path.join(self.test_dir, 'input.txt')
+        self._write(infile, 'one')
+
+        calls = []
+        graph = self._make_graph(config, calls)
+        self.assertEqual(graph.dependencies(), {'a': set(), 'b': {'a'}, 'c': set()})
+
+        graph.run(ncores=1)
+        self.assertEqual(calls, ['a.txt', 'c.txt', 'b.txt'])
+        self.assertTrue(os.path.isfile(graph.stampfile))
+
+        # Everything is up to date
+        calls = []
+        self._make_graph(config, calls).run(ncores=1)
+        self.assertEqual(calls, [])
+
+        # Touching the input with the same contents does not rerun
+        self._write(infile, 'one')
+        self._make_graph(config, calls).run(ncores=1)
+        self.assertEqual(calls, [])
+
+        # Changing the input reruns everything downstream
+        self._write(infile, 'two')
+        self._make_graph(config, calls).run(ncores=1)
+        self.assertEqual(sorted(calls), ['a.txt', 'b.txt', 'c.txt'])
+        with open(os.path.join(self.test_dir, 'b.txt')) as f:
+            self.assertEqual(f.read(), 'two')
+
+        # Outputs made before they were recorded are up to date
+        os.remove(graph.stampfile)
+        calls = []
+        self._make_graph(config, calls).run(ncores=1)
+        self.assertEqual(calls, [])
+
+        # Run concurrently in forked processes
+        for name in ['a', 'b', 'c']:
+            os.remove(os.path.join(self.test_dir, '%s.txt' % (name)))
+        self._write(infile, 'three')
+        self._make_graph(config, None).run(ncores=2)
+        for name in ['a', 'b', 'c']:
+            with open(os.path.join(self.test_dir, '%s.txt' % (name))) as f:
+                self.assertEqual(f.read(), 'three')
+
+        calls = []
+        self._make_graph(config, calls).run(ncores=2)
+        self.assertEqual(calls, [])
+
+        # A failing task
+        graph = CalibrationTaskGraph(config)
+        graph.add(CalibrationTask('fail', _fail_task, config,
+                                  outputs=[os.path.join(self.test_dir, 'fail.txt')]))
+        self.assertRaises(RuntimeError, graph.run, ncores=2)
+
+        # A cycle
+        graph = CalibrationTaskGraph(config)
+        graph.add(CalibrationTask('x', _copy_task, config, inputs=['x.txt'], outputs=['y.txt']))
+        graph.add(CalibrationTask('y', _copy_task, config, inputs=['y.txt'], outputs=['x.txt']))
+        self.assertRaises(ValueError, graph.run)
+
+        # Pixel files listed in a master table are part of its hash
+        pixfile = os.path.join(self.test_dir, 'pix_0000001.fit')
+        self._write(pixfile, 'one')
+        masterfile = os.path.join(self.test_dir, 'master_table.fit')
+        tab = np.zeros(1, dtype=[('nside', 'i4'), ('filenames', 'U20', 2)])
+        tab['filenames'][0, :] = ['pix_0000001.fit', 'pix_0000002.fit']
+        fitsio.write(masterfile, tab, clobber=True)
+
+        def _make_master_graph(calls):
+            graph = CalibrationTaskGraph(config)
+            graph.add(CalibrationTask('m', _copy_task, config,
+                                      args=(pixfile, os.path.join(self.test_dir, 'm.txt'), calls),
+                                      inputs=[masterfile],
+                                      outputs=[os.path.join(self.test_dir, 'm.txt')]))
+            return graph
+
+        calls = []
+        _make_master_graph(calls).run(ncores=1)
+        _make_master_graph(calls).run(ncores=1)
+        self.assertEqual(calls, ['m.txt'])
+        self._write(pixfile, 'two')
+        _make_master_graph(calls).run(ncores=1)
+        self.assertEqual(calls, ['m.txt', 'm.txt'])
+
+        # Config fields set by a task are kept for later tasks, and the
+        # fields set for a task are restored afterwards
+        zredfile_orig = config.zredfile
+        bkgfile_orig = config.bkgfile
+
+        calls = []
+        graph = CalibrationTaskGraph(config)
+        config.bkgfile = 'task_bkg.fit'
+        graph.add(CalibrationTask('set', _set_zredfile_task, config,
+                                  args=('task_zreds.fit', os.path.join(self.test_dir, 'set.txt'), calls),
+                                  outputs=[os.path.join(self.test_dir, 'set.txt')]))
+        config.bkgfile = bkgfile_orig
+        graph.add(CalibrationTask('get', _get_zredfile_task, config,
+                                  args=(os.path.join(self.test_dir, 'get.txt'), calls),
+                                  requires=['set'],
+                                  outputs=[os.path.join(self.test_dir, 'get.txt')]))
+        graph.run(ncores=1)
+        self.assertEqual(calls, ['task_bkg.fit', 'task_zreds.fit', bkgfile_orig])
+        self.assertEqual(config.bkgfile, bkgfile_orig)
+        self.assertEqual(config.zredfile, 'task_zreds.fit')
+        config.zredfile = zredfile_orig
+
+        # A task that does not make its output stops the graph, and the
+        # tasks still running are terminated
+        pidfile = os.path.join(self.test_dir, 'sleep.pid')
+        graph = CalibrationTaskGraph(config)
+        graph.add(CalibrationTask('sleep', _sleep_task, config, args=(pidfile, ),
+                                  outputs=[os.path.join(self.test_dir, 'sleep.txt')]))
+        graph.add(CalibrationTask('nooutput', _no_output_task, config,
+                                  outputs=[os.path.join(self.test_dir, 'nooutput.txt')]))
+        self.assertRaises(RuntimeError, graph.run, ncores=2)
+        with open(pidfile) as f:
+            pid = int(f.read())
+        self.assertRaises(OSError, os.kill, pid, 0)
+
+    def setUp(self):
+        self.test_dir = None
+
+    def tearDown(self):
+        if self.test_dir is not None:
+            if os.path.exists(self.test_dir):
+                shutil.rmtree(self.test_dir, True)
+
+if __name__=='__main__':
+    unittest.main()
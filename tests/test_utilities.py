@@ -6,9 +6,12 @@ import numpy.testing as testing
 import numpy as np
 import fitsio
 import esutil
+import healpy as hp
+import healsparse
 
 import redmapper
-from redmapper.utilities import CubicSpline, sample_from_pdf
+from redmapper.utilities import CubicSpline, CubicSplineEvaluator, sample_from_pdf, make_rng, mag_to_lup, model_lupcorrs
+from redmapper.utilities import DenseHealsparseMap
 
 class SplineTestCase(unittest.TestCase):
     """
@@ -31,6 +34,23 @@ class SplineTestCase(unittest.TestCase):
         # these numbers are also from redMaPPer 6.3.1, DR8
         testing.assert_almost_equal(vals,np.array([14.648017,19.792828,19.973761,20.301322],dtype=np.float64),decimal=6)
 
+        # The fixed-abscissa evaluator must match, including the basis
+        # matrix and the fixed extrapolation
+        xvals = np.array([0.01, 0.12, 0.44, 0.55, 0.665])
+        for fixextrap in [False, True]:
+            spl = CubicSpline(xx, yy, fixextrap=fixextrap)
+            spleval = CubicSplineEvaluator(xx, xvals, fixextrap=fixextrap)
+            testing.assert_almost_equal(spleval(yy), spl(xvals))
+            testing.assert_almost_equal(np.dot(spleval.basis(), yy), spl(xvals))
+
+            yy2 = yy[::-1].copy()
+            testing.assert_almost_equal(spleval(yy2), CubicSpline(xx, yy2, fixextrap=fixextrap)(xvals))
+
+        spleval = CubicSplineEvaluator(xx, xvals, yp='3d=0')
+        testing.assert_almost_equal(spleval(yy), CubicSpline(xx, yy, yp='3d=0')(xvals))
+
+        self.assertRaises(ValueError, CubicSplineEvaluator, xx, xvals, yp=[0.0, 0.0])
+
         # Test the pdf inverter
         def power(x, exp=1.0):
             return x ** exp
@@ -132,6 +152,108 @@ class CicTestCase(unittest.TestCase):
         testing.assert_almost_equal(field, incat[0]['FIELD'], decimal=6)
         testing.assert_almost_equal(avfield, incat[0]['AVFIELD'], decimal=6)
 
+        # Check the boundary handling in 1d and 2d
+        field = redmapper.utilities.cic(np.ones(2), np.array([0.25, 2.5]), 4, isolated=False)
+        testing.assert_almost_equal(field, [0.75, 0.0, 1.0, 0.25])
+        field = redmapper.utilities.cic(np.ones(2), np.array([0.25, 2.5]), 4, isolated=True)
+        testing.assert_almost_equal(field, [0.75, 0.0, 1.0, 0.0])
+
+        field = redmapper.utilities.cic(np.array([2.0]), np.array([3.75]), 4, np.array([1.0]), 3,
+                                        isolated=False)
+        testing.assert_equal(field.shape, (3, 4))
+        testing.assert_almost_equal(field[0, :], [0.25, 0.0, 0.0, 0.75])
+        testing.assert_almost_equal(field[1, :], [0.25, 0.0, 0.0, 0.75])
+        testing.assert_almost_equal(field.sum(), 2.0)
+
+
+class MakeRngTestCase(unittest.TestCase):
+    """
+    Tests of redmapper.utilities.make_rng
+    """
+    def runTest(self):
+        """
+        Run tests on redmapper.utilities.make_rng
+        """
+        # No seed means the global state
+        self.assertTrue(make_rng(None, 1, 2) is np.random)
+
+        # The same keys give the same stream, in any order
+        a = make_rng(12345, 10, 1).random(size=5)
+        b = make_rng(12345, 10, 2).random(size=5)
+        testing.assert_array_equal(make_rng(12345, 10, 2).random(size=5), b)
+        testing.assert_array_equal(make_rng(12345, 10, 1).random(size=5), a)
+
+        # And different keys or seeds give different streams
+        self.assertFalse(np.any(a == b))
+        self.assertFalse(np.any(make_rng(54321, 10, 1).random(size=5) == a))
+
+
+class LupcorrTestCase(unittest.TestCase):
+    """
+    Tests of redmapper.utilities.model_lupcorrs
+    """
+    def runTest(self):
+        """
+        Run tests on redmapper.utilities.model_lupcorrs
+        """
+        b = np.array([1.4e-10, 0.9e-10, 1.2e-10, 1.8e-10, 7.4e-10])
+        refmag = np.array([16.0, 19.0, 21.5])
+        colors = np.array([[1.8, 1.4, 0.5, 0.4],
+                           [1.6, 1.2, 0.4, 0.3],
+                           [1.2, 0.9, 0.3, 0.2]])
+
+        for ref_ind in xrange(b.size):
+            # Build the magnitudes one band at a time
+            mags = np.zeros((refmag.size, b.size))
+            mags[:, ref_ind] = refmag
+            for j in xrange(ref_ind + 1, b.size):
+                mags[:, j] = mags[:, j - 1] - colors[:, j - 1]
+            for j in xrange(ref_ind - 1, -1, -1):
+                mags[:, j] = mags[:, j + 1] + colors[:, j]
+
+            lups = np.zeros_like(mags)
+            for j in xrange(b.size):
+                lups[:, j] = mag_to_lup(mags[:, j], b[j])
+
+            lupcorrs = model_lupcorrs(refmag, colors, ref_ind, b)
+            testing.assert_array_almost_equal(lupcorrs, (lups[:, :-1] - lups[:, 1:]) - colors)
+
+        # Faint galaxies have larger corrections
+        self.assertTrue(np.all(np.abs(lupcorrs[2, :]) > np.abs(lupcorrs[0, :])))
+
+        # And extra leading dimensions are supported
+        lupcorrs2 = model_lupcorrs(np.tile(refmag, (2, 1)), np.tile(colors, (2, 1, 1)), 2, b)
+        testing.assert_equal(lupcorrs2.shape, (2, refmag.size, colors.shape[1]))
+        testing.assert_array_almost_equal(lupcorrs2[1], model_lupcorrs(refmag, colors, 2, b))
+
+
+class DenseHealsparseMapTestCase(unittest.TestCase):
+    """
+    Tests of redmapper.utilities.DenseHealsparseMap
+    """
+    def runTest(self):
+        """
+        Run tests on redmapper.utilities.DenseHealsparseMap
+        """
+        sparse_map = healsparse.HealSparseMap.make_empty(32, 1024, np.float32)
+        pixels = np.arange(2000, 6000)
+        sparse_map[pixels] = np.arange(pixels.size, dtype=np.float32)
+
+        dense_map = DenseHealsparseMap(sparse_map)
+
+        rng = np.random.RandomState(12345)
+        ras = rng.uniform(0.0, 90.0, size=1000)
+        decs = rng.uniform(0.0, 90.0, size=1000)
+
+        values = dense_map.get_values_pos(ras, decs, lonlat=True)
+        testing.assert_array_equal(values, sparse_map.get_values_pos(ras, decs, lonlat=True))
+        self.assertTrue(np.any(values > hp.UNSEEN))
+
+        # And theta/phi in radians
+        theta = np.radians(90.0 - decs)
+        phi = np.radians(ras)
+        testing.assert_array_equal(dense_map.get_values_pos(theta, phi, lonlat=False), values)
+
 
 # copy this for a new utility test
 class UtilityTemplateTestCase(unittest.TestCase):
@@ -9,6 +9,7 @@ import tempfile
 import shutil
 import fitsio
 import os
+import healsparse
 
 from redmapper import DepthMap
 from redmapper import Configuration
@@ -39,6 +40,18 @@ class VolumeLimitMaskTestCase(unittest.TestCase):
         zmax = vlim.calc_zmax(ras, decs, get_fracgood=False)
         testing.assert_almost_equal(zmax, [0.338, 0.341, 0.0])
 
+        # Rebuild in parallel, one coverage pixel per chunk, and compare
+        vlim_serial = healsparse.HealSparseMap.read(vlim.vlimfile)
+
+        config.calib_nproc = 2
+        vlim.vlimfile = os.path.join(self.test_dir, 'vlim_chunked.hs')
+        vlim._build_mask(chunk_size=1)
+        vlim_chunked = healsparse.HealSparseMap.read(vlim.vlimfile)
+
+        testing.assert_array_equal(vlim_chunked.valid_pixels, vlim_serial.valid_pixels)
+        testing.assert_array_equal(vlim_chunked.get_values_pix(vlim_chunked.valid_pixels),
+                                   vlim_serial.get_values_pix(vlim_serial.valid_pixels))
+
         # And compute a geometry mask
         vlim_geom = VolumeLimitMask(config, config.vlim_lstar + 1.0, use_geometry=True)
 
@@ -144,6 +144,75 @@ class ZredTestCase(unittest.TestCase):
         use, = np.where(np.abs(delta_zred_uncorr) < 1e-3)
         testing.assert_array_less(0.98, float(use.size) / float(ok.size))
 
+    def test_zred_runcat_warmstart(self):
+        """
+        Test redmapper.ZredRunCatalog, reusing zreds from a previous run
+        where the red-sequence model has not changed.
+        """
+
+        file_path = 'data_for_tests'
+        configfile = 'testconfig.yaml'
+
+        config = Configuration(os.path.join(file_path, configfile))
+
+        self.test_dir = tempfile.mkdtemp(dir='./', prefix='TestRedmapper-')
+        config.outpath = self.test_dir
+
+        tab = fitsio.read(config.galfile, ext=1, lower=True)
+        try:
+            galfile = os.path.join(os.path.dirname(config.galfile), tab[0]['filenames'][0].decode())
+        except AttributeError:
+            galfile = os.path.join(os.path.dirname(config.galfile), tab[0]['filenames'][0])
+
+        prev_zredfile = os.path.join(self.test_dir, 'test_zred_prev.fits')
+        zredRuncat = ZredRunCatalog(config)
+        zredRuncat.run(galfile, prev_zredfile)
+
+        # Nothing changes with the same parameters
+        outfile = os.path.join(self.test_dir, 'test_zred_same.fits')
+        zredRuncat = ZredRunCatalog(config)
+        zredRuncat.run(galfile, outfile, prev_zredfile=prev_zredfile, prev_parfile=config.parfile)
+
+        zreds_prev = fitsio.read(prev_zredfile, ext=1, lower=True)
+        zreds = fitsio.read(outfile, ext=1, lower=True)
+        for name in zreds_prev.dtype.names:
+            testing.assert_array_equal(zreds[name], zreds_prev[name])
+
+        # Perturb the red sequence at high redshift
+        prev_parfile = config.parfile
+        config.parfile = os.path.join(self.test_dir, 'test_pars_perturbed.fit')
+
+        pars, hdr = fitsio.read(prev_parfile, ext=1, header=True)
+        hi = pars['Z00'][0] > 0.5
+        pars['C00'][0][hi] += 0.05
+        fitsio.write(config.parfile, pars, header=hdr)
+
+        fullfile = os.path.join(self.test_dir, 'test_zred_full.fits')
+        zredRuncat = ZredRunCatalog(config)
+        zredRuncat.run(galfile, fullfile)
+
+        warmfile = os.path.join(self.test_dir, 'test_zred_warm.fits')
+        zredRuncat = ZredRunCatalog(config)
+        zredRuncat.run(galfile, warmfile, prev_zredfile=prev_zredfile, prev_parfile=prev_parfile)
+
+        zreds_full = fitsio.read(fullfile, ext=1, lower=True)
+        zreds_warm = fitsio.read(warmfile, ext=1, lower=True)
+
+        # Many low redshift galaxies are copied exactly, and the rest are
+        # recomputed (and so match the full run)
+        reused = zredRuncat.reused
+        lowz = ((zreds_prev['zred_uncorr'] > 0.0) &
+                (zreds_prev['zred_uncorr'] + 3.0*zreds_prev['zred_uncorr_e'] < 0.3))
+        self.assertGreater(np.sum(reused & lowz), 0)
+        self.assertEqual(np.sum(reused & (zreds_prev['zred_uncorr'] > 0.5)), 0)
+        for name in zreds_prev.dtype.names:
+            testing.assert_array_equal(zreds_warm[name][reused], zreds_prev[name][reused])
+            testing.assert_allclose(zreds_warm[name][~reused], zreds_full[name][~reused],
+                                    rtol=1e-5, atol=1e-5)
+
+        use, = np.where(np.abs(zreds_warm['zred'] - zreds_full['zred']) < 1e-3)
+        testing.assert_array_less(0.98, float(use.size) / float(zreds_full.size))
+
     def test_zred_runpixels(self):
         """
         Test redmapper.ZredRunPixels, computing zreds for all the galaxies